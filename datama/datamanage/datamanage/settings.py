@@ -123,3 +123,96 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Background tasks (manager.tasks)
+# 导入等耗时任务的进程内线程池大小；EAGER 为 True 时在调用线程中同步执行；
+# 导入任务的逐批进度写入 IMPORT_PROGRESS_CACHE_ALIAS 对应的缓存，多进程部署时须为共享缓存；
+# BACKGROUND_TASK_POOLS 为独立线程池的大小（审计写入）；进程重启后执行 recover_import_jobs，
+# 将超过 IMPORT_JOB_STALE_SECONDS 秒仍为 RUNNING 的任务标记失败、仍为 PENDING 的任务重新执行
+
+BACKGROUND_TASK_WORKERS = 2
+
+BACKGROUND_TASK_POOLS = {'audit': 1}
+
+IMPORT_JOB_STALE_SECONDS = 60 * 60
+
+BACKGROUND_TASKS_EAGER = False
+
+IMPORT_PROGRESS_CACHE_ALIAS = 'default'
+
+
+# Map archive delta chain (manager.archive)
+# 每隔多少个版本存一次完整快照，其余版本只存补丁
+
+MAP_ARCHIVE_KEYFRAME_INTERVAL = 10
+
+
+# Export cache (manager.export_cache)
+# 导出结果缓存；LocMemCache 按 LRU 淘汰，仅适用于单进程开发环境。
+# 失效代数保存在缓存中，多进程部署必须改用 Redis 等共享缓存（check --deploy 报 manager.E001）
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'exports': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'manager-exports',
+        'OPTIONS': {'MAX_ENTRIES': 512},
+    },
+}
+
+EXPORT_CACHE_ALIAS = 'exports'
+
+EXPORT_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Data migration targets (manager.utils.db_router)
+# 数据迁移接口只能写入这里按名称配置的目标库，例如
+# {'archive': {'ENGINE': 'django.db.backends.mysql', 'NAME': 'datama', 'USER': '...', 'HOST': '...'}}；
+# 同时保持注册的目标库别名（及持久连接）上限，超出时淘汰最久未用的
+
+DATA_MIGRATION_TARGETS = {}
+
+DATA_MIGRATION_MAX_CONNECTIONS = 4
+
+
+# Batch simulation (manager.simulation_batch)
+# 批量仿真的进程数，None 表示使用 CPU 核数
+
+SIMULATION_WORKERS = None
+
+
+# Columnar record store (manager.record_store)
+# 仿真逐迭代 × 逐节点数据的分块 NumPy 文件根目录，Record.record_data 中只保存相对路径
+
+RECORD_STORE_ROOT = BASE_DIR / 'record_store'
+
+
+# Audit log pipeline (manager.audit)
+# 审计日志在事务提交后由后台线程合并批量写入；meta 超过 AUDIT_INLINE_META_BYTES 时结构化内容压缩后行外存储，
+# 写入失败的批次按指数退避重试（最多 AUDIT_MAX_ATTEMPTS 次），进程退出时写入剩余条目；
+# archive_audit_logs 将早于 AUDIT_RETENTION_MONTHS 个月的日志按月归档
+
+AUDIT_ASYNC = True
+
+AUDIT_FLUSH_DELAY = 0.05
+
+AUDIT_BATCH_SIZE = 500
+
+AUDIT_INLINE_META_BYTES = 4096
+
+AUDIT_RETRY_DELAY = 0.5
+
+AUDIT_RETRY_MAX_DELAY = 30
+
+AUDIT_MAX_ATTEMPTS = 8
+
+AUDIT_RETENTION_MONTHS = 6
+
+
+# Optimistic version control (manager.versioning)
+# Map / Layer 版本号以 compare-and-swap 推进；导入与回滚遇到并发修改时在新的顶层事务中重试的次数，仍冲突返回 409
+
+VERSION_CONFLICT_RETRIES = 3
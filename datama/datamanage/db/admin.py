@@ -1,8 +1,9 @@
 from django.contrib import admin
 
 # Register your models here.
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
 from django.forms import ModelForm
 from django.utils.html import format_html
 from django.urls import reverse
@@ -15,6 +16,8 @@ from .models import (
     Condition, Record, Execution, AnalysisAlgorithm, FormatConversion,
     Result, Simulation, Project
 )
+from .validation import validate_batch
+from manager import rollups
 # from .models import ResourceImportJob  # 需在顶部导入新增模型
 
 
@@ -136,6 +139,46 @@ class TargetNodeInline(admin.TabularInline):
     verbose_name_plural = "目标节点"
 
 
+# 行政区划侧栏：选项与计数取自 manager.rollups 预计算的 RegionRollup，不对节点表 GROUP BY；
+# 下级区划在选定上级之后才列出
+class RegionRollupFilter(admin.SimpleListFilter):
+    EMPTY = '-'
+
+    def lookups(self, request, model_admin):
+        level = self.parameter_name
+        parents = {}
+        for parent in rollups.LEVELS[:rollups.LEVELS.index(level)]:
+            value = request.GET.get(parent)
+            if value is None:
+                return []
+            parents[parent] = '' if value == self.EMPTY else value
+        return [(row[level] or self.EMPTY, f"{row[level] or '(空)'} ({row['count']})")
+                for row in rollups.region_counts(level, **parents)]
+
+    def queryset(self, request, queryset):
+        value, field = self.value(), self.parameter_name
+        if value is None:
+            return queryset
+        if value == self.EMPTY:
+            return queryset.filter(Q(**{f'{field}__isnull': True}) | Q(**{field: ''}))
+        return queryset.filter(**{field: value})
+
+
+class NationFilter(RegionRollupFilter):
+    title = '国家'
+    parameter_name = 'nation'
+
+
+class ProvinceFilter(RegionRollupFilter):
+    title = '省份'
+    parameter_name = 'province'
+
+
+class CityFilter(RegionRollupFilter):
+    title = '城市'
+    parameter_name = 'city'
+
+
 # 主要管理器类
 @admin.register(BaseNode)
 class BaseNodeAdmin(admin.ModelAdmin):
@@ -144,7 +187,7 @@ class BaseNodeAdmin(admin.ModelAdmin):
         'id', 'base_node_name', 'cis_type', 'sub_type', 
         'nation', 'province', 'city', 'model_name', 'owner'
     ]
-    list_filter = ['cis_type', 'sub_type', 'nation', 'province', 'city', 'owner']
+    list_filter = ['cis_type', 'sub_type', NationFilter, ProvinceFilter, CityFilter, 'owner']
     search_fields = [
         'base_node_name', 'base_node_desc', 'model_name', 
         'nation', 'province', 'city', 'owner'
@@ -205,10 +248,15 @@ class MapAdmin(admin.ModelAdmin):
     inlines = [MapLayerInline]
     list_filter = ['version_number', 'author']
     search_fields = ['message']
+
+    def get_queryset(self, request):
+        # 图层数随列表查询一次 GROUP BY 取得，不再逐行 COUNT
+        return super().get_queryset(request).annotate(_layer_count=Count('map_layers'))
     
     def layer_count(self, obj):
-        return obj.map_layers.count()
+        return obj._layer_count
     layer_count.short_description = '图层数量'
+    layer_count.admin_order_field = '_layer_count'
     
     def created_info(self, obj):
         return f"Map-{obj.id} (v{obj.version_number})"
@@ -233,6 +281,8 @@ class LayerAdmin(admin.ModelAdmin):
     search_fields = ['type', 'message']
     inlines = [NodeInline, IntraEdgeInline]
     readonly_fields = ('create_time', 'created_at', 'updated_at')
+    # 计数取自 LayerStats（manager.counters 维护），缺少计数行的图层退回 COUNT
+    list_select_related = ('stats',)
 
     fieldsets = (
         ('基本信息', {
@@ -245,12 +295,16 @@ class LayerAdmin(admin.ModelAdmin):
     )
     
     def node_count(self, obj):
-        return obj.nodes.count()
+        stats = getattr(obj, 'stats', None)
+        return stats.node_count if stats else obj.nodes.count()
     node_count.short_description = '节点数量'
+    node_count.admin_order_field = 'stats__node_count'
     
     def edge_count(self, obj):
-        return obj.intra_edges.count()
+        stats = getattr(obj, 'stats', None)
+        return stats.edge_count if stats else obj.intra_edges.count()
     edge_count.short_description = '边数量'
+    edge_count.admin_order_field = 'stats__edge_count'
 
 
 @admin.register(MapLayer)
@@ -258,6 +312,7 @@ class MapLayerAdmin(admin.ModelAdmin):
     list_display = ['id', 'map', 'layer', 'layer_type']
     list_filter = ['layer__type']
     raw_id_fields = ('map', 'layer')
+    list_select_related = ('layer',)
     
     def layer_type(self, obj):
         return obj.layer.get_type_display() if obj.layer else '-'
@@ -270,6 +325,7 @@ class NodeAdmin(admin.ModelAdmin):
     list_filter = ['layer__type', 'base_node__cis_type', 'base_node__sub_type']
     search_fields = ['base_node__base_node_name']
     raw_id_fields = ('layer', 'base_node')
+    list_select_related = ('layer', 'base_node')
     
     def node_name(self, obj):
         return obj.base_node.base_node_name if obj.base_node else '-'
@@ -310,6 +366,7 @@ class EdgeAdmin(admin.ModelAdmin):
         'base_edge__base_edge_name'
     ]
     raw_id_fields = ('base_edge', 'source_node', 'destination_node', 'mechanism_relationship')
+    list_select_related = ('source_node', 'destination_node', 'mechanism_relationship')
     
     def relationship_summary(self, obj):
         if obj.mechanism_relationship and obj.mechanism_relationship.business:
@@ -332,6 +389,7 @@ class IntraEdgeAdmin(admin.ModelAdmin):
     list_display = ['id', 'layer', 'edge', 'edge_info']
     list_filter = ['layer__type']
     raw_id_fields = ('layer', 'edge')
+    list_select_related = ('layer', 'edge')
     
     def edge_info(self, obj):
         if obj.edge:
@@ -345,6 +403,7 @@ class ConfigurationAdmin(admin.ModelAdmin):
     list_display = ['id', 'layer', 'layer_type', 'related_items']
     list_filter = ['layer__type']
     raw_id_fields = ('layer',)
+    list_select_related = ('layer__stats',)
     
     def layer_type(self, obj):
         return obj.layer.get_type_display() if obj.layer else '-'
@@ -352,8 +411,9 @@ class ConfigurationAdmin(admin.ModelAdmin):
     
     def related_items(self, obj):
         if obj.layer:
-            node_count = obj.layer.nodes.count()
-            edge_count = obj.layer.intra_edges.count()
+            stats = getattr(obj.layer, 'stats', None)
+            node_count = stats.node_count if stats else obj.layer.nodes.count()
+            edge_count = stats.edge_count if stats else obj.layer.intra_edges.count()
             return f"{node_count} 节点, {edge_count} 边"
         return '-'
     related_items.short_description = '关联项目'
@@ -511,6 +571,22 @@ class ProjectAdmin(admin.ModelAdmin):
     project_summary.short_description = '项目摘要'
 
 
+# 批量操作：校验所选记录（外键存在性按目标表批量查询，不随所选行数增长）
+@admin.action(description='校验所选记录')
+def validate_selected(modeladmin, request, queryset):
+    objs = list(queryset)
+    errors = validate_batch(objs, validate_unique=True)
+    if not errors:
+        modeladmin.message_user(request, f"{len(objs)} 条记录校验通过")
+        return
+    for index, row_errors in list(errors.items())[:20]:
+        modeladmin.message_user(request, f"{objs[index]}: {row_errors}", level=messages.ERROR)
+    modeladmin.message_user(request, f"{len(errors)} / {len(objs)} 条记录校验未通过", level=messages.WARNING)
+
+
+admin.site.add_action(validate_selected)
+
+
 # 自定义Admin站点标题
 admin.site.site_header = "资源管理系统"
 admin.site.site_title = "资源管理系统管理"
@@ -3,6 +3,8 @@ from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 import json
 
+from .validation import check_references
+
 
 class BaseNode(models.Model):
     """节点基类表"""
@@ -204,6 +206,8 @@ class MapLayer(models.Model):
     class Meta:
         db_table = 'Map_Layer'
         unique_together = ['map', 'layer']
+        # 反向（由 Layer 找所属 Map）的覆盖索引
+        indexes = [models.Index(fields=['layer', 'map'], name='maplayer_layer_map_idx')]
         verbose_name = '地图图层映射'
         verbose_name_plural = '地图图层映射'
     
@@ -212,10 +216,10 @@ class MapLayer(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.map_id and not Map.objects.filter(id=self.map_id).exists():
-            raise ValidationError({'map': 'Referenced Map does not exist'})
-        if self.layer_id and not Layer.objects.filter(id=self.layer_id).exists():
-            raise ValidationError({'layer': 'Referenced Layer does not exist'})
+        check_references(self, [
+            ('map', Map, 'Referenced Map does not exist'),
+            ('layer', Layer, 'Referenced Layer does not exist'),
+        ])
 
 
 class Node(models.Model):
@@ -237,6 +241,8 @@ class Node(models.Model):
     class Meta:
         db_table = 'Node'
         unique_together = ['layer', 'base_node']
+        # 反向（由 BaseNode 找所属 Layer）的覆盖索引
+        indexes = [models.Index(fields=['base_node', 'layer'], name='node_basenode_layer_idx')]
         verbose_name = '节点'
         verbose_name_plural = '节点'
     
@@ -245,10 +251,10 @@ class Node(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.layer_id and not Layer.objects.filter(id=self.layer_id).exists():
-            raise ValidationError({'layer': 'Referenced Layer does not exist'})
-        if self.base_node_id and not BaseNode.objects.filter(id=self.base_node_id).exists():
-            raise ValidationError({'base_node': 'Referenced BaseNode does not exist'})
+        check_references(self, [
+            ('layer', Layer, 'Referenced Layer does not exist'),
+            ('base_node', BaseNode, 'Referenced BaseNode does not exist'),
+        ])
 
 
 class MechanismRelationship(models.Model):
@@ -300,6 +306,11 @@ class Edge(models.Model):
     
     class Meta:
         db_table = 'Edge'
+        # 出边 / 入边邻接查询的覆盖索引
+        indexes = [
+            models.Index(fields=['source_node', 'destination_node'], name='edge_src_dst_idx'),
+            models.Index(fields=['destination_node', 'source_node'], name='edge_dst_src_idx'),
+        ]
         verbose_name = '边'
         verbose_name_plural = '边'
     
@@ -308,12 +319,11 @@ class Edge(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.source_node_id and not BaseNode.objects.filter(id=self.source_node_id).exists():
-            raise ValidationError({'source_node': 'Referenced source BaseNode does not exist'})
-        if self.destination_node_id and not BaseNode.objects.filter(id=self.destination_node_id).exists():
-            raise ValidationError({'destination_node': 'Referenced destination BaseNode does not exist'})
-        if self.mechanism_relationship_id and not MechanismRelationship.objects.filter(id=self.mechanism_relationship_id).exists():
-            raise ValidationError({'mechanism_relationship': 'Referenced MechanismRelationship does not exist'})
+        check_references(self, [
+            ('source_node', BaseNode, 'Referenced source BaseNode does not exist'),
+            ('destination_node', BaseNode, 'Referenced destination BaseNode does not exist'),
+            ('mechanism_relationship', MechanismRelationship, 'Referenced MechanismRelationship does not exist'),
+        ])
         if self.source_node_id == self.destination_node_id:
             raise ValidationError('Source and destination nodes cannot be the same')
 
@@ -337,6 +347,8 @@ class IntraEdge(models.Model):
     class Meta:
         db_table = 'IntraEdge'
         unique_together = ['layer', 'edge']
+        # 反向（由 Edge 找所属 Layer）的覆盖索引
+        indexes = [models.Index(fields=['edge', 'layer'], name='intraedge_edge_layer_idx')]
         verbose_name = '层内边'
         verbose_name_plural = '层内边'
     
@@ -345,10 +357,10 @@ class IntraEdge(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.layer_id and not Layer.objects.filter(id=self.layer_id).exists():
-            raise ValidationError({'layer': 'Referenced Layer does not exist'})
-        if self.edge_id and not Edge.objects.filter(base_edge_id=self.edge_id).exists():
-            raise ValidationError({'edge': 'Referenced Edge does not exist'})
+        check_references(self, [
+            ('layer', Layer, 'Referenced Layer does not exist'),
+            ('edge', Edge, 'Referenced Edge does not exist'),
+        ])
 
 
 class Configuration(models.Model):
@@ -371,8 +383,9 @@ class Configuration(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.layer_id and not Layer.objects.filter(id=self.layer_id).exists():
-            raise ValidationError({'layer': 'Referenced Layer does not exist'})
+        check_references(self, [
+            ('layer', Layer, 'Referenced Layer does not exist'),
+        ])
 
 
 class Technique(models.Model):
@@ -424,10 +437,10 @@ class TargetNode(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.technique_id and not Technique.objects.filter(id=self.technique_id).exists():
-            raise ValidationError({'technique': 'Referenced Technique does not exist'})
-        if self.node_id and not BaseNode.objects.filter(id=self.node_id).exists():
-            raise ValidationError({'node': 'Referenced BaseNode does not exist'})
+        check_references(self, [
+            ('technique', Technique, 'Referenced Technique does not exist'),
+            ('node', BaseNode, 'Referenced BaseNode does not exist'),
+        ])
         if self.target_sequence is not None and self.target_sequence < 0:
             raise ValidationError({'target_sequence': 'Target sequence must be non-negative'})
 
@@ -464,12 +477,11 @@ class Diagram(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.map_id and not Map.objects.filter(id=self.map_id).exists():
-            raise ValidationError({'map': 'Referenced Map does not exist'})
-        if self.configuration_id and not Configuration.objects.filter(id=self.configuration_id).exists():
-            raise ValidationError({'configuration': 'Referenced Configuration does not exist'})
-        if self.technique_id and not Technique.objects.filter(id=self.technique_id).exists():
-            raise ValidationError({'technique': 'Referenced Technique does not exist'})
+        check_references(self, [
+            ('map', Map, 'Referenced Map does not exist'),
+            ('configuration', Configuration, 'Referenced Configuration does not exist'),
+            ('technique', Technique, 'Referenced Technique does not exist'),
+        ])
 
 
 class Condition(models.Model):
@@ -536,8 +548,9 @@ class Execution(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.record_id and not Record.objects.filter(id=self.record_id).exists():
-            raise ValidationError({'record': 'Referenced Record does not exist'})
+        check_references(self, [
+            ('record', Record, 'Referenced Record does not exist'),
+        ])
         if self.iteration is not None and self.iteration < 0:
             raise ValidationError({'iteration': 'Iteration must be non-negative'})
 
@@ -599,10 +612,10 @@ class Result(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.analysis_algorithm_id and not AnalysisAlgorithm.objects.filter(id=self.analysis_algorithm_id).exists():
-            raise ValidationError({'analysis_algorithm': 'Referenced AnalysisAlgorithm does not exist'})
-        if self.format_conversion_id and not FormatConversion.objects.filter(id=self.format_conversion_id).exists():
-            raise ValidationError({'format_conversion': 'Referenced FormatConversion does not exist'})
+        check_references(self, [
+            ('analysis_algorithm', AnalysisAlgorithm, 'Referenced AnalysisAlgorithm does not exist'),
+            ('format_conversion', FormatConversion, 'Referenced FormatConversion does not exist'),
+        ])
 
 
 class Simulation(models.Model):
@@ -637,12 +650,11 @@ class Simulation(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.condition_id and not Condition.objects.filter(id=self.condition_id).exists():
-            raise ValidationError({'condition': 'Referenced Condition does not exist'})
-        if self.execution_id and not Execution.objects.filter(id=self.execution_id).exists():
-            raise ValidationError({'execution': 'Referenced Execution does not exist'})
-        if self.result_id and not Result.objects.filter(id=self.result_id).exists():
-            raise ValidationError({'result': 'Referenced Result does not exist'})
+        check_references(self, [
+            ('condition', Condition, 'Referenced Condition does not exist'),
+            ('execution', Execution, 'Referenced Execution does not exist'),
+            ('result', Result, 'Referenced Result does not exist'),
+        ])
 
 
 class Project(models.Model):
@@ -671,10 +683,10 @@ class Project(models.Model):
     
     def clean(self):
         """数据校验"""
-        if self.diagram_id and not Diagram.objects.filter(id=self.diagram_id).exists():
-            raise ValidationError({'diagram': 'Referenced Diagram does not exist'})
-        if self.simulation_id and not Simulation.objects.filter(id=self.simulation_id).exists():
-            raise ValidationError({'simulation': 'Referenced Simulation does not exist'})
+        check_references(self, [
+            ('diagram', Diagram, 'Referenced Diagram does not exist'),
+            ('simulation', Simulation, 'Referenced Simulation does not exist'),
+        ])
 
 
 # class ResourceImportJob(models.Model):
@@ -0,0 +1,102 @@
+# validation.py
+"""
+批量校验：替代逐行 full_clean() 中的外键存在性查询。
+
+模型的 clean() 通过 check_references() 校验引用对象是否存在；单独调用时每个引用一次 exists() 查询，
+在 validate_batch() 内调用时改为查预取的 id 集合。validate_batch() 先收集整批对象引用的全部 id，
+按目标表各做一次 pk__in 查询（ForeignKey 字段自身的存在性校验也用同一批结果完成），再逐行执行其余校验，
+返回逐行错误而不是在第一行出错时中断。
+"""
+from contextvars import ContextVar
+
+from django.core.exceptions import ValidationError
+
+VALIDATION_QUERY_BATCH_SIZE = 900  # 单条 pk__in 查询的 id 数上限（兼容 SQLite 参数个数限制）
+
+_known_ids = ContextVar('known_ids', default=None)
+
+
+def check_references(instance, references):
+    """
+    references: [(字段名, 目标模型, 错误信息), ...]；引用值为空时跳过，不存在时抛出 ValidationError({字段名: 错误信息})。
+    """
+    known = _known_ids.get()
+    for name, model, message in references:
+        value = getattr(instance, instance._meta.get_field(name).attname)
+        if not value:
+            continue
+        ids = known.get(model) if known is not None else None
+        exists = value in ids if ids is not None else model._default_manager.filter(pk=value).exists()
+        if not exists:
+            raise ValidationError({name: message})
+
+
+def _foreign_keys(model):
+    return [f for f in model._meta.concrete_fields if f.many_to_one or f.one_to_one]
+
+
+def prefetch_ids(instances):
+    """按目标模型汇总 instances 的外键取值，每个目标表 pk__in 查询一次，返回 {目标模型: 存在的 pk 集合}。"""
+    wanted = {}
+    for obj in instances:
+        for field in _foreign_keys(type(obj)):
+            value = getattr(obj, field.attname)
+            if value is not None:
+                wanted.setdefault(field.related_model, set()).add(value)
+    known = {}
+    for model, ids in wanted.items():
+        ids = list(ids)
+        found = known.setdefault(model, set())
+        for start in range(0, len(ids), VALIDATION_QUERY_BATCH_SIZE):
+            found.update(model._default_manager.filter(pk__in=ids[start:start + VALIDATION_QUERY_BATCH_SIZE])
+                         .values_list('pk', flat=True))
+    return known
+
+
+def _check_foreign_keys(obj, known):
+    errors = {}
+    for field in _foreign_keys(type(obj)):
+        value = getattr(obj, field.attname)
+        if value is None:
+            # 与 Field.validate() 一致：blank 字段允许为空，否则按 null 决定报 null 或 blank
+            if not field.blank:
+                errors[field.name] = [field.error_messages['blank' if field.null else 'null']]
+        elif value not in known.get(field.related_model, ()):
+            errors[field.name] = [field.error_messages['invalid'] % {
+                'model': field.related_model._meta.verbose_name,
+                'field': field.remote_field.field_name, 'value': value,
+            }]
+    return errors
+
+
+def _collect(errors, step, **kwargs):
+    # 与 Model.full_clean() 相同：各步骤的错误合并到同一字典，前一步出错的字段不参与唯一性校验
+    try:
+        step(**kwargs)
+    except ValidationError as exc:
+        exc.update_error_dict(errors)
+
+
+def validate_batch(instances, validate_unique=False):
+    """
+    批量校验同一批（可混合多种模型的）未保存或已修改的实例，返回 {下标: {字段: [错误信息]}}，无错误的行不出现。
+    查询数 = 引用到的目标表数量（每表按 VALIDATION_QUERY_BATCH_SIZE 分块），与行数无关；
+    validate_unique=True 时唯一性校验仍为逐行查询。
+    """
+    instances = list(instances)
+    known = prefetch_ids(instances)
+    token = _known_ids.set(known)
+    errors = {}
+    try:
+        for index, obj in enumerate(instances):
+            row = _check_foreign_keys(obj, known)
+            _collect(row, obj.clean_fields, exclude=[f.name for f in _foreign_keys(type(obj))])
+            _collect(row, obj.clean)
+            if validate_unique:
+                _collect(row, obj.validate_unique, exclude=set(row))
+                _collect(row, obj.validate_constraints, exclude=set(row))
+            if row:
+                errors[index] = ValidationError(row).message_dict
+    finally:
+        _known_ids.reset(token)
+    return errors
@@ -1,6 +1,9 @@
 # admin.py
 from django.contrib import admin
-from .models import MapArchive, ResourceImportJob, AuditLog, MapVersionSnapshot, LayerVersion
+from .models import (
+    MapArchive, ResourceImportJob, AuditLog, AuditArchive, MapVersionSnapshot, LayerVersion,
+    LayerCommit, LayerBranch, MapBranch,
+)
 
 
 @admin.register(MapArchive)
@@ -53,20 +56,29 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_filter = ("action", "resource_type", "created_at")
     search_fields = ("user__username", "resource_type", "resource_id")
     ordering = ("-created_at",)
-    readonly_fields = ("created_at",)
+    readonly_fields = ("created_at", "full_meta")
+    list_select_related = ("user",)
 
     fieldsets = (
         ("操作信息", {
             "fields": ("user", "action", "resource_type", "resource_id")
         }),
         ("详情", {
-            "fields": ("meta",),
+            "fields": ("meta", "full_meta"),
         }),
         ("时间", {
             "fields": ("created_at",),
         }),
     )
 
+@admin.register(AuditArchive)
+class AuditArchiveAdmin(admin.ModelAdmin):
+    list_display = ("id", "month", "first_id", "last_id", "count", "created_at")
+    list_filter = ("month",)
+    ordering = ("-month", "-first_id")
+    exclude = ("data",)
+    readonly_fields = ("month", "first_id", "last_id", "count", "created_at")
+
 # 新增MapVersionSnapshot模型的admin配置
 @admin.register(MapVersionSnapshot)
 class MapVersionSnapshotAdmin(admin.ModelAdmin):
@@ -108,3 +120,28 @@ class LayerVersionAdmin(admin.ModelAdmin):
             "fields": ("created_at",),
         }),
     )
+
+@admin.register(LayerCommit)
+class LayerCommitAdmin(admin.ModelAdmin):
+    list_display = ("id", "commit_hash", "layer", "parent", "merge_parent", "node_count", "edge_count", "author", "created_at")
+    list_filter = ("created_at",)
+    search_fields = ("commit_hash", "content_hash", "layer_id", "author")
+    ordering = ("-id",)
+    list_select_related = ("layer", "parent", "merge_parent")
+    exclude = ("node_buckets", "edge_buckets")
+    readonly_fields = ("commit_hash", "content_hash", "created_at")
+    raw_id_fields = ("layer", "parent", "merge_parent")
+
+@admin.register(LayerBranch)
+class LayerBranchAdmin(admin.ModelAdmin):
+    list_display = ("layer", "name", "origin", "head", "created_at")
+    search_fields = ("name", "layer_id", "origin_id")
+    list_select_related = ("layer", "origin", "head")
+    raw_id_fields = ("layer", "origin", "head")
+
+@admin.register(MapBranch)
+class MapBranchAdmin(admin.ModelAdmin):
+    list_display = ("map", "name", "origin", "created_at")
+    search_fields = ("name", "map_id", "origin_id")
+    list_select_related = ("map", "origin")
+    raw_id_fields = ("map", "origin")
@@ -0,0 +1,177 @@
+# archive.py
+"""
+MapArchive 差量链：每隔 MAP_ARCHIVE_KEYFRAME_INTERVAL 个版本存一次完整快照（关键帧），
+其余版本只存相对上一归档版本的补丁。
+
+补丁格式（针对 export_map 输出的结构）：
+{
+    'map':    {'set': {字段: 新值}, 'unset': [字段]},
+    'layers': {'added': [layer...], 'removed': [id...], 'changed': {id: {'set':..., 'unset':...}},
+               'order': [id...]   # 仅当顺序无法由 旧顺序-删除+新增 推出时才存},
+    'top':    {'set': {...}, 'unset': [...]},   # 其余顶层键，如 exported_at
+}
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import MapArchive
+
+DEFAULT_KEYFRAME_INTERVAL = 10
+
+
+def keyframe_interval():
+    return max(1, getattr(settings, 'MAP_ARCHIVE_KEYFRAME_INTERVAL', DEFAULT_KEYFRAME_INTERVAL))
+
+
+def _dict_patch(old, new):
+    old = old or {}
+    new = new or {}
+    return {
+        'set': {k: v for k, v in new.items() if k not in old or old[k] != v},
+        'unset': [k for k in old if k not in new],
+    }
+
+
+def _apply_dict_patch(base, patch):
+    result = dict(base or {})
+    for k in patch.get('unset', []):
+        result.pop(k, None)
+    result.update(patch.get('set', {}))
+    return result
+
+
+def _layer_key(layer):
+    return str(layer.get('id'))
+
+
+def _layers_patch(old_layers, new_layers):
+    old_by_id = {_layer_key(l): l for l in old_layers}
+    new_by_id = {_layer_key(l): l for l in new_layers}
+    patch = {
+        'added': [l for l in new_layers if _layer_key(l) not in old_by_id],
+        'removed': [k for k in old_by_id if k not in new_by_id],
+        'changed': {},
+    }
+    for k, l in new_by_id.items():
+        if k in old_by_id and old_by_id[k] != l:
+            patch['changed'][k] = _dict_patch(old_by_id[k], l)
+    implied = [k for k in old_by_id if k in new_by_id] + [_layer_key(l) for l in patch['added']]
+    actual = [_layer_key(l) for l in new_layers]
+    if implied != actual:
+        patch['order'] = actual
+    return patch
+
+
+def _apply_layers_patch(base_layers, patch):
+    removed = set(patch.get('removed', []))
+    changed = patch.get('changed', {})
+    by_id = {}
+    for l in base_layers:
+        k = _layer_key(l)
+        if k in removed:
+            continue
+        by_id[k] = _apply_dict_patch(l, changed[k]) if k in changed else l
+    for l in patch.get('added', []):
+        by_id[_layer_key(l)] = l
+    order = patch.get('order') or list(by_id)
+    return [by_id[k] for k in order]
+
+
+def make_patch(old, new):
+    """计算两个 export_map 快照之间的补丁（JSON 原生结构）。"""
+    old_top = {k: v for k, v in old.items() if k not in ('map', 'layers')}
+    new_top = {k: v for k, v in new.items() if k not in ('map', 'layers')}
+    return {
+        'map': _dict_patch(old.get('map'), new.get('map')),
+        'layers': _layers_patch(old.get('layers', []), new.get('layers', [])),
+        'top': _dict_patch(old_top, new_top),
+    }
+
+
+def summarize(archive):
+    """
+    版本列表中展示的变更摘要：补丁给出 Map 变更字段与 Layer 增删改数量，关键帧给出 Layer 总数。
+    """
+    if archive.is_keyframe:
+        return {'keyframe': True, 'layers': len(archive.snapshot.get('layers', []))}
+    map_patch, layers_patch = archive.snapshot.get('map', {}), archive.snapshot.get('layers', {})
+    return {
+        'map': sorted(list(map_patch.get('set', {})) + list(map_patch.get('unset', []))),
+        'layers_added': len(layers_patch.get('added', [])),
+        'layers_removed': len(layers_patch.get('removed', [])),
+        'layers_changed': len(layers_patch.get('changed', {})),
+    }
+
+
+def stored_size(data):
+    """归档 / 版本数据序列化后的字节数。"""
+    return len(json.dumps(data, cls=DjangoJSONEncoder).encode())
+
+
+def apply_patch(base, patch):
+    result = _apply_dict_patch({k: v for k, v in base.items() if k not in ('map', 'layers')}, patch.get('top', {}))
+    result['map'] = _apply_dict_patch(base.get('map'), patch.get('map', {}))
+    result['layers'] = _apply_layers_patch(base.get('layers', []), patch.get('layers', {}))
+    return result
+
+
+def _replay(archives):
+    """archives 为按版本升序、以关键帧开头的归档序列，返回最后一个版本的完整快照。"""
+    snapshot, version = None, None
+    for archive in archives:
+        if archive.is_keyframe:
+            snapshot = archive.snapshot
+        else:
+            if snapshot is None or archive.base_version != version:
+                raise ObjectDoesNotExist(
+                    f"Broken archive chain for map {archive.map_id} at version {archive.version_number}"
+                )
+            snapshot = apply_patch(snapshot, archive.snapshot)
+        version = archive.version_number
+    return snapshot
+
+
+def reconstruct_map_snapshot(map_id, version_number):
+    """
+    重建 Map 指定版本的完整快照：从不晚于该版本的最近关键帧开始依次应用补丁。
+    最多读取 keyframe_interval() 行归档，共两次查询。
+    """
+    keyframe = (MapArchive.objects.filter(map_id=map_id, version_number__lte=version_number, is_keyframe=True)
+                .order_by('-version_number').only('version_number').first())
+    if keyframe is None:
+        raise ObjectDoesNotExist(f"No archived snapshot for map {map_id} version {version_number}")
+    chain = list(MapArchive.objects.filter(map_id=map_id,
+                                           version_number__gte=keyframe.version_number,
+                                           version_number__lte=version_number)
+                 .order_by('version_number'))
+    if chain[-1].version_number != version_number:
+        raise ObjectDoesNotExist(f"No archived snapshot for map {map_id} version {version_number}")
+    return _replay(chain)
+
+
+def build_archive(map_obj, snapshot, author='', message=''):
+    """
+    为 map_obj 当前版本构造（未保存的）MapArchive：
+    距上一个关键帧已满 keyframe_interval() 个版本、或没有更早归档时存完整快照，否则存补丁。
+    """
+    history = list(MapArchive.objects.filter(map=map_obj, version_number__lt=map_obj.version_number)
+                   .order_by('-version_number')[:keyframe_interval()])
+    archive = MapArchive(map=map_obj, version_number=map_obj.version_number,
+                         author=author, message=message)
+    if not history or not any(a.is_keyframe for a in history[:keyframe_interval() - 1]):
+        archive.is_keyframe = True
+        archive.snapshot = snapshot
+    else:
+        history.reverse()
+        while not history[0].is_keyframe:
+            history.pop(0)
+        archive.is_keyframe = False
+        archive.base_version = history[-1].version_number
+        archive.snapshot = make_patch(_replay(history), snapshot)
+    # 版本列表只读这两列，不取 snapshot
+    archive.size = stored_size(archive.snapshot)
+    archive.summary = summarize(archive)
+    return archive
@@ -0,0 +1,273 @@
+# audit.py
+"""
+审计日志写入管道：业务代码调用 record() / record_many()，日志在事务提交后才写入，不再占用业务事务的写入与锁时间。
+
+- 提交钩子（transaction.on_commit）把条目放入进程内缓冲，后台线程（manager.tasks 的 'audit' 线程池）等待 AUDIT_FLUSH_DELAY 秒后
+  整批 bulk_create，多次提交的条目合并写入；事务回滚（含回滚到保存点）时条目随钩子一起丢弃；
+- created_at 在 record() 时确定（事件时间），不受延迟写入影响；
+- 写入失败的批次放回缓冲头部，按指数退避（AUDIT_RETRY_DELAY 起，最长 AUDIT_RETRY_MAX_DELAY 秒）重试，
+  失败批次逐条重写以隔离无法写入的条目；单条失败达到 AUDIT_MAX_ATTEMPTS 次后以完整内容记入错误日志并放弃；
+- 进程正常退出时（atexit）同步写入缓冲中剩余的条目，写入失败的条目同样完整记入错误日志；
+- BACKGROUND_TASKS_EAGER 为 True 或 AUDIT_ASYNC 为 False 时在提交钩子中同步写入（测试 / 调试用）；
+- meta 序列化后超过 AUDIT_INLINE_META_BYTES 时，其中的 dict / list 值压缩后存入 AuditPayload（行外），
+  AuditLog.meta 只保留标量与 '_payload_keys'，完整内容由 AuditLog.full_meta 读取；
+- archive_before() 把早于指定时间的日志按月压缩为 AuditArchive 行并从 AuditLog 删除，
+  对应管理命令 archive_audit_logs（保留最近 AUDIT_RETENTION_MONTHS 个月）。
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import tasks
+from .models import AuditLog, AuditPayload, AuditArchive
+
+logger = logging.getLogger(__name__)
+
+AUDIT_ARCHIVE_CHUNK_SIZE = 1000
+
+# 审计写入使用独立线程池：重试退避不占用导入线程，长时间导入也不会推迟审计写入
+AUDIT_POOL = 'audit'
+
+_buffer = []
+_lock = threading.Lock()
+_scheduled = False
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _is_async():
+    return _setting('AUDIT_ASYNC', True) and not _setting('BACKGROUND_TASKS_EAGER', False)
+
+
+def _dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def record(action, resource_type, resource_id, meta=None, user=None):
+    """登记一条审计日志，当前事务提交后写入（不在事务中时立即进入写入流程）。"""
+    record_many([AuditLog(user=user, action=action, resource_type=resource_type,
+                          resource_id=resource_id, meta=meta or {}, created_at=timezone.now())])
+
+
+def record_many(entries):
+    """登记一组未保存的 AuditLog 实例，提交后作为一批写入；未设置 created_at 的条目以登记时刻为准。"""
+    entries = list(entries)
+    now = timezone.now()
+    for entry in entries:
+        if entry.created_at is None:
+            entry.created_at = now
+    if entries:
+        transaction.on_commit(partial(_committed, entries))
+
+
+def _committed(entries):
+    if not _is_async():
+        write(entries)
+        return
+    with _lock:
+        _buffer.extend(entries)
+    _schedule()
+
+
+def _schedule():
+    global _scheduled
+    with _lock:
+        if _scheduled:
+            return
+        _scheduled = True
+    tasks.submit_to(AUDIT_POOL, _drain)
+
+
+def _take(limit=None):
+    with _lock:
+        batch = _buffer[:limit] if limit else _buffer[:]
+        del _buffer[:len(batch)]
+        return batch
+
+
+def _dead_letter(entries, reason):
+    # 放弃写入的条目以完整内容记入错误日志，可据此人工补录
+    for entry in entries:
+        logger.error("audit log entry dropped (%s): %s", reason, _dumps(_archive_row(entry)))
+
+
+def _write_each(batch):
+    """逐条写入，返回写入失败的条目。"""
+    failed = []
+    for entry in batch:
+        try:
+            write([entry])
+        except Exception:
+            failed.append(entry)
+    return failed
+
+
+def _requeue(failed):
+    """失败条目计数后放回缓冲头部（保持原有顺序）；达到 AUDIT_MAX_ATTEMPTS 次的条目放弃。"""
+    max_attempts = _setting('AUDIT_MAX_ATTEMPTS', 8)
+    retry = []
+    for entry in failed:
+        entry._audit_attempts = getattr(entry, '_audit_attempts', 0) + 1
+        if entry._audit_attempts >= max_attempts:
+            _dead_letter([entry], f"{entry._audit_attempts} failed attempts")
+        else:
+            retry.append(entry)
+    with _lock:
+        _buffer[:0] = retry
+    return retry
+
+
+def _drain():
+    global _scheduled
+    time.sleep(_setting('AUDIT_FLUSH_DELAY', 0.05))
+    failures = 0
+    while True:
+        batch = _take(_setting('AUDIT_BATCH_SIZE', 500))
+        if not batch:
+            with _lock:
+                # 取空与清除标记之间可能有新条目进入缓冲，加锁复查
+                if not _buffer:
+                    _scheduled = False
+                    return
+            continue
+        try:
+            write(batch)
+            failures = 0
+            continue
+        except Exception:
+            logger.exception("failed to write %d audit log entries, will retry", len(batch))
+        # 连接可能已断开（数据库重启、超时），下次查询时重新建立
+        connection.close_if_unusable_or_obsolete()
+        failed = _write_each(batch) if len(batch) > 1 else batch
+        if _requeue(failed):
+            failures += 1
+            time.sleep(min(_setting('AUDIT_RETRY_DELAY', 0.5) * 2 ** (failures - 1),
+                           _setting('AUDIT_RETRY_MAX_DELAY', 30)))
+
+
+def flush():
+    """
+    在调用线程中写入缓冲内全部已提交条目（进程退出前、管理命令或测试中使用），返回写入条数。
+    写入失败时逐条重写，仍失败的条目与后台写入一样放回缓冲重试（计入 AUDIT_MAX_ATTEMPTS），不会丢失。
+    """
+    batch = _take()
+    if not batch:
+        return 0
+    try:
+        write(batch)
+        return len(batch)
+    except Exception:
+        logger.exception("failed to flush %d audit log entries, will retry", len(batch))
+    failed = _write_each(batch)
+    if _requeue(failed) and _is_async():
+        _schedule()
+    return len(batch) - len(failed)
+
+
+@atexit.register
+def _flush_at_exit():
+    # 进程回收 / 正常退出前写入剩余条目；逐条重写后仍失败的条目记入错误日志，不阻断退出
+    batch = _take()
+    if not batch:
+        return
+    try:
+        write(batch)
+    except Exception:
+        logger.exception("failed to flush %d audit log entries at exit", len(batch))
+        _dead_letter(_write_each(batch), "flush at exit failed")
+
+
+def _split(entry, limit):
+    # 逐个值序列化一次：既用于估算大小，也直接拼接为行外内容，避免对大 meta 重复序列化
+    parts = {k: _dumps(v) for k, v in entry.meta.items() if isinstance(v, (dict, list))}
+    size = sum(len(p) for p in parts.values())
+    if not parts or size + len(_dumps({k: v for k, v in entry.meta.items() if k not in parts})) <= limit:
+        return None
+    raw = '{' + ','.join(f'{_dumps(str(k))}:{p}' for k, p in parts.items()) + '}'
+    entry.meta = {k: v for k, v in entry.meta.items() if k not in parts}
+    entry.meta['_payload_keys'] = sorted(parts)
+    return AuditPayload(data=zlib.compress(raw.encode(), 1), size=len(raw))
+
+
+def write(entries):
+    """
+    立即写入一组 AuditLog 实例：大体量 meta 先行外存储，再整批插入日志。
+    写入失败时条目恢复为写入前的状态（meta、未保存），可原样重试。
+    """
+    limit = _setting('AUDIT_INLINE_META_BYTES', 4096)
+    batch_size = _setting('AUDIT_BATCH_SIZE', 500)
+    metas = [entry.meta for entry in entries]
+    split = [(entry, _split(entry, limit)) for entry in entries]
+    payloads = [payload for _, payload in split if payload is not None]
+    try:
+        with transaction.atomic():
+            if connection.features.can_return_rows_from_bulk_insert:
+                AuditPayload.objects.bulk_create(payloads, batch_size=batch_size)
+            else:
+                # 后端不回填自增主键（如 MySQL）时退回逐条插入
+                for payload in payloads:
+                    payload.save(force_insert=True)
+            for entry, payload in split:
+                if payload is not None:
+                    entry.payload = payload
+            AuditLog.objects.bulk_create(entries, batch_size=batch_size)
+    except Exception:
+        # 回滚后已回填的主键不再有效
+        for entry, meta in zip(entries, metas):
+            entry.meta, entry.payload, entry.pk = meta, None, None
+            entry._state.adding = True
+        raise
+
+
+def month_start(months_ago=0):
+    """当前时区下 months_ago 个月前的月初时刻。"""
+    now = timezone.localtime() if settings.USE_TZ else timezone.now()
+    year, month = divmod(now.year * 12 + now.month - 1 - months_ago, 12)
+    return now.replace(year=year, month=month + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _month(value):
+    return (timezone.localtime(value) if timezone.is_aware(value) else value).date().replace(day=1)
+
+
+def _archive_row(log):
+    return {'id': log.id, 'user_id': log.user_id, 'action': log.action, 'resource_type': log.resource_type,
+            'resource_id': log.resource_id, 'created_at': log.created_at, 'meta': log.full_meta}
+
+
+def archive_before(cutoff, chunk_size=AUDIT_ARCHIVE_CHUNK_SIZE):
+    """
+    把 created_at 早于 cutoff 的日志按 id 顺序分段归档：每段在一个事务内按月份写入 AuditArchive，
+    再删除这些日志及其行外内容。返回归档条数。
+    """
+    archived = 0
+    while True:
+        with transaction.atomic():
+            logs = list(AuditLog.objects.filter(created_at__lt=cutoff).select_related('payload')
+                        .order_by('pk')[:chunk_size])
+            if not logs:
+                return archived
+            months = defaultdict(list)
+            for log in logs:
+                months[_month(log.created_at)].append(log)
+            AuditArchive.objects.bulk_create([
+                AuditArchive(month=month, first_id=rows[0].id, last_id=rows[-1].id, count=len(rows),
+                             data=zlib.compress('\n'.join(_dumps(_archive_row(log)) for log in rows).encode()))
+                for month, rows in months.items()
+            ])
+            payload_ids = {log.payload_id for log in logs} - {None}
+            AuditLog.objects.filter(pk__in=[log.pk for log in logs]).delete()
+            AuditPayload.objects.filter(pk__in=payload_ids, logs__isnull=True).delete()
+        archived += len(logs)
@@ -0,0 +1,342 @@
+# branches.py
+"""
+Layer / Map 的分支、提交与三方合并。
+
+- 分支即一个 Layer：fork 复制来源 Layer 的字段与 Node / IntraEdge 成员，之后各分支独立编辑、各自推进版本号，
+  不同团队不再争用同一个版本计数器；分支信息记录在 LayerBranch（db 表结构由外部 SQL 管理，不在 Layer 上加列）；
+- 提交（LayerCommit）记录内容字段与成员的 Merkle 树：Node 的 base_node_id、IntraEdge 的 edge_id 按 id % TREE_BUCKETS
+  分桶，每桶为升序 id 列表的 SHA-1，桶内容按哈希存入 TreeBucket（跨提交共享）；根哈希覆盖内容字段与全部桶哈希，
+  内容未变时提交为空操作；
+- 合并以两个分支头的最近公共祖先为基准逐桶比较哈希：两侧相同、或只有一侧相对基准有变化的桶直接取结果，不读取成员；
+  只有两侧都改过的桶才取出三份 id 集合做集合三方合并。成员增删不会冲突，内容字段两侧改为不同值时抛出 MergeConflict，
+  除非指定 strategy='ours' / 'theirs'；
+- Map 分支 fork 其全部 Layer；合并时逐个 Layer 合并回来源，并以 fork 时的 layer 列表（MapBranch.base_layers）为基准
+  三方合并 MapLayer 关联。
+
+版本号推进与审计由 services.merge_layer_branch / merge_map_branch 负责，本模块只处理内容。
+"""
+import hashlib
+import json
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from db.models import Map, Layer, MapLayer, Node, IntraEdge
+from . import counters, export_cache, rollups
+from .models import TreeBucket, LayerCommit, LayerBranch, MapBranch
+
+TREE_BUCKETS = 256
+BRANCH_BATCH_SIZE = 1000
+
+# 参与提交与合并的 Layer 内容字段（版本号、作者、说明与时间戳属于版本元数据，各分支各自维护）
+LAYER_CONTENT_FIELDS = ('type',)
+
+# 成员种类 -> (模型, 成员 id 列)
+_MEMBERS = {'node': (Node, 'base_node_id'), 'edge': (IntraEdge, 'edge_id')}
+
+MERGE_STRATEGIES = ('ours', 'theirs')
+
+
+class MergeConflict(ValidationError):
+    """内容字段在两侧被改为不同的值；conflicts 为 [{'field', 'base', 'ours', 'theirs'}]（Map 合并时另含 'layer'）。"""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f"merge conflict in {', '.join(sorted({str(c['field']) for c in conflicts}))}")
+
+
+def _sha1(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+
+
+def bucket_hash(kind, ids):
+    """一个桶的哈希：成员种类 + 升序 id 列表。"""
+    return _sha1(f"{kind}:{','.join(map(str, ids))}")
+
+
+def build_tree(kind, ids):
+    """把 id 集合分桶，返回 {桶号(str): (哈希, 升序 id 列表)}，空桶省略。"""
+    buckets = defaultdict(list)
+    for i in ids:
+        buckets[str(i % TREE_BUCKETS)].append(i)
+    return {key: (bucket_hash(kind, sorted(members)), sorted(members)) for key, members in buckets.items()}
+
+
+def tree_hash(fields, node_buckets, edge_buckets):
+    """内容树根哈希：内容字段 + 两类成员的 {桶号: 桶哈希}。"""
+    return _sha1(_dumps([fields, node_buckets, edge_buckets]))
+
+
+def layer_fields(layer):
+    return {f: getattr(layer, f) for f in LAYER_CONTENT_FIELDS}
+
+
+def layer_members(layer_id):
+    """Layer 当前的成员集合 {'node': {base_node_id}, 'edge': {edge_id}}（每类一次查询）。"""
+    return {kind: set(model.objects.filter(layer_id=layer_id).values_list(column, flat=True))
+            for kind, (model, column) in _MEMBERS.items()}
+
+
+def _branch(layer):
+    # 锁定分支行：同一分支上的提交串行，不同分支互不影响
+    branch, _ = LayerBranch.objects.select_for_update().select_related('head').get_or_create(layer=layer)
+    return branch
+
+
+def _commit(layer, branch, fields, members, author='', message='', merge_parent=None):
+    trees = {kind: build_tree(kind, ids) for kind, ids in members.items()}
+    buckets = {kind: {key: h for key, (h, _) in tree.items()} for kind, tree in trees.items()}
+    root = tree_hash(fields, buckets['node'], buckets['edge'])
+    head = branch.head
+    if head is not None and head.content_hash == root and merge_parent is None:
+        return head
+
+    # 只写入上一提交中没有的桶（未变化的子树不重复写入）
+    known = set(head.node_buckets.values()) | set(head.edge_buckets.values()) if head else set()
+    TreeBucket.objects.bulk_create(
+        [TreeBucket(hash=h, ids=ids) for tree in trees.values() for h, ids in tree.values() if h not in known],
+        batch_size=BRANCH_BATCH_SIZE, ignore_conflicts=True)
+    now = timezone.now()
+    parents = [c.commit_hash if c else None for c in (head, merge_parent)]
+    commit = LayerCommit.objects.create(
+        commit_hash=_sha1(_dumps([root, parents, layer.id, author, message, now])),
+        layer=layer, parent=head, merge_parent=merge_parent, content_hash=root, fields=fields,
+        node_buckets=buckets['node'], edge_buckets=buckets['edge'],
+        node_count=len(members['node']), edge_count=len(members['edge']),
+        author=author or '', message=message or '', created_at=now,
+    )
+    branch.head = commit
+    branch.save(update_fields=['head'])
+    return commit
+
+
+@transaction.atomic
+def commit_layer(layer, author='', message=''):
+    """提交 layer 的当前内容并推进其分支头；内容与分支头相同时不新建提交，直接返回分支头。"""
+    return _commit(layer, _branch(layer), layer_fields(layer), layer_members(layer.id), author, message)
+
+
+def _copy_members(layer, members):
+    nodes = Node.objects.bulk_create([Node(layer=layer, base_node_id=i) for i in sorted(members['node'])],
+                                     batch_size=BRANCH_BATCH_SIZE)
+    edges = IntraEdge.objects.bulk_create([IntraEdge(layer=layer, edge_id=i) for i in sorted(members['edge'])],
+                                          batch_size=BRANCH_BATCH_SIZE)
+    # bulk_create 不触发信号，显式维护计数与区划汇总
+    counters.apply_instances(Node, nodes)
+    counters.apply_instances(IntraEdge, edges)
+    rollups.apply_instances(Node, nodes)
+
+
+@transaction.atomic
+def fork_layer(layer, name, author=''):
+    """
+    从 layer 的当前内容 fork 出新分支（新 Layer），复制字段与 Node / IntraEdge 成员。
+    新分支的头提交即来源的头提交，之后的合并以它为共同祖先。返回新 Layer。
+    """
+    fields, members = layer_fields(layer), layer_members(layer.id)
+    head = _commit(layer, _branch(layer), fields, members, author, f"fork {name}")
+    fork = Layer.objects.create(version_number=layer.version_number, author=author or layer.author,
+                                message=f"fork {name} of layer {layer.id}", **fields)
+    _copy_members(fork, members)
+    LayerBranch.objects.create(layer=fork, name=name, origin=layer, head=head)
+    return fork
+
+
+def merge_base(ours, theirs):
+    """
+    两个提交的最近公共祖先：从两侧同时按层向上（parent 与 merge_parent）广度遍历，每层一次查询，
+    最先相遇的提交中取最新者。没有公共祖先时返回 None。
+    """
+    seen = ({ours.pk: ours}, {theirs.pk: theirs})
+    frontiers = ([ours], [theirs])
+    while True:
+        common = seen[0].keys() & seen[1].keys()
+        if common:
+            return max((seen[0][pk] for pk in common), key=lambda c: (c.created_at, c.pk))
+        wanted = {pk for frontier in frontiers for c in frontier for pk in (c.parent_id, c.merge_parent_id) if pk}
+        if not wanted:
+            return None
+        parents = LayerCommit.objects.in_bulk(wanted)
+        frontiers = tuple(
+            [parents[pk] for c in frontier for pk in (c.parent_id, c.merge_parent_id) if pk in parents and pk not in s]
+            for frontier, s in zip(frontiers, seen))
+        for frontier, s in zip(frontiers, seen):
+            s.update((c.pk, c) for c in frontier)
+
+
+def merge_fields(base, ours, theirs, strategy=None):
+    """内容字段三方合并，返回 (合并结果, 冲突列表)；指定 strategy 时冲突按该侧取值。"""
+    merged, conflicts = {}, []
+    for field in LAYER_CONTENT_FIELDS:
+        b, o, t = base.get(field), ours.get(field), theirs.get(field)
+        if o == t or t == b:
+            merged[field] = o
+        elif o == b:
+            merged[field] = t
+        elif strategy:
+            merged[field] = o if strategy == 'ours' else t
+        else:
+            conflicts.append({'field': field, 'base': b, 'ours': o, 'theirs': t})
+    return merged, conflicts
+
+
+def _merge_members(kind, ours_members, base_buckets, ours_buckets, theirs_buckets, loaded, stats):
+    """按桶三方合并一类成员，返回 (新增 id 集合, 删除 id 集合)。"""
+    added, removed = set(), set()
+    ours_by_bucket = defaultdict(set)
+    for i in ours_members:
+        ours_by_bucket[str(i % TREE_BUCKETS)].add(i)
+    for key in ours_buckets.keys() | theirs_buckets.keys():
+        b, o, t = base_buckets.get(key), ours_buckets.get(key), theirs_buckets.get(key)
+        if o == t or t == b:
+            stats['skipped'] += 1
+            continue
+        mine = ours_by_bucket[key]
+        other = set(loaded[t]) if t else set()
+        if o == b:
+            stats['taken'] += 1
+            result = other
+        else:
+            stats['merged'] += 1
+            common = set(loaded[b]) if b else set()
+            result = (mine & other) | (mine - common) | (other - common)
+        added |= result - mine
+        removed |= mine - result
+    return added, removed
+
+
+def _apply_members(layer, changes):
+    for kind, (added, removed) in changes.items():
+        model, column = _MEMBERS[kind]
+        removed = sorted(removed)
+        for start in range(0, len(removed), BRANCH_BATCH_SIZE):
+            # 逐行删除信号维护计数、区划汇总与缓存
+            model.objects.filter(layer=layer, **{f'{column}__in': removed[start:start + BRANCH_BATCH_SIZE]}).delete()
+        created = model.objects.bulk_create([model(layer=layer, **{column: i}) for i in sorted(added)],
+                                            batch_size=BRANCH_BATCH_SIZE)
+        counters.apply_instances(model, created)
+        if model is Node:
+            rollups.apply_instances(Node, created)
+
+
+@transaction.atomic
+def merge_layers(target, source, author='', message='', strategy=None):
+    """
+    把分支 source 合并进 target（均为 Layer），两侧先各自提交当前内容：
+    - source 已包含在 target 的历史中：'up-to-date'，不做修改；
+    - target 没有新提交：'fast-forward'，内容改为 source 的内容，分支头指向 source 的头提交；
+    - 否则逐桶三方合并成员、三方合并内容字段，写入差异并创建带两个父提交的合并提交：'merged'。
+    返回 {'status', 'base', 'commit', 'fields', 'nodes_added', 'nodes_removed', 'edges_added', 'edges_removed',
+    'buckets'}，其中 buckets 为 {'skipped', 'taken', 'merged'} 桶数。内容字段冲突时抛出 MergeConflict。
+    """
+    if strategy is not None and strategy not in MERGE_STRATEGIES:
+        raise ValidationError(f"strategy must be one of {', '.join(MERGE_STRATEGIES)}")
+    if target.pk == source.pk:
+        raise ValidationError("cannot merge a layer into itself")
+    branch = _branch(target)
+    ours_members = layer_members(target.id)
+    ours = _commit(target, branch, layer_fields(target), ours_members, author, "commit before merge")
+    theirs = commit_layer(source, author)
+    base = merge_base(ours, theirs)
+    result = {'base': base.commit_hash if base else None, 'fields': {}, 'nodes_added': 0, 'nodes_removed': 0,
+              'edges_added': 0, 'edges_removed': 0, 'buckets': {'skipped': 0, 'taken': 0, 'merged': 0}}
+    if base is not None and base.pk == theirs.pk:
+        return {**result, 'status': 'up-to-date', 'commit': ours.commit_hash}
+
+    empty = LayerCommit(fields={}, node_buckets={}, edge_buckets={})
+    fields, conflicts = merge_fields((base or empty).fields, ours.fields, theirs.fields, strategy)
+    if conflicts:
+        raise MergeConflict(conflicts)
+
+    trees = {kind: [getattr(c or empty, f'{kind}_buckets') for c in (base, ours, theirs)] for kind in _MEMBERS}
+    # 两侧都改过的桶要读基准与对方的内容，只改在对方的桶读对方的内容；一次查询取回
+    wanted = set()
+    for b, o, t in trees.values():
+        for key in o.keys() | t.keys():
+            if o.get(key) != t.get(key) and t.get(key) != b.get(key):
+                wanted.update(h for h in (t.get(key), b.get(key) if o.get(key) != b.get(key) else None) if h)
+    loaded = dict(TreeBucket.objects.filter(hash__in=wanted).values_list('hash', 'ids')) if wanted else {}
+
+    changes = {kind: _merge_members(kind, ours_members[kind], b, o, t, loaded, result['buckets'])
+               for kind, (b, o, t) in trees.items()}
+    _apply_members(target, changes)
+    changed = {f: v for f, v in fields.items() if getattr(target, f) != v}
+    if changed:
+        for f, v in changed.items():
+            setattr(target, f, v)
+        target.save(update_fields=[*changed, 'updated_at'])
+    export_cache.invalidate_layers([target.id])
+
+    members = {kind: (ours_members[kind] | added) - removed for kind, (added, removed) in changes.items()}
+    if base is not None and base.pk == ours.pk:
+        branch.head = theirs
+        branch.save(update_fields=['head'])
+        commit, status = theirs, 'fast-forward'
+    else:
+        commit = _commit(target, branch, fields, members, author, message or f"merge layer {source.id}",
+                         merge_parent=theirs)
+        status = 'merged'
+    for kind, (added, removed) in changes.items():
+        result[f'{kind}s_added'], result[f'{kind}s_removed'] = len(added), len(removed)
+    return {**result, 'status': status, 'commit': commit.commit_hash, 'fields': changed}
+
+
+def _map_layer_ids(map_obj):
+    return list(MapLayer.objects.filter(map=map_obj).order_by('id').values_list('layer_id', flat=True))
+
+
+@transaction.atomic
+def fork_map(map_obj, name, author=''):
+    """fork 出新 Map：其中每个 Layer 各自 fork，记录 fork 时的 layer 列表作为合并基准。返回新 Map。"""
+    layer_ids = _map_layer_ids(map_obj)
+    layers = Layer.objects.in_bulk(layer_ids)
+    fork = Map.objects.create(version_number=map_obj.version_number, author=author or map_obj.author,
+                              message=f"fork {name} of map {map_obj.id}")
+    forks = [fork_layer(layers[layer_id], name, author) for layer_id in layer_ids]
+    MapLayer.objects.bulk_create([MapLayer(map=fork, layer=layer) for layer in forks], batch_size=BRANCH_BATCH_SIZE)
+    MapBranch.objects.create(map=fork, name=name, origin=map_obj, base_layers=layer_ids)
+    return fork
+
+
+@transaction.atomic
+def merge_maps(target, source, author='', message='', strategy=None):
+    """
+    把 fork 出的 Map（source）合并回其来源 target：
+    - source 中由 target 的 Layer fork 出的分支逐个 merge_layers 回来源 Layer；
+    - source 中新增的 Layer 加入 target；fork 后在 source 中移除、target 中仍在的 Layer 从 target 移除；
+      target 在 fork 后移除的 Layer 保持移除。
+    返回 {'layers': {来源 layer_id: merge_layers 结果}, 'layer_ids': 合并后的 layer 列表, 'added', 'removed'}；
+    任一 Layer 冲突时整体回滚，MergeConflict 汇总全部冲突（各含 'layer'）。
+    """
+    branch = MapBranch.objects.filter(map=source).first()
+    if branch is None or branch.origin_id != target.id:
+        raise ValidationError(f"map {source.id} is not a fork of map {target.id}")
+    source_ids, target_ids = _map_layer_ids(source), _map_layer_ids(target)
+    origins = dict(LayerBranch.objects.filter(layer_id__in=source_ids).values_list('layer_id', 'origin_id'))
+    base, current = set(branch.base_layers), set(target_ids)
+    layers = Layer.objects.in_bulk(set(source_ids) | current)
+
+    results, conflicts, added = {}, [], []
+    for layer_id in source_ids:
+        origin = origins.get(layer_id)
+        if origin in current:
+            try:
+                results[origin] = merge_layers(layers[origin], layers[layer_id], author, message, strategy)
+            except MergeConflict as exc:
+                conflicts.extend({**c, 'layer': origin} for c in exc.conflicts)
+        elif origin not in base:
+            added.append(layer_id)
+    if conflicts:
+        raise MergeConflict(conflicts)
+
+    kept_origins = {origins.get(layer_id) for layer_id in source_ids}
+    removed = [layer_id for layer_id in target_ids if layer_id in base and layer_id not in kept_origins]
+    layer_ids = [layer_id for layer_id in target_ids if layer_id not in removed] + added
+    return {'layers': results, 'layer_ids': layer_ids, 'added': added, 'removed': removed}
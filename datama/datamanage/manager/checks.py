@@ -0,0 +1,37 @@
+# checks.py
+"""
+manager 应用的系统检查。
+
+导出缓存的失效代数与导入任务的逐批进度都保存在 Django 缓存中，多进程部署时必须是各 worker 共享的后端；
+LocMemCache 只在本进程内可见，因此在 manage.py check --deploy 时报告。
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def _is_process_local(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_BACKENDS
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    issues = []
+    export_alias = getattr(settings, 'EXPORT_CACHE_ALIAS', 'default')
+    if _is_process_local(export_alias):
+        issues.append(Error(
+            f"export cache '{export_alias}' uses a process-local backend",
+            hint="Invalidation only reaches the writing process; other workers keep serving stale exports "
+                 "and tiles. Configure a shared backend (Redis, Memcached, database) for EXPORT_CACHE_ALIAS.",
+            id='manager.E001',
+        ))
+    progress_alias = getattr(settings, 'IMPORT_PROGRESS_CACHE_ALIAS', 'default')
+    if _is_process_local(progress_alias):
+        issues.append(Warning(
+            f"import progress cache '{progress_alias}' uses a process-local backend",
+            hint="Polls served by other workers only see the job's stored progress. "
+                 "Configure a shared backend for IMPORT_PROGRESS_CACHE_ALIAS.",
+            id='manager.W001',
+        ))
+    return issues
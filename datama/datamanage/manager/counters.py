@@ -0,0 +1,176 @@
+# counters.py
+"""
+图层计数与成员摘要（LayerStats）的维护。
+
+- 逐行写入：signals 在 Node / IntraEdge 新增、删除或改换图层 / 成员时以 F() 原子增减，与写入处于同一事务；
+- 批量写入（bulk_create 不触发信号）：写入后调用 apply_instances()；
+- 某图层尚无计数行时不做增减，而是按实际行数补建（refresh），因此计数行可以延迟创建；
+- 全量或按图层校正：refresh()，对应管理命令 ensure_db_indexes --refresh-stats。
+
+成员摘要是成员（id 连同内容）的多重集加法哈希：每个成员的哈希值求和并模 DIGEST_MODULUS，与顺序无关，
+增删一行只需对摘要列做一次加减，与图层大小无关。manager.digests 以它计算图层内容哈希。
+成员内容：Node 为其 BaseNode 的字段；IntraEdge 为其 Edge 的端点与机理关系 id 及 BaseEdge 的字段。
+BaseNode / BaseEdge / Edge 逐行保存后（signals）按新旧内容之差调整包含它的各图层摘要（content_changed）；
+这些表的 QuerySet.update() 不触发信号，之后需 refresh() 校正。
+"""
+import hashlib
+import json
+from collections import Counter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, F
+
+from db.models import Layer, Node, IntraEdge, BaseNode, BaseEdge, Edge
+from .models import LayerStats
+
+STATS_BATCH_SIZE = 1000
+
+DIGEST_MODULUS = (1 << 61) - 1  # 两个摘要值之和仍在 64 位有符号整数范围内
+
+# 模型 -> (计数列, 摘要列, 成员 id 列)
+_COUNT_FIELDS = {Node: ('node_count', 'node_digest', 'base_node_id'),
+                 IntraEdge: ('edge_count', 'edge_digest', 'edge_id')}
+
+
+def _content_fields(model):
+    return tuple(f.name for f in model._meta.concrete_fields if not f.primary_key)
+
+
+# 成员模型 -> (内容来源模型, 成员到来源的关联名, 内容字段)；BaseEdge 的字段经 Edge.base_edge 读取
+_CONTENT = {
+    Node: (BaseNode, 'base_node', _content_fields(BaseNode)),
+    IntraEdge: (Edge, 'edge', ('source_node', 'destination_node', 'mechanism_relationship')
+                + tuple(f'base_edge__{name}' for name in _content_fields(BaseEdge))),
+}
+# 内容来源（逐行保存时调整摘要）-> 成员模型
+_MEMBER_OF = {BaseNode: Node, BaseEdge: IntraEdge, Edge: IntraEdge}
+
+
+def _content_key(path):
+    return path.rsplit('__', 1)[-1]
+
+
+def member_hash(table, member_id, content):
+    """
+    成员在摘要中的哈希值（0 <= h < DIGEST_MODULUS）：table 为成员表名（Node / IntraEdge），
+    content 为成员内容 {字段名: 值}（见 member_contents）。
+    """
+    raw = json.dumps([table, member_id, content], cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+    digest = hashlib.sha1(raw.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % DIGEST_MODULUS
+
+
+def member_contents(model, member_ids):
+    """Node / IntraEdge 的成员 id（base_node_id / edge_id）-> 成员内容 {字段名: 值}；来源行不存在的 id 不出现。"""
+    source, _, paths = _CONTENT[model]
+    ids = sorted(set(member_ids) - {None})
+    contents = {}
+    for start in range(0, len(ids), STATS_BATCH_SIZE):
+        rows = source.objects.filter(pk__in=ids[start:start + STATS_BATCH_SIZE]).values_list('pk', *paths)
+        contents.update((row[0], dict(zip(map(_content_key, paths), row[1:]))) for row in rows)
+    return contents
+
+
+def stored_content(sender, pk):
+    """BaseNode / BaseEdge / Edge 行当前作为图层成员的内容（保存前调用）；没有对应成员来源时为 None。"""
+    return member_contents(_MEMBER_OF[sender], [pk]).get(pk)
+
+
+def content_changed(sender, pk, before):
+    """
+    BaseNode / BaseEdge / Edge 行保存后调用：before 为保存前的 stored_content()，
+    内容有变化时按新旧哈希之差调整包含该成员的各图层摘要。
+    """
+    if before is None:
+        return
+    model = _MEMBER_OF[sender]
+    after = member_contents(model, [pk]).get(pk)
+    if after is None or after == before:
+        return
+    table = model._meta.db_table
+    delta = member_hash(table, pk, after) - member_hash(table, pk, before)
+    layers = Counter(model.objects.filter(**{_COUNT_FIELDS[model][2]: pk}).values_list('layer_id', flat=True))
+    if layers:
+        adjust(model, {}, {layer_id: delta * n for layer_id, n in layers.items()})
+
+
+def member_key(instance):
+    """Node / IntraEdge 实例的 (layer_id, 成员 id)，二者都不变时计数与摘要无需调整。"""
+    return instance.layer_id, getattr(instance, _COUNT_FIELDS[type(instance)][2])
+
+
+def adjust(model, deltas, digests=None):
+    """
+    将 {layer_id: 行数增量} 与 {layer_id: 摘要增量} 计入 model（Node / IntraEdge）对应的列；
+    没有计数行的图层按实际成员补建。
+    """
+    count_field, digest_field, _ = _COUNT_FIELDS[model]
+    digests = digests or {}
+    missing = []
+    with transaction.atomic():
+        for layer_id in deltas.keys() | digests.keys():
+            delta, digest = deltas.get(layer_id, 0), digests.get(layer_id, 0) % DIGEST_MODULUS
+            if (not delta and not digest) or layer_id is None:
+                continue
+            updated = LayerStats.objects.filter(layer_id=layer_id).update(**{
+                count_field: F(count_field) + delta,
+                digest_field: (F(digest_field) + digest) % DIGEST_MODULUS,
+            })
+            if not updated:
+                missing.append(layer_id)
+        if missing:
+            refresh(missing)
+
+
+def apply_instances(model, instances, sign=1):
+    """按 Node / IntraEdge 实例更新计数与摘要：sign=1 为新增（批量写入之后），sign=-1 为删除。"""
+    column = _COUNT_FIELDS[model][2]
+    instances = list(instances)
+    contents = member_contents(model, [getattr(obj, column) for obj in instances])
+    deltas, digests = Counter(), Counter()
+    for obj in instances:
+        member_id = getattr(obj, column)
+        deltas[obj.layer_id] += sign
+        digests[obj.layer_id] += sign * member_hash(model._meta.db_table, member_id, contents.get(member_id, {}))
+    adjust(model, deltas, digests)
+
+
+def _grouped(model, layer_ids):
+    rows = model.objects.all() if layer_ids is None else model.objects.filter(layer_id__in=layer_ids)
+    return dict(rows.values_list('layer_id').annotate(n=Count('pk')).order_by())
+
+
+def _digests(model, layer_ids):
+    _, _, column = _COUNT_FIELDS[model]
+    _, relation, paths = _CONTENT[model]
+    keys = [_content_key(path) for path in paths]
+    rows = model.objects.all() if layer_ids is None else model.objects.filter(layer_id__in=layer_ids)
+    rows = rows.values_list('layer_id', column, *(f'{relation}__{path}' for path in paths))
+    digests = Counter()
+    for layer_id, member_id, *content in rows.iterator(chunk_size=STATS_BATCH_SIZE):
+        digests[layer_id] += member_hash(model._meta.db_table, member_id, dict(zip(keys, content)))
+    return {layer_id: digest % DIGEST_MODULUS for layer_id, digest in digests.items()}
+
+
+def refresh(layer_ids=None):
+    """
+    按实际成员重建计数与摘要：layer_ids 为空时处理全部图层。计数为 Node、IntraEdge 各一次 GROUP BY，
+    摘要逐行读取成员 id 与内容计算；已有计数行批量更新，其余批量插入。返回处理的图层数。
+    """
+    scope = None if layer_ids is None else list(layer_ids)
+    layers = Layer.objects.all() if scope is None else Layer.objects.filter(pk__in=scope)
+    nodes, edges = _grouped(Node, scope), _grouped(IntraEdge, scope)
+    node_digests, edge_digests = _digests(Node, scope), _digests(IntraEdge, scope)
+    stats = [LayerStats(layer_id=i, node_count=nodes.get(i, 0), edge_count=edges.get(i, 0),
+                        node_digest=node_digests.get(i, 0), edge_digest=edge_digests.get(i, 0))
+             for i in layers.values_list('pk', flat=True)]
+    with transaction.atomic():
+        existing = LayerStats.objects.all() if scope is None else LayerStats.objects.filter(layer_id__in=scope)
+        existing = set(existing.values_list('layer_id', flat=True))
+        LayerStats.objects.bulk_update([s for s in stats if s.layer_id in existing],
+                                       ['node_count', 'edge_count', 'node_digest', 'edge_digest'],
+                                       batch_size=STATS_BATCH_SIZE)
+        LayerStats.objects.bulk_create([s for s in stats if s.layer_id not in existing],
+                                       batch_size=STATS_BATCH_SIZE)
+    return len(stats)
@@ -0,0 +1,89 @@
+# digests.py
+"""
+Layer / Map 的内容哈希（Merkle 式：成员摘要 -> Layer 哈希 -> Map 哈希）。
+
+- 成员摘要：LayerStats.node_digest / edge_digest，覆盖成员 id 及成员内容（BaseNode；Edge 与 BaseEdge），
+  由 manager.counters 随 Node / IntraEdge 的增删与成员内容的逐行保存增量维护；
+- Layer 哈希 = SHA-1(内容字段 + 两个成员摘要)；Map 哈希 = SHA-1(Map 内容字段 + 按关联顺序的 (layer_id, Layer 哈希))。
+  内容字段为除 id、版本号与时间戳以外的字段（含 author / message），因此哈希相同即版本快照除版本号外完全相同；
+- 写入版本时把哈希记在 LayerVersion.content_hash / MapArchive.content_hash，create_layer_version / create_map_version
+  与最新版本比较后跳过无变化的调用；导入比较导入前后的哈希，跳过内容相同的 Layer；
+- 最新版本的导出缓存以版本号 + 内容哈希为键，成员或成员内容变化即换键。
+
+没有 LayerStats 行的图层视为没有成员（计数行在首次增删成员时补建，counters.refresh 可全量校正）。
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+
+from db.models import Layer, MapLayer
+from .models import LayerVersion, MapArchive
+
+# 不参与内容哈希的字段：主键、版本号与时间戳
+VOLATILE_FIELDS = ('id', 'version_number', 'create_time', 'created_at', 'updated_at')
+
+LAYER_CONTENT_FIELDS = tuple(f.attname for f in Layer._meta.concrete_fields if f.name not in VOLATILE_FIELDS)
+_STATS_FIELDS = ('stats__node_digest', 'stats__edge_digest')
+
+
+def _sha1(obj):
+    return hashlib.sha1(json.dumps(obj, cls=DjangoJSONEncoder, sort_keys=True,
+                                   separators=(',', ':')).encode()).hexdigest()
+
+
+def content_fields(instance, message=None):
+    """实例的内容字段；message 非空时按即将写入的提交说明计算（与版本写入路径一致）。"""
+    fields = {f.attname: f.value_from_object(instance) for f in type(instance)._meta.concrete_fields
+              if f.name not in VOLATILE_FIELDS}
+    if message:
+        fields['message'] = message
+    return fields
+
+
+def _layer_hash(fields, node_digest, edge_digest):
+    return _sha1([fields, node_digest or 0, edge_digest or 0])
+
+
+def member_digests(layer_ids):
+    """{layer_id: (node_digest, edge_digest)}（一次查询）。"""
+    rows = Layer.objects.filter(pk__in=layer_ids).values_list('pk', *_STATS_FIELDS)
+    return {pk: (node, edge) for pk, node, edge in rows}
+
+
+def layer_hash(layer, message=None, digests=None):
+    """Layer 实例（可含未保存的修改）的内容哈希；digests 为 member_digests() 的结果，省略时查询一次。"""
+    node, edge = (digests if digests is not None else member_digests([layer.pk])).get(layer.pk, (0, 0))
+    return _layer_hash(content_fields(layer, message), node, edge)
+
+
+def stored_layer_hash(layer_id):
+    """数据库中 Layer 当前的 (version_number, 内容哈希)，一次查询；不存在时返回 None。"""
+    row = Layer.objects.filter(pk=layer_id).values(*LAYER_CONTENT_FIELDS, 'version_number', *_STATS_FIELDS).first()
+    if row is None:
+        return None
+    node, edge = row.pop(_STATS_FIELDS[0]), row.pop(_STATS_FIELDS[1])
+    return row.pop('version_number'), _layer_hash(row, node, edge)
+
+
+def map_hash(map_obj, message=None):
+    """Map 实例的内容哈希：Map 字段 + 按关联顺序的各 Layer 哈希（一次查询）。"""
+    rows = (MapLayer.objects.filter(map=map_obj).order_by('id')
+            .values_list('layer_id', *(f'layer__{f}' for f in LAYER_CONTENT_FIELDS),
+                         *(f'layer__{f}' for f in _STATS_FIELDS)))
+    n = len(LAYER_CONTENT_FIELDS)
+    layers = [[row[0], _layer_hash(dict(zip(LAYER_CONTENT_FIELDS, row[1:n + 1])), *row[n + 1:])] for row in rows]
+    return _sha1([content_fields(map_obj, message), layers])
+
+
+def versioned_layer_hashes(layer_ids):
+    """各 Layer 最新 LayerVersion 记录的内容哈希 {layer_id: hash}（一次查询；没有版本或旧版本无哈希时为 None / ''）。"""
+    latest = LayerVersion.objects.filter(layer_id=OuterRef('pk')).order_by('-version').values('content_hash')[:1]
+    return dict(Layer.objects.filter(pk__in=layer_ids).annotate(h=Subquery(latest)).values_list('pk', 'h'))
+
+
+def versioned_map_hash(map_id):
+    """Map 最新 MapArchive 记录的内容哈希。"""
+    return (MapArchive.objects.filter(map_id=map_id).order_by('-version_number')
+            .values_list('content_hash', flat=True).first())
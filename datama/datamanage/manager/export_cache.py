@@ -0,0 +1,97 @@
+# export_cache.py
+"""
+导出结果缓存（Django cache 框架，默认使用 settings.EXPORT_CACHE_ALIAS 对应的缓存）。
+
+缓存键 = 资源类型 + id + 版本号 + 导出参数 (+ 最新版本的失效代数)：
+- 固定版本（MapArchive 归档）不可变，键中不含代数，永不失效，仅由缓存后端按容量淘汰；
+- 最新版本的键含失效代数，create_map_version / create_layer_version 等写路径在事务提交后递增代数，
+  旧条目随即不可达并被 LRU 淘汰。
+每个条目附带内容哈希作为 ETag，用于 If-None-Match 条件请求；ETag 不含导出时间等易变键，相同数据重建后 ETag 不变。
+
+失效代数保存在缓存中，各进程必须共享同一缓存后端（Redis / Memcached 等）：LocMemCache 只在本进程内可见，
+其他 worker 会继续返回旧条目直到过期。manage.py check --deploy 对此报错（manager.checks）。
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from db.models import MapLayer
+
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+# 不参与 ETag 计算的顶层键
+VOLATILE_KEYS = ('exported_at',)
+
+
+def _cache():
+    return caches[getattr(settings, 'EXPORT_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'EXPORT_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _generation_key(kind, resource_id):
+    return f"export:gen:{kind}:{resource_id}"
+
+
+def _generation(kind, resource_id):
+    return _cache().get(_generation_key(kind, resource_id), 0)
+
+
+def _bump(kind, resource_ids):
+    cache = _cache()
+    for resource_id in resource_ids:
+        key = _generation_key(kind, resource_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def _entry_key(kind, resource_id, version, options, latest):
+    opts = ','.join(f"{k}={v}" for k, v in sorted(options.items()))
+    gen = f":g{_generation(kind, resource_id)}" if latest else ''
+    return f"export:{kind}:{resource_id}:v{version}{gen}:{opts}"
+
+
+def content_etag(payload):
+    if isinstance(payload, dict):
+        payload = {k: v for k, v in payload.items() if k not in VOLATILE_KEYS}
+    body = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True, ensure_ascii=False)
+    return '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"'
+
+
+def get_or_build(kind, resource_id, version, options, builder, latest=True):
+    """
+    返回 (etag, payload)。命中缓存时不调用 builder。
+    kind: 'map' / 'layer'；version: 当前或归档版本号；options: 影响导出内容的参数（如 depth）。
+    """
+    cache = _cache()
+    key = _entry_key(kind, resource_id, version, options, latest)
+    entry = cache.get(key)
+    if entry is None:
+        payload = builder()
+        entry = {'etag': content_etag(payload), 'payload': payload}
+        cache.set(key, entry, _timeout())
+    return entry['etag'], entry['payload']
+
+
+def invalidate_maps(map_ids):
+    """事务提交后使这些 Map 最新版本的导出缓存失效。"""
+    map_ids = list(map_ids)
+    transaction.on_commit(lambda: _bump('map', map_ids))
+
+
+def invalidate_layers(layer_ids):
+    """事务提交后使这些 Layer 及包含它们的 Map 的最新导出缓存失效。"""
+    layer_ids = list(layer_ids)
+
+    def bump():
+        _bump('layer', layer_ids)
+        _bump('map', set(MapLayer.objects.filter(layer_id__in=layer_ids).values_list('map_id', flat=True)))
+    transaction.on_commit(bump)
@@ -0,0 +1,250 @@
+# graph.py
+"""
+Map 级内存图引擎：将一个 Map 的全部 Layer（Node / IntraEdge -> Edge）以少量批量查询载入为 CSR 邻接数组，
+供跨层依赖分析使用。
+
+- 顶点为 BaseNode：同一 BaseNode 出现在多个 Layer 中即构成层间耦合点；
+- 有向边为 Edge（source_node -> destination_node），按 base_edge_id 去重（同一条边可被多个 Layer 引用）；
+- 正向（下游）与反向（上游）各一组 CSR：indptr[i]..indptr[i+1] 为顶点 i 的邻接区间，
+  数组均为 array('q')，百万条边约占十余 MB，遍历时不再访问数据库。
+"""
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+from django.core.exceptions import ObjectDoesNotExist
+
+from db.models import Map, MapLayer, Node, IntraEdge, TargetNode, Diagram
+
+GRAPH_LOAD_CHUNK_SIZE = 20000  # 游标每次读取的行数
+DIRECTIONS = ('out', 'in', 'both')
+
+
+def _csr(count, heads, tails):
+    """
+    按 heads 分组构造 CSR（计数排序，O(V + E)），返回 (indptr, indices, order)，
+    order[k] 为第 k 个邻接项对应的原始边序号。
+    """
+    degree = [0] * count
+    for h in heads:
+        degree[h] += 1
+    indptr = array('q', [0])
+    indptr.extend(accumulate(degree))
+    cursor = indptr.tolist()
+    order = [0] * len(heads)
+    for k, h in enumerate(heads):
+        order[cursor[h]] = k
+        cursor[h] += 1
+    indices = array('q', map(tails.__getitem__, order))
+    return indptr, indices, order
+
+
+class MapGraph:
+    """
+    一个 Map 的只读图快照。对外接口均使用 base_node_id，内部使用连续的顶点序号。
+    """
+
+    def __init__(self, node_ids, sources, destinations, edge_ids=None, node_layers=()):
+        """
+        node_ids: 顶点（base_node_id）序列，决定内部序号；
+        sources / destinations: 与边一一对应的顶点序号；
+        edge_ids: 与边一一对应的 base_edge_id（可选）；
+        node_layers: (顶点序号, layer_id) 对，描述顶点所属图层。
+        """
+        self.node_ids = array('q', node_ids)
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        count = len(self.node_ids)
+        self.out_ptr, self.out_idx, order = _csr(count, sources, destinations)
+        self.in_ptr, self.in_idx, _ = _csr(count, destinations, sources)
+        self.edge_ids = array('q', map(edge_ids.__getitem__, order)) if edge_ids is not None else None
+        pairs = list(node_layers)
+        self.layer_ptr, self.layer_idx, _ = _csr(count, [p[0] for p in pairs], [p[1] for p in pairs])
+
+    @property
+    def node_count(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.out_idx)
+
+    def _indexes(self, base_node_ids):
+        missing = [n for n in base_node_ids if n not in self.index]
+        if missing:
+            raise KeyError(f"BaseNode(s) not in graph: {missing[:10]}")
+        return list(dict.fromkeys(self.index[n] for n in base_node_ids))
+
+    def _adjacency(self, direction):
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {DIRECTIONS}")
+        if direction == 'out':
+            return [(self.out_ptr, self.out_idx)]
+        if direction == 'in':
+            return [(self.in_ptr, self.in_idx)]
+        return [(self.out_ptr, self.out_idx), (self.in_ptr, self.in_idx)]
+
+    def neighbors(self, base_node_id, direction='out'):
+        i = self.index[base_node_id]
+        return [self.node_ids[j] for ptr, idx in self._adjacency(direction) for j in idx[ptr[i]:ptr[i + 1]]]
+
+    def layers_of(self, base_node_id):
+        i = self.index[base_node_id]
+        return list(self.layer_idx[self.layer_ptr[i]:self.layer_ptr[i + 1]])
+
+    def _levels(self, starts, adjacency, max_depth=None):
+        """逐层 BFS，返回 (每个顶点的深度数组（未到达为 -1）, 按层的顶点序号列表)。"""
+        depth = array('q', [-1]) * self.node_count
+        for i in starts:
+            depth[i] = 0
+        levels = [list(starts)]
+        while levels[-1] and (max_depth is None or len(levels) <= max_depth):
+            frontier, d = [], len(levels)
+            for u in levels[-1]:
+                for ptr, idx in adjacency:
+                    for v in idx[ptr[u]:ptr[u + 1]]:
+                        if depth[v] < 0:
+                            depth[v] = d
+                            frontier.append(v)
+            levels.append(frontier)
+        if not levels[-1]:
+            levels.pop()
+        return depth, levels
+
+    def bfs(self, sources, direction='out', max_depth=None):
+        """
+        从 sources 出发的广度优先遍历，返回 [[第 0 层 base_node_id...], [第 1 层...], ...]。
+        direction: 'out' 沿边方向（下游）、'in' 逆边方向（上游）、'both' 忽略方向。
+        """
+        _, levels = self._levels(self._indexes(sources), self._adjacency(direction), max_depth)
+        return [[self.node_ids[i] for i in level] for level in levels]
+
+    def reachable(self, sources, direction='out', max_depth=None):
+        """返回从 sources 可达的 base_node_id 集合（含 sources 本身）。"""
+        return {node_id for level in self.bfs(sources, direction, max_depth) for node_id in level}
+
+    def component_labels(self):
+        """弱连通分量标号：返回与顶点序号对齐的 array，同一分量的顶点标号相同（0 起连续编号）。"""
+        labels = array('q', [-1]) * self.node_count
+        adjacency = self._adjacency('both')
+        label = 0
+        for start in range(self.node_count):
+            if labels[start] >= 0:
+                continue
+            labels[start] = label
+            stack = [start]
+            while stack:
+                u = stack.pop()
+                for ptr, idx in adjacency:
+                    for v in idx[ptr[u]:ptr[u + 1]]:
+                        if labels[v] < 0:
+                            labels[v] = label
+                            stack.append(v)
+            label += 1
+        return labels
+
+    def connected_components(self):
+        """弱连通分量，按规模从大到小返回 base_node_id 列表的列表。"""
+        groups = {}
+        for i, label in enumerate(self.component_labels()):
+            groups.setdefault(label, []).append(self.node_ids[i])
+        return sorted(groups.values(), key=len, reverse=True)
+
+    def cascade(self, seeds, threshold=1.0, max_steps=None):
+        """
+        级联失效传播：边 u -> v 表示 v 依赖 u 的供给。
+        seeds 在第 0 步失效；此后某顶点失效的上游边数占其入度的比例达到 threshold
+        （0 < threshold <= 1，1.0 即全部上游失效，取很小的值即任一上游失效）时，在下一步失效。
+        返回 [[第 0 步失效的 base_node_id...], [第 1 步...], ...]。
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        count = self.node_count
+        failed = bytearray(count)
+        lost = array('q', [0]) * count
+        in_ptr = self.in_ptr
+        start = self._indexes(seeds)
+        for i in start:
+            failed[i] = 1
+        steps = [start]
+        while steps[-1] and (max_steps is None or len(steps) <= max_steps):
+            frontier = []
+            for u in steps[-1]:
+                for v in self.out_idx[self.out_ptr[u]:self.out_ptr[u + 1]]:
+                    if failed[v]:
+                        continue
+                    lost[v] += 1
+                    if lost[v] >= threshold * (in_ptr[v + 1] - in_ptr[v]):
+                        failed[v] = 1
+                        frontier.append(v)
+            steps.append(frontier)
+        if not steps[-1]:
+            steps.pop()
+        return [[self.node_ids[i] for i in step] for step in steps]
+
+    def layer_impact(self, base_node_ids):
+        """统计一组顶点（如 cascade 结果）在各 Layer 中的数量：{layer_id: count}。"""
+        impact = Counter()
+        for node_id in base_node_ids:
+            impact.update(self.layers_of(node_id))
+        return dict(impact)
+
+
+def load_map_graph(map_id, chunk_size=GRAPH_LOAD_CHUNK_SIZE):
+    """
+    载入 Map 的全部 Layer 为 MapGraph：Node 一次查询、IntraEdge JOIN Edge 一次查询（游标分块读取），
+    总查询数固定，与图层、节点、边的数量无关。
+    边的端点即使不在任何 Layer 的 Node 中也会作为顶点加入。
+    """
+    if not Map.objects.filter(id=map_id).exists():
+        raise ObjectDoesNotExist(f"Map {map_id} not found")
+    layer_ids = MapLayer.objects.filter(map_id=map_id).values('layer_id')
+
+    index = {}
+    node_layers = []
+    rows = Node.objects.filter(layer__in=layer_ids).values_list('base_node_id', 'layer_id')
+    for base_node_id, layer_id in rows.iterator(chunk_size=chunk_size):
+        node_layers.append((index.setdefault(base_node_id, len(index)), layer_id))
+
+    seen = set()
+    edge_ids, sources, destinations = array('q'), array('q'), array('q')
+    rows = (IntraEdge.objects.filter(layer__in=layer_ids)
+            .values_list('edge_id', 'edge__source_node_id', 'edge__destination_node_id'))
+    for edge_id, source, destination in rows.iterator(chunk_size=chunk_size):
+        if edge_id in seen:
+            continue
+        seen.add(edge_id)
+        edge_ids.append(edge_id)
+        sources.append(index.setdefault(source, len(index)))
+        destinations.append(index.setdefault(destination, len(index)))
+
+    return MapGraph(index, sources, destinations, edge_ids=edge_ids, node_layers=node_layers)
+
+
+def target_node_ids(map_id, technique_id=None):
+    """
+    取级联分析的初始失效点：technique_id 指定时为该 Technique 的 TargetNode，
+    否则为该 Map 的 Diagram 所用 Technique 的全部 TargetNode；按 target_sequence 排序、去重。
+    """
+    if technique_id is not None:
+        targets = TargetNode.objects.filter(technique_id=technique_id)
+    else:
+        targets = TargetNode.objects.filter(technique__in=Diagram.objects.filter(map_id=map_id).values('technique_id'))
+    ids = targets.order_by('target_sequence', 'id').values_list('node_id', flat=True)
+    return list(dict.fromkeys(ids))
+
+
+def cascade_from_targets(map_id, technique_id=None, threshold=1.0, max_steps=None, graph=None):
+    """
+    以 TargetNode 为初始失效点在 Map 图上做级联传播。不在图中的目标节点被忽略。
+    返回 {'seeds', 'steps', 'failed_count', 'layer_impact'}。
+    """
+    graph = graph or load_map_graph(map_id)
+    seeds = [n for n in target_node_ids(map_id, technique_id) if n in graph.index]
+    steps = graph.cascade(seeds, threshold=threshold, max_steps=max_steps) if seeds else []
+    failed = [n for step in steps for n in step]
+    return {
+        'seeds': seeds,
+        'steps': steps,
+        'failed_count': len(failed),
+        'layer_impact': graph.layer_impact(failed),
+    }
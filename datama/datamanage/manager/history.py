@@ -0,0 +1,73 @@
+# history.py
+"""
+版本历史索引：MapArchive / LayerVersion 的元数据分页查询，快照正文按需单独读取。
+
+- 列表只取 version、author、message、created_at、size、summary 等元数据列，从不读取 snapshot / data；
+- 按版本号倒序、以游标分页（before=上一页最后一个版本号），每页是 (map, version_number) / (layer, version)
+  索引上的一次范围扫描，总数为同一索引上的 COUNT；
+- 正文：Map 由差量链重建（manager.archive.reconstruct_map_snapshot），Layer 直接取该版本的 data；
+- 分支提交（LayerCommit，见 manager.branches）同样只列元数据，以提交 id 为游标。
+"""
+from django.core.exceptions import ObjectDoesNotExist
+
+from .archive import reconstruct_map_snapshot
+from .models import MapArchive, LayerVersion, LayerCommit
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+MAP_VERSION_FIELDS = ('version_number', 'is_keyframe', 'author', 'message', 'created_at', 'size', 'summary')
+LAYER_VERSION_FIELDS = ('version', 'author', 'message', 'created_at', 'size', 'summary', 'user_id')
+LAYER_COMMIT_FIELDS = ('id', 'commit_hash', 'parent__commit_hash', 'merge_parent__commit_hash', 'content_hash',
+                       'fields', 'node_count', 'edge_count', 'author', 'message', 'created_at')
+
+
+def _page(queryset, key, fields, before=None, limit=HISTORY_PAGE_SIZE):
+    limit = max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+    page = queryset.order_by(f'-{key}')
+    if before is not None:
+        page = page.filter(**{f'{key}__lt': int(before)})
+    rows = list(page.values(*fields)[:limit + 1])
+    return {
+        'count': queryset.count(),
+        'results': rows[:limit],
+        'next_before': rows[limit - 1][key] if len(rows) > limit else None,
+    }
+
+
+def map_versions(map_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """Map 的归档版本元数据，按版本号倒序；返回 {'count', 'results', 'next_before'}。"""
+    return _page(MapArchive.objects.filter(map_id=map_id), 'version_number', MAP_VERSION_FIELDS, before, limit)
+
+
+def layer_versions(layer_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """Layer 的 LayerVersion 元数据，按版本号倒序；返回 {'count', 'results', 'next_before'}。"""
+    return _page(LayerVersion.objects.filter(layer_id=layer_id), 'version', LAYER_VERSION_FIELDS, before, limit)
+
+
+def layer_commits(layer_id, before=None, limit=HISTORY_PAGE_SIZE):
+    """在该 Layer 上创建的提交元数据（不含桶内容），按 id 倒序；返回 {'count', 'results', 'next_before'}。"""
+    return _page(LayerCommit.objects.filter(layer_id=layer_id), 'id', LAYER_COMMIT_FIELDS, before, limit)
+
+
+def recent_versions(map_before=None, layer_before=None, limit=HISTORY_PAGE_SIZE):
+    """全部 Map / Layer 最近的版本元数据（按主键倒序，两个列表各自以 id 为游标），用于总览。"""
+    return {
+        'map_versions': _page(MapArchive.objects.all(), 'id', ('id', 'map_id') + MAP_VERSION_FIELDS,
+                              map_before, limit),
+        'layer_versions': _page(LayerVersion.objects.all(), 'id', ('id', 'layer_id') + LAYER_VERSION_FIELDS,
+                                layer_before, limit),
+    }
+
+
+def map_version_body(map_id, version):
+    """Map 指定版本的完整快照（由差量链重建）。"""
+    return reconstruct_map_snapshot(map_id, version)
+
+
+def layer_version_body(layer_id, version):
+    """Layer 指定版本的快照数据。"""
+    data = LayerVersion.objects.filter(layer_id=layer_id, version=version).values_list('data', flat=True).first()
+    if data is None:
+        raise ObjectDoesNotExist(f"No LayerVersion for layer {layer_id} version {version}")
+    return data
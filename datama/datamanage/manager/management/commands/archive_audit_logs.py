@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from manager import audit
+
+
+class Command(BaseCommand):
+    help = "将早于最近 N 个月的审计日志按月压缩归档到 AuditArchive 并从 AuditLog 删除"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=getattr(settings, 'AUDIT_RETENTION_MONTHS', 6),
+                            help='保留的最近月份数（含当月）')
+
+    def handle(self, *args, **options):
+        cutoff = audit.month_start(max(options['keep_months'] - 1, 0))
+        self.stdout.write(f"{audit.archive_before(cutoff)} audit log entries archived (before {cutoff:%Y-%m-%d})")
@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from db.models import Map, Layer, MapLayer
+from manager import archive, services
+from manager.models import MapArchive
+
+
+class Command(BaseCommand):
+    help = "基准测试：MapArchive 完整快照 vs 差量链的存储量与重建耗时（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layers', type=int, default=500, help='map 中的 layer 数量')
+        parser.add_argument('--versions', type=int, default=50, help='创建的版本数')
+        parser.add_argument('--changes', type=int, default=5, help='每个版本修改的 layer 数')
+        parser.add_argument('--interval', type=int, default=10, help='关键帧间隔')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(MAP_ARCHIVE_KEYFRAME_INTERVAL=options['interval']):
+            self._run(options)
+            transaction.set_rollback(True)
+
+    def _run(self, options):
+        m = Map.objects.create(version_number=1, author='bench')
+        layers = Layer.objects.bulk_create(
+            [Layer(type='PowerLayer', author='bench', message='init') for _ in range(options['layers'])]
+        )
+        MapLayer.objects.bulk_create([MapLayer(map=m, layer=l) for l in layers])
+        services._archive_map_snapshot(m)
+
+        full_bytes = len(json.dumps(services.export_map(m.id)))
+        for v in range(options['versions'] - 1):
+            changed = layers[(v * options['changes']) % len(layers):][:options['changes']]
+            for l in changed:
+                l.message = f'v{v}'
+            Layer.objects.bulk_update(changed, ['message'])
+            services.create_map_version(m, change_message=f'v{v}')
+            full_bytes += len(json.dumps(services.export_map(m.id)))
+
+        delta_bytes = sum(len(json.dumps(s)) for s in MapArchive.objects.filter(map=m).values_list('snapshot', flat=True))
+        versions = list(MapArchive.objects.filter(map=m).values_list('version_number', flat=True))
+
+        start = time.perf_counter()
+        for v in versions:
+            archive.reconstruct_map_snapshot(m.id, v)
+        delta_time = (time.perf_counter() - start) / len(versions)
+
+        # 完整快照方案：每个版本读取一行完整快照（以关键帧行模拟）
+        keyframes = list(MapArchive.objects.filter(map=m, is_keyframe=True).values_list('version_number', flat=True))
+        start = time.perf_counter()
+        for i in range(len(versions)):
+            MapArchive.objects.get(map=m, version_number=keyframes[i % len(keyframes)]).snapshot
+        keyframe_time = (time.perf_counter() - start) / len(versions)
+
+        self.stdout.write(f"versions={len(versions)} layers={options['layers']} interval={options['interval']}")
+        self.stdout.write(f"storage  full={full_bytes:,} B  delta={delta_bytes:,} B  ratio={delta_bytes / full_bytes:.3f}")
+        self.stdout.write(f"read     full~{keyframe_time * 1000:.2f} ms/version  delta={delta_time * 1000:.2f} ms/version")
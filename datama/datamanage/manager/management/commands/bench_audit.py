@@ -0,0 +1,50 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from manager import audit
+from manager.models import AuditLog, AuditPayload
+
+
+class Command(BaseCommand):
+    help = ("基准测试：业务事务内逐条写入 AuditLog 与经 manager.audit 登记、提交后批量写入（含行外压缩）的耗时与存储体积"
+            "（事务内执行并回滚）")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=500)
+        parser.add_argument('--results', type=int, default=2000, help='每条 meta 中导入结果的条数')
+
+    def handle(self, *args, **options):
+        n = options['entries']
+        meta = {'results': {'created': [{'layer': i} for i in range(options['results'])], 'updated': [],
+                            'conflicts': [], 'errors': []},
+                'logs': {'message': 'bench', 'progress': {'stage': 'done'}}}
+        meta_bytes = len(json.dumps(meta, cls=DjangoJSONEncoder))
+        self.stdout.write(f"{n} entries, meta {meta_bytes / 1024:.1f} KB each")
+        with transaction.atomic():
+            start = time.perf_counter()
+            for i in range(n):
+                AuditLog.objects.create(action='IMPORT', resource_type='MAP', resource_id=i, meta=meta)
+            self._report('inline create (in txn)', time.perf_counter() - start, n)
+
+            entries = [AuditLog(action='IMPORT', resource_type='MAP', resource_id=i, meta=dict(meta)) for i in range(n)]
+            start = time.perf_counter()
+            for entry in entries:
+                audit.record_many([entry])
+            self._report('record (in txn)', time.perf_counter() - start, n)
+            start = time.perf_counter()
+            audit.write(entries)
+            self._report('batched write (after commit)', time.perf_counter() - start, n)
+
+            stored = sum(len(json.dumps(m)) for m in AuditLog.objects.filter(payload__isnull=False)
+                         .values_list('meta', flat=True))
+            compressed = sum(len(bytes(d)) for d in AuditPayload.objects.values_list('data', flat=True))
+            self.stdout.write(f"out-of-line: {stored / n:.0f} B inline meta + {compressed / n / 1024:.1f} KB "
+                              f"compressed payload per entry (was {meta_bytes / 1024:.1f} KB inline)")
+            transaction.set_rollback(True)
+
+    def _report(self, label, seconds, n):
+        self.stdout.write(f"{label:>30}: {seconds * 1000:9.2f} ms total, {seconds / n * 1e6:9.1f} us/entry")
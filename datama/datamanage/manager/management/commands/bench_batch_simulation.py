@@ -0,0 +1,66 @@
+import os
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from db.models import (
+    Map, Layer, MapLayer, BaseNode, Node, BaseEdge, Edge, IntraEdge, MechanismRelationship, Technique, TargetNode,
+    Configuration, Diagram,
+)
+from manager import simulation_batch
+
+
+class Command(BaseCommand):
+    help = "基准测试：Technique × Configuration 批量仿真在不同进程数下的吞吐（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=20000)
+        parser.add_argument('--degree', type=int, default=3)
+        parser.add_argument('--layers', type=int, default=4)
+        parser.add_argument('--techniques', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--threshold', type=float, default=0.3)
+        parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, 4, os.cpu_count() or 1}))
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"cpu_count={os.cpu_count()}")
+        baseline = None
+        for workers in options['workers']:
+            with transaction.atomic():
+                map_id = self._populate(options)
+                report = simulation_batch.run_batch(map_id, iterations=options['iterations'],
+                                                    threshold=options['threshold'], seed=0, workers=workers)
+                transaction.set_rollback(True)
+            rate = report['iterations_per_second']
+            baseline = baseline or rate
+            self.stdout.write(f"workers={workers:>2}: {len(report['scenarios'])} scenarios, "
+                              f"{report['iterations']} iterations in {report['seconds']:.3f} s, "
+                              f"{rate:.1f} it/s (speedup {rate / baseline:.2f}x)")
+
+    def _populate(self, options):
+        rng = random.Random(0)
+        node_count, layer_count = options['nodes'], options['layers']
+        m = Map.objects.create(author='bench')
+        layers = Layer.objects.bulk_create([Layer(type='PowerLayer', author='bench') for _ in range(layer_count)])
+        MapLayer.objects.bulk_create([MapLayer(map=m, layer=l) for l in layers])
+        configs = Configuration.objects.bulk_create([Configuration(layer=l) for l in layers])
+        base_nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(node_count)], batch_size=5000)
+        Node.objects.bulk_create([Node(layer=layers[i % layer_count], base_node=b) for i, b in enumerate(base_nodes)],
+                                 batch_size=5000)
+        mech = MechanismRelationship.objects.create(business='bench')
+        pairs = [(rng.randrange(node_count), rng.randrange(node_count)) for _ in range(node_count * options['degree'])]
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in pairs], batch_size=5000)
+        edges = Edge.objects.bulk_create(
+            [Edge(base_edge=be, source_node=base_nodes[s], destination_node=base_nodes[d], mechanism_relationship=mech)
+             for be, (s, d) in zip(base_edges, pairs)], batch_size=5000)
+        IntraEdge.objects.bulk_create([IntraEdge(layer=layers[s % layer_count], edge=e)
+                                       for e, (s, _) in zip(edges, pairs)], batch_size=5000)
+        techniques = Technique.objects.bulk_create([Technique(type='Random') for _ in range(options['techniques'])])
+        TargetNode.objects.bulk_create([
+            TargetNode(technique=t, node=base_nodes[i], target_sequence=k % 3, target_effect=0.5)
+            for t in techniques for k, i in enumerate(rng.sample(range(node_count), 40))
+        ])
+        # run_batch 缺省扫描该 Map 的 Diagram 所用 Technique
+        Diagram.objects.bulk_create([Diagram(map=m, configuration=configs[0], technique=t) for t in techniques])
+        return m.id
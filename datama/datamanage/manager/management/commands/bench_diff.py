@@ -0,0 +1,37 @@
+import json
+import time
+
+from deepdiff import DeepDiff
+from django.core.management.base import BaseCommand
+
+from manager.services import compute_diff_flat
+
+
+class Command(BaseCommand):
+    help = "微基准：compute_diff_flat 与 DeepDiff(ignore_order=True, verbose_level=2) + to_json 的耗时对比"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument('--fields', type=int, default=17, help='扁平字典字段数（BaseNode 为 17）')
+
+    def handle(self, *args, **options):
+        n, fields = options['iterations'], options['fields']
+        old = {f'field_{i}': f'value-{i}' for i in range(fields)}
+        old.update({'id': 1, 'version_number': 1, 'updated_at': '2025-01-01T00:00:00+00:00'})
+        new = dict(old, version_number=2, updated_at='2025-01-02T00:00:00+00:00', field_0='changed')
+
+        if compute_diff_flat(old, new) != json.loads(DeepDiff(old, new, ignore_order=True, verbose_level=2).to_json()):
+            raise RuntimeError('flat diff disagrees with DeepDiff')
+
+        start = time.perf_counter()
+        for _ in range(n):
+            compute_diff_flat(old, new)
+        flat = (time.perf_counter() - start) / n
+
+        start = time.perf_counter()
+        for _ in range(n // 20 or 1):
+            json.loads(DeepDiff(old, new, ignore_order=True, verbose_level=2).to_json())
+        deep = (time.perf_counter() - start) / (n // 20 or 1)
+
+        self.stdout.write(f"fields={len(old)}  flat={flat * 1e6:.1f} us/diff  deepdiff={deep * 1e6:.1f} us/diff  "
+                          f"speedup={deep / flat:.0f}x")
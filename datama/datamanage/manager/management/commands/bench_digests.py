@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from db.models import Map, Layer, MapLayer, BaseNode, Node
+from manager import counters, services
+from manager.models import LayerVersion, MapArchive
+
+
+class Command(BaseCommand):
+    help = ("基准测试：内容未变化时的版本调用与重复导入（manager.digests 短路）与强制写入的查询数、耗时与写入行数"
+            "（事务内执行并回滚）")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layers', type=int, default=200, help='map 中的 layer 数量')
+        parser.add_argument('--nodes', type=int, default=20000, help='每个 layer 的 Node 数量（只建在第一个 layer）')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            m = Map.objects.create(author='bench')
+            layers = Layer.objects.bulk_create([Layer(type='PowerLayer', author='bench')
+                                                for _ in range(options['layers'])])
+            MapLayer.objects.bulk_create([MapLayer(map=m, layer=l) for l in layers])
+            base_nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(options['nodes'])], batch_size=1000)
+            nodes = Node.objects.bulk_create([Node(layer=layers[0], base_node=b) for b in base_nodes], batch_size=1000)
+            self._measure('digest update (bulk)', lambda: counters.apply_instances(Node, nodes))
+            services.create_map_version(m, change_message='bench')
+            for layer in layers:
+                services.create_layer_version(layer, change_message='bench')
+
+            self._measure('map version (forced)', lambda: services.create_map_version(m, 'bench', 'bench', force=True))
+            self._measure('map version (no-op)', lambda: services.create_map_version(m, 'bench', 'bench'))
+            self._measure('layer version (forced)',
+                          lambda: services.create_layer_version(layers[0], 'bench', 'bench', force=True))
+            self._measure('layer version (no-op)', lambda: services.create_layer_version(layers[0], 'bench', 'bench'))
+
+            payload = {'import_type': 'MAP', 'message': 'bench', 'data': {
+                'map': {'id': m.id},
+                'layers': [{'id': l.id, 'type': l.type, 'author': l.author, 'version_number': l.version_number + 1}
+                           for l in Layer.objects.filter(pk__in=[l.pk for l in layers])]}}
+            res = self._measure('identical re-import', lambda: services.import_json_payload(payload))
+            self.stdout.write(f"re-import: {len(res['results']['unchanged'])} unchanged, "
+                              f"{len(res['results']['updated'])} updated; "
+                              f"{LayerVersion.objects.count()} LayerVersion / {MapArchive.objects.count()} MapArchive rows")
+            transaction.set_rollback(True)
+
+    def _measure(self, label, run):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:>24}: {len(queries):5d} queries, {elapsed * 1000:9.2f} ms")
+        return result
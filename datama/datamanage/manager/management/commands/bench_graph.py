@@ -0,0 +1,71 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from db.models import Map, Layer, MapLayer, BaseNode, Node, BaseEdge, Edge, IntraEdge, MechanismRelationship
+from manager import graph
+
+
+class Command(BaseCommand):
+    help = "基准测试：Map 图载入与 BFS / 连通分量 / 级联传播（事务内构造随机图并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--edges', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--layers', type=int, default=4)
+        parser.add_argument('--degree', type=int, default=4, help='平均出度，顶点数 = 边数 / 平均出度')
+        parser.add_argument('--memory-only', action='store_true',
+                            help='跳过数据库，直接由随机边数组构造 MapGraph')
+
+    def handle(self, *args, **options):
+        for edge_count in options['edges']:
+            node_count = max(2, edge_count // options['degree'])
+            rng = random.Random(edge_count)
+            pairs = [(rng.randrange(node_count), rng.randrange(node_count)) for _ in range(edge_count)]
+            if options['memory_only']:
+                start = time.perf_counter()
+                g = graph.MapGraph(range(node_count), [p[0] for p in pairs], [p[1] for p in pairs])
+                self._report(edge_count, None, time.perf_counter() - start, g)
+                continue
+            with transaction.atomic():
+                map_id = self._populate(node_count, pairs, options['layers'])
+                connection.queries_log.clear()  # 构造数据的查询不计入
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    g = graph.load_map_graph(map_id)
+                    elapsed = time.perf_counter() - start
+                self._report(edge_count, len(ctx.captured_queries), elapsed, g)
+                transaction.set_rollback(True)
+
+    def _populate(self, node_count, pairs, layer_count):
+        m = Map.objects.create(author='bench')
+        layers = Layer.objects.bulk_create([Layer(type='PowerLayer', author='bench') for _ in range(layer_count)])
+        MapLayer.objects.bulk_create([MapLayer(map=m, layer=l) for l in layers])
+        base_nodes = BaseNode.objects.bulk_create([BaseNode(base_node_name=f'n{i}') for i in range(node_count)],
+                                                  batch_size=5000)
+        Node.objects.bulk_create([Node(layer=layers[i % layer_count], base_node=b) for i, b in enumerate(base_nodes)],
+                                 batch_size=5000)
+        mech = MechanismRelationship.objects.create(business='bench')
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in pairs], batch_size=5000)
+        edges = Edge.objects.bulk_create(
+            [Edge(base_edge=be, source_node=base_nodes[s], destination_node=base_nodes[d], mechanism_relationship=mech)
+             for be, (s, d) in zip(base_edges, pairs)], batch_size=5000)
+        IntraEdge.objects.bulk_create([IntraEdge(layer=layers[s % layer_count], edge=e)
+                                       for e, (s, _) in zip(edges, pairs)], batch_size=5000)
+        return m.id
+
+    def _report(self, edge_count, queries, load_time, g):
+        seeds = list(g.node_ids[:10])
+        timings = []
+        for label, run, size in (
+            ('bfs', lambda: g.reachable(seeds), len),
+            ('components', g.connected_components, len),
+            ('cascade', lambda: g.cascade(seeds, threshold=0.25), lambda steps: sum(map(len, steps))),
+        ):
+            start = time.perf_counter()
+            result = run()
+            timings.append(f"{label} {time.perf_counter() - start:.3f} s [{size(result)}]")
+        source = f"load {load_time:.3f} s ({queries} queries)" if queries is not None else f"build {load_time:.3f} s"
+        self.stdout.write(f"{edge_count:>9} edges / {g.node_count:>8} nodes: {source}, " + ', '.join(timings))
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from db.models import Map, Layer, MapLayer
+from manager import history, services
+from manager.models import MapArchive
+from manager.serializers import MapArchiveSerializer
+
+
+class Command(BaseCommand):
+    help = "基准测试：带完整 snapshot 列出全部 MapArchive 与元数据分页（manager.history）的查询数与耗时（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layers', type=int, default=300, help='map 中的 layer 数量')
+        parser.add_argument('--versions', type=int, default=300)
+        parser.add_argument('--limit', type=int, default=50, help='每页版本数')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            m = Map.objects.create(version_number=1, author='bench')
+            layers = Layer.objects.bulk_create([Layer(type='PowerLayer', author='bench') for _ in range(options['layers'])])
+            MapLayer.objects.bulk_create([MapLayer(map=m, layer=l) for l in layers])
+            for v in range(options['versions']):
+                layers[v % len(layers)].message = f'v{v}'
+                layers[v % len(layers)].save(update_fields=['message'])
+                services.create_map_version(m, change_message=f'v{v}')
+            self.repeat = options['repeat']
+
+            self._measure('all archives + snapshot', lambda: MapArchiveSerializer(
+                MapArchive.objects.filter(map=m).order_by('version_number'), many=True).data)
+            self._measure('metadata first page', lambda: history.map_versions(m.id, limit=options['limit']))
+            middle = m.version_number // 2
+            self._measure('metadata middle page', lambda: history.map_versions(m.id, before=middle,
+                                                                                limit=options['limit']))
+            self._measure('one body (delta chain)', lambda: history.map_version_body(m.id, middle))
+            transaction.set_rollback(True)
+
+    def _measure(self, label, run):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            for _ in range(self.repeat):
+                run()
+            elapsed = (time.perf_counter() - start) / self.repeat
+        self.stdout.write(f"{label:>24}: {len(queries) // self.repeat:4d} queries, {elapsed * 1000:9.2f} ms")
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from db.models import Map, Layer, MapLayer
+from manager import services
+
+
+class Command(BaseCommand):
+    help = "基准测试：MAP 导入的每 Layer 查询数（在事务内执行并回滚，不落库）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                            help='每轮导入的 layer 数量')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'layers':>8} {'queries':>8} {'q/layer':>8} {'seconds':>8}")
+        for size in options['sizes']:
+            with transaction.atomic():
+                queries, elapsed = self._run(size)
+                transaction.set_rollback(True)
+            self.stdout.write(f"{size:>8} {queries:>8} {queries / size:>8.3f} {elapsed:>8.3f}")
+
+    def _run(self, size):
+        m = Map.objects.create(version_number=1, author='bench', message='bench')
+        # 一半为已存在的 layer（走更新 + 版本化），一半为新建
+        existing = Layer.objects.bulk_create(
+            [Layer(type='PowerLayer', version_number=1, author='bench') for _ in range(size // 2)]
+        )
+        MapLayer.objects.bulk_create([MapLayer(map=m, layer=l) for l in existing])
+        layers = [{'id': l.id, 'type': 'WaterLayer', 'version_number': 2} for l in existing]
+        layers += [{'type': 'PowerLayer', 'version_number': 1} for _ in range(size - len(existing))]
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': m.id, 'author': 'bench'}, 'layers': layers}}
+
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            res = services.import_json_payload(payload, performed_by='bench')
+            elapsed = time.perf_counter() - start
+        if res['status'] != 'SUCCESS':
+            raise RuntimeError(res)
+        return len(ctx.captured_queries), elapsed
@@ -0,0 +1,100 @@
+import random
+import time
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from db.models import (
+    Map, Layer, MapLayer, BaseNode, Node, BaseEdge, Edge, IntraEdge, MechanismRelationship, Configuration,
+)
+from manager import counters, graph, services
+from manager.models import LayerStats
+from manager.utils.db_indexes import INDEX_SPECS, ensure_indexes
+
+
+class Command(BaseCommand):
+    help = ("基准测试：去掉复合索引与图层计数 / 加上之后，图层导出、admin 列表页、图载入与邻接查询的查询数与耗时"
+            "（事务内执行并回滚；DDL 不可回滚的后端如 MySQL 上勿用）")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layers', type=int, default=100)
+        parser.add_argument('--nodes', type=int, default=1000, help='每个图层的节点数')
+        parser.add_argument('--degree', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        with transaction.atomic():
+            map_obj, layers = self._populate(options['layers'], options['nodes'], options['degree'])
+            probes = random.Random(1).sample(list(BaseNode.objects.values_list('pk', flat=True)), 1000)
+            for state in ('plain', 'tuned'):
+                if state == 'plain':
+                    self._drop_indexes()
+                    LayerStats.objects.all().delete()
+                else:
+                    ensure_indexes(connection.schema_editor())
+                    counters.refresh()
+                self.stdout.write(f"--- {state} ---")
+                self._measure('export_layer', lambda: services.export_layer(layers[0].id))
+                self._measure('load_map_graph', lambda: graph.load_map_graph(map_obj.id))
+                self._measure('out-neighbours x1000', lambda: list(
+                    Edge.objects.filter(source_node_id__in=probes).values_list('source_node_id', 'destination_node_id')))
+                self._measure('in-neighbours x1000', lambda: list(
+                    Edge.objects.filter(destination_node_id__in=probes).values_list('destination_node_id', 'source_node_id')))
+                self._measure('layers of nodes x1000', lambda: list(
+                    Node.objects.filter(base_node_id__in=probes).values_list('base_node_id', 'layer_id')))
+                for model in (Layer, Map, Configuration):
+                    self._measure(f'admin {model.__name__} list', lambda: self._changelist(model))
+            transaction.set_rollback(True)
+
+    def _measure(self, label, run):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            for _ in range(self.repeat):
+                run()
+            elapsed = (time.perf_counter() - start) / self.repeat
+        self.stdout.write(f"{label:>24}: {len(queries) // self.repeat:6d} queries, {elapsed * 1000:9.2f} ms")
+
+    def _changelist(self, model):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        admin.site._registry[model].changelist_view(request).render()
+
+    def _drop_indexes(self):
+        # 测试库中 unique_together 随建表创建无法单独删除，这里只去掉普通复合索引；
+        # 不进入 schema_editor 上下文（SQLite 不允许在事务中途关闭外键检查），只借用其 execute
+        schema_editor = connection.schema_editor()
+        for _, _, unique, name in INDEX_SPECS:
+            if not unique:
+                schema_editor.execute(f"DROP INDEX {schema_editor.quote_name(name)}")
+
+    def _populate(self, layer_count, per_layer, degree):
+        rng = random.Random(0)
+        self.user = User.objects.create_superuser('bench-indexes', password=None)
+        map_obj = Map.objects.create(author='bench')
+        layers = Layer.objects.bulk_create([Layer(type='PowerLayer') for _ in range(layer_count)])
+        MapLayer.objects.bulk_create([MapLayer(map=map_obj, layer=layer) for layer in layers])
+        Configuration.objects.bulk_create([Configuration(layer=layer) for layer in layers])
+        # 节点池为单层节点数的 5 倍，各图层抽样，节点可属于多个图层
+        pool = BaseNode.objects.bulk_create([BaseNode() for _ in range(per_layer * 5)], batch_size=5000)
+        mech = MechanismRelationship.objects.create()
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in range(len(pool) * degree)], batch_size=5000)
+        edges = Edge.objects.bulk_create(
+            [Edge(base_edge=be, source_node=pool[i % len(pool)], destination_node=rng.choice(pool),
+                  mechanism_relationship=mech) for i, be in enumerate(base_edges)], batch_size=5000)
+        nodes, intra_edges = [], []
+        for layer in layers:
+            nodes += [Node(layer=layer, base_node=b) for b in rng.sample(pool, per_layer)]
+            intra_edges += [IntraEdge(layer=layer, edge=e) for e in rng.sample(edges, per_layer * degree)]
+        Node.objects.bulk_create(nodes, batch_size=5000)
+        IntraEdge.objects.bulk_create(intra_edges, batch_size=5000)
+        return map_obj, layers
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from db.models import Layer, BaseNode, Node
+from manager import branches
+
+
+class Command(BaseCommand):
+    help = ("基准测试：fork 大图层、两侧各做少量修改后三方合并（manager.branches）与逐行全量比较成员的查询数与耗时"
+            "（事务内执行并回滚）")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=50000, help='图层中的 Node 数量')
+        parser.add_argument('--changes', type=int, default=20, help='每侧新增 / 删除的 Node 数量')
+
+    def handle(self, *args, **options):
+        n, changes = options['nodes'], options['changes']
+        with transaction.atomic():
+            base_nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(n + 2 * changes)],
+                                                      batch_size=branches.BRANCH_BATCH_SIZE)
+            layer = Layer.objects.create(type='PowerLayer', author='bench')
+            Node.objects.bulk_create([Node(layer=layer, base_node=b) for b in base_nodes[:n]],
+                                     batch_size=branches.BRANCH_BATCH_SIZE)
+            self._measure('commit (first)', lambda: branches.commit_layer(layer, 'bench'))
+            fork = self._measure('fork', lambda: branches.fork_layer(layer, 'bench', 'bench'))
+
+            for target, extra, drop in ((layer, base_nodes[n:n + changes], base_nodes[:changes]),
+                                        (fork, base_nodes[n + changes:], base_nodes[changes:2 * changes])):
+                Node.objects.bulk_create([Node(layer=target, base_node=b) for b in extra])
+                Node.objects.filter(layer=target, base_node__in=drop).delete()
+
+            self._measure('full member compare', lambda: (
+                branches.layer_members(layer.id)['node'] ^ branches.layer_members(fork.id)['node']))
+            result = self._measure('three-way merge', lambda: branches.merge_layers(layer, fork, 'bench'))
+            buckets = result['buckets']
+            self.stdout.write(f"status={result['status']} +{result['nodes_added']} -{result['nodes_removed']} nodes; "
+                              f"buckets skipped={buckets['skipped']} taken={buckets['taken']} "
+                              f"merged={buckets['merged']} (of {branches.TREE_BUCKETS} per kind)")
+            self._measure('merge again (no-op)', lambda: branches.merge_layers(layer, fork, 'bench'))
+            transaction.set_rollback(True)
+
+    def _measure(self, label, run):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:>22}: {len(queries):5d} queries, {elapsed * 1000:9.2f} ms")
+        return result
@@ -0,0 +1,79 @@
+import json
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from db.models import Record, Execution
+from manager import record_store
+
+
+class Command(BaseCommand):
+    help = "基准测试：逐迭代 × 逐节点仿真数据写入 Record.record_data(JSON) 与列式存储的写入、体积与切片读取（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=20000)
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--failed-ratio', type=float, default=0.3)
+        parser.add_argument('--query-nodes', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        n, iterations = options['nodes'], options['iterations']
+        node_ids = np.arange(1, n + 1, dtype=np.int64) * 7
+        steps = np.where(rng.random((iterations, n)) < options['failed_ratio'],
+                         rng.integers(0, 30, (iterations, n)), -1).astype(np.int8)
+        query = np.sort(rng.choice(node_ids, options['query_nodes'], replace=False))
+        lo, hi = iterations // 4, iterations * 3 // 4
+        self.stdout.write(f"{iterations} iterations x {n} nodes; query {len(query)} nodes over iterations [{lo}, {hi})")
+
+        with transaction.atomic():
+            self._json(node_ids, steps, query, lo, hi)
+            transaction.set_rollback(True)
+        with tempfile.TemporaryDirectory() as root, override_settings(RECORD_STORE_ROOT=root):
+            for fmt in record_store.FORMATS:
+                self._columnar(fmt, node_ids, steps, query, lo, hi)
+
+    def _report(self, label, write, size, read):
+        self.stdout.write(f"{label:>14}: write {write:7.3f} s, {size / 2 ** 20:8.2f} MB, slice read {read * 1000:9.2f} ms")
+
+    def _json(self, node_ids, steps, query, lo, hi):
+        start = time.perf_counter()
+        size = 0
+        for first in range(0, len(steps), 500):
+            records = []
+            for i, row in enumerate(steps[first:first + 500], first):
+                hit = np.flatnonzero(row >= 0)
+                data = {'iteration': i, 'fail_step': dict(zip(map(str, node_ids[hit].tolist()), row[hit].tolist()))}
+                size += len(json.dumps(data))
+                records.append(Record(record_data=data))
+            Record.objects.bulk_create(records, batch_size=500)
+            Execution.objects.bulk_create([Execution(iteration=r.record_data['iteration'], record=r) for r in records],
+                                          batch_size=500)
+        write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        keys = [str(k) for k in query.tolist()]
+        rows = Record.objects.filter(executions__iteration__gte=lo, executions__iteration__lt=hi) \
+            .order_by('executions__iteration').values_list('record_data', flat=True)
+        result = np.array([[data['fail_step'].get(k, -1) for k in keys] for data in rows], dtype=np.int8)
+        read = time.perf_counter() - start
+        assert result.shape == (hi - lo, len(query))
+        self._report('JSONField', write, size, read)
+
+    def _columnar(self, fmt, node_ids, steps, query, lo, hi):
+        start = time.perf_counter()
+        writer = record_store.ColumnarWriter(node_ids, np.int8, fmt=fmt)
+        for first in range(0, len(steps), 500):
+            writer.append(steps[first:first + 500])
+        manifest = writer.finish()
+        write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = record_store.open_record(manifest).read(query, start=lo, stop=hi)
+        read = time.perf_counter() - start
+        np.testing.assert_array_equal(result, steps[lo:hi][:, np.searchsorted(node_ids, query)])
+        self._report(f'columnar {fmt}', write, record_store.disk_usage(manifest), read)
@@ -0,0 +1,53 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from db.models import BaseNode
+from manager import rollups
+
+
+class Command(BaseCommand):
+    help = "基准测试：对节点表实时 GROUP BY 与读取 RegionRollup 汇总的耗时，以及全量重建与单行维护开销（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=200000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        provinces = [f'省{i}' for i in range(30)]
+        cities = [f'市{i}' for i in range(15)]
+        repeat = options['repeat']
+        with transaction.atomic():
+            BaseNode.objects.bulk_create([
+                BaseNode(nation='中国', province=rng.choice(provinces), city=rng.choice(cities),
+                         district=f'区{rng.randrange(8)}', cis_type=rng.choice(['001', '002', '003', '004']),
+                         sub_type=rng.choice(['2-1Gen', '2-2Trans', '1-1Terminal']))
+                for _ in range(options['nodes'])], batch_size=5000)
+            start = time.perf_counter()
+            rows = rollups.refresh_rollups()
+            self.stdout.write(f"refresh_rollups: {rows} rows in {time.perf_counter() - start:.2f} s")
+
+            for label, run in [
+                ('live GROUP BY', lambda: list(BaseNode.objects.filter(nation='中国').values('province', 'cis_type')
+                                               .annotate(n=Count('id')).order_by('province'))),
+                ('rollup', lambda: rollups.region_counts('province', nation='中国', by=['cis_type'])),
+                ('live city', lambda: list(BaseNode.objects.filter(nation='中国', province='省3')
+                                           .values('city').annotate(n=Count('id')).order_by('city'))),
+                ('rollup city', lambda: rollups.region_counts('city', nation='中国', province='省3')),
+            ]:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    run()
+                self.stdout.write(f"{label:>14}: {(time.perf_counter() - start) / repeat * 1000:8.2f} ms/query")
+
+            node = BaseNode.objects.first()
+            start = time.perf_counter()
+            for i in range(repeat):
+                node.city = cities[i % len(cities)]
+                node.save()
+            self.stdout.write(f"BaseNode.save with rollup upkeep: {(time.perf_counter() - start) / repeat * 1000:.2f} ms")
+            transaction.set_rollback(True)
@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from db.models import Layer, BaseNode, Node, BaseEdge, Edge, IntraEdge, MechanismRelationship
+from manager import services
+
+
+def _legacy_serialize_instance(obj):
+    # 预编译之前的实现，仅作对比基线
+    data = {}
+    for field in obj._meta.fields:
+        name = field.name
+        value = getattr(obj, name)
+        if field.is_relation and value is not None:
+            data[name] = getattr(value, 'pk', value)
+        else:
+            data[name] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return data
+
+
+class Command(BaseCommand):
+    help = "基准测试：大图层导出时 _serialize_instance 的逐行开销（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=100000)
+        parser.add_argument('--edges', type=int, default=2000,
+                            help='层内边数量（旧实现每条边会额外触发外键查询，默认取较小值）')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._run(options['nodes'], options['edges'])
+            transaction.set_rollback(True)
+
+    def _run(self, count, edge_count):
+        layer = Layer.objects.create(type='PowerLayer', author='bench')
+        base_nodes = BaseNode.objects.bulk_create(
+            [BaseNode(base_node_name=f'n{i}', cis_type='002', sub_type='2-1Gen', attribute={'i': i})
+             for i in range(count)], batch_size=5000)
+        Node.objects.bulk_create([Node(layer=layer, base_node=b) for b in base_nodes], batch_size=5000)
+
+        mech = MechanismRelationship.objects.create(business='bench')
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge(base_edge_name=f'e{i}') for i in range(edge_count)],
+                                                  batch_size=5000)
+        edges = Edge.objects.bulk_create(
+            [Edge(base_edge=be, source_node=base_nodes[i], destination_node=base_nodes[i + 1],
+                  mechanism_relationship=mech) for i, be in enumerate(base_edges)], batch_size=5000)
+        IntraEdge.objects.bulk_create([IntraEdge(layer=layer, edge=e) for e in edges], batch_size=5000)
+
+        node_rows = list(layer.nodes.select_related('base_node'))
+        edge_rows = list(layer.intra_edges.select_related('edge__base_edge'))
+        for label, serialize in (('legacy', _legacy_serialize_instance), ('compiled', services._serialize_instance)):
+            start = time.perf_counter()
+            for n in node_rows:
+                serialize(n)
+                serialize(n.base_node)
+            node_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for ie in edge_rows:
+                serialize(ie)
+                serialize(ie.edge)
+                serialize(ie.edge.base_edge)
+            edge_time = time.perf_counter() - start
+            self.stdout.write(f"{label:>9}: nodes {node_time:.3f} s ({node_time / count * 1e6:.2f} us/node)  "
+                              f"intra-edges {edge_time:.3f} s ({edge_time / max(edge_count, 1) * 1e6:.2f} us/edge)")
+
+        start = time.perf_counter()
+        services.export_layer(layer.id)
+        self.stdout.write(f"export_layer({count} nodes): {time.perf_counter() - start:.3f} s")
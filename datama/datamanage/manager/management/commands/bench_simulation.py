@@ -0,0 +1,74 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from db.models import (
+    Map, Layer, MapLayer, BaseNode, Node, BaseEdge, Edge, IntraEdge, MechanismRelationship, Technique, TargetNode,
+)
+from manager import graph, simulation
+
+
+class Command(BaseCommand):
+    help = "基准测试：向量化级联仿真 vs 逐迭代 Python 循环，以及含落库的 run_simulation（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--degree', type=int, default=3)
+        parser.add_argument('--targets', type=int, default=20)
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--threshold', type=float, default=0.5,
+                            help='较小的阈值使级联波及更大范围')
+
+    def handle(self, *args, **options):
+        for node_count in options['nodes']:
+            rng = random.Random(node_count)
+            pairs = [(rng.randrange(node_count), rng.randrange(node_count))
+                     for _ in range(node_count * options['degree'])]
+            targets = rng.sample(range(node_count), min(options['targets'], node_count))
+            self._kernel(node_count, pairs, targets, options['iterations'], options['threshold'])
+            with transaction.atomic():
+                self._end_to_end(node_count, pairs, targets, options['iterations'], options['threshold'])
+                transaction.set_rollback(True)
+
+    def _kernel(self, node_count, pairs, targets, iterations, threshold):
+        map_graph = graph.MapGraph(range(node_count), [p[0] for p in pairs], [p[1] for p in pairs])
+        sim_graph = simulation.SimulationGraph(map_graph)
+        waves = [(np.array(targets), np.full(len(targets), 0.5))]
+
+        # 基线：每次迭代抽样目标后用 MapGraph.cascade 逐顶点传播
+        py_rng = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            seeds = [t for t in targets if py_rng.random() < 0.5]
+            if seeds:
+                map_graph.cascade(seeds, threshold=threshold)
+        loop_rate = iterations / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        simulation.simulate_batch(sim_graph, waves, iterations, np.random.default_rng(0), threshold=threshold)
+        vector_rate = iterations / (time.perf_counter() - start)
+        self.stdout.write(f"{node_count:>7} nodes / {len(pairs):>7} edges: python loop {loop_rate:>9.1f} it/s, "
+                          f"vectorized {vector_rate:>9.1f} it/s ({vector_rate / loop_rate:.1f}x)")
+
+    def _end_to_end(self, node_count, pairs, targets, iterations, threshold):
+        m = Map.objects.create(author='bench')
+        layer = Layer.objects.create(type='PowerLayer', author='bench')
+        MapLayer.objects.create(map=m, layer=layer)
+        base_nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(node_count)], batch_size=5000)
+        Node.objects.bulk_create([Node(layer=layer, base_node=b) for b in base_nodes], batch_size=5000)
+        mech = MechanismRelationship.objects.create(business='bench')
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in pairs], batch_size=5000)
+        edges = Edge.objects.bulk_create(
+            [Edge(base_edge=be, source_node=base_nodes[s], destination_node=base_nodes[d], mechanism_relationship=mech)
+             for be, (s, d) in zip(base_edges, pairs)], batch_size=5000)
+        IntraEdge.objects.bulk_create([IntraEdge(layer=layer, edge=e) for e in edges], batch_size=5000)
+        technique = Technique.objects.create(type='Random')
+        TargetNode.objects.bulk_create([TargetNode(technique=technique, node=base_nodes[t], target_effect=0.5)
+                                        for t in targets])
+
+        result = simulation.run_simulation(m.id, technique.id, iterations=iterations, threshold=threshold, seed=0)
+        self.stdout.write(f"{'':>7} run_simulation with Record/Execution writes: {result['seconds']:.3f} s, "
+                          f"{result['iterations_per_second']:.1f} it/s, mean failed {result['summary']['mean_failed']}")
@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from db.models import BaseNode
+from manager import spatial
+
+
+class Command(BaseCommand):
+    help = "基准测试：逐行解析 geo_location 扫描与空间索引的视口 / 半径 / 最近邻查询（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=200000)
+        parser.add_argument('--queries', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            start = time.perf_counter()
+            BaseNode.objects.bulk_create(
+                [BaseNode(geo_location=f'{rng.uniform(73, 135):.6f},{rng.uniform(18, 53):.6f}')
+                 for _ in range(options['nodes'])], batch_size=5000)
+            self.stdout.write(f"{options['nodes']} nodes inserted in {time.perf_counter() - start:.2f} s")
+            start = time.perf_counter()
+            spatial.index_objects(BaseNode)
+            self.stdout.write(f"index built in {time.perf_counter() - start:.2f} s")
+
+            boxes = []
+            for _ in range(options['queries']):
+                lat, lng = rng.uniform(20, 50), rng.uniform(75, 130)
+                boxes.append((lat, lng, lat + 0.5, lng + 0.8))
+
+            start = time.perf_counter()
+            scanned = [self._scan(box) for box in boxes[:3]]
+            scan = (time.perf_counter() - start) / 3
+            start = time.perf_counter()
+            indexed = [set(spatial.in_bbox(BaseNode, *box).values_list('pk', flat=True)) for box in boxes]
+            bbox = (time.perf_counter() - start) / len(boxes)
+            assert scanned == indexed[:3]
+            self.stdout.write(f"bbox: scan {scan * 1000:9.2f} ms/query, index {bbox * 1000:7.2f} ms/query "
+                              f"({sum(map(len, indexed)) / len(indexed):.0f} hits)")
+
+            start = time.perf_counter()
+            for lat, lng, _, _ in boxes:
+                spatial.within_radius(BaseNode, lat, lng, 20000)
+            self.stdout.write(f"radius 20 km: {(time.perf_counter() - start) / len(boxes) * 1000:7.2f} ms/query")
+            start = time.perf_counter()
+            for lat, lng, _, _ in boxes:
+                spatial.nearest(BaseNode, lat, lng, k=10)
+            self.stdout.write(f"nearest 10: {(time.perf_counter() - start) / len(boxes) * 1000:7.2f} ms/query")
+            transaction.set_rollback(True)
+
+    def _scan(self, box):
+        min_lat, min_lng, max_lat, max_lng = box
+        hits = set()
+        for pk, text in BaseNode.objects.values_list('pk', 'geo_location').iterator(5000):
+            points = spatial.parse_points(text)
+            if points and min_lat <= points[0][1] <= max_lat and min_lng <= points[0][0] <= max_lng:
+                hits.add(pk)
+        return hits
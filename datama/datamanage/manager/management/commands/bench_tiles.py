@@ -0,0 +1,61 @@
+import json
+import math
+import random
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from db.models import Layer, BaseNode, Node, BaseEdge, Edge, IntraEdge, MechanismRelationship
+from manager import services, spatial
+
+
+class Command(BaseCommand):
+    help = "基准测试：整层导出与瓦片接口（聚合 / 逐要素、缓存未命中 / 命中）的耗时与响应体积（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=50000)
+        parser.add_argument('--degree', type=int, default=2)
+        parser.add_argument('--zooms', type=int, nargs='+', default=[6, 10, 14])
+
+    def handle(self, *args, **options):
+        caches['exports'].clear()
+        with transaction.atomic():
+            layer = self._populate(options['nodes'], options['degree'])
+            start = time.perf_counter()
+            payload = services.export_layer(layer.id)
+            self._report('export_layer', time.perf_counter() - start, payload)
+            for z in options['zooms']:
+                n = 2 ** z
+                x = int((116.4 + 180.0) / 360.0 * n)
+                y = int((1 - math.asinh(math.tan(math.radians(39.9))) / math.pi) / 2 * n)
+                start = time.perf_counter()
+                _, payload = services.cached_layer_tile(layer.id, z, x, y)
+                self._report(f'tile z={z} miss', time.perf_counter() - start, payload)
+                start = time.perf_counter()
+                services.cached_layer_tile(layer.id, z, x, y)
+                self._report(f'tile z={z} hit', time.perf_counter() - start, payload)
+            transaction.set_rollback(True)
+
+    def _report(self, label, seconds, payload):
+        size = len(json.dumps(payload, cls=DjangoJSONEncoder))
+        features = len(payload.get('nodes', payload.get('clusters', [])))
+        self.stdout.write(f"{label:>16}: {seconds * 1000:9.2f} ms, {size / 1024:9.1f} KB, {features} nodes/clusters")
+
+    def _populate(self, count, degree):
+        rng = random.Random(0)
+        layer = Layer.objects.create(type='PowerLayer')
+        nodes = BaseNode.objects.bulk_create(
+            [BaseNode(geo_location=f'{rng.gauss(116.4, 1.0):.6f},{rng.gauss(39.9, 0.8):.6f}') for _ in range(count)],
+            batch_size=5000)
+        spatial.index_objects(BaseNode, [b.id for b in nodes])
+        Node.objects.bulk_create([Node(layer=layer, base_node=b) for b in nodes], batch_size=5000)
+        mech = MechanismRelationship.objects.create()
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in range(count * degree)], batch_size=5000)
+        edges = Edge.objects.bulk_create(
+            [Edge(base_edge=be, source_node=nodes[i % count], destination_node=rng.choice(nodes),
+                  mechanism_relationship=mech) for i, be in enumerate(base_edges)], batch_size=5000)
+        IntraEdge.objects.bulk_create([IntraEdge(layer=layer, edge=e) for e in edges], batch_size=5000)
+        return layer
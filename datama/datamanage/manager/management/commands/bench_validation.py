@@ -0,0 +1,52 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from db.models import BaseNode, Technique, TargetNode, Record, Execution
+from db.validation import validate_batch
+
+
+class Command(BaseCommand):
+    help = "基准测试：逐行 full_clean() 与 validate_batch() 校验 TargetNode / Execution 批次的查询数与耗时（事务内执行并回滚）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 5000])
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            with transaction.atomic():
+                batch = self._populate(rows)
+                self._report(f"{rows} rows per-row", lambda: self._per_row(batch))
+                self._report(f"{rows} rows batch", lambda: validate_batch(batch))
+                transaction.set_rollback(True)
+
+    def _per_row(self, batch):
+        errors = {}
+        for index, obj in enumerate(batch):
+            try:
+                obj.full_clean(validate_unique=False)
+            except ValidationError as exc:
+                errors[index] = exc.message_dict
+        return errors
+
+    def _report(self, label, run):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            errors = run()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:>22}: {len(queries):6d} queries, {elapsed:8.3f} s, {len(errors)} invalid")
+
+    def _populate(self, rows):
+        nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(rows)], batch_size=1000)
+        technique = Technique.objects.create(type='Random')
+        records = Record.objects.bulk_create([Record(record_data={}) for _ in range(rows)], batch_size=1000)
+        return ([TargetNode(technique=technique, node=n, target_sequence=0) for n in nodes]
+                + [Execution(iteration=i, record=r) for i, r in enumerate(records)])
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from db.models import Layer
+from manager import services, versioning
+
+
+class Command(BaseCommand):
+    help = ("基准测试：compare-and-swap 推进版本（manager.versioning）与 select_for_update + save() 的查询数与耗时，"
+            "以及批量导入中条件 bulk_update 的开销（事务内执行并回滚）")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layers', type=int, default=500, help='layer 数量')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            layers = Layer.objects.bulk_create([Layer(type='PowerLayer', author='bench')
+                                                for _ in range(options['layers'])])
+
+            def locked_save():
+                for layer in layers:
+                    locked = Layer.objects.select_for_update().get(pk=layer.pk)
+                    locked.version_number += 1
+                    locked.save()
+
+            def swap():
+                for layer in Layer.objects.filter(pk__in=[l.pk for l in layers]):
+                    expected = layer.version_number
+                    layer.version_number += 1
+                    versioning.compare_and_swap(layer, expected)
+
+            self._measure('lock + save()', locked_save)
+            self._measure('compare-and-swap', swap)
+
+            current = list(Layer.objects.filter(pk__in=[l.pk for l in layers]))
+            expected = {layer.pk: layer.version_number for layer in current}
+            for layer in current:
+                layer.version_number += 1
+            self._measure('bulk_update', lambda: Layer.objects.bulk_update(
+                current, ['version_number'], batch_size=services.IMPORT_BATCH_SIZE))
+            for layer in current:
+                expected[layer.pk] += 1
+                layer.version_number += 1
+            self._measure('bulk compare-and-swap', lambda: versioning.bulk_compare_and_swap(
+                current, ['version_number'], expected, batch_size=services.IMPORT_BATCH_SIZE))
+            transaction.set_rollback(True)
+
+    def _measure(self, label, run):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            start = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{label:>22}: {len(queries):5d} queries, {elapsed * 1000:9.2f} ms")
+        return result
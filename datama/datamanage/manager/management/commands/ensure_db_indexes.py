@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from manager import counters
+from manager.utils.db_indexes import DuplicateRows, ensure_indexes
+
+
+class Command(BaseCommand):
+    help = "补建 Node / IntraEdge / Map_Layer / Edge 缺失的唯一约束与复合索引（重新执行外部 SQL 建表后使用），可选重建图层计数"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh-stats', action='store_true', help='同时按实际行数重建 LayerStats')
+        parser.add_argument('--deduplicate', action='store_true',
+                            help='补建唯一索引前删除重复行（每组保留最小 id），逐行输出被删除的行；缺省时有重复行即报错退出')
+
+    def handle(self, *args, **options):
+        try:
+            with connection.schema_editor() as schema_editor:
+                created = ensure_indexes(schema_editor, deduplicate=options['deduplicate'], log=self.stdout.write)
+        except DuplicateRows as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"created indexes: {', '.join(created) or 'none'}")
+        if options['refresh_stats']:
+            self.stdout.write(f"{counters.refresh()} layer stats rows refreshed")
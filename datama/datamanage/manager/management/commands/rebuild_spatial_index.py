@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from db.models import BaseNode, BaseEdge
+from manager import spatial
+
+
+class Command(BaseCommand):
+    help = "由 geo_location / location 重建 BaseNode、BaseEdge 的空间索引（初次建索引或批量导入后使用）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=['nodes', 'edges'])
+        parser.add_argument('--chunk-size', type=int, default=spatial.SPATIAL_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        for name, model in (('nodes', BaseNode), ('edges', BaseEdge)):
+            if options['only'] not in (None, name):
+                continue
+            with transaction.atomic():
+                written = spatial.index_objects(model, chunk_size=options['chunk_size'])
+            self.stdout.write(f"{name}: {written} indexed of {model.objects.count()}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from manager import services
+
+
+class Command(BaseCommand):
+    help = ("恢复工作进程重启后中断的导入任务：长时间仍为 RUNNING 的标记为 FAILED，仍为 PENDING 的重新执行"
+            "（部署 / 重启后执行）")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help='超过多少秒视为中断（默认 settings.IMPORT_JOB_STALE_SECONDS）')
+
+    def handle(self, *args, **options):
+        failed, requeued = services.recover_import_jobs(options['stale_after'])
+        self.stdout.write(f"{len(failed)} stale running jobs marked failed, {len(requeued)} pending jobs requeued")
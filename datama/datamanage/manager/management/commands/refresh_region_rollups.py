@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from manager import rollups
+
+
+class Command(BaseCommand):
+    help = "由 BaseNode / Node 全量重建行政区划汇总表 RegionRollup（初次建表或校正使用）"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{rollups.refresh_rollups()} rollup rows written")
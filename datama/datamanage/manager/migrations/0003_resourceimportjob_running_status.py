@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0002_mapversionsnapshot_layerversion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='resourceimportjob',
+            name='status',
+            field=models.CharField(choices=[('PENDING', '待处理'), ('RUNNING', '执行中'), ('SUCCESS', '成功'), ('FAILED', '失败')], default='PENDING', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0003_resourceimportjob_running_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='maparchive',
+            name='base_version',
+            field=models.PositiveIntegerField(blank=True, help_text='补丁所基于的归档版本号', null=True),
+        ),
+        migrations.AddField(
+            model_name='maparchive',
+            name='is_keyframe',
+            field=models.BooleanField(default=True, help_text='是否为完整快照（关键帧）'),
+        ),
+        migrations.AlterField(
+            model_name='maparchive',
+            name='snapshot',
+            field=models.JSONField(help_text='关键帧为导出的 Map 完整 JSON（包含 layers），否则为相对 base_version 的补丁'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__first__'),
+        ('manager', '0004_maparchive_delta_chain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BaseEdgeGeo',
+            fields=[
+                ('min_lat', models.FloatField()),
+                ('min_lng', models.FloatField()),
+                ('max_lat', models.FloatField()),
+                ('max_lng', models.FloatField()),
+                ('cell', models.CharField(blank=True, db_index=True, help_text='包含外包矩形的最小 geohash 单元', max_length=12)),
+                ('base_edge', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='geo', serialize=False, to='db.baseedge')),
+            ],
+            options={
+                'verbose_name': '边空间索引',
+                'verbose_name_plural': '边空间索引',
+                'db_table': 'BaseEdgeGeo',
+            },
+        ),
+        migrations.CreateModel(
+            name='BaseNodeGeo',
+            fields=[
+                ('min_lat', models.FloatField()),
+                ('min_lng', models.FloatField()),
+                ('max_lat', models.FloatField()),
+                ('max_lng', models.FloatField()),
+                ('cell', models.CharField(blank=True, db_index=True, help_text='包含外包矩形的最小 geohash 单元', max_length=12)),
+                ('base_node', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='geo', serialize=False, to='db.basenode')),
+            ],
+            options={
+                'verbose_name': '节点空间索引',
+                'verbose_name_plural': '节点空间索引',
+                'db_table': 'BaseNodeGeo',
+            },
+        ),
+    ]
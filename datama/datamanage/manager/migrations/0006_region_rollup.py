@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__first__'),
+        ('manager', '0005_geo_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField()),
+                ('nation', models.CharField(blank=True, default='', max_length=50)),
+                ('province', models.CharField(blank=True, default='', max_length=50)),
+                ('city', models.CharField(blank=True, default='', max_length=50)),
+                ('district', models.CharField(blank=True, default='', max_length=50)),
+                ('street', models.CharField(blank=True, default='', max_length=50)),
+                ('cis_type', models.CharField(blank=True, default='', max_length=3)),
+                ('sub_type', models.CharField(blank=True, default='', max_length=15)),
+                ('count', models.IntegerField(default=0)),
+                ('layer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='region_rollups', to='db.layer')),
+            ],
+            options={
+                'verbose_name': '行政区划汇总',
+                'verbose_name_plural': '行政区划汇总',
+                'db_table': 'RegionRollup',
+                'unique_together': {('level', 'nation', 'province', 'city', 'district', 'street', 'cis_type', 'sub_type', 'layer')},
+            },
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+# 以下索引规格与检查复制自本迁移编写时的 manager.utils.db_indexes，迁移不引用随后续版本变化的业务代码；
+# 迁移只补建、从不删除数据（去重见管理命令 ensure_db_indexes --deduplicate）
+INDEX_SPECS = [
+    ('Node', ('layer_id', 'base_node_id'), True, 'node_layer_basenode_uniq'),
+    ('Node', ('base_node_id', 'layer_id'), False, 'node_basenode_layer_idx'),
+    ('IntraEdge', ('layer_id', 'edge_id'), True, 'intraedge_layer_edge_uniq'),
+    ('IntraEdge', ('edge_id', 'layer_id'), False, 'intraedge_edge_layer_idx'),
+    ('Map_Layer', ('map_id', 'layer_id'), True, 'maplayer_map_layer_uniq'),
+    ('Map_Layer', ('layer_id', 'map_id'), False, 'maplayer_layer_map_idx'),
+    ('Edge', ('source_node_id', 'destination_node_id'), False, 'edge_src_dst_idx'),
+    ('Edge', ('destination_node_id', 'source_node_id'), False, 'edge_dst_src_idx'),
+]
+MAX_REPORTED_GROUPS = 20
+
+
+def _covered(constraints, columns, unique):
+    for info in constraints.values():
+        existing = info['columns'] or []
+        if unique:
+            if info['unique'] and set(existing) == set(columns):
+                return True
+        elif (info['index'] or info['unique']) and tuple(existing[:len(columns)]) == tuple(columns):
+            return True
+    return False
+
+
+def add_db_indexes(apps, schema_editor):
+    # db 应用的表由外部 SQL 建立，这里补建模型声明但库中缺失的唯一约束与复合索引。
+    # 迁移不删除数据：存在重复行时列出重复组并中止，需先人工处理或执行 manage.py ensure_db_indexes --deduplicate
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+        missing = [(table, columns, unique, name) for table, columns, unique, name in INDEX_SPECS
+                   if table in tables
+                   and not _covered(connection.introspection.get_constraints(cursor, table), columns, unique)]
+        report = []
+        for table, columns, unique, name in missing:
+            if not unique:
+                continue
+            cols = ', '.join(quote(c) for c in columns)
+            cursor.execute(f"SELECT {cols}, COUNT(*) FROM {quote(table)} GROUP BY {cols} "
+                           f"HAVING COUNT(*) > 1 ORDER BY {cols}")
+            rows = cursor.fetchmany(MAX_REPORTED_GROUPS + 1)
+            if rows:
+                report.append(f"{table} ({', '.join(columns)}):")
+                report += [f"    {tuple(row[:-1])} x{row[-1]}" for row in rows[:MAX_REPORTED_GROUPS]]
+                if len(rows) > MAX_REPORTED_GROUPS:
+                    report.append("    ...")
+        if report:
+            raise RuntimeError(
+                "cannot create unique indexes, duplicate rows found:\n" + "\n".join(report) +
+                "\nresolve them by hand, or run `manage.py ensure_db_indexes --deduplicate` "
+                "to delete all but the lowest id of each group"
+            )
+        for table, columns, unique, name in missing:
+            schema_editor.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX {quote(name)} ON {quote(table)} "
+                f"({', '.join(quote(c) for c in columns)})"
+            )
+
+
+def populate_layer_stats(apps, schema_editor):
+    # db 应用没有迁移，历史状态中的模型不含字段，直接按表名 GROUP BY；按 Layer 分段计数，内存占用与表大小无关
+    quote = schema_editor.quote_name
+    connection = schema_editor.connection
+    LayerStats = apps.get_model('manager', 'LayerStats')
+
+    def grouped(cursor, table, layer_ids):
+        placeholders = ', '.join(['%s'] * len(layer_ids))
+        cursor.execute(f"SELECT {quote('layer_id')}, COUNT(*) FROM {quote(table)} "
+                       f"WHERE {quote('layer_id')} IN ({placeholders}) GROUP BY {quote('layer_id')}", layer_ids)
+        return dict(cursor.fetchall())
+
+    last = None
+    while True:
+        # 按主键分页（而非单个游标 fetchmany：MySQL / PostgreSQL 的默认游标会在客户端缓冲全部结果）
+        with connection.cursor() as cursor:
+            after = '' if last is None else f"WHERE {quote('id')} > %s "
+            cursor.execute(f"SELECT {quote('id')} FROM {quote('Layer')} {after}ORDER BY {quote('id')} "
+                           f"LIMIT {CHUNK_SIZE}", [] if last is None else [last])
+            layer_ids = [row[0] for row in cursor.fetchall()]
+            if not layer_ids:
+                return
+            nodes, edges = grouped(cursor, 'Node', layer_ids), grouped(cursor, 'IntraEdge', layer_ids)
+        LayerStats.objects.bulk_create(
+            [LayerStats(layer_id=i, node_count=nodes.get(i, 0), edge_count=edges.get(i, 0)) for i in layer_ids]
+        )
+        last = layer_ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__first__'),
+        ('manager', '0006_region_rollup'),
+    ]
+
+    operations = [
+        # 先补建索引：因重复行中止时尚未建表，处理后可直接重新执行迁移
+        migrations.RunPython(add_db_indexes, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='LayerStats',
+            fields=[
+                ('layer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='db.layer')),
+                ('node_count', models.PositiveIntegerField(default=0)),
+                ('edge_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': '图层计数',
+                'verbose_name_plural': '图层计数',
+                'db_table': 'LayerStats',
+            },
+        ),
+        migrations.RunPython(populate_layer_stats, migrations.RunPython.noop),
+    ]
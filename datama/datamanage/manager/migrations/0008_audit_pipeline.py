@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0007_layer_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, help_text='所属月份（当月 1 日）')),
+                ('first_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': '审计日志归档',
+                'verbose_name_plural': '审计日志归档',
+                'db_table': 'AuditArchive',
+                'ordering': ['month', 'first_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuditPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(help_text='压缩前的 JSON 字节数')),
+            ],
+            options={
+                'verbose_name': '审计日志内容',
+                'verbose_name_plural': '审计日志内容',
+                'db_table': 'AuditPayload',
+            },
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='auditlog',
+            name='payload',
+            field=models.ForeignKey(blank=True, help_text='行外存储的大体量 meta 内容', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs', to='manager.auditpayload'),
+        ),
+    ]
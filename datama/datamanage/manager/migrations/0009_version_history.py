@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:46
+
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+# 以下两个函数复制自本迁移编写时的 manager.archive，迁移不引用随后续版本变化的业务代码
+def stored_size(data):
+    return len(json.dumps(data, cls=DjangoJSONEncoder).encode())
+
+
+def summarize(archive):
+    if archive.is_keyframe:
+        return {'keyframe': True, 'layers': len(archive.snapshot.get('layers', []))}
+    map_patch, layers_patch = archive.snapshot.get('map', {}), archive.snapshot.get('layers', {})
+    return {
+        'map': sorted(list(map_patch.get('set', {})) + list(map_patch.get('unset', []))),
+        'layers_added': len(layers_patch.get('added', [])),
+        'layers_removed': len(layers_patch.get('removed', [])),
+        'layers_changed': len(layers_patch.get('changed', {})),
+    }
+
+
+def backfill_version_metadata(apps, schema_editor):
+    MapArchive = apps.get_model('manager', 'MapArchive')
+    LayerVersion = apps.get_model('manager', 'LayerVersion')
+
+    batch = []
+    for archive in MapArchive.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        archive.size, archive.summary = stored_size(archive.snapshot), summarize(archive)
+        batch.append(archive)
+        if len(batch) >= BATCH_SIZE:
+            MapArchive.objects.bulk_update(batch, ['size', 'summary'])
+            batch = []
+    MapArchive.objects.bulk_update(batch, ['size', 'summary'])
+
+    # 变更字段相对同一 Layer 的上一版本计算
+    batch, previous = [], (None, {})
+    for version in LayerVersion.objects.order_by('layer_id', 'version').iterator(chunk_size=BATCH_SIZE):
+        data = version.data or {}
+        old = previous[1] if previous[0] == version.layer_id else {}
+        version.author = (data.get('author') or '')[:50]
+        version.message = data.get('message') or ''
+        version.size = stored_size(data)
+        version.summary = {'fields': sorted(k for k in data.keys() | old.keys() if old.get(k) != data.get(k))}
+        previous = (version.layer_id, data)
+        batch.append(version)
+        if len(batch) >= BATCH_SIZE:
+            LayerVersion.objects.bulk_update(batch, ['author', 'message', 'size', 'summary'])
+            batch = []
+    LayerVersion.objects.bulk_update(batch, ['author', 'message', 'size', 'summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__first__'),
+        ('manager', '0008_audit_pipeline'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layerversion',
+            name='author',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='layerversion',
+            name='message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='layerversion',
+            name='size',
+            field=models.PositiveIntegerField(default=0, help_text='data 序列化后的字节数'),
+        ),
+        migrations.AddField(
+            model_name='layerversion',
+            name='summary',
+            field=models.JSONField(blank=True, default=dict, help_text='相对上一版本变更的字段'),
+        ),
+        migrations.AddField(
+            model_name='maparchive',
+            name='size',
+            field=models.PositiveIntegerField(default=0, help_text='snapshot 序列化后的字节数'),
+        ),
+        migrations.AddField(
+            model_name='maparchive',
+            name='summary',
+            field=models.JSONField(blank=True, default=dict, help_text='变更摘要（见 manager.archive.summarize）'),
+        ),
+        migrations.AddIndex(
+            model_name='layerversion',
+            index=models.Index(fields=['layer', 'version', 'size', 'created_at'], name='layerversion_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maparchive',
+            index=models.Index(fields=['map', 'version_number', 'is_keyframe', 'size', 'created_at'], name='maparchive_history_idx'),
+        ),
+        migrations.RunPython(backfill_version_metadata, migrations.RunPython.noop),
+    ]
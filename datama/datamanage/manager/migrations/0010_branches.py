@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('db', '__first__'),
+        ('manager', '0009_version_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreeBucket',
+            fields=[
+                ('hash', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('ids', models.JSONField(help_text='升序 id 列表')),
+            ],
+            options={
+                'verbose_name': '提交树桶',
+                'verbose_name_plural': '提交树桶',
+                'db_table': 'TreeBucket',
+            },
+        ),
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('EXPORT', '导出'), ('IMPORT', '导入'), ('VERSION', '版本变更'), ('ROLLBACK', '回滚'), ('FORK', '分支'), ('MERGE', '合并')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='LayerCommit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('commit_hash', models.CharField(max_length=40, unique=True)),
+                ('content_hash', models.CharField(db_index=True, help_text='内容树根哈希', max_length=40)),
+                ('fields', models.JSONField(default=dict, help_text='Layer 内容字段')),
+                ('node_buckets', models.JSONField(default=dict, help_text='{桶号: TreeBucket 哈希}，只含非空桶')),
+                ('edge_buckets', models.JSONField(default=dict)),
+                ('node_count', models.PositiveIntegerField(default=0)),
+                ('edge_count', models.PositiveIntegerField(default=0)),
+                ('author', models.CharField(blank=True, max_length=50)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('layer', models.ForeignKey(help_text='提交所在的 Layer（分支）', on_delete=django.db.models.deletion.CASCADE, related_name='commits', to='db.layer')),
+                ('merge_parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='merge_children', to='manager.layercommit')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='manager.layercommit')),
+            ],
+            options={
+                'verbose_name': 'Layer 提交',
+                'verbose_name_plural': 'Layer 提交',
+                'db_table': 'LayerCommit',
+            },
+        ),
+        migrations.CreateModel(
+            name='LayerBranch',
+            fields=[
+                ('layer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='branch', serialize=False, to='db.layer')),
+                ('name', models.CharField(default='main', max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('origin', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='forks', to='db.layer')),
+                ('head', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='manager.layercommit')),
+            ],
+            options={
+                'verbose_name': 'Layer 分支',
+                'verbose_name_plural': 'Layer 分支',
+                'db_table': 'LayerBranch',
+            },
+        ),
+        migrations.CreateModel(
+            name='MapBranch',
+            fields=[
+                ('map', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='branch', serialize=False, to='db.map')),
+                ('name', models.CharField(max_length=50)),
+                ('base_layers', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('origin', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='forks', to='db.map')),
+            ],
+            options={
+                'verbose_name': 'Map 分支',
+                'verbose_name_plural': 'Map 分支',
+                'db_table': 'MapBranch',
+            },
+        ),
+    ]
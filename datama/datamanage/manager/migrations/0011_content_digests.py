@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:57
+
+import hashlib
+from collections import Counter
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+# 以下摘要算法复制自本迁移编写时的 manager.counters，迁移不引用随后续版本变化的业务代码
+DIGEST_MODULUS = (1 << 61) - 1
+
+
+def member_hash(table, member_id):
+    digest = hashlib.sha1(f"{table}:{member_id}".encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % DIGEST_MODULUS
+
+
+def populate_member_digests(apps, schema_editor):
+    # db 应用没有迁移，历史状态中的模型不含字段，直接按表名读取成员 id；
+    # 按主键分页读取成员行（内存只保留每个图层的累加值，与成员表大小无关）
+    quote = schema_editor.quote_name
+    LayerStats = apps.get_model('manager', 'LayerStats')
+    digests = {}
+    for table, column in (('Node', 'base_node_id'), ('IntraEdge', 'edge_id')):
+        sums, last = Counter(), 0
+        while True:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(f"SELECT {quote('id')}, {quote('layer_id')}, {quote(column)} FROM {quote(table)} "
+                               f"WHERE {quote('id')} > %s ORDER BY {quote('id')} LIMIT {CHUNK_SIZE}", [last])
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            for _, layer_id, member_id in rows:
+                sums[layer_id] += member_hash(table, member_id)
+            last = rows[-1][0]
+        digests[table] = sums
+    batch = []
+    for row in LayerStats.objects.order_by('pk').iterator(chunk_size=CHUNK_SIZE):
+        row.node_digest = digests['Node'].get(row.layer_id, 0) % DIGEST_MODULUS
+        row.edge_digest = digests['IntraEdge'].get(row.layer_id, 0) % DIGEST_MODULUS
+        batch.append(row)
+        if len(batch) >= CHUNK_SIZE:
+            LayerStats.objects.bulk_update(batch, ['node_digest', 'edge_digest'])
+            batch = []
+    LayerStats.objects.bulk_update(batch, ['node_digest', 'edge_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0010_branches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layerstats',
+            name='edge_digest',
+            field=models.BigIntegerField(default=0, help_text='edge_id 多重集加法哈希'),
+        ),
+        migrations.AddField(
+            model_name='layerstats',
+            name='node_digest',
+            field=models.BigIntegerField(default=0, help_text='base_node_id 多重集加法哈希'),
+        ),
+        migrations.AddField(
+            model_name='layerversion',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='该版本的 Layer 内容哈希（见 manager.digests）', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='maparchive',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='归档时的 Map 内容哈希（见 manager.digests）', max_length=40),
+        ),
+        migrations.RunPython(populate_member_digests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0012_auditlog_event_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resourceimportjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, help_text='认领执行（RUNNING）的时刻', null=True),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:36
+
+import hashlib
+import json
+from collections import Counter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+# 以下摘要算法与成员内容字段复制自本迁移编写时的 manager.counters，迁移不引用随后续版本变化的业务代码
+DIGEST_MODULUS = (1 << 61) - 1
+
+BASE_FIELDS = ('geo_location', 'nation', 'province', 'city', 'district', 'street', 'no', 'location', 'attribute')
+BASE_NODE_FIELDS = ('base_node_name', 'base_node_desc', *BASE_FIELDS,
+                    'cis_type', 'sub_type', 'model_name', 'coverage', 'owner')
+BASE_EDGE_FIELDS = ('base_edge_name', 'base_edge_desc', *BASE_FIELDS)
+EDGE_FIELDS = ('source_node', 'destination_node', 'mechanism_relationship')
+
+
+def member_hash(table, member_id, content):
+    raw = json.dumps([table, member_id, content], cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+    return int.from_bytes(hashlib.sha1(raw.encode()).digest()[:8], 'big') % DIGEST_MODULUS
+
+
+def _content(keys, values):
+    # attribute 为 JSON 列，原始 SQL 读出的是文本，按 JSONField 的读取结果解析
+    content = dict(zip(keys, values))
+    if isinstance(content['attribute'], str):
+        content['attribute'] = json.loads(content['attribute'])
+    return content
+
+
+def populate_member_content_digests(apps, schema_editor):
+    # 成员摘要改为覆盖成员内容后重算；db 应用没有迁移，按表名连接读取，按成员主键分页
+    q = schema_editor.quote_name
+    LayerStats = apps.get_model('manager', 'LayerStats')
+    node_sql = (f"SELECT m.{q('id')}, m.{q('layer_id')}, m.{q('base_node_id')}, "
+                + ', '.join(f"b.{q(f)}" for f in BASE_NODE_FIELDS) +
+                f" FROM {q('Node')} m INNER JOIN {q('BaseNode')} b ON b.{q('id')} = m.{q('base_node_id')}")
+    edge_sql = (f"SELECT m.{q('id')}, m.{q('layer_id')}, m.{q('edge_id')}, "
+                + ', '.join(f"e.{q(f + '_id')}" for f in EDGE_FIELDS) + ', '
+                + ', '.join(f"b.{q(f)}" for f in BASE_EDGE_FIELDS) +
+                f" FROM {q('IntraEdge')} m INNER JOIN {q('Edge')} e ON e.{q('base_edge_id')} = m.{q('edge_id')}"
+                f" INNER JOIN {q('BaseEdge')} b ON b.{q('id')} = e.{q('base_edge_id')}")
+    digests = {}
+    for table, sql, keys in (('Node', node_sql, BASE_NODE_FIELDS),
+                             ('IntraEdge', edge_sql, EDGE_FIELDS + BASE_EDGE_FIELDS)):
+        sums, last = Counter(), 0
+        while True:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(f"{sql} WHERE m.{q('id')} > %s ORDER BY m.{q('id')} LIMIT {CHUNK_SIZE}", [last])
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            for _, layer_id, member_id, *values in rows:
+                sums[layer_id] += member_hash(table, member_id, _content(keys, values))
+            last = rows[-1][0]
+        digests[table] = sums
+    batch = []
+    for row in LayerStats.objects.order_by('pk').iterator(chunk_size=CHUNK_SIZE):
+        row.node_digest = digests['Node'].get(row.layer_id, 0) % DIGEST_MODULUS
+        row.edge_digest = digests['IntraEdge'].get(row.layer_id, 0) % DIGEST_MODULUS
+        batch.append(row)
+        if len(batch) >= CHUNK_SIZE:
+            LayerStats.objects.bulk_update(batch, ['node_digest', 'edge_digest'])
+            batch = []
+    LayerStats.objects.bulk_update(batch, ['node_digest', 'edge_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0013_import_job_started_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='layerstats',
+            name='edge_digest',
+            field=models.BigIntegerField(default=0, help_text='成员 Edge / BaseEdge（id 与内容）多重集加法哈希'),
+        ),
+        migrations.AlterField(
+            model_name='layerstats',
+            name='node_digest',
+            field=models.BigIntegerField(default=0, help_text='成员 BaseNode（id 与内容）多重集加法哈希'),
+        ),
+        migrations.RunPython(populate_member_content_digests, migrations.RunPython.noop),
+    ]
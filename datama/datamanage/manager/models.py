@@ -1,4 +1,7 @@
 # models.py (新增/变更片段)
+import json
+import zlib
+
 from django.conf import settings
 from django.db import models
 from db.models import Map, Layer
@@ -10,13 +13,19 @@ from django.contrib.auth.models import User
 # === 新增：地图归档表（保存完整 JSON 快照） ===
 class MapArchive(models.Model):
     """
-    保存 Map 的固定版本快照（完整 JSON），用于精确回滚。
+    保存 Map 的固定版本快照，用于精确回滚。
+    以差量链存储：关键帧存完整 JSON，其余版本存补丁，由 manager.archive 重建。
     """
     map = models.ForeignKey('db.Map', on_delete=models.CASCADE, related_name='archives')
     version_number = models.PositiveIntegerField(help_text='该快照对应的 Map 版本号')
-    snapshot = models.JSONField(help_text='导出的 Map 完整 JSON（包含 layers）')
+    snapshot = models.JSONField(help_text='关键帧为导出的 Map 完整 JSON（包含 layers），否则为相对 base_version 的补丁')
+    is_keyframe = models.BooleanField(default=True, help_text='是否为完整快照（关键帧）')
+    base_version = models.PositiveIntegerField(null=True, blank=True, help_text='补丁所基于的归档版本号')
     author = models.CharField(max_length=50, blank=True)
     message = models.TextField(blank=True)
+    size = models.PositiveIntegerField(default=0, help_text='snapshot 序列化后的字节数')
+    summary = models.JSONField(default=dict, blank=True, help_text='变更摘要（见 manager.archive.summarize）')
+    content_hash = models.CharField(max_length=40, blank=True, help_text='归档时的 Map 内容哈希（见 manager.digests）')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -24,6 +33,9 @@ class MapArchive(models.Model):
         verbose_name = '地图归档'
         verbose_name_plural = '地图归档'
         unique_together = ('map', 'version_number')  # 每个版本一个快照
+        # 版本列表（manager.history）按 map 倒序分页，计数与翻页只走索引
+        indexes = [models.Index(fields=['map', 'version_number', 'is_keyframe', 'size', 'created_at'],
+                                name='maparchive_history_idx')]
 
     def __str__(self):
         return f"MapArchive map={self.map_id} v{self.version_number}"
@@ -41,8 +53,9 @@ class ResourceImportJob(models.Model):
                                      on_delete=models.CASCADE, related_name='manager_import_jobs')
     imported_data = models.JSONField(help_text='导入的JSON数据')
     status = models.CharField(max_length=20, default='PENDING',
-                              choices=[('PENDING','待处理'), ('SUCCESS','成功'), ('FAILED','失败')])
+                              choices=[('PENDING','待处理'), ('RUNNING','执行中'), ('SUCCESS','成功'), ('FAILED','失败')])
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, help_text='认领执行（RUNNING）的时刻')
     completed_at = models.DateTimeField(null=True, blank=True)
 
     # 新增操作者 & 日志
@@ -59,11 +72,17 @@ class ResourceImportJob(models.Model):
 
 # === 新增：审计日志 ===
 class AuditLog(models.Model):
+    """
+    审计日志，由 manager.audit 在事务提交后批量写入。
+    meta 过大时其中的结构化内容移到 AuditPayload（payload），meta 只保留标量与 '_payload_keys'，完整内容见 full_meta。
+    """
     ACTION_CHOICES = [
         ('EXPORT', '导出'),
         ('IMPORT', '导入'),
         ('VERSION', '版本变更'),
-        ('ROLLBACK', '回滚')
+        ('ROLLBACK', '回滚'),
+        ('FORK', '分支'),
+        ('MERGE', '合并'),
     ]
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True,
                              on_delete=models.SET_NULL, related_name='audit_logs')
@@ -71,7 +90,10 @@ class AuditLog(models.Model):
     resource_type = models.CharField(max_length=50)  # 如 'Map', 'Layer'
     resource_id = models.IntegerField()
     meta = models.JSONField(default=dict, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    payload = models.ForeignKey('AuditPayload', null=True, blank=True, on_delete=models.SET_NULL,
+                                related_name='logs', help_text='行外存储的大体量 meta 内容')
+    # 事件时间：由 audit.record() 登记时确定，而非延迟写入的时刻
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         db_table = 'AuditLog'
@@ -81,6 +103,58 @@ class AuditLog(models.Model):
     def __str__(self):
         return f"AuditLog {self.action} {self.resource_type}#{self.resource_id}"
 
+    @property
+    def full_meta(self):
+        """合并行外内容后的完整 meta。"""
+        if self.payload_id is None:
+            return self.meta
+        meta = {k: v for k, v in self.meta.items() if k != '_payload_keys'}
+        meta.update(self.payload.load())
+        return meta
+
+
+class AuditPayload(models.Model):
+    """AuditLog 的行外 meta 内容（zlib 压缩的 JSON）。"""
+    data = models.BinaryField()
+    size = models.PositiveIntegerField(help_text='压缩前的 JSON 字节数')
+
+    class Meta:
+        db_table = 'AuditPayload'
+        verbose_name = '审计日志内容'
+        verbose_name_plural = '审计日志内容'
+
+    def __str__(self):
+        return f"AuditPayload {self.id} ({self.size} bytes)"
+
+    def load(self):
+        return json.loads(zlib.decompress(bytes(self.data)))
+
+
+class AuditArchive(models.Model):
+    """
+    按月归档的审计日志：一行保存同一月份一段 id 区间内的日志（zlib 压缩的 JSON Lines，meta 已合并行外内容）。
+    由 manager.audit.archive_before 生成，归档后的行从 AuditLog 删除。
+    """
+    month = models.DateField(db_index=True, help_text='所属月份（当月 1 日）')
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'AuditArchive'
+        verbose_name = '审计日志归档'
+        verbose_name_plural = '审计日志归档'
+        ordering = ['month', 'first_id']
+
+    def __str__(self):
+        return f"AuditArchive {self.month:%Y-%m} #{self.first_id}-{self.last_id} ({self.count})"
+
+    def entries(self):
+        """解压为日志字典列表（字段同 AuditLog，meta 为完整内容）。"""
+        return [json.loads(line) for line in zlib.decompress(bytes(self.data)).decode().splitlines()]
+
 
 class MapVersionSnapshot(models.Model):
     from_map = models.ForeignKey(Map, on_delete=models.CASCADE, related_name='from_snapshots')
@@ -106,10 +180,188 @@ class LayerVersion(models.Model):
     data = models.JSONField(encoder=DjangoJSONEncoder)
     created_at = models.DateTimeField(default=timezone.now)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    author = models.CharField(max_length=50, blank=True)
+    message = models.TextField(blank=True)
+    size = models.PositiveIntegerField(default=0, help_text='data 序列化后的字节数')
+    summary = models.JSONField(default=dict, blank=True, help_text='相对上一版本变更的字段')
+    content_hash = models.CharField(max_length=40, blank=True, help_text='该版本的 Layer 内容哈希（见 manager.digests）')
 
     class Meta:
         unique_together = ("layer", "version")
         ordering = ["-version"]
+        indexes = [models.Index(fields=['layer', 'version', 'size', 'created_at'], name='layerversion_history_idx')]
+
+    def __str__(self):
+        return f"LayerVersion(layer={self.layer_id}, v{self.version})"
+
+# === 新增：空间索引（由 BaseNode / BaseEdge 的 geo_location 解析，manager.spatial 维护与查询） ===
+class GeoExtent(models.Model):
+    """
+    解析后的经纬度外包矩形；节点为退化的点（min == max）。
+    cell 为完整包含该矩形的最小 geohash 单元，按前缀/区间检索即可利用普通 B 树索引（SQLite、MySQL 通用）。
+    """
+    min_lat = models.FloatField()
+    min_lng = models.FloatField()
+    max_lat = models.FloatField()
+    max_lng = models.FloatField()
+    cell = models.CharField(max_length=12, db_index=True, blank=True, help_text='包含外包矩形的最小 geohash 单元')
+
+    class Meta:
+        abstract = True
+
+
+class BaseNodeGeo(GeoExtent):
+    base_node = models.OneToOneField('db.BaseNode', on_delete=models.CASCADE, primary_key=True, related_name='geo')
+
+    class Meta:
+        db_table = 'BaseNodeGeo'
+        verbose_name = '节点空间索引'
+        verbose_name_plural = '节点空间索引'
+
+    def __str__(self):
+        return f"BaseNodeGeo {self.base_node_id} ({self.min_lat}, {self.min_lng})"
+
+
+class BaseEdgeGeo(GeoExtent):
+    base_edge = models.OneToOneField('db.BaseEdge', on_delete=models.CASCADE, primary_key=True, related_name='geo')
+
+    class Meta:
+        db_table = 'BaseEdgeGeo'
+        verbose_name = '边空间索引'
+        verbose_name_plural = '边空间索引'
+
+    def __str__(self):
+        return f"BaseEdgeGeo {self.base_edge_id} [{self.cell}]"
+
+
+# === 新增：行政区划汇总（manager.rollups 增量维护） ===
+class RegionRollup(models.Model):
+    """
+    BaseNode 按行政区划层级 × cis_type × sub_type × 图层的计数。
+    level 为 1..5（nation / province / city / district / street），低于 level 的区划字段为空串；
+    layer 为空表示不区分图层（全部 BaseNode），否则为该图层内 Node 的计数。空值统一存为空串。
+    """
+    level = models.PositiveSmallIntegerField()
+    nation = models.CharField(max_length=50, blank=True, default='')
+    province = models.CharField(max_length=50, blank=True, default='')
+    city = models.CharField(max_length=50, blank=True, default='')
+    district = models.CharField(max_length=50, blank=True, default='')
+    street = models.CharField(max_length=50, blank=True, default='')
+    cis_type = models.CharField(max_length=3, blank=True, default='')
+    sub_type = models.CharField(max_length=15, blank=True, default='')
+    layer = models.ForeignKey('db.Layer', null=True, blank=True, on_delete=models.CASCADE, related_name='region_rollups')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'RegionRollup'
+        verbose_name = '行政区划汇总'
+        verbose_name_plural = '行政区划汇总'
+        unique_together = ('level', 'nation', 'province', 'city', 'district', 'street', 'cis_type', 'sub_type', 'layer')
+
+    def __str__(self):
+        path = '/'.join(p for p in (self.nation, self.province, self.city, self.district, self.street)[:self.level])
+        return f"RegionRollup L{self.level} {path} {self.cis_type}/{self.sub_type} layer={self.layer_id}: {self.count}"
+
+
+# === 新增：图层计数（manager.counters 增量维护） ===
+class LayerStats(models.Model):
+    """
+    Layer 的 Node / IntraEdge 行数与成员摘要，供 admin 列表与概览直接读取，避免逐行 COUNT；摘要用于内容哈希（manager.digests）。
+    逐行写入由 signals 以 F() 原子增减；批量写入后调用 counters.apply_instances，缺失或需校正时 counters.refresh。
+    """
+    layer = models.OneToOneField('db.Layer', on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    node_count = models.PositiveIntegerField(default=0)
+    edge_count = models.PositiveIntegerField(default=0)
+    node_digest = models.BigIntegerField(default=0, help_text='成员 BaseNode（id 与内容）多重集加法哈希')
+    edge_digest = models.BigIntegerField(default=0, help_text='成员 Edge / BaseEdge（id 与内容）多重集加法哈希')
+
+    class Meta:
+        db_table = 'LayerStats'
+        verbose_name = '图层计数'
+        verbose_name_plural = '图层计数'
+
+    def __str__(self):
+        return f"LayerStats {self.layer_id}: {self.node_count} nodes, {self.edge_count} edges"
+
+
+# === 新增：分支与提交（manager.branches 维护；db 表结构由外部 SQL 管理，分支信息不落在 Map / Layer 上） ===
+class TreeBucket(models.Model):
+    """
+    提交树的叶子：某类成员（Node 的 base_node_id / IntraEdge 的 edge_id）中落入同一桶的 id 集合，按内容哈希寻址，
+    相同内容在所有提交间共享一行。
+    """
+    hash = models.CharField(max_length=40, primary_key=True)
+    ids = models.JSONField(help_text='升序 id 列表')
+
+    class Meta:
+        db_table = 'TreeBucket'
+        verbose_name = '提交树桶'
+        verbose_name_plural = '提交树桶'
+
+    def __str__(self):
+        return f"TreeBucket {self.hash[:12]} ({len(self.ids)})"
+
+
+class LayerCommit(models.Model):
+    """
+    Layer 内容的一次提交：内容字段 + Node / IntraEdge 成员的 Merkle 树（桶号 -> TreeBucket 哈希）。
+    parent 为同一分支上的上一提交，merge_parent 为合并进来的另一分支头。
+    """
+    commit_hash = models.CharField(max_length=40, unique=True)
+    layer = models.ForeignKey('db.Layer', on_delete=models.CASCADE, related_name='commits', help_text='提交所在的 Layer（分支）')
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='children')
+    merge_parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='merge_children')
+    content_hash = models.CharField(max_length=40, db_index=True, help_text='内容树根哈希')
+    fields = models.JSONField(default=dict, help_text='Layer 内容字段')
+    node_buckets = models.JSONField(default=dict, help_text='{桶号: TreeBucket 哈希}，只含非空桶')
+    edge_buckets = models.JSONField(default=dict)
+    node_count = models.PositiveIntegerField(default=0)
+    edge_count = models.PositiveIntegerField(default=0)
+    author = models.CharField(max_length=50, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'LayerCommit'
+        verbose_name = 'Layer 提交'
+        verbose_name_plural = 'Layer 提交'
+
+    def __str__(self):
+        return f"LayerCommit {self.commit_hash[:12]} layer={self.layer_id}"
+
+
+class LayerBranch(models.Model):
+    """
+    分支即一个 Layer：主线 Layer 首次提交时登记为 'main'，fork 出的 Layer 记录来源（origin）与名称。
+    head 为该分支最新提交，fork 时与来源的头提交相同。
+    """
+    layer = models.OneToOneField('db.Layer', on_delete=models.CASCADE, primary_key=True, related_name='branch')
+    name = models.CharField(max_length=50, default='main')
+    origin = models.ForeignKey('db.Layer', null=True, blank=True, on_delete=models.SET_NULL, related_name='forks')
+    head = models.ForeignKey(LayerCommit, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'LayerBranch'
+        verbose_name = 'Layer 分支'
+        verbose_name_plural = 'Layer 分支'
+
+    def __str__(self):
+        return f"LayerBranch {self.name} layer={self.layer_id} origin={self.origin_id}"
+
+
+class MapBranch(models.Model):
+    """Map 的分支：fork 出的 Map 及其来源；base_layers 为 fork 时来源 Map 的 layer_id 列表（合并时的共同祖先）。"""
+    map = models.OneToOneField('db.Map', on_delete=models.CASCADE, primary_key=True, related_name='branch')
+    name = models.CharField(max_length=50)
+    origin = models.ForeignKey('db.Map', null=True, blank=True, on_delete=models.SET_NULL, related_name='forks')
+    base_layers = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'MapBranch'
+        verbose_name = 'Map 分支'
+        verbose_name_plural = 'Map 分支'
 
     def __str__(self):
-        return f"LayerVersion(layer={self.layer_id}, v{self.version})"
\ No newline at end of file
+        return f"MapBranch {self.name} map={self.map_id} origin={self.origin_id}"
@@ -0,0 +1,191 @@
+# record_store.py
+"""
+Record 的列式存储：大体量的逐迭代 × 逐节点数据（如仿真中每个节点的失效步）不再写入 Record.record_data，
+而是按迭代分块写为 NumPy 文件，Record.record_data 只保存清单（manifest）：
+
+{
+    'columnar': 'npy' | 'npz',     # npy 可 mmap 按需读取；npz 为压缩格式，读取时解压所涉分块
+    'path': 'records/<uuid>',      # 相对 settings.RECORD_STORE_ROOT
+    'dtype': 'int8',               # 取能容纳数值范围的最小整数类型
+    'iterations': 10000, 'nodes': 250000, 'chunk_iterations': 1000,
+    'chunks': ['chunk_00000.npy', ...],
+    'fill': -1,                    # 缺省值（如未失效）
+    ...                            # 调用方附加的统计字段
+}
+
+每个分块为 (块内迭代, 节点) 矩阵，按列优先存放；目录下另存 node_ids.npy（升序 base_node_id，与列一一对应），
+按节点切片时以二分查找定位列。
+"""
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+DEFAULT_CHUNK_ITERATIONS = 1000
+FORMATS = ('npy', 'npz')
+
+
+def store_root():
+    return Path(getattr(settings, 'RECORD_STORE_ROOT', Path(settings.BASE_DIR) / 'record_store'))
+
+
+def _contained(base, relative):
+    """
+    base 下的相对路径 relative 解析后的绝对路径。清单来自 Record.record_data，不可信：
+    绝对路径、含 .. 或符号链接等解析后不严格位于 base 之内的路径一律抛出 ValueError。
+    """
+    base = Path(base).resolve()
+    path = (base / relative).resolve()
+    if base not in path.parents:
+        raise ValueError(f"record store path {relative!r} escapes {base}")
+    return path
+
+
+def record_directory(manifest):
+    """清单对应的分块目录（位于 store_root() 之内）。"""
+    return _contained(store_root(), manifest['path'])
+
+
+def smallest_int_dtype(low, high):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def is_columnar(record_data):
+    return isinstance(record_data, dict) and record_data.get('columnar') in FORMATS
+
+
+class ColumnarWriter:
+    """
+    逐批追加 (迭代, 节点) 矩阵，满 chunk_iterations 行即落盘一个分块；finish() 返回写入 Record 的清单。
+    列顺序按 node_ids 升序重排，便于读取时二分定位。
+    """
+
+    def __init__(self, node_ids, dtype, chunk_iterations=DEFAULT_CHUNK_ITERATIONS, fmt='npy', fill=-1):
+        if fmt not in FORMATS:
+            raise ValueError(f"fmt must be one of {FORMATS}")
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.order = np.argsort(node_ids, kind='stable')
+        self.dtype = np.dtype(dtype)
+        self.chunk_iterations = max(1, chunk_iterations)
+        self.fmt = fmt
+        self.fill = fill
+        self.relative = Path('records') / uuid.uuid4().hex
+        self.directory = store_root() / self.relative
+        self.directory.mkdir(parents=True)
+        np.save(self.directory / 'node_ids.npy', node_ids[self.order])
+        self.chunks, self.iterations, self._pending = [], 0, []
+
+    def _flush(self, rows):
+        # 分块按列优先（Fortran 序）存放：同一节点在块内的全部迭代连续，按节点切片时只读取对应区段
+        rows = np.asfortranarray(rows)
+        name = f"chunk_{len(self.chunks):05d}.{self.fmt}"
+        if self.fmt == 'npy':
+            np.save(self.directory / name, rows)
+        else:
+            np.savez_compressed(self.directory / name, data=rows)
+        self.chunks.append(name)
+
+    def append(self, matrix):
+        rows = np.asarray(matrix)[:, self.order].astype(self.dtype, copy=False)
+        self._pending.append(rows)
+        self.iterations += len(rows)
+        buffered = sum(len(p) for p in self._pending)
+        if buffered >= self.chunk_iterations:
+            pending = np.concatenate(self._pending)
+            full = len(pending) - len(pending) % self.chunk_iterations
+            for start in range(0, full, self.chunk_iterations):
+                self._flush(pending[start:start + self.chunk_iterations])
+            self._pending = [pending[full:]] if full < len(pending) else []
+
+    def finish(self, **extra):
+        if self._pending:
+            self._flush(np.concatenate(self._pending))
+            self._pending = []
+        return {
+            'columnar': self.fmt,
+            'path': self.relative.as_posix(),
+            'dtype': self.dtype.name,
+            'iterations': self.iterations,
+            'nodes': len(self.order),
+            'chunk_iterations': self.chunk_iterations,
+            'chunks': self.chunks,
+            'fill': self.fill,
+            **extra,
+        }
+
+    def abort(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ColumnarRecord:
+    """按清单读取列式数据；只打开与迭代区间相交的分块，npy 分块以 mmap 方式只读取所选列。"""
+
+    def __init__(self, manifest):
+        if not is_columnar(manifest):
+            raise ValueError("record_data is not a columnar manifest")
+        self.manifest = manifest
+        self.directory = record_directory(manifest)
+        self.iterations = manifest['iterations']
+        self.chunk_iterations = manifest['chunk_iterations']
+        self._node_ids = None
+
+    @property
+    def node_ids(self):
+        if self._node_ids is None:
+            self._node_ids = np.load(_contained(self.directory, 'node_ids.npy'), mmap_mode='r')
+        return self._node_ids
+
+    def columns(self, node_ids):
+        """base_node_id -> 列号；不存在的节点抛 KeyError。"""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        known = np.asarray(self.node_ids)
+        cols = np.searchsorted(known, node_ids)
+        found = cols < len(known)
+        found[found] = known[cols[found]] == node_ids[found]
+        if not found.all():
+            raise KeyError(f"BaseNode(s) not in record: {node_ids[~found][:10].tolist()}")
+        return cols
+
+    def _chunk(self, index):
+        path = _contained(self.directory, self.manifest['chunks'][index])
+        if self.manifest['columnar'] == 'npy':
+            return np.load(path, mmap_mode='r')
+        with np.load(path) as archive:
+            return archive['data']
+
+    def read(self, node_ids=None, start=0, stop=None):
+        """
+        返回迭代 [start, stop) × 所选节点 的矩阵（node_ids 为空时取全部节点，列顺序与 node_ids 一致）。
+        """
+        stop = self.iterations if stop is None else min(stop, self.iterations)
+        start = max(0, start)
+        cols = None if node_ids is None else self.columns(node_ids)
+        width = self.manifest['nodes'] if cols is None else len(cols)
+        out = np.empty((max(0, stop - start), width), dtype=self.manifest['dtype'])
+        size = self.chunk_iterations
+        for index in range(start // size, (stop + size - 1) // size if stop > start else 0):
+            first = index * size
+            lo, hi = max(start, first) - first, min(stop, first + size) - first
+            rows = self._chunk(index)[lo:hi]
+            out[first + lo - start:first + hi - start] = rows if cols is None else rows[:, cols]
+        return out
+
+    def delete(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def open_record(record):
+    """由 Record 实例或其 record_data 打开列式数据。"""
+    return ColumnarRecord(getattr(record, 'record_data', record))
+
+
+def disk_usage(manifest):
+    directory = record_directory(manifest)
+    return sum(os.path.getsize(directory / name) for name in os.listdir(directory))
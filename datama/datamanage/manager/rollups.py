@@ -0,0 +1,110 @@
+# rollups.py
+"""
+BaseNode 行政区划汇总（RegionRollup）的维护与查询。
+
+每个节点在 5 个层级（nation → street）各计入一行；layer 为空的行统计全部 BaseNode，
+另按 Node 所属图层各计入一组行。看板与 admin 侧栏只读汇总表，不再对节点表 GROUP BY。
+
+维护方式：
+- 逐行写入：signals 在 BaseNode / Node 保存与删除时计算差量并以 F() 原子累加；
+- 批量写入（bulk_create 不触发信号）：写入后调用 apply_instances()；
+- 全量重建：refresh_rollups()（两条 GROUP BY + 批量插入），供初次建表或校正使用，
+  对应管理命令 refresh_region_rollups。
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from db.models import BaseNode, Node
+from .models import RegionRollup
+
+LEVELS = ('nation', 'province', 'city', 'district', 'street')
+DIMENSIONS = ('cis_type', 'sub_type')
+FIELDS = LEVELS + DIMENSIONS
+ROLLUP_BATCH_SIZE = 1000
+
+
+def node_values(instance):
+    """BaseNode 实例的汇总字段取值元组（顺序同 FIELDS）。"""
+    return tuple(getattr(instance, f) for f in FIELDS)
+
+
+def _keys(values, layer_id):
+    """一个节点计入的 5 个汇总键：(level, 5 个区划字段, cis_type, sub_type, layer_id)。"""
+    values = tuple(v or '' for v in values)
+    region, dims = values[:len(LEVELS)], values[len(LEVELS):]
+    return [(level,) + region[:level] + ('',) * (len(LEVELS) - level) + dims + (layer_id,)
+            for level in range(1, len(LEVELS) + 1)]
+
+
+def _key_filter(key):
+    return dict(zip(('level',) + FIELDS + ('layer_id',), key))
+
+
+def add(deltas, values, layer_ids, sign):
+    """把 values 对应节点在 layer_ids（None 表示全部）下的计数变化 sign 累加到 deltas。"""
+    for layer_id in layer_ids:
+        for key in _keys(values, layer_id):
+            deltas[key] += sign
+
+
+def apply(deltas):
+    """将 {汇总键: 增量} 写入 RegionRollup：已有行以 F() 原子累加，没有的行新建。"""
+    with transaction.atomic():
+        for key, delta in deltas.items():
+            if not delta:
+                continue
+            lookup = _key_filter(key)
+            if not RegionRollup.objects.filter(**lookup).update(count=F('count') + delta):
+                RegionRollup.objects.create(count=delta, **lookup)
+
+
+def apply_instances(model, instances, sign=1):
+    """
+    按 BaseNode / Node 实例更新汇总：sign=1 为新增（批量写入之后），sign=-1 为删除。
+    Node 需要所属 BaseNode 的区划字段，额外一次 in_bulk 查询。
+    """
+    deltas = Counter()
+    if model is BaseNode:
+        for obj in instances:
+            add(deltas, node_values(obj), [None], sign)
+    elif model is Node:
+        instances = list(instances)
+        base_nodes = BaseNode.objects.in_bulk({obj.base_node_id for obj in instances})
+        for obj in instances:
+            if obj.base_node_id in base_nodes:
+                add(deltas, node_values(base_nodes[obj.base_node_id]), [obj.layer_id], sign)
+    apply(deltas)
+
+
+def refresh_rollups():
+    """全量重建：节点表与 Node 各一次 GROUP BY（最细粒度），在内存中上卷到各层级后批量写入。"""
+    deltas = Counter()
+    for row in BaseNode.objects.values_list(*FIELDS).annotate(n=Count('id')).order_by():
+        add(deltas, row[:-1], [None], row[-1])
+    for row in (Node.objects.values_list('layer_id', *(f'base_node__{f}' for f in FIELDS))
+                .annotate(n=Count('id')).order_by()):
+        add(deltas, row[1:-1], [row[0]], row[-1])
+    with transaction.atomic():
+        RegionRollup.objects.all().delete()
+        RegionRollup.objects.bulk_create([RegionRollup(count=n, **_key_filter(key)) for key, n in deltas.items()],
+                                         batch_size=ROLLUP_BATCH_SIZE)
+    return len(deltas)
+
+
+def region_counts(level='nation', layer_id=None, by=(), **parents):
+    """
+    level 层级下各区划的计数，parents 为上级区划的过滤值（如 nation='中国', province='某省'）；
+    by 为附加的分组维度（cis_type / sub_type）。layer_id 为空时统计全部 BaseNode。
+    返回 [{区划字段..., 维度..., 'count': n}, ...]，按区划排序，只含计数大于 0 的行。
+    """
+    if level not in LEVELS:
+        raise ValueError(f"level must be one of {LEVELS}")
+    depth = LEVELS.index(level) + 1
+    unknown = set(parents) - set(LEVELS[:depth - 1])
+    if unknown or set(by) - set(DIMENSIONS):
+        raise ValueError(f"unsupported filters: {sorted(unknown | (set(by) - set(DIMENSIONS)))}")
+    columns = list(LEVELS[:depth]) + list(by)
+    return list(RegionRollup.objects.filter(level=depth, layer_id=layer_id, **parents)
+                .values(*columns).annotate(count=Sum('count')).filter(count__gt=0).order_by(*columns))
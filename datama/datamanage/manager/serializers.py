@@ -17,6 +17,7 @@ class MapLayerSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 from .models import MapArchive, ResourceImportJob, AuditLog
+from .services import import_progress
 
 class MapArchiveSerializer(serializers.ModelSerializer):
     class Meta:
@@ -28,7 +29,22 @@ class ResourceImportJobSerializer(serializers.ModelSerializer):
         model = ResourceImportJob
         fields = '__all__'
 
+class ResourceImportJobStatusSerializer(serializers.ModelSerializer):
+    """轮询导入任务状态时使用，不回传 imported_data 原文；运行中的 logs['progress'] 为逐批进度。"""
+    class Meta:
+        model = ResourceImportJob
+        exclude = ('imported_data',)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.status == 'RUNNING':
+            data['logs'] = {**(data.get('logs') or {}), 'progress': import_progress(instance)}
+        return data
+
 class AuditLogSerializer(serializers.ModelSerializer):
+    # 合并行外存储（AuditPayload）后的完整 meta
+    meta = serializers.JSONField(source='full_meta', read_only=True)
+
     class Meta:
         model = AuditLog
-        fields = '__all__'
\ No newline at end of file
+        exclude = ('payload',)
\ No newline at end of file
@@ -1,12 +1,15 @@
 # services.py
 import copy
 import json
-from datetime import datetime
-from django.db import transaction
+import operator
+from datetime import datetime, timedelta
+from functools import partial
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models, transaction, connection
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.utils import timezone
-
-from deepdiff import DeepDiff  # pip install deepdiff
+from django.core.serializers.json import DjangoJSONEncoder
 
 from db.models import (
     Map, Layer, MapLayer,
@@ -15,42 +18,139 @@ from db.models import (
     Condition, Record, Execution, AnalysisAlgorithm,
     FormatConversion, Result, Simulation, Project,
 )
-from .models import ResourceImportJob, AuditLog, MapArchive, MapVersionSnapshot, LayerVersion
+from db.validation import validate_batch
+from .models import ResourceImportJob, AuditLog, MapVersionSnapshot, LayerVersion, LayerCommit
+from . import audit, branches, counters, digests, export_cache, rollups, spatial, tasks, tiles, versioning
+from .archive import build_archive, reconstruct_map_snapshot, stored_size
 
-def _serialize_instance(obj):
-    data = {}
-    for field in obj._meta.fields:
-        name = field.name
-        value = getattr(obj, name)
-        if field.is_relation and value is not None:
-            data[name] = getattr(value, 'id', value)
-        else:
+_SERIALIZERS = {}
+_ROW_BUILDERS = {}
+
+def _row_builder(model):
+    """
+    模型字段的行构造计划（按模型类缓存）：返回 (attnames, build)。
+    build 接收按 attnames 顺序排列的取值元组（来自实例 __dict__ 或 values_list），
+    产出以字段名为键的字典；关系字段取 attname（如 layer_id），日期/时间字段转 isoformat。
+    """
+    plan = _ROW_BUILDERS.get(model)
+    if plan is not None:
+        return plan
+    fields = model._meta.fields
+    names = tuple(f.name for f in fields)
+    attnames = tuple(f.attname for f in fields)
+    temporal = tuple(f.name for f in fields
+                     if isinstance(f, (models.DateTimeField, models.DateField, models.TimeField)))
+
+    def build(values):
+        data = dict(zip(names, values))
+        for name in temporal:
+            value = data[name]
             if hasattr(value, 'isoformat'):
                 data[name] = value.isoformat()
-            else:
-                data[name] = value
-    return data
+        return data
+    plan = _ROW_BUILDERS[model] = (attnames, build)
+    return plan
 
-def compute_diff_deep(old: dict, new: dict) -> dict:
+def _compile_serializer(model):
     """
-    使用 deepdiff 提供更精细的差异结果（可 JSON 序列化）。
+    为模型预编译实例序列化函数：一次 itemgetter 从 __dict__ 取出全部字段值，再交给 _row_builder。
     """
+    attnames, build = _row_builder(model)
+    # 已加载字段直接从实例 __dict__ 批量取值；存在 defer()/only() 未加载字段时退回属性访问
+    from_dict = operator.itemgetter(*attnames)
+    from_attrs = operator.attrgetter(*attnames)
+    if len(attnames) == 1:
+        from_dict = lambda d, _get=from_dict: (_get(d),)
+        from_attrs = lambda obj, _get=from_attrs: (_get(obj),)
+
+    def serialize(obj):
+        try:
+            values = from_dict(obj.__dict__)
+        except KeyError:
+            values = from_attrs(obj)
+        return build(values)
+    return serialize
+
+def _serialize_instance(obj):
+    serializer = _SERIALIZERS.get(obj.__class__)
+    if serializer is None:
+        serializer = _SERIALIZERS[obj.__class__] = _compile_serializer(obj.__class__)
+    return serializer(obj)
+
+def _diff_path(key):
+    return f"root[{key!r}]"
+
+def compute_diff_flat(old: dict, new: dict, deep_json: bool = False) -> dict:
+    """
+    针对 _serialize_instance 产出的扁平字段字典的差异计算，O(字段数)，结果直接为 JSON 原生结构。
+    报告键与 DeepDiff(verbose_level=2) 保持一致：
+    dictionary_item_added / dictionary_item_removed / values_changed / type_changes。
+    dict/list 类型（JSONField）字段默认整体比较；deep_json=True 时交由 DeepDiff 给出字段内部差异。
+    """
+    added, removed, changed, type_changes = {}, {}, {}, {}
+    nested = []
+    for key, new_value in new.items():
+        if key not in old:
+            added[_diff_path(key)] = new_value
+            continue
+        old_value = old[key]
+        if type(old_value) is not type(new_value):
+            type_changes[_diff_path(key)] = {
+                'old_type': type(old_value).__name__, 'new_type': type(new_value).__name__,
+                'old_value': old_value, 'new_value': new_value
+            }
+        elif old_value != new_value:
+            if deep_json and isinstance(new_value, (dict, list)):
+                nested.append(key)
+            else:
+                changed[_diff_path(key)] = {'new_value': new_value, 'old_value': old_value}
+    for key, old_value in old.items():
+        if key not in new:
+            removed[_diff_path(key)] = old_value
+
+    diff = {}
+    for name, report in (('type_changes', type_changes), ('dictionary_item_added', added),
+                         ('dictionary_item_removed', removed), ('values_changed', changed)):
+        if report:
+            diff[name] = report
+    if nested:
+        deep = _compute_deepdiff({k: old[k] for k in nested}, {k: new[k] for k in nested})
+        for name, report in deep.items():
+            diff.setdefault(name, {}).update(report)
+    return diff
+
+def _compute_deepdiff(old: dict, new: dict) -> dict:
+    from deepdiff import DeepDiff  # pip install deepdiff（仅 deep_json 时需要）
     dd = DeepDiff(old, new, ignore_order=True, verbose_level=2)
     # deepdiff 返回的是特殊对象，转成原生 dict/JSON
     return json.loads(dd.to_json())
 
-def export_map(map_id, version_number=None):
+def compute_diff_deep(old: dict, new: dict, deep_json: bool = False) -> dict:
+    """
+    版本/导入差异。默认使用 compute_diff_flat；deep_json=True 时对 JSONField 内容做 DeepDiff 细粒度比较。
+    """
+    return compute_diff_flat(old, new, deep_json=deep_json)
+
+EXPORT_DEPTHS = ('meta', 'full')
+LAYER_SECTIONS = ('nodes', 'intra_edges', 'configurations', 'diagrams')
+
+def export_map(map_id, version_number=None, depth='meta'):
     """
     导出 Map（当前实现导出当前 Map + 其包含的最新 Layer）。
     若传 version_number，将尝试从 MapArchive 获取历史快照（真正固定版本）。
+    depth='full' 时额外导出每个 Layer 的 nodes / intra_edges / configurations / diagrams，
+    放在 layer_contents[layer_id] 中；所有图层的同类数据合并为一次查询，总查询数固定，与图层数量无关。
     """
+    if depth not in EXPORT_DEPTHS:
+        raise ValueError(f"depth must be one of {EXPORT_DEPTHS}")
     if version_number is not None:
-        archive = MapArchive.objects.filter(map_id=map_id, version_number=version_number).first()
-        if not archive:
-            raise ObjectDoesNotExist(f"No archived snapshot for map {map_id} version {version_number}")
+        if depth != 'meta':
+            raise ValueError("depth='full' is only available for the latest version")
+        version_number = int(version_number)
+        snapshot = reconstruct_map_snapshot(map_id, version_number)
         return {
-            'map': archive.snapshot.get('map'),
-            'layers': archive.snapshot.get('layers', []),
+            'map': snapshot.get('map'),
+            'layers': snapshot.get('layers', []),
             'exported_at': timezone.now().isoformat(),
             'archived_version': version_number
         }
@@ -66,11 +166,82 @@ def export_map(map_id, version_number=None):
         layer = ml.layer
         layers.append(_serialize_instance(layer))
 
-    return {
-        'map': map_obj,
-        'layers': layers,
-        'exported_at': timezone.now().isoformat()
-    }
+    payload = {'map': map_obj, 'layers': layers}
+    if depth == 'full':
+        contents = {
+            str(l['id']): {name: [] for name in LAYER_SECTIONS} for l in layers
+        }
+        layer_ids = MapLayer.objects.filter(map=m).values('layer_id')
+        for name, rows in _section_rows({'layer__in': layer_ids}, grouped=True):
+            for layer_id, row in rows:
+                contents[str(layer_id)][name].append(row)
+        payload['layer_contents'] = contents
+    payload['exported_at'] = timezone.now().isoformat()
+    return payload
+
+def _values_rows(qs, parts, chunk_size=None, key=None):
+    """
+    以单条 values_list 查询取回 qs 及其 JOIN 的关联模型字段，不实例化模型。
+    parts 为 [(查询前缀, 模型), ...]，每行产出与 parts 等长的字典元组（结构同 _serialize_instance）；
+    传入 key（如 'layer_id'）时，元组首位为该列的值，用于按图层分组。
+    """
+    columns, slices = [key] if key else [], []
+    for prefix, model in parts:
+        attnames, build = _row_builder(model)
+        start = len(columns)
+        columns.extend(prefix + a for a in attnames)
+        slices.append((start, len(columns), build))
+    rows = qs.values_list(*columns)
+    for row in (rows.iterator(chunk_size=chunk_size) if chunk_size else rows):
+        built = tuple(build(row[a:b]) for a, b, build in slices)
+        yield (row[0],) + built if key else built
+
+def _section_rows(layer_filter, chunk_size=None, grouped=False):
+    """
+    各导出分段的行迭代器，每个分段一条 values_list 查询。
+    layer_filter 为针对 layer 外键的过滤条件，如 {'layer': layer} 或 {'layer__in': 子查询}；
+    grouped=True 时每行形如 (layer_id, 行数据)。
+    """
+    def scoped(prefix=''):
+        return {prefix + k: v for k, v in layer_filter.items()}
+
+    def key(column):
+        return column if grouped else None
+
+    nodes = _values_rows(Node.objects.filter(**scoped()).order_by('pk'),
+                         [('base_node__', BaseNode)], chunk_size, key('layer_id'))
+    intra_edges = _values_rows(IntraEdge.objects.filter(**scoped()).order_by('pk'),
+                               [('', IntraEdge), ('edge__', Edge), ('edge__base_edge__', BaseEdge)],
+                               chunk_size, key('layer_id'))
+    configurations = _values_rows(Configuration.objects.filter(**scoped()).order_by('pk'),
+                                  [('', Configuration)], chunk_size, key('layer_id'))
+    # Diagram 不直接关联 Layer，经由 Configuration 归属到图层
+    diagrams = _values_rows(Diagram.objects.filter(**scoped('configuration__')).order_by('pk'),
+                            [('', Diagram)], chunk_size, key('configuration__layer_id'))
+
+    def intra_edge(ie, edge, base_edge):
+        return {'intraedge': ie, 'edge': {'edge_fields': edge, 'base_edge': base_edge}}
+
+    if grouped:
+        return [
+            ('nodes', ((lid, base_node) for lid, base_node in nodes)),
+            ('intra_edges', ((lid, intra_edge(*rest)) for lid, *rest in intra_edges)),
+            ('configurations', ((lid, cfg) for lid, cfg in configurations)),
+            ('diagrams', ((lid, dg) for lid, dg in diagrams)),
+        ]
+    return [
+        ('nodes', (base_node for (base_node,) in nodes)),
+        ('intra_edges', (intra_edge(*row) for row in intra_edges)),
+        ('configurations', (cfg for (cfg,) in configurations)),
+        ('diagrams', (dg for (dg,) in diagrams)),
+    ]
+
+def _layer_sections(layer, chunk_size=None):
+    """
+    Layer 导出的各分段 (名称, 行迭代器)。
+    chunk_size 为 None 时一次性取回；否则使用 .iterator(chunk_size) 分批游标读取，内存恒定。
+    """
+    return _section_rows({'layer': layer}, chunk_size)
 
 def export_layer(layer_id, include_related=True):
     try:
@@ -82,87 +253,210 @@ def export_layer(layer_id, include_related=True):
     if not include_related:
         return {'layer': layer_data, 'exported_at': timezone.now().isoformat()}
 
-    nodes = [_serialize_instance(n.base_node) for n in layer.nodes.select_related('base_node').all()]
-    intra_edges = []
-    for ie in layer.intra_edges.select_related('edge__base_edge').all():
-        edge = ie.edge
-        base_edge = edge.base_edge
-        d = {
-            'intraedge': _serialize_instance(ie),
-            'edge': {'edge_fields': _serialize_instance(edge), 'base_edge': _serialize_instance(base_edge)}
-        }
-        intra_edges.append(d)
+    payload = {'layer': layer_data}
+    for name, rows in _layer_sections(layer):
+        payload[name] = list(rows)
+    payload['exported_at'] = timezone.now().isoformat()
+    return payload
+
+def cached_export_map(map_id, version_number=None, depth='meta'):
+    """
+    带缓存的 export_map，返回 (etag, payload)。
+    固定版本按 (map_id, version, depth) 永久缓存；最新版本以当前 version_number 为键，写路径提交后失效。
+    """
+    if version_number is not None:
+        version_number = int(version_number)
+        return export_cache.get_or_build('map', map_id, version_number, {'depth': depth},
+                                         lambda: export_map(map_id, version_number, depth), latest=False)
+    map_obj = Map.objects.filter(id=map_id).first()
+    if map_obj is None:
+        raise ObjectDoesNotExist(f"Map {map_id} not found")
+    return export_cache.get_or_build('map', map_id, _cache_version(map_obj.version_number, digests.map_hash(map_obj)),
+                                     {'depth': depth}, lambda: export_map(map_id, depth=depth))
+
+def cached_export_layer(layer_id, include_related=True):
+    """带缓存的 export_layer，返回 (etag, payload)。"""
+    current = digests.stored_layer_hash(layer_id)
+    if current is None:
+        raise ObjectDoesNotExist(f"Layer {layer_id} not found")
+    return export_cache.get_or_build('layer', layer_id, _cache_version(*current), {'related': include_related},
+                                     lambda: export_layer(layer_id, include_related))
+
+def cached_layer_tile(layer_id, z, x, y):
+    """带缓存的图层瓦片，返回 (etag, payload)；与整层导出共用图层的版本键与失效代数。"""
+    current = digests.stored_layer_hash(layer_id)
+    if current is None:
+        raise ObjectDoesNotExist(f"Layer {layer_id} not found")
+    tiles.tile_bbox(z, x, y)  # 非法瓦片坐标在读缓存前报 ValueError
+    return export_cache.get_or_build('layer', layer_id, _cache_version(*current), {'tile': f'{z}/{x}/{y}'},
+                                     lambda: tiles.layer_tile(layer_id, z, x, y))
+
+def _cache_version(version_number, content_hash):
+    # 最新版本的缓存版本标识：版本号 + 内容哈希（manager.digests），字段或成员变化即换键
+    return f"{version_number}@{content_hash}"
+
+EXPORT_STREAM_CHUNK_SIZE = 2000  # 每次游标读取的行数
+EXPORT_STREAM_BUFFER_BYTES = 64 * 1024  # 聚合后再写出，避免逐行 flush
+
+# NDJSON 中每行的 type 取值（分段名 -> 单条记录类型）
+_STREAM_ROW_TYPES = {
+    'nodes': 'node',
+    'intra_edges': 'intra_edge',
+    'configurations': 'configuration',
+    'diagrams': 'diagram',
+}
+
+def _buffered(pieces, size=EXPORT_STREAM_BUFFER_BYTES):
+    buf, buf_len = [], 0
+    for piece in pieces:
+        buf.append(piece)
+        buf_len += len(piece)
+        if buf_len >= size:
+            yield ''.join(buf)
+            buf, buf_len = [], 0
+    if buf:
+        yield ''.join(buf)
 
-    configurations = [_serialize_instance(cfg) for cfg in layer.configurations.all()]
-    diagrams = [_serialize_instance(dg) for dg in layer.diagrams.all()]
+def _dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False)
 
-    return {
-        'layer': layer_data,
-        'nodes': nodes,
-        'intra_edges': intra_edges,
-        'configurations': configurations,
-        'diagrams': diagrams,
-        'exported_at': timezone.now().isoformat()
-    }
+def _iter_layer_ndjson(layer, chunk_size):
+    yield _dumps({'type': 'layer', 'data': _serialize_instance(layer)}) + '\n'
+    counts = {}
+    for name, rows in _layer_sections(layer, chunk_size=chunk_size):
+        row_type = _STREAM_ROW_TYPES[name]
+        counts[name] = 0
+        for row in rows:
+            counts[name] += 1
+            yield _dumps({'type': row_type, 'data': row}) + '\n'
+    yield _dumps({'type': 'end', 'counts': counts, 'exported_at': timezone.now().isoformat()}) + '\n'
+
+def _iter_layer_json(layer, chunk_size):
+    # 与 export_layer 返回结构一致，仅逐段增量编码
+    yield '{"layer": ' + _dumps(_serialize_instance(layer))
+    for name, rows in _layer_sections(layer, chunk_size=chunk_size):
+        yield ', ' + _dumps(name) + ': ['
+        first = True
+        for row in rows:
+            yield (_dumps(row) if first else ', ' + _dumps(row))
+            first = False
+        yield ']'
+    yield ', "exported_at": ' + _dumps(timezone.now().isoformat()) + '}'
+
+def stream_export_layer(layer_id, fmt='ndjson', chunk_size=EXPORT_STREAM_CHUNK_SIZE):
+    """
+    流式导出 Layer，返回字符串块生成器，供 StreamingHttpResponse 使用。
+    fmt='ndjson': 每行一条记录 {"type": ..., "data": ...}，最后一行 type=end 附带计数；
+    fmt='json'  : 与 export_layer 相同结构的 JSON 文档，增量编码。
+    Layer 不存在时在返回生成器之前即抛出 ObjectDoesNotExist。
+    """
+    if fmt not in ('ndjson', 'json'):
+        raise ValueError("fmt must be 'ndjson' or 'json'")
+    try:
+        layer = Layer.objects.get(id=layer_id)
+    except Layer.DoesNotExist:
+        raise ObjectDoesNotExist(f"Layer {layer_id} not found")
+
+    pieces = _iter_layer_ndjson(layer, chunk_size) if fmt == 'ndjson' else _iter_layer_json(layer, chunk_size)
+    return _buffered(pieces)
 
 @transaction.atomic
-def _archive_map_snapshot(map_obj, author='', message=''):
+def _archive_map_snapshot(map_obj, author='', message='', content_hash=None):
     """
-    将当前 Map + 最新 Layers 导出并存为 MapArchive 固定版本。
+    将当前 Map + 最新 Layers 导出并存为 MapArchive 固定版本（关键帧或补丁），并记录其内容哈希。
     """
     snapshot = export_map(map_obj.id)  # 当前版本
-    MapArchive.objects.create(
-        map=map_obj,
-        version_number=map_obj.version_number,
-        snapshot=snapshot,
+    archive = build_archive(
+        map_obj,
+        snapshot,
         author=author or (map_obj.author or ''),
         message=message or (map_obj.message or '')
     )
+    archive.content_hash = content_hash or digests.map_hash(map_obj)
+    archive.save()
     return snapshot
 
-@transaction.atomic
-def create_layer_version(layer_instance, changed_by=None, change_message=None):
+def _prepare_layer_version(layer_instance, changed_by=None, change_message=None, content_hash=None):
+    """
+    在内存中推进 Layer 版本号，返回未保存的 LayerVersion / AuditLog 及版本变更结果（AuditLog 交由 audit.record_many 提交后写入）。
+    由 create_layer_version（逐条保存）与 _bulk_upsert_layers（批量写入）共用；content_hash 省略时查询成员摘要计算。
+    """
+    content_hash = content_hash or digests.layer_hash(layer_instance, change_message)
     old_snapshot = _serialize_instance(layer_instance)
     layer_instance.version_number = (layer_instance.version_number or 1) + 1
     if change_message:
         layer_instance.message = change_message
     layer_instance.updated_at = timezone.now()
-    layer_instance.save()
-    LayerVersion.objects.create(
-        layer=layer_instance,
-        version=layer_instance.version_number,
-        data=new_snapshot
-    )
     new_snapshot = _serialize_instance(layer_instance)
     diff = compute_diff_deep(old_snapshot, new_snapshot)
-    # 审计
-    AuditLog.objects.create(
+    version = LayerVersion(
+        layer=layer_instance, version=layer_instance.version_number, data=new_snapshot,
+        author=layer_instance.author or '', message=layer_instance.message or '', size=stored_size(new_snapshot),
+        content_hash=content_hash,
+        summary={'fields': sorted(k for k in new_snapshot.keys() | old_snapshot.keys()
+                                  if old_snapshot.get(k) != new_snapshot.get(k))},
+    )
+    entry = AuditLog(
         user=None, action='VERSION', resource_type='Layer', resource_id=layer_instance.id,
         meta={'diff': diff, 'new_version': layer_instance.version_number, 'by': changed_by, 'message': change_message}
     )
-    return {'layer_id': layer_instance.id, 'new_version': layer_instance.version_number, 'diff': diff}
+    return version, entry, {'layer_id': layer_instance.id, 'new_version': layer_instance.version_number, 'diff': diff}
+
+def _unchanged_version(key, instance):
+    return {key: instance.id, 'new_version': instance.version_number, 'diff': {}, 'unchanged': True}
+
+@transaction.atomic
+def create_layer_version(layer_instance, changed_by=None, change_message=None, force=False, expected_version=None):
+    """
+    推进 Layer 版本并写入 LayerVersion 与审计。内容哈希（含 change_message）与最新版本相同时不做任何写入，
+    返回当前版本号与 'unchanged': True；force=True 时总是写入。
+    Layer 以读取时的版本号（expected_version，默认为实例当前版本号）为条件写入（versioning.compare_and_swap），
+    期间已被其他写入者推进版本时抛出 versioning.VersionConflict，不写入 LayerVersion。
+    """
+    expected = layer_instance.version_number if expected_version is None else expected_version
+    content_hash = digests.layer_hash(layer_instance, change_message)
+    if not force and content_hash == digests.versioned_layer_hashes([layer_instance.id]).get(layer_instance.id):
+        return _unchanged_version('layer_id', layer_instance)
+    version, entry, result = _prepare_layer_version(layer_instance, changed_by, change_message, content_hash)
+    versioning.compare_and_swap(layer_instance, expected)
+    # UPDATE 不触发 post_save，显式使导出缓存失效
+    export_cache.invalidate_layers([layer_instance.id])
+    version.save()
+    # 审计（提交后批量写入）
+    audit.record_many([entry])
+    return result
 
 @transaction.atomic
-def create_map_version(map_instance, changed_by=None, change_message=None):
+def create_map_version(map_instance, changed_by=None, change_message=None, force=False, expected_version=None):
+    """
+    推进 Map 版本并归档快照、写入审计。内容哈希（Map 字段 + 各 Layer 哈希，含 change_message）与最新归档相同时
+    不做任何写入，返回当前版本号与 'unchanged': True；force=True 时总是写入。
+    与 create_layer_version 相同，Map 以读取时的版本号为条件写入，冲突时抛出 versioning.VersionConflict。
+    """
+    expected = map_instance.version_number if expected_version is None else expected_version
+    content_hash = digests.map_hash(map_instance, change_message)
+    if not force and content_hash == digests.versioned_map_hash(map_instance.id):
+        return _unchanged_version('map_id', map_instance)
     old_snapshot = _serialize_instance(map_instance)
     old_version = map_instance.version_number or 1
     map_instance.version_number = old_version + 1
     if change_message:
         map_instance.message = change_message
     map_instance.updated_at = timezone.now()
-    map_instance.save()
+    versioning.compare_and_swap(map_instance, expected)
+    export_cache.invalidate_maps([map_instance.id])
     MapVersionSnapshot.objects.create(from_map=map_instance, to_map=map_instance)
     new_snapshot = _serialize_instance(map_instance)
     diff = compute_diff_deep(old_snapshot, new_snapshot)
     # 归档固定版本快照
-    _archive_map_snapshot(map_instance, author=map_instance.author, message=change_message or '')
-    # 审计
-    AuditLog.objects.create(
-        user=None, action='VERSION', resource_type='Map', resource_id=map_instance.id,
-        meta={'diff': diff, 'new_version': map_instance.version_number, 'by': changed_by, 'message': change_message}
-    )
+    _archive_map_snapshot(map_instance, author=map_instance.author, message=change_message or '', content_hash=content_hash)
+    # 审计（提交后批量写入）
+    audit.record('VERSION', 'Map', map_instance.id,
+                 meta={'diff': diff, 'new_version': map_instance.version_number, 'by': changed_by, 'message': change_message})
     return {'map_id': map_instance.id, 'new_version': map_instance.version_number, 'diff': diff}
 
+IMPORT_BATCH_SIZE = 500  # bulk_create / bulk_update 每批行数
+
 def _validate_and_prepare_import_payload(payload: dict):
     errors = []
     if 'import_type' not in payload:
@@ -171,210 +465,608 @@ def _validate_and_prepare_import_payload(payload: dict):
         errors.append('data required')
     return (len(errors) == 0, errors)
 
-@transaction.atomic
-def import_json_payload(payload: dict, performed_by=None):
-    ok, errors = _validate_and_prepare_import_payload(payload)
-    if not ok:
-        return {'status': 'FAILED', 'errors': errors}
+# Layer 上允许由导入数据覆盖的字段（批量更新时使用）
+_LAYER_IMPORT_FIELDS = [
+    f.name for f in Layer._meta.concrete_fields
+    if not f.primary_key and f.name not in ('create_time', 'created_at')
+]
 
-    import_type = payload['import_type']
-    data = payload['data']
-    bind_map = payload.get('bind_map')
-    bind_layer = payload.get('bind_layer')
-    message = payload.get('message', '')
+def _base_commits(layers):
+    """导入数据中 base_commit 引用的 LayerCommit，{commit_hash: LayerCommit}（一次查询）。"""
+    hashes = {l['base_commit'] for l in layers if l.get('base_commit')}
+    return LayerCommit.objects.in_bulk(hashes, field_name='commit_hash') if hashes else {}
+
+def _incoming_layer_fields(layer_obj, l, base_commits):
+    """
+    导入数据中要写入已有 Layer 的字段，返回 (字段, 冲突)，二者恰有一个为 None：
+    - 带 base_commit（导入数据所基于的 LayerCommit）时，内容字段以该提交为基准三方合并（branches.merge_fields），
+      服务器端在此之后的修改与导入修改互不覆盖，只有同一字段两侧改为不同值才冲突；版本号由服务器推进；
+    - 否则沿用版本号比较：导入版本号不大于当前版本号即冲突。
+    """
+    incoming = {k: v for k, v in l.items() if k not in ('id', 'created_at', 'updated_at', 'base_commit')}
+    if not l.get('base_commit'):
+        if l.get('version_number', 1) <= (layer_obj.version_number or 1):
+            return None, {'layer': layer_obj.id, 'reason': 'incoming version not newer'}
+        return incoming, None
+    base = base_commits.get(l['base_commit'])
+    if base is None:
+        return None, {'layer': layer_obj.id, 'reason': 'unknown base_commit'}
+    theirs = {**base.fields, **{f: incoming[f] for f in branches.LAYER_CONTENT_FIELDS if f in incoming}}
+    merged, conflicts = branches.merge_fields(base.fields, branches.layer_fields(layer_obj), theirs)
+    if conflicts:
+        return None, {'layer': layer_obj.id, 'reason': 'merge conflict', 'fields': conflicts}
+    incoming.pop('version_number', None)
+    return {**incoming, **merged}, None
+
+def _bulk_upsert_layers(map_obj, layers, results, performed_by=None, message='', progress=None):
+    """
+    MAP 导入中的 Layer 批量 upsert：
+    - 一次 in_bulk 预取所有引用的 Layer；
+    - 在进程内完成冲突检查与 full_clean（不做逐行唯一性查询），任一行非法则整体不写入；
+    - 导入后内容哈希不变的 Layer 记入 results['unchanged']，不写入、不推进版本；
+    - 使用 bulk_update / bulk_create 写入 Layer、MapLayer 与 LayerVersion，AuditLog 提交后整批写入；
+      已有 Layer 以读取时的版本号为条件更新（versioning.bulk_compare_and_swap），被并发修改时抛出 VersionConflict。
+    结果写入 results（与逐条导入的结构一致），返回 layer_diffs 日志。
+    progress(stage, processed) 每校验 IMPORT_BATCH_SIZE 个 Layer 及开始写入时调用一次。
+    """
+    existing = Layer.objects.in_bulk([l['id'] for l in layers if l.get('id')])
+    base_commits = _base_commits(layers)
+    member_digests = digests.member_digests(existing.keys())
+    content_hashes = {}
+    loaded_versions = {pk: layer.version_number for pk, layer in existing.items()}
+
+    to_update, to_create, layer_diffs, errors = [], [], [], []
+    for index, l in enumerate(layers):
+        if progress and index and index % IMPORT_BATCH_SIZE == 0:
+            progress('layers', index)
+        layer_obj = existing.get(l.get('id')) if l.get('id') else None
+        if layer_obj:
+            incoming, conflict = _incoming_layer_fields(layer_obj, l, base_commits)
+            if conflict:
+                results['conflicts'].append(conflict)
+                continue
+            before_hash = digests.layer_hash(layer_obj, digests=member_digests)
+            before = _serialize_instance(layer_obj)
+            for k, v in incoming.items():
+                setattr(layer_obj, k, v)
+            content_hashes[layer_obj.id] = digests.layer_hash(layer_obj, message, member_digests)
+            if content_hashes[layer_obj.id] == before_hash:
+                results['unchanged'].append({'layer': layer_obj.id})
+                continue
+            candidate = layer_obj
+        else:
+            candidate = Layer(
+                type=l.get('type'),
+                version_number=l.get('version_number', 1),
+                author=l.get('author', ''),
+                message=l.get('message', '')
+            )
+        try:
+            candidate.full_clean(validate_unique=False)
+        except ValidationError as exc:
+            errors.append(f"layers[{index}]: {exc.message_dict}")
+            continue
+        if layer_obj:
+            layer_diffs.append({'layer_id': layer_obj.id, 'diff': compute_diff_deep(before, _serialize_instance(layer_obj))})
+            to_update.append(layer_obj)
+        else:
+            to_create.append(candidate)
+    if errors:
+        raise ValidationError(errors)
+    if progress:
+        progress('writing', len(layers))
 
-    results = {'created': [], 'updated': [], 'conflicts': [], 'errors': [], 'version_changes': []}
+    versions, entries = [], []
+    for layer_obj in to_update:
+        version, entry, vc = _prepare_layer_version(layer_obj, performed_by, message, content_hashes[layer_obj.id])
+        versions.append(version)
+        entries.append(entry)
+        results['updated'].append({'layer': layer_obj.id})
+        results['version_changes'].append(vc)
+    versioning.bulk_compare_and_swap(to_update, _LAYER_IMPORT_FIELDS, loaded_versions, batch_size=IMPORT_BATCH_SIZE)
+    LayerVersion.objects.bulk_create(versions, batch_size=IMPORT_BATCH_SIZE)
+    audit.record_many(entries)
+
+    if connection.features.can_return_rows_from_bulk_insert:
+        Layer.objects.bulk_create(to_create, batch_size=IMPORT_BATCH_SIZE)
+    else:
+        # 后端不回填自增主键（如 MySQL）时退回逐条插入
+        for new_layer in to_create:
+            new_layer.save(force_insert=True)
+    MapLayer.objects.bulk_create([MapLayer(map=map_obj, layer=new_layer) for new_layer in to_create],
+                                 batch_size=IMPORT_BATCH_SIZE, ignore_conflicts=True)
+    # bulk_* 不触发 post_save，显式使导出缓存失效
+    export_cache.invalidate_layers([l.id for l in to_update + to_create])
+    for new_layer in to_create:
+        results['created'].append({'layer': new_layer.id})
+        results['version_changes'].append({
+            'layer_id': new_layer.id, 'new_version': new_layer.version_number, 'diff': {'created': True}
+        })
+    return layer_diffs
+
+# MAP 导入 data['records'] 中允许的表，按外键依赖排序：后面的分段可引用前面分段中显式给出 id 的行
+_RECORD_IMPORT_MODELS = [
+    BaseNode, BaseEdge, MechanismRelationship, Node, Edge, IntraEdge, Configuration, Technique, TargetNode,
+    Diagram, Condition, Record, Execution, AnalysisAlgorithm, FormatConversion, Result, Simulation, Project,
+]
+
+def _record_instances(model, rows):
+    """
+    按导出格式（外键以 id 表示）构造未保存实例；'id' 指主键（主键不名为 id 的模型如 Edge 映射到其主键字段）。
+    未知字段、'id' 与主键字段同时给出且不一致时按行报错。返回 (实例, 各实例在 rows 中的下标, 错误)。
+    """
+    pk = model._meta.pk
+    fields = {f.name: f.attname for f in model._meta.concrete_fields}
+    fields.setdefault('id', pk.attname)
+    instances, indexes, errors = [], [], []
+    for index, row in enumerate(rows):
+        unknown = sorted(set(row) - set(fields))
+        if unknown:
+            errors.append(f"{model.__name__}[{index}]: unknown fields {unknown}")
+            continue
+        values = {}
+        for k, v in row.items():
+            if values.setdefault(fields[k], v) != v:
+                errors.append(f"{model.__name__}[{index}]: conflicting values for {pk.name}: 'id' and {k!r}")
+                break
+        else:
+            instances.append(model(**values))
+            indexes.append(index)
+    return instances, indexes, errors
 
-    job = ResourceImportJob.objects.create(
-        import_type=import_type,
+def _bulk_import_records(sections, results, progress=None):
+    """
+    MAP 导入中的关联记录（TargetNode、Diagram、Simulation 等）批量写入：
+    每个分段经 validate_batch 校验，外键存在性按目标表各一次 id__in 查询完成（不随行数增长），
+    逐行错误汇总后任一行非法则整体失败；合法分段 bulk_create 后再处理依赖它的分段。
+    progress(stage, processed, total) 每写完一个分段调用一次。
+    """
+    unknown = sorted(set(sections) - {m.__name__ for m in _RECORD_IMPORT_MODELS})
+    if unknown:
+        raise ValidationError(f"Unsupported record types: {unknown}")
+    layer_ids, configuration_ids = set(), set()
+    present = [model for model in _RECORD_IMPORT_MODELS if sections.get(model.__name__)]
+    for done, model in enumerate(present):
+        rows = sections[model.__name__]
+        instances, indexes, errors = _record_instances(model, rows)
+        errors += [f"{model.__name__}[{indexes[position]}]: {row_errors}"
+                   for position, row_errors in sorted(validate_batch(instances).items())]
+        if errors:
+            raise ValidationError(errors)
+        if connection.features.can_return_rows_from_bulk_insert or all(obj.pk for obj in instances):
+            model.objects.bulk_create(instances, batch_size=IMPORT_BATCH_SIZE)
+        else:
+            # 后端不回填自增主键（如 MySQL）时退回逐条插入
+            for obj in instances:
+                obj.save(force_insert=True)
+        results['created'].extend({model.__name__: obj.pk} for obj in instances)
+        # bulk_create 不触发 post_save，显式建立空间索引、行政区划汇总与图层计数
+        if model in (BaseNode, BaseEdge):
+            spatial.index_objects(model, [obj.pk for obj in instances])
+        if model in (BaseNode, Node):
+            rollups.apply_instances(model, instances)
+        if model in (Node, IntraEdge):
+            counters.apply_instances(model, instances)
+        layer_ids.update(getattr(obj, 'layer_id', None) for obj in instances)
+        configuration_ids.update(getattr(obj, 'configuration_id', None) for obj in instances)
+        if progress:
+            progress('records', done + 1, len(present))
+    # bulk_* 不触发 post_save：Node / IntraEdge / Configuration 直接属于图层，Diagram 经 Configuration 归属图层
+    configuration_ids.discard(None)
+    if configuration_ids:
+        layer_ids.update(Configuration.objects.filter(id__in=configuration_ids).values_list('layer_id', flat=True))
+    layer_ids.discard(None)
+    if layer_ids:
+        export_cache.invalidate_layers(layer_ids)
+
+def _create_import_job(payload: dict, user=None):
+    bind_map = payload.get('bind_map')
+    bind_layer = payload.get('bind_layer')
+    return ResourceImportJob.objects.create(
+        import_type=payload['import_type'],
         target_map=Map.objects.filter(id=bind_map).first() if bind_map else None,
         target_layer=Layer.objects.filter(id=bind_layer).first() if bind_layer else None,
-        imported_data=data,
+        imported_data=payload['data'],
         status='PENDING',
-        user=None,  # 调用方可在视图层传入 request.user
-        logs={}
+        user=user,  # 调用方可在视图层传入 request.user
+        logs={'message': payload.get('message', '')}
     )
 
-    try:
-        if import_type == 'MAP':
-            map_info = data.get('map')
-            layers = data.get('layers', [])
-            if not map_info:
-                raise ValidationError("MAP import requires top-level 'map' object")
-
-            # upsert map
-            map_obj = Map.objects.filter(id=map_info.get('id')).first() if map_info.get('id') else None
-            if map_obj:
-                before = _serialize_instance(map_obj)
-                for k, v in map_info.items():
-                    if k in ['id', 'created_at', 'updated_at']: continue
-                    setattr(map_obj, k, v)
-                map_obj.full_clean(); map_obj.save()
-                after = _serialize_instance(map_obj)
-                results['updated'].append({'map': map_obj.id})
-                diff = compute_diff_deep(before, after)
-                results['version_changes'].append(create_map_version(map_obj, performed_by, message))
-                job.logs['map_diff'] = diff
-            else:
-                map_obj = Map.objects.create(
-                    version_number=map_info.get('version_number', 1),
-                    author=map_info.get('author', ''),
-                    message=map_info.get('message', '')
-                )
-                results['created'].append({'map': map_obj.id})
-                # 初次创建也做归档
-                _archive_map_snapshot(map_obj, author=map_obj.author, message=map_obj.message)
-
-            # layers
-            job.logs['layer_diffs'] = []
-            for l in layers:
-                layer_obj = Layer.objects.filter(id=l.get('id')).first() if l.get('id') else None
-                if layer_obj:
-                    incoming_version = l.get('version_number', 1)
-                    if incoming_version <= (layer_obj.version_number or 1):
-                        results['conflicts'].append({'layer': layer_obj.id, 'reason': 'incoming version not newer'})
-                        continue
-                    before = _serialize_instance(layer_obj)
-                    for k, v in l.items():
-                        if k in ['id', 'created_at', 'updated_at']: continue
-                        setattr(layer_obj, k, v)
-                    layer_obj.full_clean(); layer_obj.save()
-                    after = _serialize_instance(layer_obj)
-                    results['updated'].append({'layer': layer_obj.id})
-                    vc = create_layer_version(layer_obj, performed_by, message)
-                    results['version_changes'].append(vc)
-                    job.logs['layer_diffs'].append({'layer_id': layer_obj.id, 'diff': compute_diff_deep(before, after)})
-                else:
-                    new_layer = Layer.objects.create(
-                        type=l.get('type'),
-                        version_number=l.get('version_number', 1),
-                        author=l.get('author', ''),
-                        message=l.get('message', '')
-                    )
-                    MapLayer.objects.get_or_create(map=map_obj, layer=new_layer)
-                    results['created'].append({'layer': new_layer.id})
-                    results['version_changes'].append({
-                        'layer_id': new_layer.id, 'new_version': new_layer.version_number, 'diff': {'created': True}
-                    })
-
-        elif import_type == 'LAYER':
-            l = data.get('layer')
-            if not l:
-                raise ValidationError("LAYER import requires top-level 'layer' object")
-            layer_obj = Layer.objects.filter(id=l.get('id')).first() if l.get('id') else None
-            if layer_obj:
-                incoming_version = l.get('version_number', 1)
-                if incoming_version <= (layer_obj.version_number or 1):
-                    results['conflicts'].append({'layer': layer_obj.id, 'reason': 'incoming version not newer'})
-                else:
-                    before = _serialize_instance(layer_obj)
-                    for k, v in l.items():
-                        if k in ['id', 'created_at', 'updated_at']: continue
-                        setattr(layer_obj, k, v)
-                    layer_obj.full_clean(); layer_obj.save()
-                    after = _serialize_instance(layer_obj)
-                    results['updated'].append({'layer': layer_obj.id})
-                    vc = create_layer_version(layer_obj, performed_by, message)
-                    results['version_changes'].append(vc)
-                    job.logs['layer_diff'] = compute_diff_deep(before, after)
-            else:
-                new_layer = Layer.objects.create(
-                    type=l.get('type'),
-                    version_number=l.get('version_number', 1),
-                    author=l.get('author', ''),
-                    message=l.get('message', '')
-                )
-                results['created'].append({'layer': new_layer.id})
-                results['version_changes'].append({'layer_id': new_layer.id, 'new_version': new_layer.version_number, 'diff': {'created': True}})
-                layer_obj = new_layer
-
-            if payload.get('bind_map'):
-                map_obj = Map.objects.filter(id=payload['bind_map']).first()
-                if map_obj:
-                    MapLayer.objects.get_or_create(map=map_obj, layer=layer_obj)
+def _import_total(import_type, data):
+    if import_type == 'MAP' and isinstance(data, dict):
+        return len(data.get('layers') or [])
+    return 1
+
+# 逐批进度在缓存中的保留时间（秒）；任务结束后进度写入 logs['progress'] 并删除缓存条目
+IMPORT_PROGRESS_TIMEOUT = 60 * 60
 
+def _progress_cache():
+    return caches[getattr(settings, 'IMPORT_PROGRESS_CACHE_ALIAS', 'default')]
+
+def _progress_key(job_id):
+    return f"import:progress:{job_id}"
+
+def _report_progress(job, stage, processed, total=None):
+    """
+    写入导入任务的逐批进度。进度写入缓存而非任务行：导入事务提交前轮询方即可见，
+    也不与导入事务争用数据库写锁（SQLite 同一时刻只允许一个写事务）。
+    """
+    if total is None:
+        total = _import_total(job.import_type, job.imported_data)
+    _progress_cache().set(_progress_key(job.id), {'stage': stage, 'total': total, 'processed': processed},
+                          IMPORT_PROGRESS_TIMEOUT)
+
+def import_progress(job):
+    """轮询返回的进度：运行中取缓存中的逐批进度（缺失时退回 logs['progress']），其余状态为 logs['progress']。"""
+    progress = job.logs.get('progress')
+    if job.status == 'RUNNING':
+        progress = _progress_cache().get(_progress_key(job.id), progress)
+    return progress
+
+def import_json_payload(payload: dict, performed_by=None, user=None):
+    """
+    同步导入：在当前线程内创建并执行 ResourceImportJob。
+    不在外层事务中执行：每次尝试各自是一个顶层事务（见 _execute_import_job）。
+    """
+    ok, errors = _validate_and_prepare_import_payload(payload)
+    if not ok:
+        return {'status': 'FAILED', 'errors': errors}
+    job = _create_import_job(payload, user)
+    return _execute_import_job(job, performed_by)
+
+def submit_import_job(payload: dict, performed_by=None, user=None):
+    """
+    异步导入：创建 PENDING 状态的 ResourceImportJob 并投递到后台执行池，立即返回 job_id。
+    进度与结果通过 ResourceImportJob.status / logs 轮询获取。
+    """
+    ok, errors = _validate_and_prepare_import_payload(payload)
+    if not ok:
+        return {'status': 'FAILED', 'errors': errors}
+    job = _create_import_job(payload, user)
+    job.logs['progress'] = {'stage': 'queued', 'total': _import_total(job.import_type, job.imported_data), 'processed': 0}
+    # 任务只在进程内排队，记下执行者以便进程重启后由 recover_import_jobs 重新执行
+    job.logs['performed_by'] = performed_by
+    job.save(update_fields=['logs'])
+    tasks.enqueue(run_import_job, job.id, performed_by)
+    return {'status': 'PENDING', 'job_id': job.id}
+
+def run_import_job(job_id, performed_by=None):
+    """
+    后台执行入口：以条件 UPDATE（仅 PENDING -> RUNNING）认领任务，同一任务被重复投递时只有一个执行者认领成功；
+    RUNNING 状态先行提交（对轮询方可见），再执行导入（每次尝试各自是一个顶层事务）。
+    """
+    claimed = ResourceImportJob.objects.filter(id=job_id, status='PENDING').update(status='RUNNING',
+                                                                                   started_at=timezone.now())
+    job = ResourceImportJob.objects.get(id=job_id)
+    if not claimed:
+        return {'status': job.status, 'job_id': job.id}
+    job.logs['progress'] = {'stage': 'running', 'total': _import_total(job.import_type, job.imported_data), 'processed': 0}
+    job.save(update_fields=['logs'])
+    return _execute_import_job(job, performed_by)
+
+def recover_import_jobs(stale_after=None):
+    """
+    恢复因工作进程重启 / 回收而中断的导入任务（任务只在进程内排队，进程退出即丢失）：
+    认领超过 stale_after 秒（默认 IMPORT_JOB_STALE_SECONDS）仍为 RUNNING 的任务以条件 UPDATE 标记为 FAILED，
+    创建超过 stale_after 秒仍为 PENDING 的任务重新投递（run_import_job 的认领保证不会重复执行）。
+    返回 (标记失败的任务 id, 重新投递的任务 id)。
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'IMPORT_JOB_STALE_SECONDS', 60 * 60)
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=stale_after)
+    failed = []
+    # started_at 为空的 RUNNING 任务（字段加入之前认领）以创建时间判断
+    running = ResourceImportJob.objects.filter(status='RUNNING').filter(
+        models.Q(started_at__lt=cutoff) | models.Q(started_at__isnull=True, created_at__lt=cutoff))
+    for job in running:
+        error = f"interrupted: no progress for {stale_after} seconds (worker restarted?)"
+        job.logs['error'] = error
+        job.logs['progress'] = {'stage': 'failed', 'total': _import_total(job.import_type, job.imported_data),
+                                'processed': 0}
+        if ResourceImportJob.objects.filter(id=job.id, status='RUNNING').update(
+                status='FAILED', completed_at=now, logs=job.logs):
+            _progress_cache().delete(_progress_key(job.id))
+            audit.record('IMPORT', job.import_type, job.id, meta={'error': error}, user=job.user)
+            failed.append(job.id)
+    pending = list(ResourceImportJob.objects.filter(status='PENDING', created_at__lt=cutoff)
+                   .values_list('id', 'logs'))
+    for job_id, logs in pending:
+        tasks.enqueue(run_import_job, job_id, (logs or {}).get('performed_by'))
+    return failed, [job_id for job_id, _ in pending]
+
+def _apply_import(job, results, performed_by=None):
+    """执行一次导入，结果写入 results；在调用方的事务内运行，版本冲突时由调用方整体重试。"""
+    import_type = job.import_type
+    data = job.imported_data
+    message = job.logs.get('message', '')
+    progress = partial(_report_progress, job)
+
+    if import_type == 'MAP':
+        map_info = data.get('map')
+        layers = data.get('layers', [])
+        if not map_info:
+            raise ValidationError("MAP import requires top-level 'map' object")
+
+        # upsert map
+        map_obj = Map.objects.filter(id=map_info.get('id')).first() if map_info.get('id') else None
+        if map_obj:
+            loaded_version = map_obj.version_number
+            before = _serialize_instance(map_obj)
+            before_fields = digests.content_fields(map_obj)
+            for k, v in map_info.items():
+                if k in ['id', 'created_at', 'updated_at']: continue
+                setattr(map_obj, k, v)
+            map_obj.full_clean()
+            after = _serialize_instance(map_obj)
+            results['updated'].append({'map': map_obj.id})
+            diff = compute_diff_deep(before, after)
+            # 字段有变化时必须写入；字段与版本号以读取时的版本号为条件一次写入
+            results['version_changes'].append(create_map_version(
+                map_obj, performed_by, message, force=digests.content_fields(map_obj) != before_fields,
+                expected_version=loaded_version))
+            job.logs['map_diff'] = diff
         else:
-            raise ValidationError("Unsupported import_type (must be MAP or LAYER)")
+            map_obj = Map.objects.create(
+                version_number=map_info.get('version_number', 1),
+                author=map_info.get('author', ''),
+                message=map_info.get('message', '')
+            )
+            results['created'].append({'map': map_obj.id})
+            # 初次创建也做归档
+            _archive_map_snapshot(map_obj, author=map_obj.author, message=map_obj.message)
 
-        job.status = 'SUCCESS'
-        job.completed_at = timezone.now()
-        job.save()
+        # layers（批量 upsert，查询数与 layer 数量无关）
+        job.logs['layer_diffs'] = _bulk_upsert_layers(map_obj, layers, results, performed_by, message, progress)
+        if data.get('records'):
+            _bulk_import_records(data['records'], results, progress)
+
+    elif import_type == 'LAYER':
+        l = data.get('layer')
+        if not l:
+            raise ValidationError("LAYER import requires top-level 'layer' object")
+        layer_obj = Layer.objects.filter(id=l.get('id')).first() if l.get('id') else None
+        if layer_obj:
+            loaded_version = layer_obj.version_number
+            incoming, conflict = _incoming_layer_fields(layer_obj, l, _base_commits([l]))
+            member_digests = digests.member_digests([layer_obj.id])
+            before_hash = digests.layer_hash(layer_obj, digests=member_digests)
+            before = _serialize_instance(layer_obj)
+            for k, v in (incoming or {}).items():
+                setattr(layer_obj, k, v)
+            if conflict:
+                results['conflicts'].append(conflict)
+            elif digests.layer_hash(layer_obj, message, member_digests) == before_hash:
+                results['unchanged'].append({'layer': layer_obj.id})
+            else:
+                layer_obj.full_clean()
+                after = _serialize_instance(layer_obj)
+                results['updated'].append({'layer': layer_obj.id})
+                # 内容已确认有变化，不再与最新版本比较；字段与版本号以读取时的版本号为条件一次写入
+                vc = create_layer_version(layer_obj, performed_by, message, force=True,
+                                          expected_version=loaded_version)
+                results['version_changes'].append(vc)
+                job.logs['layer_diff'] = compute_diff_deep(before, after)
+        else:
+            new_layer = Layer.objects.create(
+                type=l.get('type'),
+                version_number=l.get('version_number', 1),
+                author=l.get('author', ''),
+                message=l.get('message', '')
+            )
+            results['created'].append({'layer': new_layer.id})
+            results['version_changes'].append({'layer_id': new_layer.id, 'new_version': new_layer.version_number, 'diff': {'created': True}})
+            layer_obj = new_layer
+
+        if job.target_map_id:
+            MapLayer.objects.get_or_create(map_id=job.target_map_id, layer=layer_obj)
 
-        AuditLog.objects.create(
-            user=job.user, action='IMPORT',
-            resource_type=import_type, resource_id=job.id,
-            meta={'results': results, 'logs': job.logs}
-        )
+    else:
+        raise ValidationError("Unsupported import_type (must be MAP or LAYER)")
+
+
+def _execute_import_job(job, performed_by=None):
+    """
+    执行导入并记录任务结果。每次尝试是一个顶层事务（导入与任务状态一同提交）：版本冲突（其他写入者在读取之后
+    推进了版本）时回滚本次尝试，在新事务中重新读取后整体重试，最多 versioning.retries() 次。
+    调用方已处于事务中时不重试——重试只能是同一事务内的保存点，在 MySQL 可重复读下会读到同一快照而再次冲突。
+    """
+    import_type = job.import_type
+    total = _import_total(import_type, job.imported_data)
+    retries = 0 if transaction.get_connection().in_atomic_block else versioning.retries()
+    results = {}
+
+    try:
+        for attempt in range(retries + 1):
+            results = {'created': [], 'updated': [], 'unchanged': [], 'conflicts': [], 'errors': [],
+                       'version_changes': []}
+            try:
+                with transaction.atomic():
+                    _apply_import(job, results, performed_by)
+                    job.status = 'SUCCESS'
+                    job.completed_at = timezone.now()
+                    job.logs['progress'] = {
+                        'stage': 'done', 'total': total, 'processed': total,
+                        **{k: len(results[k]) for k in ('created', 'updated', 'conflicts')}
+                    }
+                    job.save()
+                    audit.record('IMPORT', import_type, job.id, meta={'results': results, 'logs': job.logs},
+                                 user=job.user)
+                break
+            except versioning.VersionConflict:
+                if attempt == retries:
+                    raise
+            job.logs['retries'] = attempt + 1
+            _report_progress(job, 'retrying', 0, total)
+
+        _progress_cache().delete(_progress_key(job.id))
         return {'status': 'SUCCESS', 'results': results}
     except Exception as exc:
         job.status = 'FAILED'
         job.completed_at = timezone.now()
         job.logs['error'] = str(exc)
+        job.logs['progress'] = {'stage': 'failed', 'total': total, 'processed': 0}
         job.save()
-        AuditLog.objects.create(
-            user=job.user, action='IMPORT', resource_type=import_type, resource_id=job.id,
-            meta={'error': str(exc)}
-        )
-        return {'status': 'FAILED', 'error': str(exc), 'partial_results': results}
+        _progress_cache().delete(_progress_key(job.id))
+        audit.record('IMPORT', import_type, job.id, meta={'error': str(exc)}, user=job.user)
+        failure = {'status': 'FAILED', 'error': str(exc), 'partial_results': results}
+        if isinstance(exc, versioning.VersionConflict):
+            failure['conflict'] = True
+        return failure
+
+# 回滚时从快照恢复的 Layer 元数据字段（updated_at 由回滚时刻重新写入）
+_LAYER_ROLLBACK_FIELDS = [f for f in _LAYER_IMPORT_FIELDS if f != 'updated_at']
+
+def _restore_snapshot_layers(snap_layers, now):
+    """
+    按快照恢复 Layer 元数据：一次 in_bulk 取回现存 Layer，仅对字段有差异的行 bulk_update；
+    快照中已不存在的 Layer 批量重建。返回 (按快照顺序的 layer_id 列表, 被修改/新建的 layer_id 列表)。
+    """
+    existing = Layer.objects.in_bulk([l['id'] for l in snap_layers if l.get('id')])
+    order, changed, to_create = [], [], []
+    for l in snap_layers:
+        lay = existing.get(l.get('id')) if l.get('id') else None
+        if lay is None:
+            lay = Layer(
+                type=l.get('type'),
+                version_number=l.get('version_number', 1),
+                author=l.get('author', ''),
+                message=l.get('message', '')
+            )
+            to_create.append(lay)
+        else:
+            current = _serialize_instance(lay)
+            dirty = [k for k in _LAYER_ROLLBACK_FIELDS if k in l and current.get(k) != l[k]]
+            if dirty:
+                for k in dirty:
+                    setattr(lay, k, l[k])
+                lay.updated_at = now
+                changed.append(lay)
+        order.append(lay)
+
+    Layer.objects.bulk_update(changed, _LAYER_IMPORT_FIELDS, batch_size=IMPORT_BATCH_SIZE)
+    if connection.features.can_return_rows_from_bulk_insert:
+        Layer.objects.bulk_create(to_create, batch_size=IMPORT_BATCH_SIZE)
+    else:
+        # 后端不回填自增主键（如 MySQL）时退回逐条插入
+        for new_layer in to_create:
+            new_layer.save(force_insert=True)
+    return [lay.id for lay in order], [lay.id for lay in changed + to_create]
+
+def _sync_map_layers(map_obj, layer_ids):
+    """
+    将 Map 的 MapLayer 关联调整为 layer_ids（含顺序，导出按关联主键排序）：
+    保留与目标顺序一致的最长前缀，其后的关联删除并按目标顺序重建，
+    因此只增删有变化的行。返回 (新增 layer_id 列表, 移除 layer_id 列表)。
+    """
+    current = list(MapLayer.objects.filter(map=map_obj).order_by('id').values_list('id', 'layer_id'))
+    target = list(dict.fromkeys(layer_ids))
+    wanted = set(target)
+    kept = [(link_id, layer_id) for link_id, layer_id in current if layer_id in wanted]
+    prefix = 0
+    while prefix < len(kept) and kept[prefix][1] == target[prefix]:
+        prefix += 1
+
+    doomed = [link_id for link_id, layer_id in current if layer_id not in wanted] + [link_id for link_id, _ in kept[prefix:]]
+    if doomed:
+        MapLayer.objects.filter(id__in=doomed).delete()
+    MapLayer.objects.bulk_create([MapLayer(map=map_obj, layer_id=layer_id) for layer_id in target[prefix:]],
+                                 batch_size=IMPORT_BATCH_SIZE)
+    before = {layer_id for _, layer_id in current}
+    return [i for i in target if i not in before], [i for i in before if i not in wanted]
 
 @transaction.atomic
 def rollback_map_to_version(map_id: int, version_number: int, performed_by=None, message: str = '') -> dict:
     """
-    根据 MapArchive 快照将 Map 回滚到历史版本：
+    根据 MapArchive 快照将 Map 回滚到历史版本（增量）：
     - 用快照覆盖 Map 当前元信息
-    - 重新同步 MapLayer（以快照中的 layers 为准）
-    注意：此示例回滚的是 Map 及 Layer 元数据（不含 Layer 内更深层资源）。
+    - Layer 元数据只更新与快照不一致的行，快照中已被删除的 Layer 重新创建
+    - MapLayer 只增删与快照不一致的关联（见 _sync_map_layers）
+    查询数与图层数量无关。注意：回滚的是 Map 及 Layer 元数据（不含 Layer 内更深层资源）。
+    不锁定 Map 行：新版本以读取时的版本号为条件写入，期间 Map 被并发推进时抛出 versioning.VersionConflict 并整体回滚
+    （可经 versioning.retrying 重试）。
     """
-    archive = MapArchive.objects.filter(map_id=map_id, version_number=version_number).first()
-    if not archive:
-        raise ObjectDoesNotExist(f"No archived snapshot for map {map_id} version {version_number}")
-
-    # 读取快照
-    snap = archive.snapshot
+    # 读取快照（由差量链重建）
+    snap = reconstruct_map_snapshot(map_id, version_number)
     snap_map = snap.get('map') or {}
     snap_layers = snap.get('layers', [])
 
     m = Map.objects.get(id=map_id)
+    now = timezone.now()
 
     before = _serialize_instance(m)
-    # 覆盖 Map 基元字段（避免覆盖 id/时间）
+    # 覆盖 Map 基元字段（避免覆盖 id/时间；版本号保持线性推进，不回退）
     for k, v in snap_map.items():
-        if k in ['id', 'created_at', 'updated_at']: continue
+        if k in ['id', 'created_at', 'updated_at', 'version_number']: continue
         setattr(m, k, v)
-    m.updated_at = timezone.now()
-    m.save()
-
-    # 重建 MapLayer 关联（保持 Layer 表元信息为快照中内容）
-    # 1) 清除现有关联
-    MapLayer.objects.filter(map=m).delete()
-
-    # 2) 将快照中的 layer upsert 并绑定
-    for l in snap_layers:
-        lay = Layer.objects.filter(id=l.get('id')).first() if l.get('id') else None
-        if lay:
-            for k, v in l.items():
-                if k in ['id', 'created_at', 'updated_at']: continue
-                setattr(lay, k, v)
-            lay.save()
-        else:
-            lay = Layer.objects.create(
-                type=l.get('type'),
-                version_number=l.get('version_number', 1),
-                author=l.get('author', ''),
-                message=l.get('message', '')
-            )
-            # 如果快照里有 id，你也可以在迁移时允许手动设置 pk，但 Django 默认不建议直接改 pk
-        MapLayer.objects.get_or_create(map=m, layer=lay)
-
     after = _serialize_instance(m)
     diff = compute_diff_deep(before, after)
 
-    # 回滚后创建新版本（保持版本线性推进）
+    layer_ids, touched = _restore_snapshot_layers(snap_layers, now)
+    added, removed = _sync_map_layers(m, layer_ids)
+    # bulk_* 不触发 post_save，显式使导出缓存失效（Map 本身由 create_map_version 的 save 失效）
+    export_cache.invalidate_layers(set(touched) | set(added) | set(removed))
+
+    # 回滚后创建新版本（保持版本线性推进），其中一次性保存 Map 字段
     vc = create_map_version(m, changed_by=performed_by, change_message=message or f"Rollback to v{version_number}")
 
-    AuditLog.objects.create(
-        user=None, action='ROLLBACK', resource_type='Map', resource_id=m.id,
-        meta={'rolled_to': version_number, 'map_diff': diff, 'new_version': vc['new_version']}
-    )
+    audit.record('ROLLBACK', 'Map', m.id,
+                 meta={'rolled_to': version_number, 'map_diff': diff, 'new_version': vc['new_version'],
+                       'layers_changed': touched, 'links_added': added, 'links_removed': removed})
 
     return {'rolled_to': version_number, 'map_id': m.id, 'version_after_rollback': vc['new_version'], 'map_diff': diff}
+
+@transaction.atomic
+def fork_layer_branch(layer_id: int, name: str, performed_by=None) -> dict:
+    """从 Layer 当前内容 fork 出分支 Layer（见 manager.branches.fork_layer）。"""
+    layer = Layer.objects.get(id=layer_id)
+    fork = branches.fork_layer(layer, name, author=performed_by or '')
+    audit.record('FORK', 'Layer', layer.id, meta={'fork': fork.id, 'name': name, 'by': performed_by})
+    return {'layer_id': fork.id, 'origin': layer.id, 'name': name, 'head': fork.branch.head.commit_hash}
+
+@transaction.atomic
+def merge_layer_branch(layer_id: int, source_id: int, performed_by=None, message: str = '', strategy=None) -> dict:
+    """
+    把分支 Layer source_id 三方合并进 layer_id；内容有变化（fast-forward / merged）时推进目标 Layer 版本。
+    内容字段冲突时抛出 branches.MergeConflict，事务整体回滚。
+    """
+    target = Layer.objects.select_for_update().get(id=layer_id)
+    source = Layer.objects.get(id=source_id)
+    result = branches.merge_layers(target, source, author=performed_by or '', message=message, strategy=strategy)
+    if result['status'] != 'up-to-date':
+        result['version_change'] = create_layer_version(target, performed_by, message or f"Merge layer {source_id}")
+    audit.record('MERGE', 'Layer', target.id, meta={'source': source_id, 'by': performed_by,
+                                                    **{k: v for k, v in result.items() if k != 'version_change'}})
+    return result
+
+@transaction.atomic
+def fork_map_branch(map_id: int, name: str, performed_by=None) -> dict:
+    """fork 出 Map 分支：新 Map 及其每个 Layer 的分支（见 manager.branches.fork_map）。"""
+    map_obj = Map.objects.get(id=map_id)
+    fork = branches.fork_map(map_obj, name, author=performed_by or '')
+    _archive_map_snapshot(fork, author=fork.author, message=fork.message)
+    audit.record('FORK', 'Map', map_obj.id, meta={'fork': fork.id, 'name': name, 'by': performed_by})
+    layers = list(MapLayer.objects.filter(map=fork).order_by('id').values_list('layer_id', flat=True))
+    return {'map_id': fork.id, 'origin': map_obj.id, 'name': name, 'layers': layers}
+
+@transaction.atomic
+def merge_map_branch(map_id: int, source_id: int, performed_by=None, message: str = '', strategy=None) -> dict:
+    """
+    把 fork 出的 Map source_id 合并回 map_id：逐个 Layer 三方合并并推进有变化的 Layer 版本，
+    调整 MapLayer 关联（见 _sync_map_layers）后推进 Map 版本。任一冲突时抛出 branches.MergeConflict，整体回滚。
+    """
+    m = Map.objects.select_for_update().get(id=map_id)
+    source = Map.objects.get(id=source_id)
+    result = branches.merge_maps(m, source, author=performed_by or '', message=message, strategy=strategy)
+    for layer_id, layer_result in result['layers'].items():
+        if layer_result['status'] != 'up-to-date':
+            layer_result['version_change'] = create_layer_version(
+                Layer.objects.get(id=layer_id), performed_by, message or f"Merge map {source_id}")
+    added, removed = _sync_map_layers(m, result['layer_ids'])
+    export_cache.invalidate_layers(set(added) | set(removed))
+    result['version_change'] = create_map_version(m, changed_by=performed_by,
+                                                  change_message=message or f"Merge map {source_id}")
+    audit.record('MERGE', 'Map', m.id, meta={'source': source_id, 'by': performed_by, 'added': result['added'],
+                                             'removed': result['removed'],
+                                             'layers': {k: v['status'] for k, v in result['layers'].items()}})
+    return result
@@ -0,0 +1,167 @@
+# signals.py
+from collections import Counter
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from db.models import Map, Layer, MapLayer, Node, IntraEdge, Configuration, Diagram, BaseNode, BaseEdge, Edge
+from . import counters, export_cache, rollups, spatial
+
+
+def _default_db_only(handler):
+    """
+    导出缓存、空间索引、行政区划汇总与图层计数都只描述 default 库：
+    写入其他库（如数据迁移目标库）的行不触发处理，否则会按其主键改动 default 库中的汇总行。
+    """
+    @wraps(handler)
+    def wrapper(sender, instance, **kwargs):
+        if kwargs.get('using', DEFAULT_DB_ALIAS) != DEFAULT_DB_ALIAS:
+            return
+        return handler(sender, instance, **kwargs)
+    return wrapper
+
+
+# 逐行写入（admin、get_or_create 等）后使相关导出缓存失效；批量写入路径在 services 中显式失效
+@receiver([post_save, post_delete], sender=Map)
+@_default_db_only
+def on_map_changed(sender, instance, **kwargs):
+    export_cache.invalidate_maps([instance.id])
+
+
+@receiver([post_save, post_delete], sender=Layer)
+@_default_db_only
+def on_layer_changed(sender, instance, **kwargs):
+    export_cache.invalidate_layers([instance.id])
+
+
+@receiver([post_save, post_delete], sender=MapLayer)
+@receiver([post_save, post_delete], sender=Node)
+@receiver([post_save, post_delete], sender=IntraEdge)
+@receiver([post_save, post_delete], sender=Configuration)
+@_default_db_only
+def on_layer_child_changed(sender, instance, **kwargs):
+    export_cache.invalidate_layers([instance.layer_id])
+    if sender is MapLayer:
+        export_cache.invalidate_maps([instance.map_id])
+
+
+@receiver([post_save, post_delete], sender=Diagram)
+@_default_db_only
+def on_diagram_changed(sender, instance, **kwargs):
+    layer_id = Configuration.objects.filter(id=instance.configuration_id).values_list('layer_id', flat=True).first()
+    if layer_id is not None:
+        export_cache.invalidate_layers([layer_id])
+
+
+# 空间索引随坐标文本同步；删除由 BaseNodeGeo / BaseEdgeGeo 的级联外键完成，批量写入路径调用 spatial.index_objects
+@receiver(post_save, sender=BaseNode)
+@receiver(post_save, sender=BaseEdge)
+@_default_db_only
+def on_geo_changed(sender, instance, **kwargs):
+    spatial.index_instance(instance)
+    # 节点 / 边属性与位置出现在图层导出与瓦片中
+    if sender is BaseNode:
+        layer_ids = Node.objects.filter(base_node_id=instance.pk).values_list('layer_id', flat=True)
+    else:
+        layer_ids = IntraEdge.objects.filter(edge_id=instance.pk).values_list('layer_id', flat=True)
+    layer_ids = list(layer_ids)
+    if layer_ids:
+        export_cache.invalidate_layers(layer_ids)
+
+
+# 行政区划汇总：保存前记下旧值，保存 / 删除后按差量更新（批量写入路径调用 rollups.apply_instances）
+@receiver(pre_save, sender=BaseNode)
+@_default_db_only
+def remember_base_node_region(sender, instance, **kwargs):
+    old = BaseNode.objects.filter(pk=instance.pk).values_list(*rollups.FIELDS).first() if instance.pk else None
+    instance._rollup_before = old
+
+
+@receiver(post_save, sender=BaseNode)
+@_default_db_only
+def on_base_node_region_changed(sender, instance, created, **kwargs):
+    old, new = getattr(instance, '_rollup_before', None), rollups.node_values(instance)
+    if old == new:
+        return
+    layer_ids = [None] if created or old is None else \
+        [None] + list(Node.objects.filter(base_node_id=instance.pk).values_list('layer_id', flat=True))
+    deltas = Counter()
+    if old is not None:
+        rollups.add(deltas, old, layer_ids, -1)
+    rollups.add(deltas, new, layer_ids, 1)
+    rollups.apply(deltas)
+
+
+@receiver(post_delete, sender=BaseNode)
+@_default_db_only
+def on_base_node_deleted(sender, instance, **kwargs):
+    rollups.apply_instances(BaseNode, [instance], sign=-1)
+
+
+@receiver(pre_save, sender=Node)
+@_default_db_only
+def remember_node_layer(sender, instance, **kwargs):
+    instance._rollup_before = Node.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._member_before = instance._rollup_before
+
+
+@receiver(post_save, sender=Node)
+@_default_db_only
+def on_node_layer_changed(sender, instance, **kwargs):
+    old = getattr(instance, '_rollup_before', None)
+    if old is not None and (old.layer_id, old.base_node_id) == (instance.layer_id, instance.base_node_id):
+        return
+    if old is not None:
+        rollups.apply_instances(Node, [old], sign=-1)
+    rollups.apply_instances(Node, [instance])
+
+
+@receiver(post_delete, sender=Node)
+@_default_db_only
+def on_node_deleted(sender, instance, **kwargs):
+    rollups.apply_instances(Node, [instance], sign=-1)
+
+
+# 图层计数与成员摘要：新增、删除或改换图层 / 成员时增减 LayerStats（批量写入路径调用 counters.apply_instances）
+@receiver(pre_save, sender=IntraEdge)
+@_default_db_only
+def remember_intra_edge_layer(sender, instance, **kwargs):
+    instance._member_before = IntraEdge.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Node)
+@receiver(post_save, sender=IntraEdge)
+@_default_db_only
+def on_layer_member_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, '_member_before', None)
+    if old is not None and counters.member_key(old) == counters.member_key(instance):
+        return
+    if old is not None:
+        counters.apply_instances(sender, [old], sign=-1)
+    counters.apply_instances(sender, [instance])
+
+
+@receiver(post_delete, sender=Node)
+@receiver(post_delete, sender=IntraEdge)
+@_default_db_only
+def on_layer_member_deleted(sender, instance, **kwargs):
+    counters.apply_instances(sender, [instance], sign=-1)
+
+
+# 成员内容摘要：BaseNode / BaseEdge / Edge 的内容变化时调整包含它的各图层摘要（见 counters.content_changed）
+@receiver(pre_save, sender=BaseNode)
+@receiver(pre_save, sender=BaseEdge)
+@receiver(pre_save, sender=Edge)
+@_default_db_only
+def remember_member_content(sender, instance, **kwargs):
+    instance._content_before = counters.stored_content(sender, instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=BaseNode)
+@receiver(post_save, sender=BaseEdge)
+@receiver(post_save, sender=Edge)
+@_default_db_only
+def on_member_content_changed(sender, instance, **kwargs):
+    counters.content_changed(sender, instance.pk, getattr(instance, '_content_before', None))
@@ -0,0 +1,305 @@
+# simulation.py
+"""
+基于 NumPy 的级联失效仿真引擎。
+
+- 由 graph.load_map_graph 载入 Map 图，以 NumPy 视图零拷贝引用其 CSR 数组；
+- Technique 的 TargetNode 按 target_sequence 分波次注入：第 k 个序号的目标在第 k 步受到打击，
+  以 target_effect（截断到 [0, 1]，为空视为 1）为失效概率；
+- 每步失效传播：顶点失效的上游边数（仅计入本次迭代中“导通”的边，导通概率为 propagation_probability）
+  达到 threshold × 入度时失效；
+- 多次迭代（蒙特卡洛）堆叠为 (迭代, 顶点) 状态一起推进，每步只对本步新失效顶点的出边做数组运算，不逐顶点循环；
+- 每次迭代写一行 Record（record_data 为统计结果）与一行 Execution，批量写入；
+  最后写入 AnalysisAlgorithm（算法名与参数）/ Result / Condition / Simulation（指向最后一次迭代的 Execution），
+  给定 Diagram 时再写 Project。
+"""
+import json
+import time
+
+import numpy as np
+from django.db import connection, transaction
+
+from db.models import (
+    Diagram, TargetNode, Record, Execution, Condition, AnalysisAlgorithm, FormatConversion, Result,
+    Simulation, Project,
+)
+from . import graph as graph_engine, record_store
+
+ALGORITHM_NAME = 'cascade_failure'
+DEFAULT_MAX_STEPS = 100
+SIMULATION_WRITE_BATCH_SIZE = 500  # Record / Execution 每批写入行数
+BATCH_CELLS = 1 << 24  # 同时推进的 迭代数 × 顶点数 上限，控制内存占用
+
+
+class SimulationGraph:
+    """仿真用的图数组（只读）：CSR 出边 out_ptr/dst、入度，以及顶点-图层对。"""
+
+    ARRAYS = ('node_ids', 'out_ptr', 'dst', 'in_degree', 'layer_nodes', 'layer_ids', 'layer_pos')
+
+    def __init__(self, map_graph):
+        self.node_ids = np.frombuffer(map_graph.node_ids, dtype=np.int64)
+        self.index = map_graph.index
+        self.out_ptr = np.frombuffer(map_graph.out_ptr, dtype=np.int64)
+        self.dst = np.frombuffer(map_graph.out_idx, dtype=np.int64)
+        self.in_degree = np.diff(np.frombuffer(map_graph.in_ptr, dtype=np.int64))
+        layer_ptr = np.frombuffer(map_graph.layer_ptr, dtype=np.int64)
+        self.layer_nodes = np.repeat(np.arange(len(self.node_ids), dtype=np.int64), np.diff(layer_ptr))
+        self.layer_ids, self.layer_pos = np.unique(np.frombuffer(map_graph.layer_idx, dtype=np.int64),
+                                                   return_inverse=True)
+
+    @classmethod
+    def from_arrays(cls, arrays, index=None):
+        """由 ARRAYS 中各数组（如共享内存上的视图）直接构造，不访问数据库。"""
+        sim_graph = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(sim_graph, name, arrays[name])
+        sim_graph.index = index
+        return sim_graph
+
+    def arrays(self):
+        return {name: np.asarray(getattr(self, name), dtype=np.int64) for name in self.ARRAYS}
+
+    @property
+    def node_count(self):
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self):
+        return len(self.dst)
+
+    def layer_members(self, layer_id):
+        """某 Layer 内的顶点序号数组；图中没有该 Layer 时为空。"""
+        pos = np.searchsorted(self.layer_ids, layer_id)
+        if pos >= len(self.layer_ids) or self.layer_ids[pos] != layer_id:
+            return np.zeros(0, dtype=np.int64)
+        return self.layer_nodes[self.layer_pos == pos]
+
+
+def load_simulation_graph(map_id):
+    return SimulationGraph(graph_engine.load_map_graph(map_id))
+
+
+def waves_from_rows(rows, sim_graph, allowed=None):
+    """
+    将 (node_id, target_sequence, target_effect) 行按 target_sequence 升序分组为注入波次（为空的序号排在最前）：
+    返回 [(顶点序号数组, 失效概率数组), ...]。不在图中（或不在 allowed 顶点序号集合中）的目标节点被忽略。
+    """
+    waves = {}
+    for node_id, sequence, effect in rows:
+        i = sim_graph.index.get(node_id)
+        if i is None or (allowed is not None and i not in allowed):
+            continue
+        p = 1.0 if effect is None else min(max(float(effect), 0.0), 1.0)
+        waves.setdefault(sequence if sequence is not None else float('-inf'), {})[i] = p
+    return [(np.fromiter(w.keys(), dtype=np.int64), np.fromiter(w.values(), dtype=np.float64))
+            for _, w in sorted(waves.items())]
+
+
+def target_waves(technique_id, sim_graph):
+    """读取 Technique 的 TargetNode 并分组为注入波次（见 waves_from_rows）。"""
+    rows = TargetNode.objects.filter(technique_id=technique_id).values_list('node_id', 'target_sequence', 'target_effect')
+    return waves_from_rows(rows, sim_graph)
+
+
+def _out_edges(sim_graph, nodes):
+    """一组顶点序号的全部出边序号（CSR 区间展开，纯数组运算），以及每条出边对应的输入位置。"""
+    starts = sim_graph.out_ptr[nodes]
+    counts = sim_graph.out_ptr[nodes + 1] - starts
+    owner = np.repeat(np.arange(len(nodes)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return starts[owner] + offsets, owner
+
+
+def simulate_batch(sim_graph, waves, iterations, rng, threshold=1.0, propagation_probability=1.0,
+                   max_steps=DEFAULT_MAX_STEPS, return_steps=False):
+    """
+    同时推进 iterations 次迭代，返回 (failed, per_step)：
+    failed 为 (iterations, 顶点数) 的最终失效矩阵；per_step 为 (iterations, 步数) 的每步新增失效数。
+    return_steps=True 时追加返回 (iterations, 顶点数) 的失效步矩阵（未失效为 -1），供列式存储使用。
+    状态按 迭代 × 顶点 展平，每步只展开本步新失效顶点的出边，开销与传播规模成正比而非与图规模成正比。
+    每条边只会在其源点失效时被考察一次，因此逐边抽样导通等价于每次迭代预先抽样整张图的导通边。
+    """
+    if not 0 < threshold <= 1:
+        raise ValueError("threshold must be in (0, 1]")
+    n = sim_graph.node_count
+    need = np.where(sim_graph.in_degree > 0, threshold * sim_graph.in_degree, np.inf)
+    failed = np.zeros(iterations * n, dtype=bool)
+    lost = np.zeros(iterations * n, dtype=np.int64)
+    fail_step = np.full(iterations * n, -1, dtype=np.int32) if return_steps else None
+    per_step = []
+
+    newly = np.zeros(0, dtype=np.int64)
+    for step in range(max_steps):
+        if step < len(waves):
+            nodes, effect = waves[step]
+            rows, cols = np.nonzero(rng.random((iterations, len(nodes))) < effect)
+            newly = np.union1d(newly, rows * n + nodes[cols])
+            newly = newly[~failed[newly]]
+        if not len(newly) and step >= len(waves):
+            break
+        failed[newly] = True
+        if fail_step is not None:
+            fail_step[newly] = step
+        per_step.append(np.bincount(newly // n, minlength=iterations))
+        # 新失效顶点的出边使下游的失效上游计数 +1
+        edges, owner = _out_edges(sim_graph, newly % n)
+        targets = newly[owner] - newly[owner] % n + sim_graph.dst[edges]
+        if propagation_probability < 1:
+            targets = targets[rng.random(len(targets)) < propagation_probability]
+        targets, counts = np.unique(targets, return_counts=True)
+        lost[targets] += counts
+        newly = targets[(lost[targets] >= need[targets % n]) & ~failed[targets]]
+    per_step = np.stack(per_step, axis=1) if per_step else np.zeros((iterations, 0), dtype=np.int64)
+    if fail_step is not None:
+        return failed.reshape(iterations, n), per_step, fail_step.reshape(iterations, n)
+    return failed.reshape(iterations, n), per_step
+
+
+def batch_size(sim_graph, iterations):
+    """单次 simulate_batch 同时推进的迭代数（受 BATCH_CELLS 限制）。"""
+    return max(1, min(iterations, BATCH_CELLS // max(sim_graph.node_count, 1)))
+
+
+def _layer_impact(sim_graph, failed):
+    """(迭代, 图层) 的失效顶点计数矩阵。"""
+    iterations, layers = failed.shape[0], len(sim_graph.layer_ids)
+    rows, pairs = np.nonzero(failed[:, sim_graph.layer_nodes])
+    counts = np.bincount(rows * layers + sim_graph.layer_pos[pairs], minlength=iterations * layers)
+    return counts.reshape(iterations, layers)
+
+
+def iteration_records(sim_graph, failed, per_step, first_iteration, store_nodes):
+    impact = _layer_impact(sim_graph, failed)
+    totals = failed.sum(axis=1)
+    layer_ids = sim_graph.layer_ids.tolist()
+    for row in range(failed.shape[0]):
+        steps = per_step[row]
+        active = np.flatnonzero(steps)
+        data = {
+            'iteration': first_iteration + row,
+            'failed_count': int(totals[row]),
+            'steps': int(active[-1]) + 1 if len(active) else 0,
+            'failed_per_step': steps[:active[-1] + 1].tolist() if len(active) else [],
+            'layer_impact': {str(l): c for l, c in zip(layer_ids, impact[row].tolist()) if c},
+        }
+        if store_nodes:
+            data['failed_nodes'] = sim_graph.node_ids[failed[row]].tolist()
+        yield data
+
+
+def _insert_returning(model, objs):
+    if connection.features.can_return_rows_from_bulk_insert:
+        model.objects.bulk_create(objs, batch_size=SIMULATION_WRITE_BATCH_SIZE)
+    else:
+        # 后端不回填自增主键（如 MySQL）时退回逐条插入
+        for obj in objs:
+            obj.save(force_insert=True)
+    return objs
+
+
+def write_iterations(rows):
+    """批量写入每次迭代的 Record 与 Execution，返回 Execution 列表。"""
+    records = _insert_returning(Record, [Record(record_data=data) for data in rows])
+    executions = [Execution(iteration=data['iteration'], record=record) for data, record in zip(rows, records)]
+    Execution.objects.bulk_create(executions, batch_size=SIMULATION_WRITE_BATCH_SIZE)
+    return executions
+
+
+def finish_simulations(items):
+    """
+    items 为 [(参数 dict, 最后一次迭代的 Execution, Diagram 或 None), ...]，
+    批量写入各自的 AnalysisAlgorithm / Result / Condition / Simulation 及 Project，返回 Simulation 列表。
+    """
+    conversion, _ = FormatConversion.objects.get_or_create(input_format='map', output_format='record')
+    algorithms = _insert_returning(AnalysisAlgorithm, [
+        AnalysisAlgorithm(name=ALGORITHM_NAME, parameters=json.dumps(params)) for params, _, _ in items
+    ])
+    results = _insert_returning(Result, [
+        Result(analysis_algorithm=algorithm, format_conversion=conversion) for algorithm in algorithms
+    ])
+    conditions = _insert_returning(Condition, [Condition(status='End') for _ in items])
+    simulations = _insert_returning(Simulation, [
+        Simulation(condition=condition, execution=execution, result=result)
+        for (_, execution, _), condition, result in zip(items, conditions, results)
+    ])
+    Project.objects.bulk_create([
+        Project(diagram=diagram, simulation=simulation)
+        for (_, _, diagram), simulation in zip(items, simulations) if diagram is not None
+    ], batch_size=SIMULATION_WRITE_BATCH_SIZE)
+    return simulations
+
+
+def summarize(failed_counts):
+    counts = np.asarray(failed_counts, dtype=np.float64)
+    if not len(counts):
+        return {'mean_failed': 0.0, 'max_failed': 0, 'p95_failed': 0.0}
+    return {
+        'mean_failed': round(float(counts.mean()), 3),
+        'max_failed': int(counts.max()),
+        'p95_failed': round(float(np.percentile(counts, 95)), 3),
+    }
+
+
+def run_simulation(map_id=None, technique_id=None, iterations=1000, threshold=1.0, propagation_probability=1.0,
+                   max_steps=DEFAULT_MAX_STEPS, seed=None, diagram_id=None, store_nodes=False, sim_graph=None,
+                   columnar=None, chunk_iterations=record_store.DEFAULT_CHUNK_ITERATIONS):
+    """
+    运行级联失效仿真并落库。给定 diagram_id 时从 Diagram 取 map / technique，并写入 Project 关联。
+    columnar='npy' / 'npz' 时，每次迭代每个节点的失效步（未失效为 -1）写入列式存储（见 record_store），
+    清单存于一行汇总 Record，由 iteration 为空的 Execution 引用，Simulation 指向该 Execution。
+    返回 {'simulation_id', 'result_id', 'iterations', 'summary', 'seconds', 'iterations_per_second'}。
+    """
+    if iterations < 1:
+        raise ValueError("iterations must be >= 1")
+    diagram = None
+    if diagram_id is not None:
+        diagram = Diagram.objects.get(id=diagram_id)
+        map_id, technique_id = diagram.map_id, technique_id or diagram.technique_id
+    if map_id is None or technique_id is None:
+        raise ValueError("map_id and technique_id (or diagram_id) are required")
+
+    started = time.perf_counter()
+    sim_graph = sim_graph or load_simulation_graph(map_id)
+    waves = target_waves(technique_id, sim_graph)
+    rng = np.random.default_rng(seed)
+    batch = batch_size(sim_graph, iterations)
+    params = {
+        'map_id': map_id, 'technique_id': technique_id, 'iterations': iterations, 'threshold': threshold,
+        'propagation_probability': propagation_probability, 'max_steps': max_steps, 'seed': seed,
+    }
+
+    writer = None
+    if columnar:
+        writer = record_store.ColumnarWriter(sim_graph.node_ids, record_store.smallest_int_dtype(-1, max_steps),
+                                             chunk_iterations=chunk_iterations, fmt=columnar)
+    failed_counts, last_execution = [], None
+    try:
+        with transaction.atomic():
+            for first in range(0, iterations, batch):
+                size = min(batch, iterations - first)
+                failed, per_step, *steps = simulate_batch(
+                    sim_graph, waves, size, rng, threshold=threshold, propagation_probability=propagation_probability,
+                    max_steps=max_steps, return_steps=writer is not None)
+                if writer is not None:
+                    writer.append(steps[0])
+                rows = list(iteration_records(sim_graph, failed, per_step, first, store_nodes))
+                failed_counts.extend(r['failed_count'] for r in rows)
+                last_execution = write_iterations(rows)[-1]
+
+            if writer is not None:
+                manifest = writer.finish(kind='fail_step', **params)
+                last_execution = Execution.objects.create(iteration=None, record=Record.objects.create(record_data=manifest))
+            simulation, = finish_simulations([(params, last_execution, diagram)])
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    elapsed = time.perf_counter() - started
+    return {
+        'simulation_id': simulation.id,
+        'result_id': simulation.result_id,
+        'iterations': iterations,
+        'summary': summarize(failed_counts),
+        'seconds': round(elapsed, 3),
+        'iterations_per_second': round(iterations / elapsed, 1) if elapsed else None,
+    }
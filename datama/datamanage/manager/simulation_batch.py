@@ -0,0 +1,189 @@
+# simulation_batch.py
+"""
+多进程批量仿真：对一个 Map 扫描 Technique × Configuration 组合。
+
+- 父进程只载入一次 Map 图，把 SimulationGraph 的数组拷入一块 multiprocessing.shared_memory，
+  工作进程在初始化时按名字映射为只读 NumPy 视图，不重新查询、不逐任务传输图数据；
+- 场景 = (Technique, Configuration)：Technique 的 TargetNode 限定在 Configuration 所属 Layer 内作为注入点，
+  级联在整张 Map 图上传播；
+- 每个场景的迭代按 chunk_iterations 切成任务分发到 ProcessPoolExecutor，任务只回传每次迭代的统计字典；
+- 全部任务完成后在父进程一个事务内批量写入 Record / Execution 与各场景的 Result / Simulation（及已有 Diagram 的 Project）。
+工作进程使用 fork 启动（服务端为 Linux），以便继承已完成 django.setup() 的进程状态；工作进程不访问数据库。
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import shared_memory
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from db.models import Configuration, Diagram, MapLayer, TargetNode
+from . import simulation
+
+DEFAULT_CHUNK_ITERATIONS = 250
+
+_worker_graph = None
+_worker_shm = None
+
+
+def _workers():
+    return getattr(settings, 'SIMULATION_WORKERS', None) or os.cpu_count() or 1
+
+
+class SharedGraph:
+    """将 SimulationGraph 的全部数组放入一块共享内存；layout 可被 pickle 传给工作进程。"""
+
+    def __init__(self, sim_graph):
+        arrays = sim_graph.arrays()
+        size = max(8, sum(a.nbytes for a in arrays.values()))
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.layout, offset = {}, 0
+        for name, array in arrays.items():
+            view = np.ndarray(array.shape, dtype=np.int64, buffer=self.shm.buf, offset=offset)
+            view[...] = array
+            self.layout[name] = (offset, array.shape)
+            offset += array.nbytes
+
+    @staticmethod
+    def attach(name, layout):
+        shm = shared_memory.SharedMemory(name=name)
+        arrays = {}
+        for key, (offset, shape) in layout.items():
+            view = np.ndarray(shape, dtype=np.int64, buffer=shm.buf, offset=offset)
+            view.flags.writeable = False
+            arrays[key] = view
+        return shm, simulation.SimulationGraph.from_arrays(arrays)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _init_worker(name, layout):
+    global _worker_graph, _worker_shm
+    _worker_shm, _worker_graph = SharedGraph.attach(name, layout)
+
+
+def _init_local(sim_graph):
+    global _worker_graph
+    _worker_graph = sim_graph
+
+
+def _run_chunk(task):
+    """工作进程：对一个场景的一段迭代运行 simulate_batch，返回 (场景序号, 每次迭代的统计字典)。"""
+    scenario, first, size, waves, seed, options = task
+    sim_graph = _worker_graph
+    rng = np.random.default_rng(seed)
+    rows, batch = [], simulation.batch_size(sim_graph, size)
+    for start in range(first, first + size, batch):
+        count = min(batch, first + size - start)
+        failed, per_step = simulation.simulate_batch(
+            sim_graph, waves, count, rng, threshold=options['threshold'],
+            propagation_probability=options['propagation_probability'], max_steps=options['max_steps'])
+        rows.extend(simulation.iteration_records(sim_graph, failed, per_step, start, options['store_nodes']))
+    return scenario, rows
+
+
+def _scenarios(map_id, sim_graph, technique_ids, configuration_ids):
+    """
+    返回 [(technique_id, configuration_id, waves), ...]；两次查询取齐全部 TargetNode 与 Configuration。
+    显式给出的 configuration_ids 为空或含不属于该 Map 的 id 时抛出 ValidationError（不退回不限配置的仿真）。
+    """
+    configs = Configuration.objects.filter(layer__in=MapLayer.objects.filter(map_id=map_id).values('layer_id'))
+    if configuration_ids is not None:
+        if not configuration_ids:
+            raise ValidationError("configuration_ids must not be empty")
+        configs = configs.filter(id__in=configuration_ids)
+    config_layers = dict(configs.order_by('id').values_list('id', 'layer_id'))
+    if configuration_ids is not None:
+        unknown = sorted(set(configuration_ids) - set(config_layers))
+        if unknown:
+            raise ValidationError(f"unknown configuration ids for map {map_id}: {unknown}")
+
+    targets = {}
+    for technique_id, *row in (TargetNode.objects.filter(technique_id__in=technique_ids)
+                               .values_list('technique_id', 'node_id', 'target_sequence', 'target_effect')):
+        targets.setdefault(technique_id, []).append(row)
+
+    scenarios = []
+    members = {cid: set(sim_graph.layer_members(layer_id).tolist()) for cid, layer_id in config_layers.items()}
+    for technique_id, configuration_id in product(technique_ids, list(config_layers) or [None]):
+        allowed = members.get(configuration_id)
+        waves = simulation.waves_from_rows(targets.get(technique_id, []), sim_graph, allowed=allowed)
+        scenarios.append((technique_id, configuration_id, waves))
+    return scenarios
+
+
+def run_batch(map_id, technique_ids=None, configuration_ids=None, iterations=1000, threshold=1.0,
+              propagation_probability=1.0, max_steps=simulation.DEFAULT_MAX_STEPS, seed=None, workers=None,
+              chunk_iterations=DEFAULT_CHUNK_ITERATIONS, store_nodes=False):
+    """
+    对 map_id 的每个 Technique × Configuration 组合运行 iterations 次仿真并落库。
+    technique_ids 缺省为该 Map 的 Diagram 所用 Technique；configuration_ids 缺省为该 Map 各 Layer 的全部 Configuration。
+    workers=1 时在当前进程内执行（不创建进程池）。相同 seed 与 chunk_iterations 下结果与 workers 无关。
+    返回 {'scenarios': [...], 'iterations', 'workers', 'seconds', 'iterations_per_second'}。
+    """
+    if iterations < 1:
+        raise ValueError("iterations must be >= 1")
+    started = time.perf_counter()
+    if technique_ids is None:
+        technique_ids = sorted(set(Diagram.objects.filter(map_id=map_id).values_list('technique_id', flat=True)))
+    sim_graph = simulation.load_simulation_graph(map_id)
+    scenarios = _scenarios(map_id, sim_graph, list(technique_ids), configuration_ids)
+    workers = workers or _workers()
+    options = {'threshold': threshold, 'propagation_probability': propagation_probability,
+               'max_steps': max_steps, 'store_nodes': store_nodes}
+
+    chunk = max(1, chunk_iterations)
+    starts = range(0, iterations, chunk)
+    seeds = np.random.SeedSequence(seed).spawn(len(scenarios) * len(starts))
+    tasks = [(i, first, min(chunk, iterations - first), scenario[2], seeds[i * len(starts) + j], options)
+             for i, scenario in enumerate(scenarios) for j, first in enumerate(starts)]
+
+    rows = [[] for _ in scenarios]
+    if workers == 1 or len(tasks) == 1:
+        _init_local(sim_graph)
+        outputs = map(_run_chunk, tasks)
+        for scenario, chunk_rows in outputs:
+            rows[scenario].extend(chunk_rows)
+    else:
+        shared = SharedGraph(sim_graph)
+        try:
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(shared.shm.name, shared.layout)) as pool:
+                for scenario, chunk_rows in pool.map(_run_chunk, tasks):
+                    rows[scenario].extend(chunk_rows)
+        finally:
+            shared.close()
+
+    diagrams = {(d.technique_id, d.configuration_id): d
+                for d in Diagram.objects.filter(map_id=map_id, technique_id__in=technique_ids)}
+    items = []
+    with transaction.atomic():
+        for (technique_id, configuration_id, _), scenario_rows in zip(scenarios, rows):
+            params = {'map_id': map_id, 'technique_id': technique_id, 'configuration_id': configuration_id,
+                      'iterations': iterations, 'seed': seed, **options}
+            params.pop('store_nodes')
+            last_execution = simulation.write_iterations(scenario_rows)[-1]
+            items.append((params, last_execution, diagrams.get((technique_id, configuration_id))))
+        simulations = simulation.finish_simulations(items)
+
+    elapsed = time.perf_counter() - started
+    total = iterations * len(scenarios)
+    return {
+        'scenarios': [
+            {'technique_id': technique_id, 'configuration_id': configuration_id, 'simulation_id': sim.id,
+             'result_id': sim.result_id, 'summary': simulation.summarize([r['failed_count'] for r in scenario_rows])}
+            for (technique_id, configuration_id, _), scenario_rows, sim in zip(scenarios, rows, simulations)
+        ],
+        'iterations': total,
+        'workers': workers,
+        'seconds': round(elapsed, 3),
+        'iterations_per_second': round(total / elapsed, 1) if elapsed else None,
+    }
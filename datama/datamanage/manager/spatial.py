@@ -0,0 +1,288 @@
+# spatial.py
+"""
+BaseNode / BaseEdge 的空间索引与查询。
+
+geo_location（为空时取 location）是自由文本，这里解析出经纬度后写入 BaseNodeGeo / BaseEdgeGeo：
+节点为一个点，边为其折线各点的外包矩形。每行另存 cell = 完整包含该矩形的最小 geohash 单元。
+
+查询时先把查询矩形覆盖为不超过 MAX_QUERY_CELLS 个同级 geohash 单元，候选行为
+  - cell 以某个覆盖单元为前缀（矩形落在该单元内部），按字典序合并成少量区间查询；
+  - cell 是某个覆盖单元的前缀（矩形较大、跨越多个单元），为有限集合，cell IN (...)；
+两类条件都走 cell 上的 B 树索引，再以四个边界列精确过滤。SQLite 与 MySQL 均无需空间扩展。
+
+支持的坐标文本（经度在前，与 WKT / GeoJSON 一致）：
+    "116.39,39.91" / "116.39 39.91"            点
+    "116.39,39.91;121.47,31.23"                折线（分号分隔）
+    "POINT(116.39 39.91)" / "LINESTRING(116.39 39.91, 121.47 31.23)"
+    {"lng": 116.39, "lat": 39.91}  /  {"type": "Point", "coordinates": [116.39, 39.91]}
+无法解析的行不进入索引。
+"""
+import json
+import math
+import operator
+import re
+from functools import reduce
+
+from django.db.models import Q
+
+from db.models import BaseNode, BaseEdge
+from .models import BaseNodeGeo, BaseEdgeGeo
+
+GEOHASH_PRECISION = 12
+MAX_QUERY_CELLS = 32
+SPATIAL_CHUNK_SIZE = 5000
+EARTH_RADIUS_M = 6371008.8
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+_WKT = re.compile(r'^[A-Za-z]+\s*\((.*)\)$', re.S)
+
+# 被索引模型 -> 索引模型
+_INDEXES = {BaseNode: BaseNodeGeo, BaseEdge: BaseEdgeGeo}
+
+
+# ---------- 坐标解析 ----------
+
+def _valid(lng, lat):
+    return -180.0 <= lng <= 180.0 and -90.0 <= lat <= 90.0
+
+
+def _points_from_json(value):
+    if isinstance(value, dict):
+        if 'coordinates' in value:
+            return _points_from_json(value['coordinates'])
+        lat = value.get('lat', value.get('latitude'))
+        lng = value.get('lng', value.get('lon', value.get('longitude')))
+        return [(float(lng), float(lat))] if lat is not None and lng is not None else []
+    if isinstance(value, (list, tuple)):
+        if len(value) >= 2 and all(isinstance(v, (int, float)) for v in value[:2]):
+            return [(float(value[0]), float(value[1]))]
+        return [p for item in value for p in _points_from_json(item)]
+    return []
+
+
+def parse_points(text):
+    """解析坐标文本，返回 [(lng, lat), ...]；无法解析时返回空列表。"""
+    if not text:
+        return []
+    text = text.strip()
+    points = []
+    if text[:1] in '{[':
+        try:
+            points = _points_from_json(json.loads(text))
+        except (ValueError, TypeError):
+            points = []
+    else:
+        wkt = _WKT.match(text)
+        # WKT 点之间以逗号分隔、坐标以空格分隔；普通文本点之间以分号分隔
+        parts = wkt.group(1).replace('(', '').replace(')', '').split(',') if wkt else re.split(r'[;|]', text)
+        for part in parts:
+            numbers = _NUMBER.findall(part)
+            if len(numbers) != 2:
+                return []
+            points.append((float(numbers[0]), float(numbers[1])))
+    return points if points and all(_valid(lng, lat) for lng, lat in points) else []
+
+
+# ---------- geohash ----------
+
+def _bits(precision):
+    """precision 级单元的经度、纬度二进制位数（geohash 自经度起交替取位）。"""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def _index(value, low, span, bits):
+    return min(int((value - low) / span * (1 << bits)), (1 << bits) - 1)
+
+
+def _encode(ix, iy, precision):
+    lng_bits, lat_bits = _bits(precision)
+    code, li, ai = 0, lng_bits, lat_bits
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            li -= 1
+            code = (code << 1) | ((ix >> li) & 1)
+        else:
+            ai -= 1
+            code = (code << 1) | ((iy >> ai) & 1)
+    return code
+
+
+def _to_text(code, precision):
+    return ''.join(_BASE32[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def geohash(lat, lng, precision=GEOHASH_PRECISION):
+    lng_bits, lat_bits = _bits(precision)
+    return _to_text(_encode(_index(lng, -180.0, 360.0, lng_bits), _index(lat, -90.0, 180.0, lat_bits), precision),
+                    precision)
+
+
+def extent_cell(min_lat, min_lng, max_lat, max_lng):
+    """完整包含矩形的最小 geohash 单元：西南角与东北角 geohash 的公共前缀（单元为轴对齐矩形）。"""
+    sw, ne = geohash(min_lat, min_lng), geohash(max_lat, max_lng)
+    size = 0
+    while size < GEOHASH_PRECISION and sw[size] == ne[size]:
+        size += 1
+    return sw[:size]
+
+
+def _cover(min_lat, min_lng, max_lat, max_lng, max_cells=MAX_QUERY_CELLS):
+    """覆盖矩形的同级 geohash 单元（整数编码，升序）与其精度；取单元数不超过 max_cells 的最细精度。"""
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        lng_bits, lat_bits = _bits(precision)
+        x0, x1 = _index(min_lng, -180.0, 360.0, lng_bits), _index(max_lng, -180.0, 360.0, lng_bits)
+        y0, y1 = _index(min_lat, -90.0, 180.0, lat_bits), _index(max_lat, -90.0, 180.0, lat_bits)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > max_cells:
+            break
+        best = (precision, x0, x1, y0, y1)
+    if best is None:
+        return 0, [0]
+    precision, x0, x1, y0, y1 = best
+    return precision, sorted(_encode(x, y, precision) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+
+def _cell_filter(min_lat, min_lng, max_lat, max_lng):
+    precision, codes = _cover(min_lat, min_lng, max_lat, max_lng)
+    if precision == 0:
+        return Q()
+    # Z 序上连续的单元合并为一个区间：cell ∈ [首单元, 末单元 + '~')
+    ranges, start = [], codes[0]
+    for prev, code in zip(codes, codes[1:] + [None]):
+        if code != prev + 1:
+            ranges.append(Q(cell__gte=_to_text(start, precision), cell__lt=_to_text(prev, precision) + '~'))
+            start = code
+    ancestors = {text[:size] for text in (_to_text(c, precision) for c in codes) for size in range(precision)}
+    return reduce(operator.or_, ranges, Q(cell__in=sorted(ancestors)))
+
+
+def _bbox_condition(boxes):
+    """候选单元条件 AND 四边精确相交条件，多个矩形（跨 180° 经线拆分）之间 OR。"""
+    return reduce(operator.or_, [
+        _cell_filter(*box) & Q(min_lat__lte=box[2], max_lat__gte=box[0], min_lng__lte=box[3], max_lng__gte=box[1])
+        for box in boxes
+    ])
+
+
+# ---------- 索引维护 ----------
+
+def _index_model(model):
+    if model not in _INDEXES:
+        raise ValueError(f"{model.__name__} has no spatial index")
+    return _INDEXES[model]
+
+
+def build_extent(index_model, pk, geo_location, location=None):
+    """由坐标文本构造未保存的索引行；无法解析时返回 None。"""
+    points = parse_points(geo_location) or parse_points(location)
+    if not points:
+        return None
+    lngs, lats = [p[0] for p in points], [p[1] for p in points]
+    box = (min(lats), min(lngs), max(lats), max(lngs))
+    return index_model(pk=pk, min_lat=box[0], min_lng=box[1], max_lat=box[2], max_lng=box[3], cell=extent_cell(*box))
+
+
+def index_objects(model, ids=None, chunk_size=SPATIAL_CHUNK_SIZE):
+    """
+    重建 model（BaseNode / BaseEdge）中 ids 对应行的空间索引；ids 为 None 时重建全表。
+    按 chunk_size 分批读取坐标文本并 bulk_create，用于批量写入（不触发 post_save）之后与初始建索引。
+    返回写入索引的行数。
+    """
+    index_model = _index_model(model)
+    if ids is None:
+        index_model.objects.all().delete()
+        batches = [model.objects.order_by('pk')]
+    else:
+        ids = list(ids)
+        batches = [model.objects.filter(pk__in=ids[i:i + chunk_size]) for i in range(0, len(ids), chunk_size)]
+        for i in range(0, len(ids), chunk_size):
+            index_model.objects.filter(pk__in=ids[i:i + chunk_size]).delete()
+    written = 0
+    for rows in batches:
+        batch = []
+        for pk, geo_location, location in rows.values_list('pk', 'geo_location', 'location').iterator(chunk_size):
+            extent = build_extent(index_model, pk, geo_location, location)
+            if extent is not None:
+                batch.append(extent)
+            if len(batch) >= chunk_size:
+                index_model.objects.bulk_create(batch)
+                written, batch = written + len(batch), []
+        index_model.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def index_instance(instance):
+    """单行写入后同步索引（post_save 调用）。"""
+    index_model = _index_model(type(instance))
+    extent = build_extent(index_model, instance.pk, instance.geo_location, instance.location)
+    if extent is None:
+        index_model.objects.filter(pk=instance.pk).delete()
+    else:
+        extent.save()
+
+
+# ---------- 查询 ----------
+
+def _split_antimeridian(min_lat, min_lng, max_lat, max_lng):
+    if min_lng <= max_lng:
+        return [(min_lat, min_lng, max_lat, max_lng)]
+    return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+
+
+def extents_in_bbox(model, min_lat, min_lng, max_lat, max_lng):
+    """与矩形相交的索引行 QuerySet（BaseNodeGeo / BaseEdgeGeo）；min_lng > max_lng 表示跨越 180° 经线。"""
+    boxes = _split_antimeridian(min_lat, min_lng, max_lat, max_lng)
+    return _index_model(model).objects.filter(_bbox_condition(boxes))
+
+
+def in_bbox(model, min_lat, min_lng, max_lat, max_lng):
+    """与矩形相交的 BaseNode / BaseEdge QuerySet。"""
+    return model.objects.filter(pk__in=extents_in_bbox(model, min_lat, min_lng, max_lat, max_lng).values('pk'))
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """球面大圆距离（米）。"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _radius_bbox(lat, lng, radius_m):
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if max_lat >= 90.0 or min_lat <= -90.0 or cos < 1e-9 or dlat / cos >= 180.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    dlng = dlat / cos
+    west, east = lng - dlng, lng + dlng
+    west, east = (west + 360.0 if west < -180.0 else west), (east - 360.0 if east > 180.0 else east)
+    return _split_antimeridian(min_lat, west, max_lat, east)
+
+
+def within_radius(model, lat, lng, radius_m, limit=None):
+    """
+    距 (lat, lng) 不超过 radius_m 米的对象，返回按距离升序的 [(pk, 距离米), ...]。
+    边以外包矩形上离查询点最近的点计距离。
+    """
+    candidates = _index_model(model).objects.filter(_bbox_condition(_radius_bbox(lat, lng, radius_m)))
+    hits = []
+    for pk, min_lat, min_lng, max_lat, max_lng in candidates.values_list(
+            'pk', 'min_lat', 'min_lng', 'max_lat', 'max_lng'):
+        d = distance_m(lat, lng, min(max(lat, min_lat), max_lat), min(max(lng, min_lng), max_lng))
+        if d <= radius_m:
+            hits.append((pk, d))
+    hits.sort(key=lambda hit: (hit[1], hit[0]))
+    return hits[:limit] if limit is not None else hits
+
+
+def nearest(model, lat, lng, k=10, initial_radius_m=1000.0):
+    """距 (lat, lng) 最近的 k 个对象 [(pk, 距离米), ...]：半径逐次扩大 4 倍，直到圈内已有 k 个或覆盖全球。"""
+    radius = initial_radius_m
+    while True:
+        hits = within_radius(model, lat, lng, radius, limit=k)
+        if len(hits) >= k or radius >= math.pi * EARTH_RADIUS_M:
+            return hits
+        radius *= 4
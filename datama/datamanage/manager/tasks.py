@@ -0,0 +1,72 @@
+# tasks.py
+"""
+进程内后台任务池：用于导入等耗时操作，避免占用请求线程。
+settings.BACKGROUND_TASKS_EAGER = True 时同步执行（测试 / 调试用）。
+
+任务按用途分池（各自的线程池互不占用）：默认池大小为 BACKGROUND_TASK_WORKERS，
+其余池的大小见 BACKGROUND_TASK_POOLS（如审计日志写入使用 'audit' 池，长时间导入不会拖住审计写入，反之亦然）。
+任务只存在于进程内：进程重启时未完成的导入任务由 recover_import_jobs 命令恢复。
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL = 'default'
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def _pool_workers(pool):
+    if pool == DEFAULT_POOL:
+        return getattr(settings, 'BACKGROUND_TASK_WORKERS', 2)
+    return getattr(settings, 'BACKGROUND_TASK_POOLS', {}).get(pool, 1)
+
+
+def _get_executor(pool=DEFAULT_POOL):
+    with _executor_lock:
+        executor = _executors.get(pool)
+        if executor is None:
+            executor = _executors[pool] = ThreadPoolExecutor(
+                max_workers=_pool_workers(pool),
+                thread_name_prefix='manager-task' if pool == DEFAULT_POOL else f'manager-{pool}',
+            )
+        return executor
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception("background task %s failed", getattr(func, '__name__', func))
+        raise
+    finally:
+        # 工作线程持有独立的数据库连接，任务结束即释放
+        connection.close()
+
+
+def submit(func, *args, **kwargs):
+    """立即将 func(*args, **kwargs) 投递到默认后台线程池（不等待事务提交），返回 Future。"""
+    return _get_executor().submit(_run, func, args, kwargs)
+
+
+def submit_to(pool, func, *args, **kwargs):
+    """与 submit 相同，但投递到名为 pool 的独立线程池。"""
+    return _get_executor(pool).submit(_run, func, args, kwargs)
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    在当前事务提交后将 func(*args, **kwargs) 投递到后台线程池，
+    保证任务读取到的是已提交的数据（如刚创建的 ResourceImportJob）。
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        func(*args, **kwargs)
+        return
+    transaction.on_commit(lambda: submit(func, *args, **kwargs))
@@ -138,7 +138,7 @@ class AllAPITests(TestCase):
     
     def test_import_json_view(self):
         """测试JSON导入API"""
-        url = reverse('import-json')
+        url = reverse('import-json') + '?mode=sync'
         
         # 准备导入数据
         import_data = {
@@ -0,0 +1,107 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from db.models import Map, Layer, MapLayer
+from manager import archive, services
+from manager.models import MapArchive
+
+
+@override_settings(MAP_ARCHIVE_KEYFRAME_INTERVAL=3)
+class MapArchiveDeltaChainTests(TestCase):
+    def setUp(self):
+        self.map = Map.objects.create(version_number=1, author='tester', message='init')
+        self.layers = [Layer.objects.create(type='PowerLayer', version_number=1) for _ in range(3)]
+        for l in self.layers:
+            MapLayer.objects.create(map=self.map, layer=l)
+        services._archive_map_snapshot(self.map)
+
+    def _bump(self, i):
+        # 每个版本改动一个 layer，并轮换增删一个关联
+        layer = self.layers[i % 3]
+        layer.message = f'change {i}'
+        layer.save()
+        if i % 2:
+            MapLayer.objects.create(map=self.map, layer=Layer.objects.create(type='WaterLayer'))
+        else:
+            MapLayer.objects.filter(map=self.map).order_by('-id').first().delete()
+        services.create_map_version(self.map, change_message=f'v{i}')
+        return services.export_map(self.map.id)
+
+    def test_patch_roundtrip(self):
+        old = {'map': {'id': 1, 'a': 1, 'b': 2}, 'layers': [{'id': 1, 'x': 1}, {'id': 2, 'x': 2}], 'exported_at': 't0'}
+        new = {'map': {'id': 1, 'a': 3}, 'layers': [{'id': 3, 'x': 3}, {'id': 1, 'x': 9}], 'exported_at': 't1'}
+        patch = archive.make_patch(old, new)
+        self.assertEqual(patch['map'], {'set': {'a': 3}, 'unset': ['b']})
+        self.assertEqual(patch['layers']['order'], ['3', '1'])
+        self.assertEqual(archive.apply_patch(old, patch), new)
+
+    def test_keyframes_and_reconstruction(self):
+        expected = {1: MapArchive.objects.get(map=self.map, version_number=1).snapshot}
+        for i in range(2, 9):
+            current = self._bump(i)
+            expected[self.map.version_number] = current
+
+        keyframes = list(MapArchive.objects.filter(map=self.map, is_keyframe=True)
+                         .order_by('version_number').values_list('version_number', flat=True))
+        self.assertEqual(keyframes, [1, 4, 7])
+        for version, snapshot in expected.items():
+            rebuilt = archive.reconstruct_map_snapshot(self.map.id, version)
+            self.assertEqual(rebuilt['map']['version_number'], version)
+            self.assertEqual([l['id'] for l in rebuilt['layers']], [l['id'] for l in snapshot['layers']])
+            self.assertEqual(rebuilt['layers'], snapshot['layers'])
+
+    def test_export_and_rollback_use_reconstruction(self):
+        v1_layers = [l.id for l in self.layers]
+        for i in range(2, 6):
+            self._bump(i)
+        exported = services.export_map(self.map.id, version_number='1')
+        self.assertEqual(exported['archived_version'], 1)
+        self.assertEqual([l['id'] for l in exported['layers']], v1_layers)
+
+        services.rollback_map_to_version(self.map.id, 1)
+        self.assertEqual(sorted(MapLayer.objects.filter(map=self.map).values_list('layer_id', flat=True)), v1_layers)
+
+
+class IncrementalRollbackTests(TestCase):
+    def _map_with_layers(self, count):
+        m = Map.objects.create(version_number=1, author='tester', message='init')
+        layers = [Layer.objects.create(type='PowerLayer', message=f'l{i}') for i in range(count)]
+        MapLayer.objects.bulk_create([MapLayer(map=m, layer=l) for l in layers])
+        services._archive_map_snapshot(m)
+        return m, layers
+
+    def test_rollback_restores_links_order_and_metadata(self):
+        m, layers = self._map_with_layers(4)
+        v1 = services.export_map(m.id)
+        untouched = MapLayer.objects.get(map=m, layer=layers[0]).id
+
+        layers[1].message = 'edited'
+        layers[1].save()
+        MapLayer.objects.filter(map=m, layer=layers[2]).delete()
+        MapLayer.objects.create(map=m, layer=Layer.objects.create(type='WaterLayer'))
+        services.create_map_version(m, change_message='v2')
+
+        services.rollback_map_to_version(m.id, 1)
+        restored = services.export_map(m.id)
+        self.assertEqual([l['id'] for l in restored['layers']], [l['id'] for l in v1['layers']])
+        self.assertEqual(Layer.objects.get(id=layers[1].id).message, 'l1')
+        # 与快照一致的前缀关联原样保留
+        self.assertEqual(MapLayer.objects.get(map=m, layer=layers[0]).id, untouched)
+        self.assertEqual(Map.objects.get(id=m.id).version_number, 3)
+
+    def test_rollback_query_count_independent_of_layer_count(self):
+        counts = []
+        for size in (3, 30):
+            m, layers = self._map_with_layers(size)
+            for l in layers[::2]:
+                l.author = 'someone else'
+                l.save()
+            MapLayer.objects.filter(map=m, layer__in=layers[1::3]).delete()
+            services.create_map_version(m, change_message='v2')
+            with CaptureQueriesContext(connection) as ctx:
+                services.rollback_map_to_version(m.id, 1)
+            counts.append(len(ctx.captured_queries))
+            self.assertEqual(set(MapLayer.objects.filter(map=m).values_list('layer_id', flat=True)),
+                             {l.id for l in layers})
+            self.assertFalse(Layer.objects.filter(id__in=[l.id for l in layers], author='someone else').exists())
+        self.assertEqual(counts[0], counts[1])
@@ -0,0 +1,149 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from manager import audit
+from manager.models import AuditLog, AuditPayload, AuditArchive
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, AUDIT_INLINE_META_BYTES=200)
+class AuditPipelineTests(TestCase):
+    def test_written_after_commit_and_dropped_with_savepoint(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            audit.record('VERSION', 'Map', 1, meta={'new_version': 2})
+            try:
+                with transaction.atomic():
+                    audit.record('VERSION', 'Map', 2)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.assertFalse(AuditLog.objects.exists())
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(list(AuditLog.objects.values_list('resource_id', 'meta')), [(1, {'new_version': 2})])
+
+    def test_large_meta_stored_out_of_line(self):
+        diff = {'changed': {f'field_{i}': ['old', 'new'] for i in range(20)}}
+        with self.captureOnCommitCallbacks(execute=True):
+            audit.record('VERSION', 'Layer', 7, meta={'diff': diff, 'new_version': 3})
+
+        log = AuditLog.objects.get()
+        self.assertEqual(log.meta, {'new_version': 3, '_payload_keys': ['diff']})
+        self.assertEqual(log.full_meta, {'diff': diff, 'new_version': 3})
+        self.assertGreater(log.payload.size, len(log.payload.data))
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, AUDIT_FLUSH_DELAY=0)
+    def test_async_commits_are_coalesced(self):
+        with mock.patch('manager.tasks.submit_to') as submit:
+            for i in range(3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    audit.record('IMPORT', 'MAP', i)
+            self.assertFalse(AuditLog.objects.exists())
+            submit.assert_called_once_with(audit.AUDIT_POOL, audit._drain)
+            audit._drain()
+
+        self.assertEqual(sorted(AuditLog.objects.values_list('resource_id', flat=True)), [0, 1, 2])
+        self.assertFalse(audit._scheduled)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, AUDIT_FLUSH_DELAY=0)
+    def test_created_at_is_event_time(self):
+        event_time = timezone.now() - timedelta(minutes=5)
+        with mock.patch('manager.tasks.submit_to'):
+            with self.captureOnCommitCallbacks(execute=True):
+                audit.record('EXPORT', 'Map', 1)
+                audit.record_many([AuditLog(action='EXPORT', resource_type='Map', resource_id=2,
+                                            created_at=event_time)])
+            recorded = audit._buffer[0].created_at
+            audit._drain()
+
+        self.assertEqual(dict(AuditLog.objects.values_list('resource_id', 'created_at')),
+                         {1: recorded, 2: event_time})
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, AUDIT_FLUSH_DELAY=0, AUDIT_RETRY_DELAY=0,
+                       AUDIT_MAX_ATTEMPTS=3)
+    def test_failed_batches_are_retried(self):
+        write = audit.write
+        calls = []
+
+        def flaky(entries):
+            calls.append([entry.resource_id for entry in entries])
+            # 第一次整批写入失败；条目 1 始终无法写入
+            if len(calls) == 1 or [entry.resource_id for entry in entries] == [1]:
+                raise RuntimeError('database unavailable')
+            write(entries)
+
+        diff = {'changed': {f'field_{i}': ['old', 'new'] for i in range(20)}}
+        with mock.patch('manager.tasks.submit_to'), mock.patch.object(audit, 'write', flaky):
+            with self.captureOnCommitCallbacks(execute=True):
+                audit.record_many([AuditLog(action='VERSION', resource_type='Layer', resource_id=i,
+                                            meta={'diff': diff}) for i in range(3)])
+            with self.assertLogs('manager.audit', 'ERROR') as logs:
+                audit._drain()
+
+        # 失败批次逐条重写，条目 1 重试至 AUDIT_MAX_ATTEMPTS 次后以完整内容记入日志
+        self.assertEqual(sorted(AuditLog.objects.values_list('resource_id', flat=True)), [0, 2])
+        self.assertEqual(calls[:4], [[0, 1, 2], [0], [1], [2]])
+        self.assertEqual(calls.count([1]), 3)
+        self.assertTrue(all(log.full_meta == {'diff': diff} for log in AuditLog.objects.all()))
+        self.assertIn('"field_19"', logs.output[-1])
+        self.assertEqual(audit._buffer, [])
+        self.assertFalse(audit._scheduled)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_failed_flush_requeues_entries(self):
+        write = audit.write
+
+        def flaky(entries):
+            if [entry.resource_id for entry in entries] != [2]:
+                raise RuntimeError('database unavailable')
+            write(entries)
+
+        with mock.patch('manager.tasks.submit_to') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                audit.record_many([AuditLog(action='EXPORT', resource_type='Map', resource_id=i) for i in (1, 2)])
+            submit.reset_mock()
+            audit._scheduled = False
+            with mock.patch.object(audit, 'write', flaky), self.assertLogs('manager.audit', 'ERROR'):
+                self.assertEqual(audit.flush(), 1)
+
+            # 写入失败的条目放回缓冲并交给后台线程重试
+            self.assertEqual([entry.resource_id for entry in audit._buffer], [1])
+            submit.assert_called_once_with(audit.AUDIT_POOL, audit._drain)
+            self.assertEqual(audit.flush(), 1)
+
+        self.assertEqual(sorted(AuditLog.objects.values_list('resource_id', flat=True)), [1, 2])
+        audit._scheduled = False
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_buffer_flushed_at_exit(self):
+        with mock.patch('manager.tasks.submit_to'):
+            with self.captureOnCommitCallbacks(execute=True):
+                audit.record('IMPORT', 'MAP', 1)
+            self.assertFalse(AuditLog.objects.exists())
+            audit._flush_at_exit()
+
+        self.assertEqual(list(AuditLog.objects.values_list('resource_id', flat=True)), [1])
+        self.assertEqual(audit._buffer, [])
+        audit._scheduled = False
+
+    def test_archive_by_month(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            audit.record_many([AuditLog(action='VERSION', resource_type='Map', resource_id=i,
+                                        meta={'diff': {'x': 'y' * 300}} if i == 0 else {}) for i in range(3)])
+        old = audit.month_start(3) + timedelta(days=2)
+        logs = list(AuditLog.objects.order_by('pk'))
+        AuditLog.objects.filter(pk=logs[0].pk).update(created_at=old)
+        AuditLog.objects.filter(pk=logs[1].pk).update(created_at=old - timedelta(days=40))
+
+        self.assertEqual(audit.archive_before(audit.month_start(1)), 2)
+
+        self.assertEqual(list(AuditLog.objects.values_list('pk', flat=True)), [logs[2].pk])
+        self.assertFalse(AuditPayload.objects.exists())
+        archives = list(AuditArchive.objects.all())
+        self.assertEqual(len(archives), 2)
+        entries = {e['resource_id']: e for a in archives for e in a.entries()}
+        self.assertEqual(entries[0]['meta'], {'diff': {'x': 'y' * 300}})
+        self.assertEqual(archives[1].month, timezone.localtime(old).date().replace(day=1))
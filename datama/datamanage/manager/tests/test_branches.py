@@ -0,0 +1,148 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from db.models import Map, Layer, MapLayer, BaseNode, BaseEdge, Node, Edge, IntraEdge, MechanismRelationship
+from manager import branches, services
+from manager.models import LayerBranch, LayerCommit, LayerStats, MapBranch
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class LayerBranchTests(TestCase):
+    def setUp(self):
+        self.nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(600)])
+        mech = MechanismRelationship.objects.create()
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in range(4)])
+        self.edges = Edge.objects.bulk_create([
+            Edge(base_edge=be, source_node=self.nodes[i], destination_node=self.nodes[i + 1], mechanism_relationship=mech)
+            for i, be in enumerate(base_edges)])
+        self.layer = Layer.objects.create(type='PowerLayer', author='tester')
+        Node.objects.bulk_create([Node(layer=self.layer, base_node=n) for n in self.nodes[:500]])
+        IntraEdge.objects.bulk_create([IntraEdge(layer=self.layer, edge=e) for e in self.edges[:2]])
+
+    def _members(self, layer):
+        return branches.layer_members(layer.id)
+
+    def _head(self, layer):
+        return LayerBranch.objects.get(layer=layer).head
+
+    def test_commit_is_content_addressed(self):
+        first = branches.commit_layer(self.layer, 'tester', 'initial')
+        self.assertEqual(branches.commit_layer(self.layer), first)
+
+        Node.objects.create(layer=self.layer, base_node=self.nodes[500])
+        second = branches.commit_layer(self.layer)
+        self.assertEqual(second.parent, first)
+        self.assertEqual(second.node_count, 501)
+        changed = [k for k in second.node_buckets if second.node_buckets[k] != first.node_buckets.get(k)]
+        self.assertEqual(changed, [str(self.nodes[500].id % branches.TREE_BUCKETS)])
+
+    def test_fork_copies_members_and_shares_head(self):
+        fork = branches.fork_layer(self.layer, 'team-a', 'alice')
+
+        self.assertEqual(self._members(fork), self._members(self.layer))
+        self.assertEqual(fork.branch.origin, self.layer)
+        self.assertEqual(fork.branch.head, self.layer.branch.head)
+        self.assertEqual(LayerStats.objects.get(layer=fork).node_count, 500)
+
+    def test_three_way_merge_combines_both_sides(self):
+        fork = branches.fork_layer(self.layer, 'team-a')
+        Node.objects.filter(layer=fork, base_node=self.nodes[0]).delete()
+        Node.objects.create(layer=fork, base_node=self.nodes[550])
+        IntraEdge.objects.create(layer=fork, edge=self.edges[2])
+        fork.type = 'WaterLayer'
+        fork.save()
+        Node.objects.filter(layer=self.layer, base_node=self.nodes[1]).delete()
+        Node.objects.create(layer=self.layer, base_node=self.nodes[560])
+
+        result = branches.merge_layers(self.layer, fork, 'bob', 'merge team-a')
+
+        self.assertEqual(result['status'], 'merged')
+        self.assertEqual((result['nodes_added'], result['nodes_removed'], result['edges_added']), (1, 1, 1))
+        self.assertEqual(result['fields'], {'type': 'WaterLayer'})
+        self.assertGreater(result['buckets']['skipped'], 200)
+        expected = {n.id for n in self.nodes[2:500]} | {self.nodes[550].id, self.nodes[560].id}
+        self.assertEqual(self._members(self.layer)['node'], expected)
+        self.assertEqual(LayerStats.objects.get(layer=self.layer).node_count, len(expected))
+        commit = LayerCommit.objects.get(commit_hash=result['commit'])
+        self.assertEqual(commit.merge_parent, self._head(fork))
+
+        self.assertEqual(branches.merge_layers(self.layer, fork)['status'], 'up-to-date')
+
+    def test_fast_forward_and_conflicting_fields(self):
+        fork = branches.fork_layer(self.layer, 'team-a')
+        Node.objects.create(layer=fork, base_node=self.nodes[590])
+        result = branches.merge_layers(self.layer, fork)
+        self.assertEqual(result['status'], 'fast-forward')
+        self.assertEqual(self._head(self.layer).commit_hash, result['commit'])
+
+        fork.type = 'WaterLayer'
+        fork.save()
+        self.layer.type = 'OilGasLayer'
+        self.layer.save()
+        with self.assertRaises(branches.MergeConflict) as ctx:
+            branches.merge_layers(self.layer, fork)
+        self.assertEqual(ctx.exception.conflicts[0]['theirs'], 'WaterLayer')
+        self.assertEqual(branches.merge_layers(self.layer, fork, strategy='theirs')['fields'], {'type': 'WaterLayer'})
+
+    def test_import_with_base_commit_merges_fields(self):
+        base = branches.commit_layer(self.layer)
+        services.create_layer_version(self.layer, change_message='server edit')
+        res = services.import_json_payload({'import_type': 'LAYER', 'data': {'layer': {
+            'id': self.layer.id, 'version_number': 1, 'type': 'WaterLayer', 'base_commit': base.commit_hash}}})
+
+        self.assertEqual(res['results']['conflicts'], [])
+        self.layer.refresh_from_db()
+        self.assertEqual((self.layer.type, self.layer.version_number), ('WaterLayer', 3))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class MapBranchApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        self.nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(3)])
+        self.map = Map.objects.create(author='tester')
+        self.layers = [Layer.objects.create(type='PowerLayer') for _ in range(2)]
+        MapLayer.objects.bulk_create([MapLayer(map=self.map, layer=layer) for layer in self.layers])
+        Node.objects.create(layer=self.layers[0], base_node=self.nodes[0])
+
+    def test_fork_and_merge_map(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(reverse('map-branches', args=[self.map.id]), {'name': 'team-a'}, format='json')
+        self.assertEqual(res.status_code, 201)
+        fork = Map.objects.get(id=res.data['map_id'])
+        fork_layers = res.data['layers']
+        self.assertEqual(MapBranch.objects.get(map=fork).base_layers, [layer.id for layer in self.layers])
+
+        Node.objects.create(layer_id=fork_layers[0], base_node=self.nodes[1])
+        MapLayer.objects.filter(map=fork, layer_id=fork_layers[1]).delete()
+        new_layer = Layer.objects.create(type='WaterLayer')
+        MapLayer.objects.create(map=fork, layer=new_layer)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(reverse('map-merge', args=[self.map.id]), {'source': fork.id}, format='json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['layers'][self.layers[0].id]['status'], 'fast-forward')
+        self.assertEqual(list(MapLayer.objects.filter(map=self.map).order_by('id').values_list('layer_id', flat=True)),
+                         [self.layers[0].id, new_layer.id])
+        self.assertEqual(Node.objects.filter(layer=self.layers[0]).count(), 2)
+        self.map.refresh_from_db()
+        self.assertEqual(self.map.version_number, 2)
+
+    def test_layer_merge_conflict_returns_409(self):
+        res = self.client.post(reverse('layer-branches', args=[self.layers[0].id]), {'name': 'team-a'}, format='json')
+        fork = Layer.objects.get(id=res.data['layer_id'])
+        fork.type = 'WaterLayer'
+        fork.save()
+        self.layers[0].type = 'OilGasLayer'
+        self.layers[0].save()
+
+        res = self.client.post(reverse('layer-merge', args=[self.layers[0].id]), {'source': fork.id}, format='json')
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(res.data['conflicts'][0]['field'], 'type')
+        commits = self.client.get(reverse('layer-commits', args=[self.layers[0].id])).data
+        self.assertEqual(commits['count'], 1)
+        self.assertEqual(self.client.get(reverse('layer-branches', args=[self.layers[0].id])).data['forks'][0]['name'],
+                         'team-a')
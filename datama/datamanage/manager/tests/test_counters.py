@@ -0,0 +1,153 @@
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from db.models import Map, Layer, MapLayer, BaseNode, BaseEdge, Node, Edge, IntraEdge, MechanismRelationship
+from manager import counters, services
+from manager.models import LayerStats
+from manager.utils.db_indexes import DuplicateRows, ensure_indexes
+
+
+class LayerCounterTests(TestCase):
+    def setUp(self):
+        self.layers = [Layer.objects.create(type='PowerLayer') for _ in range(2)]
+        self.nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(4)])
+        mech = MechanismRelationship.objects.create()
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in range(2)])
+        self.edges = Edge.objects.bulk_create([
+            Edge(base_edge=be, source_node=self.nodes[i], destination_node=self.nodes[i + 1], mechanism_relationship=mech)
+            for i, be in enumerate(base_edges)])
+
+    def _stats(self, layer):
+        stats = LayerStats.objects.get(layer=layer)
+        return stats.node_count, stats.edge_count
+
+    def test_signals_maintain_counts(self):
+        a, b = self.layers
+        nodes = [Node.objects.create(layer=a, base_node=n) for n in self.nodes[:3]]
+        IntraEdge.objects.create(layer=a, edge=self.edges[0])
+        self.assertEqual(self._stats(a), (3, 1))
+
+        nodes[0].layer = b
+        nodes[0].save()
+        nodes[1].delete()
+        self.assertEqual(self._stats(a), (1, 1))
+        self.assertEqual(self._stats(b), (1, 0))
+
+    def test_missing_row_is_rebuilt_from_actual_counts(self):
+        layer = self.layers[0]
+        Node.objects.bulk_create([Node(layer=layer, base_node=n) for n in self.nodes])
+        self.assertFalse(LayerStats.objects.filter(layer=layer).exists())
+
+        IntraEdge.objects.create(layer=layer, edge=self.edges[0])
+
+        self.assertEqual(self._stats(layer), (4, 1))
+        self.assertEqual(counters.refresh(), 2)
+        self.assertEqual(self._stats(self.layers[1]), (0, 0))
+
+    def test_bulk_import_updates_counts(self):
+        layer = self.layers[0]
+        counters.refresh()
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': Map.objects.create().id}, 'layers': [], 'records': {
+            'Node': [{'layer': layer.id, 'base_node': n.id} for n in self.nodes],
+            'IntraEdge': [{'layer': layer.id, 'edge': e.pk} for e in self.edges],
+        }}}
+
+        self.assertEqual(services.import_json_payload(payload)['status'], 'SUCCESS')
+        self.assertEqual(self._stats(layer), (4, 2))
+
+    def test_migration_backfills_stats_in_chunks(self):
+        migration = import_module('manager.migrations.0007_layer_stats')
+        self.layers += [Layer.objects.create(type='PowerLayer') for _ in range(3)]
+        for i, layer in enumerate(self.layers):
+            Node.objects.bulk_create([Node(layer=layer, base_node=n) for n in self.nodes[:i]])
+        IntraEdge.objects.bulk_create([IntraEdge(layer=self.layers[1], edge=e) for e in self.edges])
+        LayerStats.objects.all().delete()
+
+        with mock.patch.object(migration, 'CHUNK_SIZE', 2):
+            migration.populate_layer_stats(apps, connection.schema_editor())
+
+        self.assertEqual(list(LayerStats.objects.order_by('layer_id').values_list('node_count', 'edge_count')),
+                         [(0, 0), (1, 2), (2, 0), (3, 0), (4, 0)])
+
+    def test_admin_changelist_reads_counters(self):
+        for layer in self.layers:
+            Node.objects.create(layer=layer, base_node=self.nodes[0])
+        self.client.force_login(User.objects.create_superuser('admin', 'a@example.com', 'pw'))
+
+        def queries():
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.get('/admin/db/layer/')
+            self.assertEqual(res.status_code, 200)
+            return len(ctx.captured_queries)
+
+        before = queries()
+        for _ in range(5):
+            Layer.objects.create(type='PowerLayer')
+        counters.refresh()
+        self.assertEqual(queries(), before)
+
+        m = Map.objects.create()
+        MapLayer.objects.create(map=m, layer=self.layers[0])
+        res = self.client.get('/admin/db/map/')
+        self.assertContains(res, '<td class="field-layer_count">1</td>', html=True)
+
+
+class EnsureIndexesTests(TestCase):
+    def _index_names(self, table):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(cursor, table))
+
+    def test_recreates_missing_composite_index(self):
+        editor = connection.schema_editor()
+        self.assertEqual(ensure_indexes(editor), [])
+        editor.execute(f"DROP INDEX {editor.quote_name('edge_dst_src_idx')}")
+
+        self.assertEqual(ensure_indexes(editor), ['edge_dst_src_idx'])
+        self.assertIn('edge_dst_src_idx', self._index_names('Edge'))
+
+    def test_duplicates_block_unique_index_unless_deduplicating(self):
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'Map_Layer')
+        unique = next(name for name, info in constraints.items()
+                      if info['unique'] and info['columns'] == ['map_id', 'layer_id'])
+        editor.execute(f"DROP INDEX {editor.quote_name(unique)}")
+        m, layer = Map.objects.create(), Layer.objects.create(type='PowerLayer')
+        rows = MapLayer.objects.bulk_create([MapLayer(map=m, layer=layer) for _ in range(3)])
+
+        with self.assertRaises(DuplicateRows) as ctx:
+            ensure_indexes(editor)
+        self.assertEqual(ctx.exception.groups, {('Map_Layer', ('map_id', 'layer_id')): [((m.id, layer.id), 3)]})
+        self.assertEqual(MapLayer.objects.count(), 3)
+        self.assertNotIn('maplayer_map_layer_uniq', self._index_names('Map_Layer'))
+
+        deleted = []
+        self.assertEqual(ensure_indexes(editor, deduplicate=True, log=deleted.append), ['maplayer_map_layer_uniq'])
+        self.assertEqual(list(MapLayer.objects.values_list('id', flat=True)), [rows[0].id])
+        self.assertEqual(len(deleted), 2)
+        self.assertIn(f'id={rows[1].id}', deleted[0])
+
+    def test_migration_reports_duplicates_without_deleting(self):
+        migration = import_module('manager.migrations.0007_layer_stats')
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'Map_Layer')
+        unique = next(name for name, info in constraints.items()
+                      if info['unique'] and info['columns'] == ['map_id', 'layer_id'])
+        editor.execute(f"DROP INDEX {editor.quote_name(unique)}")
+        m, layer = Map.objects.create(), Layer.objects.create(type='PowerLayer')
+        MapLayer.objects.bulk_create([MapLayer(map=m, layer=layer) for _ in range(2)])
+
+        with self.assertRaisesRegex(RuntimeError, rf'Map_Layer \(map_id, layer_id\):\n    \({m.id}, {layer.id}\) x2'):
+            migration.add_db_indexes(apps, editor)
+        self.assertEqual(MapLayer.objects.count(), 2)
+
+        MapLayer.objects.filter(pk=MapLayer.objects.order_by('pk').last().pk).delete()
+        migration.add_db_indexes(apps, editor)
+        self.assertIn('maplayer_map_layer_uniq', self._index_names('Map_Layer'))
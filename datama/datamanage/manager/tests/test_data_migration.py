@@ -0,0 +1,168 @@
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models.signals import pre_save, post_save
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from db.models import Map, Layer, MapLayer, BaseNode, BaseEdge, Node, Edge, IntraEdge, MechanismRelationship
+from manager import rollups, services, spatial
+from manager.models import BaseNodeGeo, LayerStats, RegionRollup
+from manager.utils.data_migration import migrate_resource
+from manager.utils.db_router import get_target_alias, release_target_alias
+
+
+TARGETS = {name: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'} for name in ('archive', 'spare', 'other')}
+
+
+@override_settings(DATA_MIGRATION_TARGETS=TARGETS)
+class MigrateResourceTests(TestCase):
+    # 目标库在 setUpClass 中才注册，测试框架据此时的 connections 展开 '__all__'（含目标库）
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # 目标库（内存库）须在测试框架为各库开启事务之前按名称注册，并建出 db 应用的表
+        with override_settings(DATA_MIGRATION_TARGETS=TARGETS):
+            cls.alias = get_target_alias('archive')
+        with connections[cls.alias].schema_editor() as editor:
+            for model in apps.get_app_config('db').get_models():
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        release_target_alias('archive')
+
+    def setUp(self):
+        self.target = 'archive'
+        self.map = Map.objects.create(version_number=1, author='tester')
+        self.layers = []
+        mech = MechanismRelationship.objects.create(business='supply')
+        for _ in range(2):
+            layer = Layer.objects.create(type='PowerLayer')
+            MapLayer.objects.create(map=self.map, layer=layer)
+            nodes = [BaseNode.objects.create(base_node_name=f'n{i}') for i in range(4)]
+            for n in nodes:
+                Node.objects.create(layer=layer, base_node=n)
+            for i in range(3):
+                edge = Edge.objects.create(base_edge=BaseEdge.objects.create(base_edge_name=f'e{i}'),
+                                           source_node=nodes[i], destination_node=nodes[i + 1],
+                                           mechanism_relationship=mech)
+                IntraEdge.objects.create(layer=layer, edge=edge)
+            self.layers.append(layer)
+        services._archive_map_snapshot(self.map)
+
+    def test_same_target_reuses_alias(self):
+        self.assertEqual(get_target_alias('archive'), self.alias)
+
+    def test_unknown_target_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'unknown migration target'):
+            get_target_alias('elsewhere')
+
+    @override_settings(DATA_MIGRATION_MAX_CONNECTIONS=2)
+    def test_alias_registry_evicts_least_recently_used(self):
+        spare = get_target_alias('spare')
+        get_target_alias('archive')
+        other = get_target_alias('other')
+        self.assertNotIn(spare, connections.databases)
+        self.assertIn(self.alias, connections.databases)
+        release_target_alias('other')
+        self.assertNotIn(other, connections.databases)
+
+    def test_endpoint_requires_admin_and_configured_target(self):
+        client = APIClient()
+        body = {'resource_type': 'map', 'resource_id': self.map.id, 'version': 1, 'target': 'archive'}
+        client.force_authenticate(User.objects.create_user('user'))
+        self.assertEqual(client.post(reverse('data-migration'), body, format='json').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+        client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        res = client.post(reverse('data-migration'), {**body, 'target': 'elsewhere'}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = client.post(reverse('data-migration'), body, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Map.objects.using(self.alias).get(id=res.data['new_id']).author, 'tester')
+
+    def test_migrate_map_copies_graph_with_remapped_ids(self):
+        report = migrate_resource('map', self.map.id, 1, self.target, batch_size=2)
+
+        self.assertEqual(report['rows'], {'Layer': 2, 'BaseNode': 8, 'MechanismRelationship': 1, 'BaseEdge': 6,
+                                          'Node': 8, 'Edge': 6, 'IntraEdge': 6, 'Map': 1, 'MapLayer': 2})
+        target_map = Map.objects.using(self.alias).get(id=report['new_id'])
+        self.assertEqual(target_map.author, 'tester')
+        target_layers = Layer.objects.using(self.alias).filter(map_layers__map=target_map)
+        self.assertEqual(target_layers.count(), 2)
+        for layer in target_layers:
+            for edge in Edge.objects.using(self.alias).filter(intra_edges__layer=layer):
+                self.assertTrue(Node.objects.using(self.alias).filter(layer=layer, base_node_id=edge.source_node_id).exists())
+
+    def test_migrate_without_bulk_returning_ids_sends_no_signals(self):
+        # MySQL 等后端不能由 bulk insert 回填主键，复制走逐行插入
+        features = type(connections[self.alias].features)
+        received = []
+
+        def receiver(sender, **kwargs):
+            received.append(sender)
+
+        for signal in (pre_save, post_save):
+            signal.connect(receiver, weak=False, dispatch_uid='migration-test')
+        try:
+            with mock.patch.object(features, 'can_return_rows_from_bulk_insert', False):
+                report = migrate_resource('map', self.map.id, 1, self.target, batch_size=2)
+        finally:
+            for signal in (pre_save, post_save):
+                signal.disconnect(dispatch_uid='migration-test')
+
+        self.assertEqual(received, [])
+        self.assertEqual(report['rows']['BaseNode'], 8)
+        target_map = Map.objects.using(self.alias).get(id=report['new_id'])
+        layers = Layer.objects.using(self.alias).filter(map_layers__map=target_map)
+        self.assertEqual(layers.count(), 2)
+        for layer in layers:
+            base_nodes = set(Node.objects.using(self.alias).filter(layer=layer).values_list('base_node_id', flat=True))
+            for edge in Edge.objects.using(self.alias).filter(intra_edges__layer=layer):
+                self.assertTrue({edge.source_node_id, edge.destination_node_id} <= base_nodes)
+
+    def _default_summaries(self):
+        return (set(RegionRollup.objects.values_list('level', 'province', 'layer_id', 'count')),
+                set(BaseNodeGeo.objects.values_list('pk', 'min_lat', 'min_lng')),
+                set(LayerStats.objects.values_list('layer_id', 'node_count', 'edge_count', 'node_digest', 'edge_digest')))
+
+    def test_rows_saved_to_target_leave_default_summaries_alone(self):
+        BaseNode.objects.filter(pk__in=[n.base_node_id for n in Node.objects.all()]).update(
+            nation='CN', province='BJ', geo_location='116.3,39.9')
+        rollups.refresh_rollups()
+        spatial.index_objects(BaseNode, BaseNode.objects.values_list('pk', flat=True))
+        before = self._default_summaries()
+
+        # 逐行保存到目标库（源库主键与目标库主键重叠），信号照常发送
+        target_layer = Layer(type='PowerLayer')
+        target_layer.save(using=self.alias)
+        nodes = []
+        for _ in range(BaseNode.objects.count()):
+            nodes.append(BaseNode(nation='CN', province='SH', geo_location='121.4,31.2'))
+            nodes[-1].save(using=self.alias)
+            Node(layer_id=target_layer.pk, base_node_id=nodes[-1].pk).save(using=self.alias)
+        mech = MechanismRelationship(business='supply')
+        mech.save(using=self.alias)
+        base_edge = BaseEdge(geo_location='121.4,31.2;121.5,31.3')
+        base_edge.save(using=self.alias)
+        Edge(base_edge=base_edge, source_node=nodes[0], destination_node=nodes[1],
+             mechanism_relationship=mech).save(using=self.alias)
+        IntraEdge(layer_id=target_layer.pk, edge_id=base_edge.pk).save(using=self.alias)
+        Node.objects.using(self.alias).filter(layer_id=target_layer.pk).first().delete()
+
+        self.assertEqual(self._default_summaries(), before)
+        self.assertTrue(all(before))
+
+    def test_migrate_layer_version(self):
+        services.create_layer_version(self.layers[0], change_message='v2')
+        report = migrate_resource('layer', self.layers[0].id, 2, self.target)
+        layer = Layer.objects.using(self.alias).get(id=report['new_id'])
+        self.assertEqual((layer.version_number, layer.message), (2, 'v2'))
+        self.assertEqual(Node.objects.using(self.alias).filter(layer=layer).count(), 4)
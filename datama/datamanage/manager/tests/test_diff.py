@@ -0,0 +1,37 @@
+import json
+from deepdiff import DeepDiff
+from django.test import SimpleTestCase
+from manager.services import compute_diff_deep, compute_diff_flat
+
+
+def _deepdiff(old, new):
+    return json.loads(DeepDiff(old, new, ignore_order=True, verbose_level=2).to_json())
+
+
+class FlatDiffTests(SimpleTestCase):
+    cases = [
+        ({'id': 1, 'message': 'a', 'version_number': 1}, {'id': 1, 'message': 'b', 'version_number': 2}),
+        ({'id': 1, 'type': None, 'author': 'x'}, {'id': 1, 'type': 'PowerLayer', 'author': 'x'}),
+        ({'id': 1, 'old': 5}, {'id': 1, 'new': 6}),
+        ({'id': 1, 'updated_at': '2025-01-01T00:00:00'}, {'id': 1, 'updated_at': '2025-01-01T00:00:00'}),
+        ({'n': 1}, {'n': 1.5}),
+    ]
+
+    def test_matches_deepdiff_on_flat_dicts(self):
+        for old, new in self.cases:
+            self.assertEqual(compute_diff_flat(old, new), _deepdiff(old, new))
+
+    def test_json_fields_compared_whole_by_default(self):
+        old = {'attribute': {'k': [1, 2]}}
+        new = {'attribute': {'k': [1, 3]}}
+        self.assertEqual(compute_diff_deep(old, new),
+                         {'values_changed': {"root['attribute']": {'new_value': new['attribute'], 'old_value': old['attribute']}}})
+
+    def test_deep_json_opt_in_uses_deepdiff(self):
+        old = {'id': 1, 'attribute': {'k': [1, 2], 'x': 1}}
+        new = {'id': 2, 'attribute': {'k': [2, 1], 'x': 2}}
+        diff = compute_diff_deep(old, new, deep_json=True)
+        self.assertEqual(diff['values_changed'], {
+            "root['id']": {'new_value': 2, 'old_value': 1},
+            "root['attribute']['x']": {'new_value': 2, 'old_value': 1},
+        })
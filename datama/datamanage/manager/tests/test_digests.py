@@ -0,0 +1,142 @@
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from db.models import Map, Layer, MapLayer, BaseNode, BaseEdge, Edge, IntraEdge, MechanismRelationship, Node
+from manager import counters, digests, services
+from manager.models import LayerStats, LayerVersion, MapArchive
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ContentDigestTests(TestCase):
+    def setUp(self):
+        caches['exports'].clear()
+        self.nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(6)])
+        self.map = Map.objects.create(author='tester')
+        self.layer = Layer.objects.create(type='PowerLayer', author='tester')
+        MapLayer.objects.create(map=self.map, layer=self.layer)
+        Node.objects.create(layer=self.layer, base_node=self.nodes[0])
+
+    def _digest(self, layer):
+        return LayerStats.objects.values_list('node_digest', flat=True).get(layer=layer)
+
+    def test_incremental_digest_matches_rebuild(self):
+        created = Node.objects.bulk_create([Node(layer=self.layer, base_node=n) for n in self.nodes[1:4]])
+        counters.apply_instances(Node, created)
+        moved = Node.objects.get(layer=self.layer, base_node=self.nodes[1])
+        moved.base_node = self.nodes[5]
+        moved.save()
+        Node.objects.filter(layer=self.layer, base_node=self.nodes[2]).delete()
+        incremental = self._digest(self.layer)
+
+        counters.refresh([self.layer.id])
+        self.assertEqual(self._digest(self.layer), incremental)
+
+        other = Layer.objects.create(type='PowerLayer', author='tester')
+        for n in reversed([self.nodes[i] for i in (0, 3, 5)]):
+            Node.objects.create(layer=other, base_node=n)
+        self.assertEqual(self._digest(other), incremental)
+
+    def test_migration_backfills_digests_in_chunks(self):
+        migration = import_module('manager.migrations.0011_content_digests')
+        Node.objects.bulk_create([Node(layer=self.layer, base_node=n) for n in self.nodes[1:5]])
+        LayerStats.objects.update(node_digest=0, edge_digest=0)
+
+        with mock.patch.object(migration, 'CHUNK_SIZE', 2):
+            migration.populate_member_digests(apps, connection.schema_editor())
+
+        expected = sum(migration.member_hash('Node', n.id) for n in self.nodes[:5]) % migration.DIGEST_MODULUS
+        self.assertEqual(self._digest(self.layer), expected)
+
+    def test_member_content_changes_update_digest(self):
+        mech = MechanismRelationship.objects.create()
+        edge = Edge.objects.create(base_edge=BaseEdge.objects.create(base_edge_name='line'),
+                                   source_node=self.nodes[0], destination_node=self.nodes[1], mechanism_relationship=mech)
+        IntraEdge.objects.create(layer=self.layer, edge=edge)
+        services.create_layer_version(self.layer, change_message='v2')
+        before = digests.stored_layer_hash(self.layer.id)[1]
+
+        node = BaseNode.objects.get(pk=self.nodes[0].pk)
+        node.attribute = {'capacity': 10}
+        node.save()
+        base_edge = BaseEdge.objects.get(pk=edge.pk)
+        base_edge.base_edge_name = 'cable'
+        base_edge.save()
+        edge.destination_node = self.nodes[2]
+        edge.save()
+        # 不属于任何图层的 BaseNode 不影响摘要
+        BaseNode.objects.filter(pk=self.nodes[4].pk).get().save()
+
+        incremental = LayerStats.objects.values_list('node_digest', 'edge_digest').get(layer=self.layer)
+        counters.refresh([self.layer.id])
+        self.assertEqual(LayerStats.objects.values_list('node_digest', 'edge_digest').get(layer=self.layer),
+                         incremental)
+        self.assertNotEqual(digests.stored_layer_hash(self.layer.id)[1], before)
+        # 成员内容变化是真实的新版本，不再被当作无变化跳过
+        self.layer.refresh_from_db()
+        self.assertEqual(services.create_layer_version(self.layer, change_message='v2')['new_version'], 3)
+
+        node.attribute, base_edge.base_edge_name, edge.destination_node = None, 'line', self.nodes[1]
+        for obj in (node, base_edge, edge):
+            obj.save()
+        self.assertEqual(digests.stored_layer_hash(self.layer.id)[1], before)
+
+    def test_content_migration_matches_rebuild(self):
+        migration = import_module('manager.migrations.0014_member_content_digests')
+        BaseNode.objects.filter(pk=self.nodes[0].pk).update(province='BJ', attribute={'b': [1, 2], 'a': 'x'})
+        Node.objects.bulk_create([Node(layer=self.layer, base_node=n) for n in self.nodes[1:5]])
+        edge = Edge.objects.create(base_edge=BaseEdge.objects.create(attribute={'k': 1}), source_node=self.nodes[0],
+                                   destination_node=self.nodes[1], mechanism_relationship=MechanismRelationship.objects.create())
+        IntraEdge.objects.bulk_create([IntraEdge(layer=self.layer, edge=edge)])
+        counters.refresh([self.layer.id])
+        expected = LayerStats.objects.values_list('node_digest', 'edge_digest').get(layer=self.layer)
+        LayerStats.objects.update(node_digest=0, edge_digest=0)
+
+        with mock.patch.object(migration, 'CHUNK_SIZE', 2):
+            migration.populate_member_content_digests(apps, connection.schema_editor())
+
+        self.assertEqual(LayerStats.objects.values_list('node_digest', 'edge_digest').get(layer=self.layer), expected)
+
+    def test_version_calls_skip_unchanged_content(self):
+        first = services.create_layer_version(self.layer, change_message='v2')
+        again = services.create_layer_version(self.layer, change_message='v2')
+
+        self.assertEqual(again, {'layer_id': self.layer.id, 'new_version': 2, 'diff': {}, 'unchanged': True})
+        self.assertEqual(LayerVersion.objects.filter(layer=self.layer).count(), 1)
+        Node.objects.create(layer=self.layer, base_node=self.nodes[1])
+        self.assertEqual(services.create_layer_version(self.layer)['new_version'], first['new_version'] + 1)
+        self.assertTrue(services.create_layer_version(self.layer, force=True).get('diff'))
+
+        services.create_map_version(self.map, change_message='m2')
+        self.assertTrue(services.create_map_version(self.map)['unchanged'])
+        self.assertEqual(MapArchive.objects.filter(map=self.map).count(), 1)
+        self.layer.type = 'WaterLayer'
+        self.layer.save()
+        self.assertEqual(services.create_map_version(self.map)['new_version'], 3)
+
+    def test_import_of_identical_layer_is_skipped(self):
+        payload = {'import_type': 'LAYER', 'data': {'layer': {'id': self.layer.id, 'type': 'PowerLayer',
+                                                              'author': 'tester', 'version_number': 9}}}
+        res = services.import_json_payload(payload)
+
+        self.assertEqual(res['results']['unchanged'], [{'layer': self.layer.id}])
+        self.assertEqual(res['results']['updated'], [])
+        self.layer.refresh_from_db()
+        self.assertEqual(self.layer.version_number, 1)
+        self.assertFalse(LayerVersion.objects.filter(layer=self.layer).exists())
+
+    def test_export_cache_key_follows_content(self):
+        etag, _ = services.cached_export_layer(self.layer.id)
+        self.assertEqual(services.cached_export_layer(self.layer.id)[0], etag)
+
+        # bulk_create 未显式失效缓存，成员摘要变化仍使键改变
+        created = Node.objects.bulk_create([Node(layer=self.layer, base_node=self.nodes[1])])
+        counters.apply_instances(Node, created)
+        new_etag, payload = services.cached_export_layer(self.layer.id)
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(len(payload['nodes']), 2)
+        self.assertEqual(digests.stored_layer_hash(self.layer.id)[1], digests.layer_hash(self.layer))
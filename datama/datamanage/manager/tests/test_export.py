@@ -0,0 +1,123 @@
+import json
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework import status
+from db.models import (
+    Map, Layer, MapLayer, BaseNode, BaseEdge, Node, Edge, IntraEdge, MechanismRelationship,
+    Configuration, Technique, Diagram,
+)
+from manager import services
+
+
+class LayerExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.map = Map.objects.create(version_number=1, author='tester', message='init')
+        self.layer = Layer.objects.create(type='PowerLayer', version_number=1, author='tester')
+        nodes = [BaseNode.objects.create(base_node_name=f'n{i}', cis_type='002', sub_type='2-1Gen') for i in range(5)]
+        for n in nodes:
+            Node.objects.create(layer=self.layer, base_node=n)
+        mech = MechanismRelationship.objects.create(business='supply')
+        for i in range(4):
+            edge = Edge.objects.create(base_edge=BaseEdge.objects.create(base_edge_name=f'e{i}'),
+                                       source_node=nodes[i], destination_node=nodes[i + 1],
+                                       mechanism_relationship=mech)
+            IntraEdge.objects.create(layer=self.layer, edge=edge)
+        cfg = Configuration.objects.create(layer=self.layer)
+        Diagram.objects.create(map=self.map, configuration=cfg, technique=Technique.objects.create(type='SELECT'))
+
+    def test_export_layer_includes_related(self):
+        payload = services.export_layer(self.layer.id)
+        self.assertEqual(len(payload['nodes']), 5)
+        self.assertEqual(len(payload['intra_edges']), 4)
+        self.assertEqual(len(payload['configurations']), 1)
+        self.assertEqual(len(payload['diagrams']), 1)
+
+    def test_stream_ndjson_matches_export(self):
+        expected = services.export_layer(self.layer.id)
+        text = ''.join(services.stream_export_layer(self.layer.id, fmt='ndjson', chunk_size=2))
+        lines = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual(lines[0], {'type': 'layer', 'data': json.loads(json.dumps(expected['layer']))})
+        self.assertEqual([l['data'] for l in lines if l['type'] == 'node'], expected['nodes'])
+        self.assertEqual(lines[-1]['type'], 'end')
+        self.assertEqual(lines[-1]['counts'], {'nodes': 5, 'intra_edges': 4, 'configurations': 1, 'diagrams': 1})
+
+    def test_stream_json_is_valid_document(self):
+        expected = services.export_layer(self.layer.id)
+        doc = json.loads(''.join(services.stream_export_layer(self.layer.id, fmt='json', chunk_size=2)))
+        for key in ('nodes', 'intra_edges', 'configurations', 'diagrams'):
+            self.assertEqual(doc[key], json.loads(json.dumps(expected[key])))
+
+    def test_stream_export_view(self):
+        url = reverse('layer-export', kwargs={'layer_id': self.layer.id}) + '?stream=ndjson'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(body.splitlines()), 1 + 5 + 4 + 1 + 1 + 1)
+
+        missing = reverse('layer-export', kwargs={'layer_id': 999999}) + '?stream=ndjson'
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_serialize_instance_uses_fk_ids_without_queries(self):
+        ie = IntraEdge.objects.filter(layer=self.layer).first()
+        edge = Edge.objects.get(pk=ie.edge_id)
+        with self.assertNumQueries(0):
+            ie_data = services._serialize_instance(ie)
+            edge_data = services._serialize_instance(edge)
+            layer_data = services._serialize_instance(self.layer)
+        self.assertEqual(ie_data, {'id': ie.id, 'layer': self.layer.id, 'edge': ie.edge_id})
+        self.assertEqual(edge_data['base_edge'], edge.pk)
+        self.assertEqual(layer_data['created_at'], self.layer.created_at.isoformat())
+
+    def test_export_layer_rows_match_instances_in_fixed_queries(self):
+        with self.assertNumQueries(5):
+            payload = services.export_layer(self.layer.id)
+        ie = IntraEdge.objects.filter(layer=self.layer).order_by('pk').first()
+        self.assertEqual(payload['intra_edges'][0], {
+            'intraedge': services._serialize_instance(ie),
+            'edge': {'edge_fields': services._serialize_instance(ie.edge),
+                     'base_edge': services._serialize_instance(ie.edge.base_edge)},
+        })
+        first_node = Node.objects.filter(layer=self.layer).order_by('pk').first()
+        self.assertEqual(payload['nodes'][0], services._serialize_instance(first_node.base_node))
+
+
+class FullMapExportTests(TestCase):
+    def _make_layer(self, m, node_count):
+        layer = Layer.objects.create(type='PowerLayer')
+        MapLayer.objects.create(map=m, layer=layer)
+        for i in range(node_count):
+            Node.objects.create(layer=layer, base_node=BaseNode.objects.create(base_node_name=f'n{i}'))
+        Configuration.objects.create(layer=layer)
+        return layer
+
+    def test_full_depth_matches_export_layer(self):
+        m = Map.objects.create()
+        layers = [self._make_layer(m, i + 1) for i in range(3)]
+        payload = services.export_map(m.id, depth='full')
+        for layer in layers:
+            expected = services.export_layer(layer.id)
+            contents = payload['layer_contents'][str(layer.id)]
+            for section in services.LAYER_SECTIONS:
+                self.assertEqual(contents[section], expected[section])
+
+    def test_full_depth_query_count_is_fixed(self):
+        small, large = Map.objects.create(), Map.objects.create()
+        self._make_layer(small, 1)
+        for _ in range(6):
+            self._make_layer(large, 2)
+        with CaptureQueriesContext(connection) as small_ctx:
+            services.export_map(small.id, depth='full')
+        with CaptureQueriesContext(connection) as large_ctx:
+            services.export_map(large.id, depth='full')
+        self.assertEqual(len(small_ctx.captured_queries), len(large_ctx.captured_queries))
+
+    def test_full_depth_rejected_for_archived_versions(self):
+        m = Map.objects.create()
+        url = reverse('map-export', kwargs={'map_id': m.id}) + '?mode=fixed&version=1&depth=full'
+        self.assertEqual(APIClient().get(url).status_code, status.HTTP_400_BAD_REQUEST)
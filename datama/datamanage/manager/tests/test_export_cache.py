@@ -0,0 +1,59 @@
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from db.models import Map, Layer, MapLayer, BaseNode, Node
+from manager import checks, services
+
+
+# 导出会登记审计日志，在提交钩子中同步写入，避免后台线程写测试库
+@override_settings(AUDIT_ASYNC=False)
+class ExportCacheTests(TestCase):
+    def setUp(self):
+        caches['exports'].clear()
+        self.client = APIClient()
+        self.map = Map.objects.create(version_number=1)
+        self.layer = Layer.objects.create(type='PowerLayer')
+        MapLayer.objects.create(map=self.map, layer=self.layer)
+
+    def test_repeat_export_served_from_cache(self):
+        etag, payload = services.cached_export_layer(self.layer.id)
+        with self.assertNumQueries(1):  # 仅读取当前版本号
+            again = services.cached_export_layer(self.layer.id)
+        self.assertEqual(again, (etag, payload))
+
+    def test_if_none_match_returns_304(self):
+        url = reverse('layer-export', kwargs={'layer_id': self.layer.id})
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_version_bump_invalidates_after_commit(self):
+        etag, _ = services.cached_export_map(self.map.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.create_layer_version(self.layer, change_message='bump')
+        new_etag, payload = services.cached_export_map(self.map.id)
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(payload['layers'][0]['version_number'], 2)
+
+    def test_child_change_invalidates_layer_export(self):
+        _, payload = services.cached_export_layer(self.layer.id)
+        self.assertEqual(payload['nodes'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Node.objects.create(layer=self.layer, base_node=BaseNode.objects.create(base_node_name='n'))
+        _, payload = services.cached_export_layer(self.layer.id)
+        self.assertEqual(len(payload['nodes']), 1)
+
+    def test_etag_ignores_export_time(self):
+        etag, _ = services.cached_export_layer(self.layer.id)
+        caches['exports'].clear()
+        self.assertEqual(services.cached_export_layer(self.layer.id)[0], etag)
+
+    def test_deploy_check_requires_shared_export_cache(self):
+        self.assertEqual([e.id for e in checks.check_shared_caches(None)], ['manager.E001', 'manager.W001'])
+        shared = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379'}
+        with override_settings(CACHES={'default': shared, 'exports': shared}):
+            self.assertEqual(checks.check_shared_caches(None), [])
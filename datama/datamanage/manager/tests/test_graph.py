@@ -0,0 +1,90 @@
+from django.test import TestCase
+from db.models import (
+    Map, Layer, MapLayer, BaseNode, BaseEdge, Node, Edge, IntraEdge, MechanismRelationship,
+    Configuration, Technique, TargetNode, Diagram,
+)
+from manager import graph
+
+
+class MapGraphTests(TestCase):
+    """
+    电力层: g -> t -> d1, t -> d2；水务层: p -> w；
+    d1 同时出现在两个层（层间耦合点），d1 -> p 为水泵对电力的依赖；孤立点 x 自成一个分量。
+    """
+
+    def setUp(self):
+        self.map = Map.objects.create()
+        self.power = Layer.objects.create(type='PowerLayer')
+        self.water = Layer.objects.create(type='WaterLayer')
+        for layer in (self.power, self.water):
+            MapLayer.objects.create(map=self.map, layer=layer)
+        self.n = {name: BaseNode.objects.create(base_node_name=name) for name in ('g', 't', 'd1', 'd2', 'p', 'w', 'x')}
+        for name in ('g', 't', 'd1', 'd2', 'x'):
+            Node.objects.create(layer=self.power, base_node=self.n[name])
+        for name in ('d1', 'p', 'w'):
+            Node.objects.create(layer=self.water, base_node=self.n[name])
+        self.mech = MechanismRelationship.objects.create(business='supply')
+        self._edge(self.power, 'g', 't')
+        self._edge(self.power, 't', 'd1')
+        self._edge(self.power, 't', 'd2')
+        self._edge(self.water, 'p', 'w')
+        shared = self._edge(self.water, 'd1', 'p')
+        IntraEdge.objects.create(layer=self.power, edge=shared)  # 同一条边被两个层引用，只计一次
+
+    def _edge(self, layer, src, dst):
+        edge = Edge.objects.create(base_edge=BaseEdge.objects.create(base_edge_name=f'{src}-{dst}'),
+                                   source_node=self.n[src], destination_node=self.n[dst],
+                                   mechanism_relationship=self.mech)
+        IntraEdge.objects.create(layer=layer, edge=edge)
+        return edge
+
+    def ids(self, *names):
+        return [self.n[name].id for name in names]
+
+    def test_load_uses_fixed_queries(self):
+        with self.assertNumQueries(3):
+            g = graph.load_map_graph(self.map.id)
+        self.assertEqual(g.node_count, 7)
+        self.assertEqual(g.edge_count, 5)
+        self.assertEqual(sorted(g.neighbors(self.n['t'].id)), sorted(self.ids('d1', 'd2')))
+        self.assertEqual(sorted(g.layers_of(self.n['d1'].id)), sorted([self.power.id, self.water.id]))
+
+    def test_bfs_and_reachability(self):
+        g = graph.load_map_graph(self.map.id)
+        levels = g.bfs(self.ids('g'))
+        self.assertEqual(levels[:2], [self.ids('g'), self.ids('t')])
+        self.assertEqual(set(levels[2]), set(self.ids('d1', 'd2')))
+        self.assertEqual(g.reachable(self.ids('g')), set(self.ids('g', 't', 'd1', 'd2', 'p', 'w')))
+        self.assertEqual(g.reachable(self.ids('g'), max_depth=1), set(self.ids('g', 't')))
+        self.assertEqual(g.reachable(self.ids('w'), direction='in'), set(self.ids('w', 'p', 'd1', 't', 'g')))
+
+    def test_connected_components(self):
+        g = graph.load_map_graph(self.map.id)
+        components = g.connected_components()
+        self.assertEqual([len(c) for c in components], [6, 1])
+        self.assertEqual(components[1], self.ids('x'))
+
+    def test_cascade_threshold(self):
+        g = graph.load_map_graph(self.map.id)
+        steps = g.cascade(self.ids('t'))
+        self.assertEqual(steps[0], self.ids('t'))
+        self.assertEqual(set(steps[1]), set(self.ids('d1', 'd2')))
+        self.assertEqual(steps[2:], [self.ids('p'), self.ids('w')])
+
+        # w 增加一路来自 g 的冗余供给：全部上游失效才失效时，w 保持运行
+        self._edge(self.water, 'g', 'w')
+        g = graph.load_map_graph(self.map.id)
+        failed = {n for step in g.cascade(self.ids('t')) for n in step}
+        self.assertNotIn(self.n['w'].id, failed)
+        failed = {n for step in g.cascade(self.ids('t'), threshold=0.5) for n in step}
+        self.assertIn(self.n['w'].id, failed)
+
+    def test_cascade_from_target_nodes(self):
+        technique = Technique.objects.create(type='SELECT')
+        TargetNode.objects.create(technique=technique, node=self.n['d1'], target_sequence=1)
+        Diagram.objects.create(map=self.map, configuration=Configuration.objects.create(layer=self.power),
+                               technique=technique)
+        result = graph.cascade_from_targets(self.map.id)
+        self.assertEqual(result['seeds'], self.ids('d1'))
+        self.assertEqual(result['steps'], [self.ids('d1'), self.ids('p'), self.ids('w')])
+        self.assertEqual(result['layer_impact'], {self.power.id: 1, self.water.id: 3})
@@ -0,0 +1,69 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from db.models import Map, Layer, MapLayer
+from manager import services
+
+
+class VersionHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.map = Map.objects.create(version_number=1, author='tester', message='init')
+        self.layer = Layer.objects.create(type='PowerLayer', version_number=1, author='tester')
+        MapLayer.objects.create(map=self.map, layer=self.layer)
+        for i in range(5):
+            services.create_map_version(self.map, change_message=f'map v{i + 2}')
+            services.create_layer_version(self.layer, change_message=f'layer v{i + 2}')
+
+    def _get(self, *args, **params):
+        res = self.client.get(reverse('versions', args=args), params)
+        self.assertEqual(res.status_code, 200)
+        return res.data
+
+    def test_map_history_is_metadata_only_and_paginated(self):
+        first = self._get('map', self.map.id, limit=2)
+
+        self.assertEqual((first['count'], first['current_version']), (5, 6))
+        self.assertEqual([r['version_number'] for r in first['results']], [6, 5])
+        row = first['results'][0]
+        self.assertNotIn('snapshot', row)
+        self.assertEqual(row['message'], 'map v6')
+        self.assertGreater(row['size'], 0)
+        self.assertIn('layers_changed', row['summary'])
+
+        second = self._get('map', self.map.id, limit=2, before=first['next_before'])
+        last = self._get('map', self.map.id, limit=2, before=second['next_before'])
+        self.assertEqual([r['version_number'] for r in second['results'] + last['results']], [4, 3, 2])
+        self.assertIsNone(last['next_before'])
+
+    def test_layer_history_and_lazy_body(self):
+        page = self._get('layer', self.layer.id, limit=50)
+
+        self.assertEqual([r['version'] for r in page['results']], [6, 5, 4, 3, 2])
+        self.assertIn('message', page['results'][0]['summary']['fields'])
+        res = self.client.get(reverse('version-detail', args=['layer', self.layer.id, 4]))
+        self.assertEqual(res.data['data']['message'], 'layer v4')
+        res = self.client.get(reverse('version-detail', args=['map', self.map.id, 3]))
+        self.assertEqual(res.data['data']['map']['version_number'], 3)
+        self.assertEqual(self.client.get(reverse('version-detail', args=['map', self.map.id, 99])).status_code, 404)
+
+    def test_query_count_independent_of_history_length(self):
+        def count():
+            with CaptureQueriesContext(connection) as ctx:
+                self._get('map', self.map.id, limit=3)
+            return len(ctx.captured_queries)
+
+        before = count()
+        for _ in range(10):
+            services.create_map_version(self.map, force=True)
+        self.assertEqual(count(), before)
+
+    def test_recent_versions_overview(self):
+        res = self.client.get(reverse('version-list'), {'limit': 3})
+
+        self.assertEqual(res.data['map_versions']['count'], 5)
+        self.assertEqual(len(res.data['layer_versions']['results']), 3)
+        self.assertEqual(res.data['layer_versions']['results'][0]['layer_id'], self.layer.id)
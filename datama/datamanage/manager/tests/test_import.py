@@ -0,0 +1,156 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from db.models import Map, Layer, MapLayer
+from manager import services
+from manager.models import LayerVersion, AuditLog, ResourceImportJob
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.map = Map.objects.create(version_number=1, author='tester', message='init')
+
+    def _payload(self, existing, new_count):
+        layers = [{'id': l.id, 'type': 'WaterLayer', 'version_number': 2} for l in existing]
+        layers += [{'type': 'PowerLayer', 'version_number': 1} for _ in range(new_count)]
+        return {'import_type': 'MAP', 'message': 'bulk', 'data': {'map': {'id': self.map.id}, 'layers': layers}}
+
+    def _make_layers(self, count):
+        layers = [Layer.objects.create(type='PowerLayer', version_number=1) for _ in range(count)]
+        for l in layers:
+            MapLayer.objects.create(map=self.map, layer=l)
+        return layers
+
+    def test_map_import_creates_and_updates_layers(self):
+        existing = self._make_layers(2)
+        stale = Layer.objects.create(type='PowerLayer', version_number=5)
+        payload = self._payload(existing, 3)
+        payload['data']['layers'].append({'id': stale.id, 'version_number': 5})
+
+        # 审计日志在提交后写入
+        with override_settings(BACKGROUND_TASKS_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            res = services.import_json_payload(payload)
+
+        self.assertEqual(res['status'], 'SUCCESS')
+        results = res['results']
+        self.assertEqual(len([c for c in results['created'] if 'layer' in c]), 3)
+        self.assertEqual(len([u for u in results['updated'] if 'layer' in u]), 2)
+        self.assertEqual(results['conflicts'], [{'layer': stale.id, 'reason': 'incoming version not newer'}])
+        self.assertEqual(MapLayer.objects.filter(map=self.map).count(), 5)
+        for l in existing:
+            l.refresh_from_db()
+            self.assertEqual((l.type, l.version_number, l.message), ('WaterLayer', 3, 'bulk'))
+            self.assertTrue(LayerVersion.objects.filter(layer=l, version=3).exists())
+        self.assertEqual(AuditLog.objects.filter(action='VERSION', resource_type='Layer').count(), 2)
+
+    def test_invalid_layer_rejects_whole_batch(self):
+        existing = self._make_layers(1)
+        payload = self._payload(existing, 1)
+        payload['data']['layers'].append({'type': 'NotALayer', 'version_number': 1})
+        before = Layer.objects.count()
+
+        res = services.import_json_payload(payload)
+
+        self.assertEqual(res['status'], 'FAILED')
+        self.assertIn('layers[2]', res['error'])
+        self.assertEqual(Layer.objects.count(), before)
+
+    def test_query_count_independent_of_layer_count(self):
+        counts = []
+        for size in (2, 20):
+            existing = self._make_layers(size)
+            with CaptureQueriesContext(connection) as ctx:
+                res = services.import_json_payload(self._payload(existing, size))
+            self.assertEqual(res['status'], 'SUCCESS')
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class AsyncImportJobTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        self.map = Map.objects.create(version_number=1)
+
+    def test_import_returns_job_and_poll_reports_progress(self):
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': self.map.id},
+                                                 'layers': [{'type': 'PowerLayer'}, {'type': 'WaterLayer'}]}}
+        response = self.client.post(reverse('import-json'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data['job_id']
+        self.assertEqual(response.data['poll_url'], reverse('import-job-status', kwargs={'job_id': job_id}))
+
+        poll = self.client.get(response.data['poll_url'])
+        self.assertEqual(poll.status_code, status.HTTP_200_OK)
+        self.assertEqual(poll.data['status'], 'SUCCESS')
+        self.assertNotIn('imported_data', poll.data)
+        self.assertEqual(poll.data['logs']['progress'],
+                         {'stage': 'done', 'total': 2, 'processed': 2, 'created': 2, 'updated': 1, 'conflicts': 0})
+        self.assertEqual(MapLayer.objects.filter(map=self.map).count(), 2)
+
+    def test_invalid_payload_rejected_without_job(self):
+        response = self.client.post(reverse('import-json'), {'data': {}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ResourceImportJob.objects.exists())
+
+    def test_poll_reports_batch_progress_while_running(self):
+        layers = [{'type': 'PowerLayer'} for _ in range(5)]
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': self.map.id}, 'layers': layers}}
+        seen = []
+        report = services._report_progress
+
+        def poll(job, *args, **kwargs):
+            report(job, *args, **kwargs)
+            seen.append(self.client.get(reverse('import-job-status', kwargs={'job_id': job.id})).data['logs']['progress'])
+
+        with mock.patch.object(services, 'IMPORT_BATCH_SIZE', 2), mock.patch.object(services, '_report_progress', poll):
+            response = self.client.post(reverse('import-json'), payload, format='json')
+
+        self.assertEqual([(p['stage'], p['processed'], p['total']) for p in seen],
+                         [('layers', 2, 5), ('layers', 4, 5), ('writing', 5, 5)])
+        poll_url = reverse('import-job-status', kwargs={'job_id': response.data['job_id']})
+        self.assertEqual(self.client.get(poll_url).data['logs']['progress']['stage'], 'done')
+
+    def test_run_import_job_claims_pending_job_once(self):
+        job = services._create_import_job({'import_type': 'LAYER', 'data': {'layer': {'type': 'PowerLayer'}}})
+        # 另一执行者已认领
+        ResourceImportJob.objects.filter(id=job.id).update(status='RUNNING')
+
+        self.assertEqual(services.run_import_job(job.id), {'status': 'RUNNING', 'job_id': job.id})
+        self.assertFalse(Layer.objects.exists())
+
+    def test_run_import_job_skips_finished_jobs(self):
+        res = services.import_json_payload({'import_type': 'LAYER', 'data': {'layer': {'type': 'PowerLayer'}}})
+        job = ResourceImportJob.objects.get()
+        self.assertEqual(res['status'], 'SUCCESS')
+        self.assertEqual(services.run_import_job(job.id), {'status': 'SUCCESS', 'job_id': job.id})
+        self.assertEqual(Layer.objects.count(), 1)
+
+    def test_recover_interrupted_jobs(self):
+        old = timezone.now() - timedelta(hours=2)
+        payload = {'import_type': 'LAYER', 'data': {'layer': {'type': 'PowerLayer'}}}
+        stale, fresh, pending, queued = (services._create_import_job(payload) for _ in range(4))
+        ResourceImportJob.objects.filter(id=stale.id).update(status='RUNNING', started_at=old)
+        ResourceImportJob.objects.filter(id=fresh.id).update(status='RUNNING', started_at=timezone.now())
+        ResourceImportJob.objects.filter(id__in=[stale.id, fresh.id, pending.id]).update(created_at=old)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            failed, requeued = services.recover_import_jobs(stale_after=3600)
+
+        self.assertEqual((failed, requeued), ([stale.id], [pending.id]))
+        statuses = dict(ResourceImportJob.objects.values_list('id', 'status'))
+        # 刚认领的与刚创建的任务不受影响，仍由原执行者处理
+        self.assertEqual(statuses, {stale.id: 'FAILED', fresh.id: 'RUNNING', pending.id: 'SUCCESS',
+                                    queued.id: 'PENDING'})
+        self.assertIn('interrupted', ResourceImportJob.objects.get(id=stale.id).logs['error'])
+        self.assertEqual(Layer.objects.count(), 1)
+        self.assertEqual(services.recover_import_jobs(stale_after=3600), ([], []))
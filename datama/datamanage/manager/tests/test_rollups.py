@@ -0,0 +1,110 @@
+import random
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from db.models import Map, Layer, BaseNode, Node
+from manager import rollups, services
+from manager.models import RegionRollup
+
+REGIONS = [('中国', '江苏', '南京', '玄武'), ('中国', '江苏', '苏州', '姑苏'), ('中国', '浙江', '杭州', None),
+           ('中国', None, None, None)]
+
+
+class RegionRollupTests(TestCase):
+    def setUp(self):
+        self.layer = Layer.objects.create(type='PowerLayer')
+
+    def _node(self, region, cis_type='002', sub_type='2-1Gen'):
+        nation, province, city, district = region
+        return BaseNode.objects.create(nation=nation, province=province, city=city, district=district,
+                                       cis_type=cis_type, sub_type=sub_type)
+
+    def _snapshot(self):
+        state = {}
+        for layer_id in (None, self.layer.id):
+            for level in rollups.LEVELS:
+                state[layer_id, level] = rollups.region_counts(level, layer_id=layer_id, by=rollups.DIMENSIONS)
+        return state
+
+    def test_signals_maintain_counts(self):
+        nodes = [self._node(REGIONS[i % 3]) for i in range(6)]
+        self.assertEqual(rollups.region_counts('nation'), [{'nation': '中国', 'count': 6}])
+        self.assertEqual(rollups.region_counts('province', nation='中国'),
+                         [{'nation': '中国', 'province': '江苏', 'count': 4},
+                          {'nation': '中国', 'province': '浙江', 'count': 2}])
+
+        Node.objects.create(layer=self.layer, base_node=nodes[0])
+        Node.objects.create(layer=self.layer, base_node=nodes[1])
+        self.assertEqual(rollups.region_counts('city', layer_id=self.layer.id, nation='中国', province='江苏'),
+                         [{'nation': '中国', 'province': '江苏', 'city': '南京', 'count': 1},
+                          {'nation': '中国', 'province': '江苏', 'city': '苏州', 'count': 1}])
+
+        # 修改区划：全部节点与所在图层的计数一并迁移
+        nodes[0].city = '苏州'
+        nodes[0].save()
+        self.assertEqual(rollups.region_counts('city', layer_id=self.layer.id, nation='中国', province='江苏'),
+                         [{'nation': '中国', 'province': '江苏', 'city': '苏州', 'count': 2}])
+
+        Node.objects.filter(base_node=nodes[0]).delete()
+        nodes[0].delete()
+        self.assertEqual(rollups.region_counts('nation'), [{'nation': '中国', 'count': 5}])
+        self.assertEqual(rollups.region_counts('nation', layer_id=self.layer.id), [{'nation': '中国', 'count': 1}])
+
+    def test_refresh_matches_incremental_state(self):
+        rng = random.Random(5)
+        nodes = [self._node(rng.choice(REGIONS), rng.choice(['001', '002', None]), rng.choice(['2-1Gen', None]))
+                 for _ in range(40)]
+        for node in rng.sample(nodes, 15):
+            Node.objects.create(layer=self.layer, base_node=node)
+        for node in rng.sample(nodes, 10):
+            node.province = rng.choice(['江苏', '浙江', None])
+            node.save()
+        incremental = self._snapshot()
+
+        rollups.refresh_rollups()
+
+        self.assertEqual(self._snapshot(), incremental)
+        self.assertEqual(sum(r['count'] for r in incremental[None, 'street']), 40)
+
+    def test_query_reads_rollup_only(self):
+        for region in REGIONS:
+            self._node(region)
+        with CaptureQueriesContext(connection) as ctx:
+            rows = rollups.region_counts('province', nation='中国', by=['cis_type'])
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('RegionRollup', ctx.captured_queries[0]['sql'])
+        self.assertNotIn('"BaseNode"', ctx.captured_queries[0]['sql'])
+        self.assertEqual([r['province'] for r in rows], ['', '江苏', '浙江'])
+
+    def test_bulk_import_updates_rollups(self):
+        m = Map.objects.create()
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': m.id}, 'layers': [], 'records': {
+            'BaseNode': [{'id': 500 + i, 'nation': '中国', 'province': '江苏'} for i in range(3)],
+            'Node': [{'layer': self.layer.id, 'base_node': 500 + i} for i in range(2)],
+        }}}
+        self.assertEqual(services.import_json_payload(payload)['status'], 'SUCCESS')
+        self.assertEqual(rollups.region_counts('province', nation='中国'),
+                         [{'nation': '中国', 'province': '江苏', 'count': 3}])
+        self.assertEqual(rollups.region_counts('province', layer_id=self.layer.id, nation='中国'),
+                         [{'nation': '中国', 'province': '江苏', 'count': 2}])
+
+    def test_view_and_admin_filter(self):
+        for region in REGIONS:
+            self._node(region)
+        res = APIClient().get(reverse('region-rollup'), {'level': 'city', 'nation': '中国', 'province': '江苏'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([r['city'] for r in res.data['results']], ['南京', '苏州'])
+        res = APIClient().get(reverse('region-rollup'), {'level': 'city', 'district': 'x'})
+        self.assertEqual(res.status_code, 400)
+
+        admin_user = User.objects.create_superuser('admin', 'a@example.com', 'pw')
+        self.client.force_login(admin_user)
+        res = self.client.get('/admin/db/basenode/', {'nation': '中国'})
+        self.assertEqual(res.status_code, 200)
+        self.assertContains(res, '江苏 (2)')
+        self.assertEqual(RegionRollup.objects.filter(level=1, layer=None).get().count, 4)
@@ -0,0 +1,188 @@
+import os
+import tempfile
+
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from db.models import (
+    Map, Layer, MapLayer, BaseNode, BaseEdge, Node, Edge, IntraEdge, MechanismRelationship,
+    Configuration, Technique, TargetNode, Diagram, Record, Execution, Simulation, Project,
+)
+from manager import record_store, simulation, simulation_batch
+
+
+class SimulationFixture(TestCase):
+    """电力层 g -> t -> d，d -> p（水泵依赖配电），p -> w；t 另有一路冗余供给 g2 -> t。"""
+
+    def setUp(self):
+        self.map = Map.objects.create()
+        self.power = Layer.objects.create(type='PowerLayer')
+        self.water = Layer.objects.create(type='WaterLayer')
+        for layer in (self.power, self.water):
+            MapLayer.objects.create(map=self.map, layer=layer)
+        self.n = {name: BaseNode.objects.create(base_node_name=name) for name in ('g', 'g2', 't', 'd', 'p', 'w')}
+        for name in ('g', 'g2', 't', 'd'):
+            Node.objects.create(layer=self.power, base_node=self.n[name])
+        for name in ('d', 'p', 'w'):
+            Node.objects.create(layer=self.water, base_node=self.n[name])
+        mech = MechanismRelationship.objects.create(business='supply')
+        for layer, src, dst in ((self.power, 'g', 't'), (self.power, 'g2', 't'), (self.power, 't', 'd'),
+                                (self.water, 'd', 'p'), (self.water, 'p', 'w')):
+            edge = Edge.objects.create(base_edge=BaseEdge.objects.create(), source_node=self.n[src],
+                                       destination_node=self.n[dst], mechanism_relationship=mech)
+            IntraEdge.objects.create(layer=layer, edge=edge)
+        self.technique = Technique.objects.create(type='Order')
+        self.diagram = Diagram.objects.create(map=self.map, configuration=Configuration.objects.create(layer=self.power),
+                                              technique=self.technique)
+
+    def target(self, name, sequence=None, effect=None):
+        TargetNode.objects.create(technique=self.technique, node=self.n[name],
+                                  target_sequence=sequence, target_effect=effect)
+
+    def ids(self, *names):
+        return [self.n[name].id for name in names]
+
+    def failed_names(self, sim_graph, failed_row):
+        names = {node.id: name for name, node in self.n.items()}
+        return {names[i] for i in sim_graph.node_ids[failed_row].tolist()}
+
+
+class SimulationEngineTests(SimulationFixture):
+
+    def test_waves_follow_target_sequence(self):
+        self.target('g', sequence=1)
+        self.target('g2', sequence=2)
+        sim_graph = simulation.load_simulation_graph(self.map.id)
+        waves = simulation.target_waves(self.technique.id, sim_graph)
+        failed, per_step = simulation.simulate_batch(sim_graph, waves, 3, np.random.default_rng(0))
+        # g 失效时 t 仍有 g2 供给；g2 在第二波失效后 t、d、p、w 依次失效
+        self.assertEqual(per_step[0].tolist(), [1, 1, 1, 1, 1, 1])
+        self.assertTrue(failed.all())
+
+    def test_threshold_and_effect(self):
+        self.target('g', effect=1.0)
+        sim_graph = simulation.load_simulation_graph(self.map.id)
+        waves = simulation.target_waves(self.technique.id, sim_graph)
+        failed, _ = simulation.simulate_batch(sim_graph, waves, 2, np.random.default_rng(0))
+        self.assertEqual(self.failed_names(sim_graph, failed[0]), {'g'})
+        failed, _ = simulation.simulate_batch(sim_graph, waves, 2, np.random.default_rng(0), threshold=0.5)
+        self.assertEqual(self.failed_names(sim_graph, failed[0]), {'g', 't', 'd', 'p', 'w'})
+
+        TargetNode.objects.update(target_effect=0.0)
+        waves = simulation.target_waves(self.technique.id, sim_graph)
+        failed, _ = simulation.simulate_batch(sim_graph, waves, 4, np.random.default_rng(0))
+        self.assertFalse(failed.any())
+
+    def test_run_simulation_writes_rows(self):
+        self.target('d', effect=0.5)
+        result = simulation.run_simulation(diagram_id=self.diagram.id, iterations=200, seed=7)
+        self.assertEqual(Execution.objects.count(), 200)
+        self.assertEqual(Record.objects.count(), 200)
+        sim = Simulation.objects.select_related('execution__record', 'result__analysis_algorithm').get(
+            id=result['simulation_id'])
+        self.assertEqual(sim.execution.iteration, 199)
+        self.assertEqual(sim.result.analysis_algorithm.name, simulation.ALGORITHM_NAME)
+        self.assertTrue(Project.objects.filter(diagram=self.diagram, simulation=sim).exists())
+
+        counts = [r['failed_count'] for r in Record.objects.values_list('record_data', flat=True)]
+        self.assertEqual(set(counts), {0, 3})  # d 以 0.5 概率失效，连带 p、w
+        self.assertEqual(result['summary']['max_failed'], 3)
+        record = next(r for r in Record.objects.values_list('record_data', flat=True) if r['failed_count'])
+        self.assertEqual(record['failed_per_step'], [1, 1, 1])
+        self.assertEqual(record['layer_impact'], {str(self.power.id): 1, str(self.water.id): 3})
+
+
+class BatchSimulationTests(SimulationFixture):
+    def setUp(self):
+        super().setUp()
+        self.water_config = Configuration.objects.create(layer=self.water)
+        self.target('d', effect=0.5)
+        self.target('p', sequence=1, effect=1.0)
+
+    def run_batch(self, workers):
+        return simulation_batch.run_batch(self.map.id, iterations=40, seed=3, workers=workers, chunk_iterations=15)
+
+    def test_scenarios_restrict_targets_to_configuration_layer(self):
+        report = self.run_batch(workers=1)
+        by_config = {s['configuration_id']: s for s in report['scenarios']}
+        self.assertEqual(set(by_config), {self.diagram.configuration_id, self.water_config.id})
+        self.assertEqual(report['iterations'], 80)
+        # 电力层配置只允许打击 d：约半数迭代失效 d、p、w；水务层配置必然打击 p（连带 w），d 也属于水务层
+        self.assertEqual(by_config[self.diagram.configuration_id]['summary']['max_failed'], 3)
+        self.assertGreaterEqual(by_config[self.water_config.id]['summary']['mean_failed'], 2)
+        self.assertEqual(Execution.objects.count(), 80)
+        self.assertEqual(Project.objects.get().simulation_id, by_config[self.diagram.configuration_id]['simulation_id'])
+
+    def test_unknown_or_empty_configuration_ids_rejected(self):
+        other = Configuration.objects.create(layer=Layer.objects.create(type='PowerLayer'))
+        for configuration_ids in ([], [self.water_config.id, other.id]):
+            with self.assertRaises(ValidationError):
+                simulation_batch.run_batch(self.map.id, configuration_ids=configuration_ids, iterations=5, workers=1)
+        self.assertFalse(Execution.objects.exists())
+
+    def test_process_pool_matches_in_process_results(self):
+        local = self.run_batch(workers=1)
+        local_records = list(Record.objects.order_by('id').values_list('record_data', flat=True))
+        pooled = self.run_batch(workers=2)
+        pooled_records = list(Record.objects.order_by('id').values_list('record_data', flat=True))[len(local_records):]
+        self.assertEqual([s['summary'] for s in pooled['scenarios']], [s['summary'] for s in local['scenarios']])
+        self.assertEqual(pooled_records, local_records)
+
+
+class ColumnarRecordTests(SimulationFixture):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.enterContext(override_settings(RECORD_STORE_ROOT=self.tmp.name))
+        self.target('d', effect=0.5)
+
+    def test_writer_reader_slices_by_node_and_iteration(self):
+        node_ids = np.array([30, 10, 20])
+        data = np.arange(25 * 3).reshape(25, 3) % 100
+        for fmt in record_store.FORMATS:
+            writer = record_store.ColumnarWriter(node_ids, np.int8, chunk_iterations=10, fmt=fmt)
+            writer.append(data[:7])
+            writer.append(data[7:25])
+            manifest = writer.finish()
+            self.assertEqual(len(manifest['chunks']), 3)
+            reader = record_store.open_record(manifest)
+            np.testing.assert_array_equal(reader.read(), data[:, [1, 2, 0]])
+            np.testing.assert_array_equal(reader.read([20, 30], start=8, stop=22), data[8:22][:, [2, 0]])
+            with self.assertRaises(KeyError):
+                reader.read([99])
+
+    def test_manifest_paths_outside_store_rejected(self):
+        writer = record_store.ColumnarWriter(np.array([1, 2]), np.int8, chunk_iterations=10)
+        writer.append(np.zeros((3, 2)))
+        manifest = writer.finish()
+        outside = tempfile.TemporaryDirectory()
+        self.addCleanup(outside.cleanup)
+        for path in ('../' + os.path.basename(outside.name), outside.name, '.'):
+            with self.assertRaises(ValueError):
+                record_store.open_record({**manifest, 'path': path}).delete()
+        with self.assertRaises(ValueError):
+            record_store.open_record({**manifest, 'chunks': ['../../escape.npy']}).read()
+        self.assertTrue(os.path.isdir(outside.name))
+        self.assertEqual(record_store.open_record(manifest).read().shape, (3, 2))
+
+    def test_run_simulation_columnar_matches_json_nodes(self):
+        json_run = simulation.run_simulation(diagram_id=self.diagram.id, iterations=30, seed=5, store_nodes=True)
+        col_run = simulation.run_simulation(diagram_id=self.diagram.id, iterations=30, seed=5, columnar='npy',
+                                            chunk_iterations=8)
+        self.assertEqual(json_run['summary'], col_run['summary'])
+
+        sim = Simulation.objects.select_related('execution__record').get(id=col_run['simulation_id'])
+        self.assertIsNone(sim.execution.iteration)
+        reader = record_store.open_record(sim.execution.record)
+        self.assertEqual(reader.manifest['dtype'], 'int8')
+        steps = reader.read()
+        json_records = Record.objects.order_by('id').values_list('record_data', flat=True)[:30]  # 第一次运行的逐迭代记录
+        for row, data in zip(steps, json_records):
+            failed = set(reader.node_ids[row >= 0].tolist())
+            self.assertEqual(failed, set(data['failed_nodes']))
+        # d 失效于第 0 步时，p、w 依次在第 1、2 步失效
+        d_p_w = reader.read(self.ids('d', 'p', 'w'))
+        hit = d_p_w[:, 0] == 0
+        self.assertTrue(hit.any())
+        np.testing.assert_array_equal(d_p_w[hit], np.tile([0, 1, 2], (hit.sum(), 1)))
@@ -0,0 +1,100 @@
+import random
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from db.models import BaseNode, BaseEdge
+from manager import spatial
+from manager.models import BaseNodeGeo, BaseEdgeGeo
+
+
+class ParseTests(TestCase):
+    def test_formats(self):
+        point = [(116.39, 39.91)]
+        for text in ['116.39,39.91', '116.39 39.91', 'POINT(116.39 39.91)', '{"lng": 116.39, "lat": 39.91}',
+                     '{"type": "Point", "coordinates": [116.39, 39.91]}']:
+            self.assertEqual(spatial.parse_points(text), point, text)
+        self.assertEqual(spatial.parse_points('LINESTRING(116.39 39.91, 121.47 31.23)'),
+                         [(116.39, 39.91), (121.47, 31.23)])
+        for text in [None, '', '位置描述', '200,10', '1,2,3']:
+            self.assertEqual(spatial.parse_points(text), [], text)
+
+    def test_geohash(self):
+        self.assertEqual(spatial.geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(spatial.extent_cell(39.91, 116.39, 39.91, 116.39), spatial.geohash(39.91, 116.39))
+
+
+class SpatialQueryTests(TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = {}
+        nodes = []
+        for _ in range(400):
+            lng, lat = rng.uniform(100, 125), rng.uniform(20, 45)
+            nodes.append(BaseNode(geo_location=f'{lng},{lat}'))
+        nodes.append(BaseNode(geo_location='位置描述'))
+        for node in BaseNode.objects.bulk_create(nodes):
+            points = spatial.parse_points(node.geo_location)
+            if points:
+                self.points[node.id] = points[0]
+        spatial.index_objects(BaseNode)
+
+    def test_bbox_matches_brute_force(self):
+        self.assertEqual(BaseNodeGeo.objects.count(), 400)
+        for box in [(30, 110, 35, 118), (39.9, 116.3, 39.95, 116.45), (0, 0, 60, 179)]:
+            min_lat, min_lng, max_lat, max_lng = box
+            expected = {pk for pk, (lng, lat) in self.points.items()
+                        if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng}
+            got = set(spatial.in_bbox(BaseNode, *box).values_list('pk', flat=True))
+            self.assertEqual(got, expected, box)
+
+    def test_radius_and_nearest_match_brute_force(self):
+        lat, lng = 31.2, 121.4
+        ranked = sorted((spatial.distance_m(lat, lng, p_lat, p_lng), pk) for pk, (p_lng, p_lat) in self.points.items())
+        hits = spatial.within_radius(BaseNode, lat, lng, 300000)
+        self.assertEqual([pk for pk, _ in hits], [pk for d, pk in ranked if d <= 300000])
+        self.assertEqual([pk for pk, _ in spatial.nearest(BaseNode, lat, lng, k=7)], [pk for _, pk in ranked[:7]])
+
+    def test_bbox_is_single_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            list(spatial.in_bbox(BaseNode, 30, 110, 35, 118))
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_edges_indexed_by_extent(self):
+        long_edge = BaseEdge.objects.create(geo_location='LINESTRING(100 20, 125 45)')
+        short_edge = BaseEdge.objects.create(geo_location='116.30,39.90;116.40,39.95')
+        self.assertEqual(BaseEdgeGeo.objects.count(), 2)
+        # 长边的外包矩形跨越查询框，即使端点都不在框内也应命中
+        got = set(spatial.in_bbox(BaseEdge, 30, 110, 31, 111).values_list('pk', flat=True))
+        self.assertEqual(got, {long_edge.pk})
+        got = set(spatial.in_bbox(BaseEdge, 39.92, 116.35, 39.93, 116.36).values_list('pk', flat=True))
+        self.assertEqual(got, {long_edge.pk, short_edge.pk})
+
+    def test_post_save_keeps_index_in_sync(self):
+        node = BaseNode.objects.create(geo_location='116.39,39.91')
+        self.assertEqual(BaseNodeGeo.objects.get(pk=node.pk).min_lat, 39.91)
+        node.geo_location = '无坐标'
+        node.save()
+        self.assertFalse(BaseNodeGeo.objects.filter(pk=node.pk).exists())
+        node.location = '121.47 31.23'
+        node.save()
+        self.assertEqual(BaseNodeGeo.objects.get(pk=node.pk).min_lng, 121.47)
+
+    def test_view(self):
+        client = APIClient()
+        res = client.get(reverse('spatial-query', kwargs={'kind': 'nodes'}), {'bbox': '110,30,118,35'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual({r['id'] for r in res.data['results']},
+                         set(spatial.in_bbox(BaseNode, 30, 110, 35, 118).values_list('pk', flat=True)))
+        res = client.get(reverse('spatial-query', kwargs={'kind': 'nodes'}), {'lat': 31.2, 'lng': 121.4, 'k': 3})
+        self.assertEqual(res.data['count'], 3)
+        res = client.get(reverse('spatial-query', kwargs={'kind': 'nodes'}), {'lat': 31.2})
+        self.assertEqual(res.status_code, 400)
+        for params in ({'bbox': 'inf,30,118,35'}, {'bbox': '-1e9,30,118,35'}, {'bbox': '110,30,118,95'},
+                       {'lat': 'nan', 'lng': 121.4, 'k': 3}, {'lat': 31.2, 'lng': 181, 'k': 3},
+                       {'lat': 31.2, 'lng': 121.4, 'radius': 'inf'}):
+            res = client.get(reverse('spatial-query', kwargs={'kind': 'nodes'}), params)
+            self.assertEqual(res.status_code, 400, params)
@@ -0,0 +1,99 @@
+import math
+import random
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from db.models import Layer, BaseNode, Node, BaseEdge, Edge, IntraEdge, MechanismRelationship
+from manager import services, spatial, tiles
+
+
+def tile_of(lat, lng, z):
+    n = 2 ** z
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return z, x, y
+
+
+class LayerTileTests(TestCase):
+    def setUp(self):
+        caches['exports'].clear()
+        rng = random.Random(3)
+        self.layer = Layer.objects.create(type='PowerLayer')
+        self.base_nodes = BaseNode.objects.bulk_create([
+            BaseNode(base_node_name=f'n{i}', geo_location=f'{rng.uniform(116.2, 116.6)},{rng.uniform(39.8, 40.0)}')
+            for i in range(200)
+        ])
+        spatial.index_objects(BaseNode)
+        Node.objects.bulk_create([Node(layer=self.layer, base_node=b) for b in self.base_nodes])
+        mech = MechanismRelationship.objects.create()
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in range(300)])
+        edges = Edge.objects.bulk_create([
+            Edge(base_edge=be, source_node=rng.choice(self.base_nodes), destination_node=rng.choice(self.base_nodes),
+                 mechanism_relationship=mech) for be in base_edges
+        ])
+        IntraEdge.objects.bulk_create([IntraEdge(layer=self.layer, edge=e) for e in edges])
+        self.edges = edges
+        self.coords = {b.id: spatial.parse_points(b.geo_location)[0] for b in self.base_nodes}
+
+    def _inside(self, box):
+        min_lat, min_lng, max_lat, max_lng = box
+        return {pk for pk, (lng, lat) in self.coords.items() if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng}
+
+    def test_tile_bbox(self):
+        self.assertEqual(tiles.tile_bbox(0, 0, 0)[1::2], (-180.0, 180.0))
+        with self.assertRaises(ValueError):
+            tiles.tile_bbox(2, 4, 0)
+
+    def test_feature_tile_matches_brute_force(self):
+        z, x, y = tile_of(39.9, 116.4, 13)
+        payload = tiles.layer_tile(self.layer.id, z, x, y)
+        inside = self._inside(tiles.tile_bbox(z, x, y))
+        self.assertFalse(payload['clustered'])
+        self.assertTrue(inside)
+        self.assertEqual({n['id'] for n in payload['nodes']}, inside)
+        expected = {e.pk for e in self.edges if e.source_node_id in inside or e.destination_node_id in inside}
+        self.assertEqual({e['id'] for e in payload['edges']}, expected)
+        edge = payload['edges'][0]
+        source = self.coords[edge['source']]
+        self.assertEqual(edge['coordinates'][0], [source[0], source[1]])
+
+    def test_clustered_tile_counts_all_nodes(self):
+        z, x, y = tile_of(39.9, 116.4, 4)
+        payload = tiles.layer_tile(self.layer.id, z, x, y)
+        self.assertTrue(payload['clustered'])
+        self.assertEqual(sum(c['count'] for c in payload['clusters']), 200)
+        self.assertTrue(all(l['source'] != l['target'] for l in payload['edges']))
+
+    def test_cached_tile_queries_and_invalidation(self):
+        z, x, y = tile_of(39.9, 116.4, 13)
+        with CaptureQueriesContext(connection) as ctx:
+            etag, payload = services.cached_layer_tile(self.layer.id, z, x, y)
+        self.assertEqual(len(ctx.captured_queries), 3)  # 图层版本 + 节点 + 边
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(services.cached_layer_tile(self.layer.id, z, x, y)[0], etag)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = self.base_nodes[0]
+            moved.geo_location = '116.40,39.90'
+            moved.save()
+        etag2, payload2 = services.cached_layer_tile(self.layer.id, z, x, y)
+        self.assertNotEqual(etag2, etag)
+        self.assertIn(moved.id, {n['id'] for n in payload2['nodes']})
+
+    def test_view(self):
+        client = APIClient()
+        url = reverse('layer-tile', kwargs={'layer_id': self.layer.id, 'z': 13, 'x': 6747, 'y': 3104})
+        res = client.get(url)
+        self.assertEqual(res.status_code, 200)
+        res = client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, 304)
+        res = client.get(reverse('layer-tile', kwargs={'layer_id': self.layer.id, 'z': 1, 'x': 5, 'y': 0}))
+        self.assertEqual(res.status_code, 400)
+        res = client.get(reverse('layer-tile', kwargs={'layer_id': 10 ** 6, 'z': 1, 'x': 0, 'y': 0}))
+        self.assertEqual(res.status_code, 404)
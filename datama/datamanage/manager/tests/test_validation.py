@@ -0,0 +1,109 @@
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from db.models import (
+    Map, Layer, MapLayer, BaseNode, BaseEdge, Edge, MechanismRelationship, Configuration, Technique, TargetNode,
+    Diagram, Record, Execution,
+)
+from db.validation import validate_batch
+from manager import services
+
+
+class BatchValidationTests(TestCase):
+    def setUp(self):
+        self.map = Map.objects.create(author='tester')
+        self.layer = Layer.objects.create(type='PowerLayer')
+        MapLayer.objects.create(map=self.map, layer=self.layer)
+        self.config = Configuration.objects.create(layer=self.layer)
+        self.technique = Technique.objects.create(type='SELECT')
+        self.nodes = BaseNode.objects.bulk_create([BaseNode() for _ in range(60)])
+
+    def _targets(self, count):
+        return [TargetNode(technique=self.technique, node=self.nodes[i % len(self.nodes)], target_sequence=i)
+                for i in range(count)]
+
+    def test_reports_per_row_errors(self):
+        rows = self._targets(3)
+        rows[1].node_id = 10 ** 9
+        rows[2].target_sequence = -1
+        rows.append(Diagram(map=self.map, configuration=self.config, technique_id=10 ** 9))
+
+        errors = validate_batch(rows)
+
+        self.assertEqual(sorted(errors), [1, 2, 3])
+        self.assertIn('node', errors[1])
+        self.assertEqual(errors[2], {'target_sequence': ['Target sequence must be non-negative']})
+        self.assertIn('technique', errors[3])
+
+    def test_query_count_independent_of_row_count(self):
+        def count(n):
+            rows = self._targets(n) + [Execution(iteration=i, record=Record.objects.create()) for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(validate_batch(rows), {})
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(3), count(50))
+        # Technique、BaseNode、Record 各一次
+        self.assertEqual(count(5), 3)
+
+    def test_single_row_clean_still_checks_existence(self):
+        with self.assertRaises(ValidationError) as ctx:
+            TargetNode(technique=self.technique, node_id=10 ** 9).clean()
+        self.assertEqual(ctx.exception.message_dict, {'node': ['Referenced BaseNode does not exist']})
+
+    def test_map_import_records_section(self):
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': self.map.id}, 'layers': [], 'records': {
+            'Technique': [{'id': 900, 'type': 'Random'}],
+            'TargetNode': [{'technique': 900, 'node': n.id, 'target_sequence': 0} for n in self.nodes[:5]],
+            'Diagram': [{'map': self.map.id, 'configuration': self.config.id, 'technique': 900}],
+        }}}
+
+        res = services.import_json_payload(payload)
+
+        self.assertEqual(res['status'], 'SUCCESS')
+        self.assertEqual(TargetNode.objects.filter(technique_id=900).count(), 5)
+        self.assertTrue(Diagram.objects.filter(map=self.map, technique_id=900).exists())
+        self.assertEqual(len([c for c in res['results']['created'] if 'TargetNode' in c]), 5)
+
+    def test_edge_records_map_id_to_primary_key(self):
+        base_edges = BaseEdge.objects.bulk_create([BaseEdge() for _ in range(2)])
+        row = {'source_node': self.nodes[0].id, 'destination_node': self.nodes[1].id,
+               'mechanism_relationship': MechanismRelationship.objects.create().id}
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': self.map.id}, 'layers': [], 'records': {
+            'Edge': [{'id': base_edges[0].id, **row}, {'base_edge': base_edges[1].id, **row}],
+        }}}
+
+        res = services.import_json_payload(payload)
+
+        self.assertEqual(res['status'], 'SUCCESS')
+        self.assertEqual(sorted(Edge.objects.values_list('pk', flat=True)), [e.id for e in base_edges])
+
+    def test_invalid_edge_records_reported_per_row(self):
+        base_edge = BaseEdge.objects.create()
+        row = {'source_node': self.nodes[0].id, 'destination_node': self.nodes[1].id,
+               'mechanism_relationship': MechanismRelationship.objects.create().id}
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': self.map.id}, 'layers': [], 'records': {
+            'Edge': [{'id': base_edge.id, 'base_edge': base_edge.id + 1, **row}, {'id': 10 ** 9, **row}],
+        }}}
+
+        res = services.import_json_payload(payload)
+
+        self.assertEqual(res['status'], 'FAILED')
+        self.assertIn("Edge[0]: conflicting values for base_edge", res['error'])
+        # 行号按原始行计：第 0 行已报错跳过，外键不存在的仍报为第 1 行
+        self.assertIn("Edge[1]: {'base_edge'", res['error'])
+        self.assertFalse(Edge.objects.exists())
+
+    def test_invalid_record_rejects_import(self):
+        payload = {'import_type': 'MAP', 'data': {'map': {'id': self.map.id}, 'layers': [], 'records': {
+            'TargetNode': [{'technique': self.technique.id, 'node': self.nodes[0].id},
+                           {'technique': self.technique.id, 'node': 10 ** 9}],
+        }}}
+
+        res = services.import_json_payload(payload)
+
+        self.assertEqual(res['status'], 'FAILED')
+        self.assertIn('TargetNode[1]', res['error'])
+        self.assertFalse(TargetNode.objects.exists())
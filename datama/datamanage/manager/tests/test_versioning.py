@@ -0,0 +1,147 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from db.models import Map, Layer, MapLayer
+from manager import services, versioning
+from manager.models import LayerVersion, MapArchive, ResourceImportJob
+
+_compare_and_swap = versioning.compare_and_swap
+
+
+def _bump_before_swap(times):
+    """模拟并发写入者：前 times 次 compare_and_swap 之前先把数据库中的版本号推进一次。"""
+    calls = []
+
+    def swap(instance, expected_version, fields=None):
+        calls.append(instance.pk)
+        if len(calls) <= times:
+            type(instance).objects.filter(pk=instance.pk).update(version_number=F('version_number') + 1)
+        return _compare_and_swap(instance, expected_version, fields)
+    return swap
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class CompareAndSwapTests(TestCase):
+    def setUp(self):
+        self.map = Map.objects.create(author='tester')
+        self.layers = [Layer.objects.create(type='PowerLayer', author='tester') for _ in range(3)]
+        MapLayer.objects.bulk_create([MapLayer(map=self.map, layer=layer) for layer in self.layers])
+
+    def test_stale_instance_is_rejected(self):
+        stale = Layer.objects.get(pk=self.layers[0].pk)
+        services.create_layer_version(self.layers[0], change_message='first')
+
+        with self.assertRaises(versioning.VersionConflict) as ctx:
+            services.create_layer_version(stale, change_message='second', force=True)
+        self.assertEqual(ctx.exception.ids, [stale.pk])
+        self.assertEqual(list(LayerVersion.objects.values_list('version', flat=True)), [2])
+        stale.refresh_from_db()
+        self.assertEqual((stale.version_number, stale.message), (2, 'first'))
+
+        stale_map = Map.objects.get(pk=self.map.pk)
+        services.create_map_version(self.map, change_message='first')
+        with self.assertRaises(versioning.VersionConflict):
+            services.create_map_version(stale_map, change_message='second')
+        self.assertEqual(MapArchive.objects.filter(map=self.map).count(), 1)
+
+    def test_bulk_swap_reports_conflicting_rows(self):
+        Layer.objects.filter(pk=self.layers[1].pk).update(version_number=5)
+        for layer in self.layers:
+            layer.version_number += 1
+            layer.type = 'WaterLayer'
+
+        with self.assertRaises(versioning.VersionConflict) as ctx:
+            versioning.bulk_compare_and_swap(self.layers, ['type', 'version_number'],
+                                             {layer.pk: 1 for layer in self.layers}, batch_size=2)
+        self.assertEqual(ctx.exception.ids, [self.layers[1].pk])
+        # 同批及之前批次的写入一并回滚
+        self.assertEqual(sorted(Layer.objects.values_list('type', 'version_number')),
+                         [('PowerLayer', 1), ('PowerLayer', 1), ('PowerLayer', 5)])
+
+    def test_bulk_swap_reports_concurrent_write_of_same_version(self):
+        # 并发写入者与本次写入把版本号推进到相同的值
+        Layer.objects.filter(pk=self.layers[2].pk).update(version_number=2)
+        for layer in self.layers:
+            layer.version_number = 2
+
+        with self.assertRaises(versioning.VersionConflict) as ctx:
+            versioning.bulk_compare_and_swap(self.layers, ['version_number'], {layer.pk: 1 for layer in self.layers})
+        self.assertEqual(ctx.exception.ids, [self.layers[2].pk])
+        self.assertEqual(sorted(Layer.objects.values_list('version_number', flat=True)), [1, 1, 2])
+
+    def test_no_retry_inside_callers_transaction(self):
+        payload = {'import_type': 'LAYER', 'message': 'imported',
+                   'data': {'layer': {'id': self.layers[0].id, 'type': 'WaterLayer', 'version_number': 2}}}
+        with mock.patch.object(versioning, 'compare_and_swap', _bump_before_swap(1)):
+            res = services.import_json_payload(payload)
+
+        # 测试事务即外层事务：重试只能是同一事务内的保存点，直接以冲突结束
+        self.assertEqual(res['status'], 'FAILED')
+        self.assertTrue(res['conflict'])
+        self.assertNotIn('retries', ResourceImportJob.objects.get().logs)
+        self.assertFalse(LayerVersion.objects.exists())
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ImportRetryTests(TransactionTestCase):
+    def setUp(self):
+        self.map = Map.objects.create(author='tester')
+        self.layer = Layer.objects.create(type='PowerLayer', author='tester')
+        MapLayer.objects.create(map=self.map, layer=self.layer)
+
+    def test_retry_rereads_after_committed_bump(self):
+        expected_versions = []
+
+        def swap(instance, expected_version, fields=None):
+            expected_versions.append(expected_version)
+            if len(expected_versions) == 1:
+                raise versioning.VersionConflict(type(instance), [instance.pk])
+            return _compare_and_swap(instance, expected_version, fields)
+
+        report = services._report_progress
+
+        def between_attempts(job, stage, processed, total=None):
+            if stage == 'retrying':
+                # 上一次尝试的事务已结束，并发写入者在两次尝试之间提交推进
+                self.assertFalse(connection.in_atomic_block)
+                Layer.objects.filter(pk=self.layer.pk).update(version_number=F('version_number') + 1)
+            report(job, stage, processed, total)
+
+        payload = {'import_type': 'LAYER', 'message': 'imported',
+                   'data': {'layer': {'id': self.layer.id, 'type': 'WaterLayer', 'version_number': 3}}}
+        with mock.patch.object(versioning, 'compare_and_swap', swap), \
+                mock.patch.object(services, '_report_progress', between_attempts):
+            res = services.import_json_payload(payload)
+
+        # 第二次尝试在新事务中读到已提交的版本 2
+        self.assertEqual(res['status'], 'SUCCESS')
+        self.assertEqual(expected_versions, [1, 2])
+        job = ResourceImportJob.objects.get()
+        self.assertEqual((job.status, job.logs['retries']), ('SUCCESS', 1))
+        self.layer.refresh_from_db()
+        self.assertEqual((self.layer.type, self.layer.version_number), ('WaterLayer', 4))
+        self.assertEqual(list(LayerVersion.objects.values_list('version', flat=True)), [4])
+
+    @override_settings(VERSION_CONFLICT_RETRIES=1)
+    def test_persistent_conflict_returns_409(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        payload = {'import_type': 'MAP', 'message': 'imported',
+                   'data': {'map': {'id': self.map.id, 'author': 'importer'}, 'layers': []}}
+        with mock.patch.object(versioning, 'compare_and_swap', _bump_before_swap(2)):
+            res = client.post(reverse('import-json') + '?mode=sync', payload, format='json')
+
+        self.assertEqual(res.status_code, 409)
+        self.assertTrue(res.data['conflict'])
+        self.map.refresh_from_db()
+        # 两次尝试均被整体回滚，任务以失败提交
+        self.assertEqual((self.map.author, self.map.version_number), ('tester', 1))
+        self.assertFalse(MapArchive.objects.exists())
+        job = ResourceImportJob.objects.get()
+        self.assertEqual((job.status, job.logs['retries']), ('FAILED', 1))
@@ -0,0 +1,101 @@
+# tiles.py
+"""
+图层瓦片：按 Web Mercator (z, x, y) 瓦片返回图层内落在瓦片中的节点与层内边，替代整层导出。
+
+- 节点位置取自空间索引（manager.spatial 的 BaseNodeGeo），瓦片范围查询走 geohash 单元索引；
+- z < TILE_CLUSTER_MAX_ZOOM 时按 geohash 前缀在数据库内 GROUP BY 聚合为簇（每个瓦片横向约 2^TILE_CLUSTER_BITS 个簇），
+  边聚合为簇间边计数（取边数最多的 TILE_MAX_CLUSTER_EDGES 组），不再逐行传输；
+- z >= TILE_CLUSTER_MAX_ZOOM 时返回逐个节点与至少一端在瓦片内的层内边（含两端坐标），超过 TILE_MAX_FEATURES 时截断；
+- 每个瓦片固定 2 条查询，结果由 services.cached_layer_tile 按图层版本缓存。
+"""
+import math
+
+from django.db.models import Avg, Count, Exists, F, OuterRef, Q
+from django.db.models.functions import Substr
+
+from db.models import BaseNode, Node, Edge, IntraEdge
+from . import spatial
+
+MAX_ZOOM = 22
+TILE_CLUSTER_MAX_ZOOM = 12
+TILE_CLUSTER_BITS = 4
+TILE_MAX_FEATURES = 5000
+TILE_MAX_CLUSTER_EDGES = 2000
+
+
+def tile_bbox(z, x, y):
+    """瓦片的 (min_lat, min_lng, max_lat, max_lng)。"""
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"invalid tile {z}/{x}/{y}")
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def cluster_precision(z):
+    """聚合所用 geohash 前缀长度：经度方向位数约为 z + TILE_CLUSTER_BITS。"""
+    return min(spatial.GEOHASH_PRECISION, max(1, math.ceil(2 * (z + TILE_CLUSTER_BITS) / 5)))
+
+
+def _nodes_in_tile(layer_id, box):
+    # 以 EXISTS 限定图层，使查询由 geohash 单元索引驱动，而不是先取出整层节点
+    in_layer = Node.objects.filter(layer_id=layer_id, base_node_id=OuterRef('pk'))
+    return spatial.extents_in_bbox(BaseNode, *box).filter(Exists(in_layer))
+
+
+def _edges_touching(layer_id, nodes_in_tile):
+    node_ids = nodes_in_tile.values('pk')
+    edge_ids = Edge.objects.filter(Q(source_node_id__in=node_ids) | Q(destination_node_id__in=node_ids)).values('pk')
+    return IntraEdge.objects.filter(layer_id=layer_id, edge_id__in=edge_ids)
+
+
+def _clustered(layer_id, nodes_in_tile, z):
+    size = cluster_precision(z)
+    clusters = (nodes_in_tile.annotate(cluster=Substr('cell', 1, size)).values('cluster')
+                .annotate(count=Count('pk'), lat=Avg('min_lat'), lng=Avg('min_lng')).order_by('cluster'))
+    links = (_edges_touching(layer_id, nodes_in_tile)
+             .annotate(source=Substr('edge__source_node__geo__cell', 1, size),
+                       target=Substr('edge__destination_node__geo__cell', 1, size))
+             .exclude(source=F('target')).exclude(source=None).exclude(target=None)
+             .values('source', 'target').annotate(count=Count('pk'))
+             .order_by('-count', 'source', 'target')[:TILE_MAX_CLUSTER_EDGES + 1])
+    links = list(links)
+    return {
+        'truncated': len(links) > TILE_MAX_CLUSTER_EDGES,
+        'clusters': [{'cell': c['cluster'], 'count': c['count'], 'lat': c['lat'], 'lng': c['lng']} for c in clusters],
+        'edges': [{'source': l['source'], 'target': l['target'], 'count': l['count']}
+                  for l in links[:TILE_MAX_CLUSTER_EDGES]],
+    }
+
+
+def _features(layer_id, nodes_in_tile):
+    nodes = list(nodes_in_tile.order_by('pk').values_list(
+        'pk', 'min_lat', 'min_lng', 'base_node__base_node_name', 'base_node__cis_type', 'base_node__sub_type'
+    )[:TILE_MAX_FEATURES + 1])
+    edges = list(_edges_touching(layer_id, nodes_in_tile).order_by('pk').values_list(
+        'edge_id', 'edge__source_node_id', 'edge__destination_node_id',
+        'edge__source_node__geo__min_lng', 'edge__source_node__geo__min_lat',
+        'edge__destination_node__geo__min_lng', 'edge__destination_node__geo__min_lat',
+    )[:TILE_MAX_FEATURES + 1])
+    return {
+        'truncated': len(nodes) > TILE_MAX_FEATURES or len(edges) > TILE_MAX_FEATURES,
+        'nodes': [{'id': pk, 'lat': lat, 'lng': lng, 'name': name, 'cis_type': cis_type, 'sub_type': sub_type}
+                  for pk, lat, lng, name, cis_type, sub_type in nodes[:TILE_MAX_FEATURES]],
+        'edges': [{'id': edge_id, 'source': source, 'destination': destination,
+                   'coordinates': [[slng, slat] if slat is not None else None,
+                                   [dlng, dlat] if dlat is not None else None]}
+                  for edge_id, source, destination, slng, slat, dlng, dlat in edges[:TILE_MAX_FEATURES]],
+    }
+
+
+def layer_tile(layer_id, z, x, y):
+    """构造图层瓦片（不做存在性检查与缓存，见 services.cached_layer_tile）。"""
+    box = tile_bbox(z, x, y)
+    nodes_in_tile = _nodes_in_tile(layer_id, box)
+    clustered = z < TILE_CLUSTER_MAX_ZOOM
+    payload = {'layer_id': layer_id, 'z': z, 'x': x, 'y': y, 'bbox': list(box), 'clustered': clustered}
+    payload.update(_clustered(layer_id, nodes_in_tile, z) if clustered else _features(layer_id, nodes_in_tile))
+    return payload
@@ -1,17 +1,31 @@
 from django.urls import path
 from .views import (
-    MapExportView, LayerExportView, MapDetailView, LayerDetailView,
-    MapLayersListView, VersionListView, ImportJSONView, DataMigrationAPIView, MapRollbackView
+    MapExportView, LayerExportView, LayerTileView, MapDetailView, LayerDetailView,
+    MapLayersListView, VersionListView, VersionDetailView, ImportJSONView, ImportJobStatusView, DataMigrationAPIView,
+    MapRollbackView, SpatialQueryView, RegionRollupView,
+    LayerBranchView, LayerMergeView, LayerCommitListView, MapBranchView, MapMergeView,
 )
 
 urlpatterns = [
     path('maps/<int:map_id>/export/', MapExportView.as_view(), name='map-export'),
     path('layers/<int:layer_id>/export/', LayerExportView.as_view(), name='layer-export'),
+    path('layers/<int:layer_id>/tiles/<int:z>/<int:x>/<int:y>/', LayerTileView.as_view(), name='layer-tile'),
     path('maps/<int:map_id>/', MapDetailView.as_view(), name='map-detail'),
     path('layers/<int:layer_id>/', LayerDetailView.as_view(), name='layer-detail'),
     path('maps/<int:map_id>/layers/', MapLayersListView.as_view(), name='map-layers'),
+    path('versions/', VersionListView.as_view(), name='version-list'),
     path('versions/<str:resource_type>/<int:resource_id>/', VersionListView.as_view(), name='versions'),
+    path('versions/<str:resource_type>/<int:resource_id>/<int:version>/', VersionDetailView.as_view(),
+         name='version-detail'),
     path('import/', ImportJSONView.as_view(), name='import-json'),
+    path('import/jobs/<int:job_id>/', ImportJobStatusView.as_view(), name='import-job-status'),
     path('migration/', DataMigrationAPIView.as_view(), name='data-migration'),
     path('maps/<int:map_id>/rollback/', MapRollbackView.as_view(), name='map-rollback'),
+    path('maps/<int:map_id>/branches/', MapBranchView.as_view(), name='map-branches'),
+    path('maps/<int:map_id>/merge/', MapMergeView.as_view(), name='map-merge'),
+    path('layers/<int:layer_id>/branches/', LayerBranchView.as_view(), name='layer-branches'),
+    path('layers/<int:layer_id>/merge/', LayerMergeView.as_view(), name='layer-merge'),
+    path('layers/<int:layer_id>/commits/', LayerCommitListView.as_view(), name='layer-commits'),
+    path('spatial/<str:kind>/', SpatialQueryView.as_view(), name='spatial-query'),
+    path('regions/rollup/', RegionRollupView.as_view(), name='region-rollup'),
 ]
@@ -1,28 +1,145 @@
 # data_migration.py
-from django.db import transaction
-from db.models import Map, Layer
-from manager.models import MapVersionSnapshot, LayerVersion
-from .db_router import setup_target_db
+import time
 
-def migrate_resource(resource_type: str, resource_id: int, version: int, target_db_config: dict):
+from django.db import connections, transaction
+from db.models import (
+    Map, Layer, MapLayer, BaseNode, BaseEdge, Node, MechanismRelationship, Edge, IntraEdge,
+)
+from manager.archive import reconstruct_map_snapshot
+from manager.models import LayerVersion
+from .db_router import get_target_alias
+
+DEFAULT_BATCH_SIZE = 1000
+
+# 复制 Map / Layer 元数据时不带过去的字段（主键与自动时间戳由目标库生成）
+_SKIP_FIELDS = {'id', 'create_time', 'created_at', 'updated_at'}
+
+
+def _assignable(model, data):
+    names = {f.name for f in model._meta.concrete_fields} - _SKIP_FIELDS
+    return {k: v for k, v in (data or {}).items() if k in names}
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class _Copier:
+    """
+    将源库（default）中的 Layer 内容按批复制到目标库，维护 源id -> 目标id 的映射。
+    目标后端支持 bulk insert 回填主键（PostgreSQL / SQLite / MariaDB 10.5+）时整批插入，
+    否则（如 MySQL）在同一事务内逐行插入以获得新主键。
+    两种方式都不经过 Model.save()：复制到目标库不应触发本应用的 pre_save / post_save 处理（缓存、计数、汇总、空间索引）。
+    """
+
+    def __init__(self, alias, batch_size):
+        self.alias = alias
+        self.batch_size = batch_size
+        self.bulk_returns_ids = connections[alias].features.can_return_rows_from_bulk_insert
+        self.rows = {}
+        self.id_maps = {BaseNode: {}, BaseEdge: {}, MechanismRelationship: {}}
+
+    def _count(self, model, n):
+        self.rows[model.__name__] = self.rows.get(model.__name__, 0) + n
+
+    def insert(self, model, objs):
+        for batch in _chunks(objs, self.batch_size):
+            model.objects.using(self.alias).bulk_create(batch)
+            self._count(model, len(batch))
+
+    def insert_returning(self, model, objs):
+        if self.bulk_returns_ids:
+            self.insert(model, objs)
+            return
+        meta = model._meta
+        fields = [f for f in meta.local_concrete_fields if f is not meta.auto_field]
+        manager = model._base_manager.using(self.alias)
+        for obj in objs:
+            # 与 Model.save() 的单行插入相同（回填自增主键），但不发送模型信号
+            row = manager._insert([obj], fields=fields, returning_fields=meta.db_returning_fields, using=self.alias)[0]
+            for value, field in zip(row, meta.db_returning_fields):
+                setattr(obj, field.attname, value)
+            obj._state.adding, obj._state.db = False, self.alias
+        self._count(model, len(objs))
+
+    def copy_rows(self, model, ids):
+        """按源主键复制一组行（无外键的基础表），记录新主键映射。"""
+        id_map = self.id_maps[model]
+        pending = [i for i in ids if i not in id_map]
+        fields = [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+        for batch_ids in _chunks(pending, self.batch_size):
+            rows = list(model.objects.filter(pk__in=batch_ids).values_list('pk', *fields))
+            objs = [model(**dict(zip(fields, row[1:]))) for row in rows]
+            self.insert_returning(model, objs)
+            id_map.update((row[0], obj.pk) for row, obj in zip(rows, objs))
+
+    def copy_layer(self, source_layer_id, layer_data):
+        target_layer = Layer(**_assignable(Layer, layer_data))
+        self.insert_returning(Layer, [target_layer])
+
+        node_ids = list(Node.objects.filter(layer_id=source_layer_id).values_list('base_node_id', flat=True))
+        edge_rows = list(IntraEdge.objects.filter(layer_id=source_layer_id).values_list(
+            'edge__base_edge_id', 'edge__source_node_id', 'edge__destination_node_id',
+            'edge__mechanism_relationship_id'))
+
+        endpoints = {r[1] for r in edge_rows} | {r[2] for r in edge_rows}
+        self.copy_rows(BaseNode, list(dict.fromkeys(node_ids)) + sorted(endpoints - set(node_ids)))
+        self.copy_rows(MechanismRelationship, sorted({r[3] for r in edge_rows}))
+        new_edges = [r for r in edge_rows if r[0] not in self.id_maps[BaseEdge]]
+        self.copy_rows(BaseEdge, [r[0] for r in new_edges])
+
+        nodes, edges, mechs = self.id_maps[BaseNode], self.id_maps[BaseEdge], self.id_maps[MechanismRelationship]
+        self.insert(Node, [Node(layer_id=target_layer.pk, base_node_id=nodes[i]) for i in node_ids])
+        self.insert(Edge, [Edge(base_edge_id=edges[be], source_node_id=nodes[src], destination_node_id=nodes[dst],
+                                mechanism_relationship_id=mechs[mech])
+                           for be, src, dst, mech in new_edges])
+        self.insert(IntraEdge, [IntraEdge(layer_id=target_layer.pk, edge_id=edges[r[0]]) for r in edge_rows])
+        return target_layer.pk
+
+
+def migrate_resource(resource_type: str, resource_id: int, version: int, target: str,
+                     batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
     """
-    迁移 Map 或 Layer 的指定版本到目标数据库
+    迁移 Map 或 Layer 的指定版本到目标数据库：
+    - Map：按 MapArchive 重建该版本快照，复制 Map 及其全部 Layer；
+    - Layer：取 LayerVersion 中该版本的元数据；
+    每个 Layer 连同其 nodes / edges / intra-edges 以 bulk_create 分批写入并重映射主键。
+    target 为 settings.DATA_MIGRATION_TARGETS 中的目标库名称，连接按名称复用（见 get_target_alias）。
+    返回新 id、各表行数与吞吐。
     """
-    alias = "target_db"
-    setup_target_db(alias, target_db_config)
+    alias = get_target_alias(target)
+    started = time.perf_counter()
 
     if resource_type == "map":
-        snapshot = MapVersionSnapshot.objects.get(map_id=resource_id, version=version)
-        data = snapshot.snapshot_data
-        model_cls = Map
+        snapshot = reconstruct_map_snapshot(resource_id, version)
+        layers = [(l['id'], l) for l in snapshot.get('layers', [])]
     elif resource_type == "layer":
-        snapshot = LayerVersion.objects.get(layer_id=resource_id, version=version)
-        data = snapshot.data
-        model_cls = Layer
+        snapshot = None
+        data = LayerVersion.objects.filter(layer_id=resource_id, version=version).values_list('data', flat=True).first()
+        if data is None:
+            raise LayerVersion.DoesNotExist(f"No LayerVersion for layer {resource_id} version {version}")
+        layers = [(resource_id, data)]
     else:
         raise ValueError("resource_type 必须是 map 或 layer")
 
+    copier = _Copier(alias, batch_size)
     # 使用事务保证目标数据库写入完整性
     with transaction.atomic(using=alias):
-        obj = model_cls.objects.using(alias).create(**data)
-        return obj.id
+        layer_ids = [copier.copy_layer(source_id, data) for source_id, data in layers]
+        if snapshot is not None:
+            target_map = Map(**_assignable(Map, snapshot.get('map')))
+            copier.insert_returning(Map, [target_map])
+            copier.insert(MapLayer, [MapLayer(map_id=target_map.pk, layer_id=lid) for lid in layer_ids])
+            new_id = target_map.pk
+        else:
+            new_id = layer_ids[0]
+
+    elapsed = time.perf_counter() - started
+    total = sum(copier.rows.values())
+    return {
+        'new_id': new_id,
+        'rows': copier.rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(total / elapsed, 1) if elapsed else None,
+    }
@@ -0,0 +1,119 @@
+# db_indexes.py
+"""
+db 应用的表结构由外部 SQL 建立（无迁移），模型上声明的 unique_together / Meta.indexes 在生产库中可能不存在。
+ensure_indexes() 按 INDEX_SPECS 检查 Node / IntraEdge / Map_Layer / Edge 的唯一约束与复合索引，缺失则补建，
+可重复执行。由管理命令 ensure_db_indexes 调用（迁移 0007 内保留一份编写时的副本）。
+
+待补建唯一索引的表中存在重复行时，默认不做任何修改并抛出 DuplicateRows（附重复的列值组合）；
+只有显式传入 deduplicate=True（ensure_db_indexes --deduplicate）才删除重复行（保留最小 id），并逐行输出被删除的行。
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# DuplicateRows 消息中每张表列出的重复组数上限
+MAX_REPORTED_GROUPS = 20
+
+# (表名, 列, 是否唯一, 索引名)；名称与 db.models 中 Meta.indexes 一致
+INDEX_SPECS = [
+    ('Node', ('layer_id', 'base_node_id'), True, 'node_layer_basenode_uniq'),
+    ('Node', ('base_node_id', 'layer_id'), False, 'node_basenode_layer_idx'),
+    ('IntraEdge', ('layer_id', 'edge_id'), True, 'intraedge_layer_edge_uniq'),
+    ('IntraEdge', ('edge_id', 'layer_id'), False, 'intraedge_edge_layer_idx'),
+    ('Map_Layer', ('map_id', 'layer_id'), True, 'maplayer_map_layer_uniq'),
+    ('Map_Layer', ('layer_id', 'map_id'), False, 'maplayer_layer_map_idx'),
+    ('Edge', ('source_node_id', 'destination_node_id'), False, 'edge_src_dst_idx'),
+    ('Edge', ('destination_node_id', 'source_node_id'), False, 'edge_dst_src_idx'),
+]
+
+
+def _covered(constraints, columns, unique):
+    """已有约束 / 索引是否满足要求：唯一约束须列集合相同；普通索引只需以这些列为前缀。"""
+    for info in constraints.values():
+        existing = info['columns'] or []
+        if unique:
+            if info['unique'] and set(existing) == set(columns):
+                return True
+        elif (info['index'] or info['unique']) and tuple(existing[:len(columns)]) == tuple(columns):
+            return True
+    return False
+
+
+class DuplicateRows(Exception):
+    """
+    待补建唯一索引的表中存在重复行。groups 为 {(表名, 列): [(列值元组, 行数), ...]}。
+    """
+
+    def __init__(self, groups):
+        self.groups = groups
+        lines = []
+        for (table, columns), rows in groups.items():
+            lines.append(f"{table} ({', '.join(columns)}): {len(rows)} duplicated groups")
+            lines += [f"    {values} x{count}" for values, count in rows[:MAX_REPORTED_GROUPS]]
+            if len(rows) > MAX_REPORTED_GROUPS:
+                lines.append(f"    ... {len(rows) - MAX_REPORTED_GROUPS} more")
+        super().__init__(
+            "cannot create unique indexes, duplicate rows found:\n" + "\n".join(lines) +
+            "\nresolve them by hand, or run `manage.py ensure_db_indexes --deduplicate` "
+            "to delete all but the lowest id of each group"
+        )
+
+
+def find_duplicates(cursor, quote, table, columns):
+    """重复的列值组合 [(列值元组, 行数), ...]，按列值排序。"""
+    cols = ', '.join(quote(c) for c in columns)
+    cursor.execute(f"SELECT {cols}, COUNT(*) FROM {quote(table)} GROUP BY {cols} HAVING COUNT(*) > 1 ORDER BY {cols}")
+    return [(tuple(row[:-1]), row[-1]) for row in cursor.fetchall()]
+
+
+def _delete_duplicates(schema_editor, cursor, table, columns, log):
+    """删除重复行（每组保留最小 id），删除前逐行输出；返回删除行数。"""
+    quote = schema_editor.quote_name
+    cols = ', '.join(quote(c) for c in columns)
+    cursor.execute(
+        f"SELECT {quote('id')}, {cols} FROM {quote(table)} WHERE {quote('id')} NOT IN "
+        f"(SELECT MIN({quote('id')}) FROM {quote(table)} GROUP BY {cols}) ORDER BY {cols}, {quote('id')}"
+    )
+    doomed = cursor.fetchall()
+    for row in doomed:
+        log(f"deleting duplicate {table} id={row[0]} ({', '.join(f'{c}={v}' for c, v in zip(columns, row[1:]))})")
+    ids = [row[0] for row in doomed]
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        schema_editor.execute(f"DELETE FROM {quote(table)} WHERE {quote('id')} IN ({', '.join(['%s'] * len(batch))})",
+                              batch)
+    return len(ids)
+
+
+def ensure_indexes(schema_editor, deduplicate=False, log=None):
+    """
+    补建缺失的唯一约束与复合索引，返回新建的索引名列表。
+    建索引前先检查全部待补建的唯一索引：有重复行且 deduplicate=False 时抛出 DuplicateRows，不建任何索引、不删任何行；
+    deduplicate=True 时删除重复行，log（缺省为 logging.warning）逐行记录被删除的行。
+    """
+    connection = schema_editor.connection
+    quote = schema_editor.quote_name
+    log = log or logger.warning
+    created = []
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+        missing = [(table, columns, unique, name) for table, columns, unique, name in INDEX_SPECS
+                   if table in tables
+                   and not _covered(connection.introspection.get_constraints(cursor, table), columns, unique)]
+        duplicates = {}
+        for table, columns, unique, name in missing:
+            if unique:
+                rows = find_duplicates(cursor, quote, table, columns)
+                if rows:
+                    duplicates[(table, columns)] = rows
+        if duplicates and not deduplicate:
+            raise DuplicateRows(duplicates)
+        for table, columns in duplicates:
+            _delete_duplicates(schema_editor, cursor, table, columns, log)
+        for table, columns, unique, name in missing:
+            schema_editor.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX {quote(name)} ON {quote(table)} "
+                f"({', '.join(quote(c) for c in columns)})"
+            )
+            created.append(name)
+    return created
@@ -1,28 +1,89 @@
 # utils/db_router.py
-from django.db import connections
-from django.db.utils import ConnectionDoesNotExist
+"""
+数据迁移目标库的连接别名。
+
+目标库只能是 settings.DATA_MIGRATION_TARGETS 中按名称配置的库（请求只给出名称，不能指定连接参数）；
+别名 target_<name> 按需注册并复用持久连接，注册表最多保留 MAX_TARGET_ALIASES 个，
+超出时淘汰最久未用的别名并关闭其连接。
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+MAX_TARGET_ALIASES = 4
+
+_TARGET_ALIASES = OrderedDict()  # name -> alias，按最近使用排序
+_TARGET_LOCK = threading.Lock()
 
-def setup_target_db(alias: str, config: dict):
-    """
-    动态添加目标数据库配置到 Django connections
-    alias: 数据库别名，例如 "target_db"
-    config: dict 包含数据库连接参数
-    """
-    from django.conf import settings
 
-    settings.DATABASES[alias] = {
-        "ENGINE": "django.db.backends.mysql",
+def _targets() -> dict:
+    return getattr(settings, 'DATA_MIGRATION_TARGETS', {})
+
+
+def _max_aliases() -> int:
+    return getattr(settings, 'DATA_MIGRATION_MAX_CONNECTIONS', MAX_TARGET_ALIASES)
+
+
+def _target_settings(config: dict) -> dict:
+    engine = config.get("ENGINE", "django.db.backends.mysql")
+    return {
+        "ENGINE": engine,
         "NAME": config["NAME"],
-        "USER": config["USER"],
-        "PASSWORD": config["PASSWORD"],
-        "HOST": config["HOST"],
+        "USER": config.get("USER", ""),
+        "PASSWORD": config.get("PASSWORD", ""),
+        "HOST": config.get("HOST", ""),
         "PORT": config.get("PORT", "3306"),
-        "OPTIONS": {"charset": "utf8mb4"},
+        "OPTIONS": config.get("OPTIONS", {"charset": "utf8mb4"} if engine.endswith("mysql") else {}),
+        # 连接在请求间保持，并在复用前做健康检查
+        "CONN_MAX_AGE": config.get("CONN_MAX_AGE", 600),
+        "CONN_HEALTH_CHECKS": True,
     }
 
-    # 清理旧连接，避免复用
+
+def _register(alias: str, target: dict):
+    # configure_settings 补全 TIME_ZONE / AUTOCOMMIT / TEST 等默认项（要求同时给出 default）
+    connections.configure_settings({DEFAULT_DB_ALIAS: connections.databases[DEFAULT_DB_ALIAS], alias: target})
+    connections.databases[alias] = target
+
+
+def _unregister(alias: str):
+    # 只能关闭当前线程的连接；其他线程持有的连接在其线程结束或 close_old_connections 时释放
     if alias in connections.databases:
-        try:
-            connections[alias].close()
-        except ConnectionDoesNotExist:
-            pass
+        connections[alias].close()
+        del connections[alias]
+        del connections.databases[alias]
+
+
+def target_names() -> list:
+    """已配置的迁移目标名称。"""
+    return sorted(_targets())
+
+
+def get_target_alias(name: str) -> str:
+    """
+    返回已配置的迁移目标 name 的数据库别名；未配置的名称抛出 ValueError。
+    同一目标只注册一次，后续请求复用同一别名及其持久连接。
+    """
+    targets = _targets()
+    if name not in targets:
+        raise ValueError(f"unknown migration target {name!r}, configured targets: {target_names()}")
+    with _TARGET_LOCK:
+        alias = _TARGET_ALIASES.pop(name, None)
+        if alias is None:
+            alias = f"target_{name}"
+            _register(alias, _target_settings(targets[name]))
+        _TARGET_ALIASES[name] = alias
+        while len(_TARGET_ALIASES) > _max_aliases():
+            _, evicted = _TARGET_ALIASES.popitem(last=False)
+            _unregister(evicted)
+        return alias
+
+
+def release_target_alias(name: str):
+    """注销迁移目标 name 的别名并关闭当前线程的连接（配置变更或测试清理时使用）。"""
+    with _TARGET_LOCK:
+        alias = _TARGET_ALIASES.pop(name, None)
+        if alias is not None:
+            _unregister(alias)
@@ -0,0 +1,97 @@
+# versioning.py
+"""
+Map / Layer 版本号的乐观并发控制（compare-and-swap）。
+
+推进版本时不再整行 save()（后写者静默覆盖先写者，或在写完全部内容后才撞上 LayerVersion 的唯一约束），而是：
+
+    UPDATE ... SET version_number = <新版本号>, <其余字段> WHERE id = <id> AND version_number = <读取时的版本号>
+
+影响行数不足说明读取之后已有其他写入者推进了版本：抛出 VersionConflict，调用方在写入 LayerVersion / MapArchive
+之前放弃当前保存点。导入任务与回滚在新的顶层事务中重新读取并整体重试（VERSION_CONFLICT_RETRIES 次），
+仍冲突时以冲突结束（API 返回 409）；调用方已处于事务中时不重试（同一事务内重试在可重复读隔离级别下读到同一快照）。整个过程不持有额外的行锁或表锁，不同资源的写入互不等待。
+
+UPDATE 不触发 post_save，调用方需显式使导出缓存失效。
+"""
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+VERSION_CONFLICT_RETRIES = 3
+
+
+class VersionConflict(ValidationError):
+    """读取之后版本号已被其他写入者推进；ids 为发生冲突的主键。"""
+
+    def __init__(self, model, ids):
+        self.model = model
+        self.ids = sorted(ids)
+        super().__init__(f"version conflict on {model._meta.object_name} {', '.join(map(str, self.ids))}: "
+                         f"modified concurrently, reload and retry")
+
+
+def retries():
+    return getattr(settings, 'VERSION_CONFLICT_RETRIES', VERSION_CONFLICT_RETRIES)
+
+
+def retrying(func, *args, **kwargs):
+    """
+    在顶层事务内调用 func，VersionConflict 时回滚并在新事务中重新执行，最多重试 retries() 次，仍冲突时抛出。
+    已处于事务中时只执行一次：保存点内的重试读到的仍是外层事务的快照。
+    """
+    attempts = 1 if transaction.get_connection().in_atomic_block else retries() + 1
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        except VersionConflict:
+            if attempt == attempts - 1:
+                raise
+
+
+def _update_fields(model, fields=None):
+    # 除主键与创建时间（auto_now_add）外的全部字段；auto_now 字段由 pre_save 取当前时间
+    return [f for f in model._meta.concrete_fields
+            if not f.primary_key and not getattr(f, 'auto_now_add', False) and (fields is None or f.name in fields)]
+
+
+def compare_and_swap(instance, expected_version, fields=None):
+    """
+    仅当数据库中的版本号仍为 expected_version 时保存实例（fields 省略时为全部可更新字段），
+    版本号写为实例当前的 version_number；否则抛出 VersionConflict，不做任何写入。
+    """
+    model = type(instance)
+    values = {f.attname: f.pre_save(instance, False) for f in _update_fields(model, fields)}
+    if not model._base_manager.filter(pk=instance.pk, version_number=expected_version).update(**values):
+        raise VersionConflict(model, [instance.pk])
+
+
+def bulk_compare_and_swap(objs, fields, expected, batch_size=None):
+    """
+    批量版本的 compare_and_swap：expected 为 {pk: 读取时的版本号}，按批 bulk_update 并以 (pk, 版本号) 为条件；
+    任一行已被修改时抛出 VersionConflict（本函数在保存点内执行，已写入的批次一并回滚）。
+    """
+    objs = list(objs)
+    if not objs:
+        return
+    model = type(objs[0])
+    connection = connections[router.db_for_write(model)]
+    max_batch = connection.ops.bulk_batch_size(['pk', 'pk', 'pk', 'version_number', *fields], objs)
+    batch_size = min(batch_size, max_batch) if batch_size else max_batch
+    try:
+        with transaction.atomic(using=connection.alias):
+            for start in range(0, len(objs), batch_size):
+                batch = objs[start:start + batch_size]
+                matched = reduce(or_, (Q(pk=obj.pk, version_number=expected[obj.pk]) for obj in batch))
+                if model._base_manager.filter(matched).bulk_update(batch, fields) < len(batch):
+                    raise VersionConflict(model, [obj.pk for obj in batch])
+    except VersionConflict as conflict:
+        # 本批写入已随保存点回滚，此时版本号不等于 expected 的行即为被并发修改的行（并发者可能写入了相同的新版本号，
+        # 不能与 obj.version_number 比较）；加锁读取以读到最新提交的版本，而非可重复读下的快照
+        with transaction.atomic(using=connection.alias):
+            current = dict(model._base_manager.select_for_update().filter(pk__in=conflict.ids)
+                           .values_list('pk', 'version_number'))
+        raise VersionConflict(model, [pk for pk in conflict.ids if current.get(pk) != expected[pk]]) from None
@@ -6,53 +6,107 @@ from rest_framework.response import Response
 from rest_framework import status, generics
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from db.models import Map, Layer, MapLayer
-from . import services
-from .models import MapVersionSnapshot
-from .serializers import MapSerializer, LayerSerializer, MapArchiveSerializer
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from db.models import Map, Layer, MapLayer, BaseNode, BaseEdge
+from . import branches, history, rollups, services, spatial, versioning
+from .models import MapVersionSnapshot, ResourceImportJob, LayerBranch, MapBranch
+from .serializers import MapSerializer, LayerSerializer, ResourceImportJobStatusSerializer
 import json
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+import math
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly
 from .permissions import IsAdminOrReadOnly
 from .utils.data_migration import migrate_resource
 
 
 class DataMigrationAPIView(APIView):
     """
-    接收请求，执行数据迁移
+    接收请求，执行数据迁移（仅管理员）
+    body: {"resource_type": "map|layer", "resource_id": <int>, "version": <int>,
+           "target": "<settings.DATA_MIGRATION_TARGETS 中的名称>"}
     """
+    permission_classes = [IsAdminUser]
 
     def post(self, request, *args, **kwargs):
         resource_type = request.data.get("resource_type")
         resource_id = request.data.get("resource_id")
         version = request.data.get("version")
-        target_db_config = request.data.get("target_db_config")
+        target = request.data.get("target")
 
         try:
-            new_id = migrate_resource(resource_type, resource_id, version, target_db_config)
-            return Response({"status": "success", "new_id": new_id}, status=status.HTTP_201_CREATED)
+            report = migrate_resource(resource_type, resource_id, version, target)
+            return Response({"status": "success", **report}, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+def _conditional_response(request, etag, payload):
+    """带 ETag 的导出响应；If-None-Match 命中时返回 304 空响应。"""
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in [t.strip() for t in if_none_match.split(',')] or if_none_match.strip() == '*':
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(payload)
+    response['ETag'] = etag
+    return response
+
 class MapExportView(APIView):
+    """
+    GET /api/maps/{id}/export/?mode=latest|fixed&version=<n>&depth=meta|full
+    """
     permission_classes = [IsAuthenticatedOrReadOnly]
     def get(self, request, map_id):
         mode = request.query_params.get('mode', 'latest')
         version = request.query_params.get('version')
+        depth = request.query_params.get('depth', 'meta')
         try:
-            payload = services.export_map(map_id, version_number=version if mode == 'fixed' else None)
-            return Response(payload)
+            etag, payload = services.cached_export_map(map_id, version_number=version if mode == 'fixed' else None,
+                                                       depth=depth)
+            return _conditional_response(request, etag, payload)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
 
 class LayerExportView(APIView):
+    """
+    GET /api/layers/{id}/export/
+    ?stream=ndjson|json 时以 StreamingHttpResponse 分块输出，适用于大图层。
+    """
     permission_classes = [IsAuthenticatedOrReadOnly]
+    STREAM_CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+
     def get(self, request, layer_id):
+        stream = request.query_params.get('stream')
+        if stream:
+            if stream not in self.STREAM_CONTENT_TYPES:
+                return Response({'error': 'stream must be ndjson or json'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                chunks = services.stream_export_layer(layer_id, fmt=stream)
+            except ObjectDoesNotExist as e:
+                return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+            return StreamingHttpResponse(chunks, content_type=self.STREAM_CONTENT_TYPES[stream])
         try:
-            payload = services.export_layer(layer_id, include_related=True)
-            return Response(payload)
+            etag, payload = services.cached_export_layer(layer_id, include_related=True)
+            return _conditional_response(request, etag, payload)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
 
+class LayerTileView(APIView):
+    """
+    GET /api/layers/{id}/tiles/{z}/{x}/{y}/
+    Web Mercator 瓦片内的节点与层内边；低缩放级别返回聚合簇。支持 ETag / If-None-Match。
+    """
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    def get(self, request, layer_id, z, x, y):
+        try:
+            etag, payload = services.cached_layer_tile(layer_id, z, x, y)
+        except ObjectDoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _conditional_response(request, etag, payload)
+
 class MapDetailView(generics.RetrieveAPIView):
     queryset = Map.objects.all()
     serializer_class = MapSerializer
@@ -76,35 +130,80 @@ class MapLayersListView(APIView):
         return Response({'map': MapSerializer(map_obj).data, 'layers': layers})
 
 class VersionListView(APIView):
+    """
+    GET /api/versions/?map_before=&layer_before=&limit=      全部 Map / Layer 最近的版本
+    GET /api/versions/{map|layer}/{id}/?before=&limit=       该资源的版本历史（倒序，before 为上一页的 next_before）
+    只返回元数据（版本号、作者、说明、时间、大小、变更摘要），快照正文见 VersionDetailView。
+    """
     permission_classes = [IsAuthenticatedOrReadOnly]
-    def get(self, request, resource_type, resource_id):
-        if resource_type == 'map':
-            m = get_object_or_404(Map, id=resource_id)
-            archives = MapArchive.objects.filter(map=m).order_by('version_number')
-            return Response({
-                'map': MapSerializer(m).data,
-                'current_version': m.version_number,
-                'archives': MapArchiveSerializer(archives, many=True).data
-            })
-        elif resource_type == 'layer':
-            l = get_object_or_404(Layer, id=resource_id)
-            return Response({
-                'layer': LayerSerializer(l).data,
-                'version_number': l.version_number
-            })
-        return Response({'error': 'resource_type must be map or layer'}, status=status.HTTP_400_BAD_REQUEST)
+    def get(self, request, resource_type=None, resource_id=None):
+        params = request.query_params
+        try:
+            limit = int(params.get('limit', history.HISTORY_PAGE_SIZE))
+            if resource_type is None:
+                return Response(history.recent_versions(params.get('map_before'), params.get('layer_before'), limit))
+            if resource_type == 'map':
+                current = get_object_or_404(Map, id=resource_id).version_number
+                page = history.map_versions(resource_id, params.get('before'), limit)
+            elif resource_type == 'layer':
+                current = get_object_or_404(Layer, id=resource_id).version_number
+                page = history.layer_versions(resource_id, params.get('before'), limit)
+            else:
+                return Response({'error': 'resource_type must be map or layer'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'resource_type': resource_type, 'resource_id': resource_id,
+                         'current_version': current, **page})
+
+class VersionDetailView(APIView):
+    """GET /api/versions/{map|layer}/{id}/{version}/  指定版本的快照正文（Map 由差量链重建）"""
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    BODIES = {'map': history.map_version_body, 'layer': history.layer_version_body}
+
+    def get(self, request, resource_type, resource_id, version):
+        body = self.BODIES.get(resource_type)
+        if body is None:
+            return Response({'error': 'resource_type must be map or layer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            data = body(resource_id, version)
+        except ObjectDoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'resource_type': resource_type, 'resource_id': resource_id, 'version': version, 'data': data})
 
 class ImportJSONView(APIView):
+    """
+    POST /api/import/
+    默认投递为后台任务，返回 202 + job_id，通过 /api/import/jobs/{job_id}/ 轮询；
+    ?mode=sync 时在请求线程内同步执行（旧行为）。
+    """
     permission_classes = [IsAdminOrReadOnly]
     def post(self, request):
         payload = request.data
-        res = services.import_json_payload(payload, performed_by=str(request.user) if request.user.is_authenticated else None)
-        return Response(res, status=status.HTTP_200_OK if res.get('status') == 'SUCCESS' else status.HTTP_400_BAD_REQUEST)
+        performed_by = str(request.user) if request.user.is_authenticated else None
+        user = request.user if request.user.is_authenticated else None
+        if request.query_params.get('mode') == 'sync':
+            res = services.import_json_payload(payload, performed_by=performed_by, user=user)
+            if res.get('conflict'):
+                return Response(res, status=status.HTTP_409_CONFLICT)
+            return Response(res, status=status.HTTP_200_OK if res.get('status') == 'SUCCESS' else status.HTTP_400_BAD_REQUEST)
+        res = services.submit_import_job(payload, performed_by=performed_by, user=user)
+        if res.get('status') == 'FAILED':
+            return Response(res, status=status.HTTP_400_BAD_REQUEST)
+        res['poll_url'] = reverse('import-job-status', kwargs={'job_id': res['job_id']})
+        return Response(res, status=status.HTTP_202_ACCEPTED)
+
+class ImportJobStatusView(generics.RetrieveAPIView):
+    queryset = ResourceImportJob.objects.all()
+    serializer_class = ResourceImportJobStatusSerializer
+    lookup_field = 'id'
+    lookup_url_kwarg = 'job_id'
+    permission_classes = [IsAuthenticatedOrReadOnly]
 
 class MapRollbackView(APIView):
     """
     POST /api/maps/{id}/rollback/
     body: {"version_number": <int>, "message": "optional"}
+    与并发写入冲突时自动重试，仍冲突返回 409。
     """
     permission_classes = [IsAdminOrReadOnly]
     def post(self, request, map_id):
@@ -113,9 +212,188 @@ class MapRollbackView(APIView):
         if version_number is None:
             return Response({'error': 'version_number required'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            result = services.rollback_map_to_version(map_id, int(version_number),
-                                                      performed_by=str(request.user) if request.user.is_authenticated else None,
-                                                      message=message)
+            result = versioning.retrying(services.rollback_map_to_version, map_id, int(version_number),
+                                         performed_by=str(request.user) if request.user.is_authenticated else None,
+                                         message=message)
             return Response(result)
+        except versioning.VersionConflict as e:
+            return Response({'error': e.message, 'ids': e.ids}, status=status.HTTP_409_CONFLICT)
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+def _branch_response(run):
+    """执行分支 / 合并操作并映射错误：冲突 409（附 conflicts），校验失败 400，对象不存在 404。"""
+    try:
+        return Response(run())
+    except branches.MergeConflict as e:
+        return Response({'error': e.message, 'conflicts': e.conflicts}, status=status.HTTP_409_CONFLICT)
+    except versioning.VersionConflict as e:
+        return Response({'error': e.message, 'ids': e.ids}, status=status.HTTP_409_CONFLICT)
+    except ObjectDoesNotExist as e:
+        return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except (ValidationError, ValueError) as e:
+        return Response({'error': '; '.join(getattr(e, 'messages', [str(e)]))}, status=status.HTTP_400_BAD_REQUEST)
+
+def _performed_by(request):
+    return str(request.user) if request.user.is_authenticated else None
+
+class LayerBranchView(APIView):
+    """
+    GET  /api/layers/{id}/branches/   该 Layer 的分支信息及由它 fork 出的分支
+    POST /api/layers/{id}/branches/   body: {"name": "..."}，fork 出新分支 Layer
+    """
+    permission_classes = [IsAdminOrReadOnly]
+    FIELDS = ('layer_id', 'name', 'origin_id', 'head__commit_hash', 'created_at')
+
+    def get(self, request, layer_id):
+        get_object_or_404(Layer, id=layer_id)
+        return Response({
+            'branch': LayerBranch.objects.filter(layer_id=layer_id).values(*self.FIELDS).first(),
+            'forks': list(LayerBranch.objects.filter(origin_id=layer_id).order_by('created_at').values(*self.FIELDS)),
+        })
+
+    def post(self, request, layer_id):
+        name = request.data.get('name')
+        if not name:
+            return Response({'error': 'name required'}, status=status.HTTP_400_BAD_REQUEST)
+        res = _branch_response(lambda: services.fork_layer_branch(layer_id, name, performed_by=_performed_by(request)))
+        if res.status_code == status.HTTP_200_OK:
+            res.status_code = status.HTTP_201_CREATED
+        return res
+
+class LayerMergeView(APIView):
+    """
+    POST /api/layers/{id}/merge/
+    body: {"source": <分支 layer_id>, "message": "optional", "strategy": "ours|theirs (optional)"}
+    内容字段冲突时返回 409 及冲突列表。
+    """
+    permission_classes = [IsAdminOrReadOnly]
+    def post(self, request, layer_id):
+        source = request.data.get('source')
+        if source is None:
+            return Response({'error': 'source required'}, status=status.HTTP_400_BAD_REQUEST)
+        return _branch_response(lambda: services.merge_layer_branch(
+            layer_id, int(source), performed_by=_performed_by(request),
+            message=request.data.get('message', ''), strategy=request.data.get('strategy')))
+
+class LayerCommitListView(APIView):
+    """
+    GET  /api/layers/{id}/commits/?before=&limit=   该 Layer 上的提交（倒序，before 为上一页的 next_before）
+    POST /api/layers/{id}/commits/                  body: {"message": "optional"}，提交当前内容（无变化时返回分支头）
+    """
+    permission_classes = [IsAdminOrReadOnly]
+    def get(self, request, layer_id):
+        get_object_or_404(Layer, id=layer_id)
+        try:
+            page = history.layer_commits(layer_id, request.query_params.get('before'),
+                                         int(request.query_params.get('limit', history.HISTORY_PAGE_SIZE)))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'layer_id': layer_id, **page})
+
+    def post(self, request, layer_id):
+        layer = get_object_or_404(Layer, id=layer_id)
+        commit = branches.commit_layer(layer, author=_performed_by(request) or '',
+                                       message=request.data.get('message', ''))
+        return Response({'layer_id': layer_id, 'commit': commit.commit_hash, 'content_hash': commit.content_hash})
+
+class MapBranchView(APIView):
+    """
+    GET  /api/maps/{id}/branches/   由该 Map fork 出的分支
+    POST /api/maps/{id}/branches/   body: {"name": "..."}，fork 出新 Map（其中每个 Layer 各自 fork）
+    """
+    permission_classes = [IsAdminOrReadOnly]
+    def get(self, request, map_id):
+        get_object_or_404(Map, id=map_id)
+        forks = MapBranch.objects.filter(origin_id=map_id).order_by('created_at')
+        return Response({'forks': list(forks.values('map_id', 'name', 'base_layers', 'created_at'))})
+
+    def post(self, request, map_id):
+        name = request.data.get('name')
+        if not name:
+            return Response({'error': 'name required'}, status=status.HTTP_400_BAD_REQUEST)
+        res = _branch_response(lambda: services.fork_map_branch(map_id, name, performed_by=_performed_by(request)))
+        if res.status_code == status.HTTP_200_OK:
+            res.status_code = status.HTTP_201_CREATED
+        return res
+
+class MapMergeView(APIView):
+    """
+    POST /api/maps/{id}/merge/
+    body: {"source": <fork 出的 map_id>, "message": "optional", "strategy": "ours|theirs (optional)"}
+    任一 Layer 冲突时整体不合并，返回 409 及冲突列表（各含 layer）。
+    """
+    permission_classes = [IsAdminOrReadOnly]
+    def post(self, request, map_id):
+        source = request.data.get('source')
+        if source is None:
+            return Response({'error': 'source required'}, status=status.HTTP_400_BAD_REQUEST)
+        return _branch_response(lambda: services.merge_map_branch(
+            map_id, int(source), performed_by=_performed_by(request),
+            message=request.data.get('message', ''), strategy=request.data.get('strategy')))
+
+
+def _coordinate(value, name, bound):
+    """解析经纬度并检查范围（|value| <= bound）；非数值、inf / nan 与越界值报 ValueError。"""
+    number = float(value)
+    if not -bound <= number <= bound:
+        raise ValueError(f"{name} must be within [-{bound}, {bound}], got {value}")
+    return number
+
+
+class SpatialQueryView(APIView):
+    """
+    GET /api/spatial/{nodes|edges}/
+    ?bbox=min_lng,min_lat,max_lng,max_lat[&limit=]   视口矩形内（相交）的对象及其外包矩形
+    ?lat=&lng=&radius=<米>[&limit=]                   半径内对象，按距离升序
+    ?lat=&lng=&k=                                     最近的 k 个对象
+    纬度须在 [-90, 90]、经度须在 [-180, 180] 内，半径须为有限非负数，否则返回 400。
+    """
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    MODELS = {'nodes': BaseNode, 'edges': BaseEdge}
+    MAX_RESULTS = 10000
+
+    def get(self, request, kind):
+        model = self.MODELS.get(kind)
+        if model is None:
+            return Response({'error': 'kind must be nodes or edges'}, status=status.HTTP_400_BAD_REQUEST)
+        params = request.query_params
+        try:
+            limit = min(int(params.get('limit', self.MAX_RESULTS)), self.MAX_RESULTS)
+            if 'bbox' in params:
+                min_lng, min_lat, max_lng, max_lat = params['bbox'].split(',')
+                min_lng, max_lng = _coordinate(min_lng, 'lng', 180), _coordinate(max_lng, 'lng', 180)
+                min_lat, max_lat = _coordinate(min_lat, 'lat', 90), _coordinate(max_lat, 'lat', 90)
+                rows = spatial.extents_in_bbox(model, min_lat, min_lng, max_lat, max_lng).order_by('pk') \
+                    .values_list('pk', 'min_lat', 'min_lng', 'max_lat', 'max_lng')[:limit]
+                results = [{'id': pk, 'extent': extent} for pk, *extent in rows]
+            else:
+                lat, lng = _coordinate(params['lat'], 'lat', 90), _coordinate(params['lng'], 'lng', 180)
+                if 'radius' in params:
+                    radius = float(params['radius'])
+                    if not 0 <= radius < math.inf:
+                        raise ValueError(f"radius must be a finite non-negative number, got {params['radius']}")
+                    hits = spatial.within_radius(model, lat, lng, radius, limit=limit)
+                else:
+                    hits = spatial.nearest(model, lat, lng, k=min(int(params.get('k', 10)), self.MAX_RESULTS))
+                results = [{'id': pk, 'distance': round(d, 3)} for pk, d in hits]
+        except (KeyError, ValueError) as e:
+            return Response({'error': f'bbox or lat/lng required: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'kind': kind, 'count': len(results), 'results': results})
+
+
+class RegionRollupView(APIView):
+    """
+    GET /api/regions/rollup/?level=nation|province|city|district|street&layer=<id>&by=cis_type,sub_type
+    上级区划作为过滤参数，如 ?level=city&nation=中国&province=某省。读取预计算的 RegionRollup，不扫描节点表。
+    """
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    def get(self, request):
+        params = request.query_params
+        parents = {k: params[k] for k in rollups.LEVELS if k in params}
+        try:
+            layer_id = int(params['layer']) if params.get('layer') else None
+            by = [b for b in params.get('by', '').split(',') if b]
+            rows = rollups.region_counts(params.get('level', 'nation'), layer_id=layer_id, by=by, **parents)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'count': len(rows), 'results': rows})